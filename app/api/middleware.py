@@ -0,0 +1,172 @@
+"""Middleware ASGI de access log e latência por rota.
+
+Não lê o corpo da requisição: o tamanho vem do Content-Length ou é contado enquanto o
+corpo passa (uploads de CSV não são bufferizados de novo). Cada requisição entra num
+histograma de buckets fixos por (método, rota) e gera no máximo uma linha de log:
+amostrada (ACCESS_LOG_SAMPLE_RATE), sempre para 5xx e para requisições lentas
+(ACCESS_LOG_SLOW_MS, como warning).
+"""
+from __future__ import annotations
+from bisect import bisect_left
+import json
+import random
+import time
+import traceback
+from typing import Any
+
+import structlog
+
+from app.core.config import settings
+from app.core.metrics import HTTP_REQUEST_SECONDS
+
+log = structlog.get_logger()
+
+# Limites superiores dos buckets em ms (último = +inf)
+LATENCY_BUCKETS_MS: tuple[float, ...] = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+_ERROR_BODY = json.dumps({"error": {"code": "internal_error", "message": "unexpected error"}}).encode()
+
+
+class LatencyHistogram:
+    __slots__ = ("counts", "total", "sum_ms")
+
+    def __init__(self) -> None:
+        self.counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.total = 0
+        self.sum_ms = 0.0
+
+    def observe(self, ms: float) -> None:
+        self.counts[bisect_left(LATENCY_BUCKETS_MS, ms)] += 1
+        self.total += 1
+        self.sum_ms += ms
+
+    def quantile(self, q: float) -> float | None:
+        """Limite superior do bucket que contém o quantil (estimativa conservadora)."""
+        if not self.total:
+            return None
+        target = q * self.total
+        acc = 0
+        for i, c in enumerate(self.counts):
+            acc += c
+            if acc >= target:
+                return LATENCY_BUCKETS_MS[i] if i < len(LATENCY_BUCKETS_MS) else float("inf")
+        return float("inf")
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            "count": self.total,
+            "avg_ms": round(self.sum_ms / self.total, 2) if self.total else None,
+            "p50_ms": self.quantile(0.5),
+            "p95_ms": self.quantile(0.95),
+            "p99_ms": self.quantile(0.99),
+            "buckets": dict(zip([*map(str, LATENCY_BUCKETS_MS), "+inf"], self.counts)),
+        }
+
+
+# (método, rota) -> histograma. Só o event loop do processo escreve aqui.
+http_latency: dict[tuple[str, str], LatencyHistogram] = {}
+
+
+def latency_snapshot() -> list[dict[str, Any]]:
+    return [
+        {"method": method, "route": route, **h.snapshot()}
+        for (method, route), h in sorted(http_latency.items(), key=lambda kv: kv[0][1])
+    ]
+
+
+def _route_of(scope: dict) -> str:
+    route = scope.get("route")
+    # Caminho do template (/veiculos/{vehicle_id}), não o concreto: cardinalidade limitada
+    return getattr(route, "path", None) or "<unmatched>"
+
+
+def _content_length(scope: dict) -> int | None:
+    for name, value in scope.get("headers") or ():
+        if name == b"content-length":
+            try:
+                return int(value)
+            except ValueError:
+                return None
+    return None
+
+
+class AccessLogMiddleware:
+    def __init__(self, app) -> None:  # type: ignore[no-untyped-def]
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:  # type: ignore[no-untyped-def]
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        req_bytes = 0
+        resp_bytes = 0
+        status = 500
+        started = False
+
+        async def _receive():  # type: ignore[no-untyped-def]
+            nonlocal req_bytes
+            message = await receive()
+            if message["type"] == "http.request":
+                req_bytes += len(message.get("body", b""))
+            return message
+
+        async def _send(message) -> None:  # type: ignore[no-untyped-def]
+            nonlocal status, resp_bytes, started
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                started = True
+            elif message["type"] == "http.response.body":
+                resp_bytes += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, _receive, _send)
+        except Exception as e:  # noqa: BLE001
+            log.error(
+                "http_request_exception",
+                method=scope["method"],
+                path=scope["path"],
+                error=str(e),
+                traceback=traceback.format_exc(),
+            )
+            if started:
+                raise
+            status = 500
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": 500,
+                    "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(_ERROR_BODY)).encode())],
+                }
+            )
+            await send({"type": "http.response.body", "body": _ERROR_BODY})
+        finally:
+            self._record(scope, status, (time.perf_counter() - start) * 1000, req_bytes, resp_bytes)
+
+    @staticmethod
+    def _record(scope: dict, status: int, ms: float, req_bytes: int, resp_bytes: int) -> None:
+        method, route = scope["method"], _route_of(scope)
+        h = http_latency.get((method, route))
+        if h is None:
+            h = http_latency[(method, route)] = LatencyHistogram()
+        h.observe(ms)
+        HTTP_REQUEST_SECONDS.labels(method, route, f"{status // 100}xx").observe(ms / 1000.0)
+
+        slow = ms >= settings.ACCESS_LOG_SLOW_MS
+        if not (slow or status >= 500 or random.random() < settings.ACCESS_LOG_SAMPLE_RATE):
+            return
+        fields = dict(
+            method=method,
+            route=route,
+            path=scope["path"],
+            status=status,
+            duration_ms=round(ms, 2),
+            req_bytes=_content_length(scope) or req_bytes,
+            resp_bytes=resp_bytes,
+        )
+        if slow:
+            log.warning("http_slow_request", **fields)
+        else:
+            log.info("http_access", **fields)
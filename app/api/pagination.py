@@ -0,0 +1,89 @@
+"""Paginação por cursor (keyset) para as listagens.
+
+O cursor é opaco para o cliente: base64url de um JSON com os valores da chave de ordenação
+da última linha da página (ex.: [created_at, id]). A próxima página filtra
+`(chave) < (valores do cursor)` em vez de pular `offset` linhas, então o custo não cresce
+com a profundidade e inserções novas não deslocam as páginas seguintes. A ordenação sempre
+termina no id para desempatar.
+
+Compatibilidade: sem `cursor`, os endpoints continuam aceitando `offset` e devolvendo a
+lista pura. Com `cursor` (vazio = primeira página), o corpo vira `{"items", "next_cursor"}`.
+Nos dois modos o próximo cursor também vai no header `X-Next-Cursor`.
+"""
+from __future__ import annotations
+import base64
+from datetime import datetime
+import json
+from typing import Any, Callable, Sequence, TypeVar
+
+from fastapi import HTTPException, Response
+from sqlalchemy import Select, tuple_
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+T = TypeVar("T")
+
+
+def _encode_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {"dt": value.isoformat()}
+    return value
+
+
+def _decode_value(value: Any) -> Any:
+    if isinstance(value, dict) and "dt" in value:
+        return datetime.fromisoformat(value["dt"])
+    return value
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    raw = json.dumps([_encode_value(v) for v in values], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor: str, size: int) -> list[Any]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = [_decode_value(v) for v in json.loads(raw)]
+    except (ValueError, TypeError) as e:
+        raise HTTPException(status_code=400, detail="invalid_cursor") from e
+    if not isinstance(values, list) or len(values) != size:
+        raise HTTPException(status_code=400, detail="invalid_cursor")
+    return values
+
+
+class Keyset:
+    """Ordenação + filtro de continuação sobre as colunas dadas (todas na mesma direção)."""
+
+    def __init__(self, *columns: Any, descending: bool = True) -> None:
+        self.columns = columns
+        self.descending = descending
+
+    def apply(self, stmt: Select, cursor: str | None, limit: int, offset: int = 0) -> Select:
+        """Ordena, filtra após o cursor (ou pula `offset`, modo legado) e busca `limit + 1` linhas.
+
+        A linha extra só indica se há próxima página.
+        """
+        if cursor:
+            values = decode_cursor(cursor, len(self.columns))
+            key, after = tuple_(*self.columns), tuple_(*values)
+            stmt = stmt.where(key < after if self.descending else key > after)
+        elif offset > 0:
+            stmt = stmt.offset(offset)
+        order = [c.desc() if self.descending else c.asc() for c in self.columns]
+        return stmt.order_by(*order).limit(limit + 1)
+
+    def page(self, rows: Sequence[T], limit: int, key: Callable[[T], Sequence[Any]]) -> tuple[list[T], str | None]:
+        items = list(rows[:limit])
+        if len(rows) <= limit or not items:
+            return items, None
+        return items, encode_cursor(key(items[-1]))
+
+
+def respond(items: list[Any], next_cursor: str | None, cursor: str | None, response: Response) -> Any:
+    """Lista pura (modo offset) ou envelope (modo cursor); o header vai nos dois."""
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    if cursor is None:
+        return items
+    return {"items": items, "next_cursor": next_cursor}
@@ -1,4 +1,7 @@
-from fastapi import APIRouter, HTTPException, Depends, UploadFile, File
+from datetime import datetime
+import re
+
+from fastapi import APIRouter, HTTPException, Depends, Response, UploadFile, File
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
 from app.repositories.db import SessionLocal
@@ -6,14 +9,13 @@ from app.repositories.models import (
     Conversation,
     ConversationStatus,
     Message,
-    MessageDirection,
     Contact,
     Tenant,
     User,
     UserRole,
     SuppressedContact,
     MessageLog,
-    Vehicle,
+    ImportJob,
 )
 
 import structlog
@@ -21,44 +23,102 @@ from app.core.config import settings
 from app.workers.tasks_outbound import send_text as task_send_text
 from app.workers.tasks_outbound import send_template as task_send_template
 from app.workers.tasks_orders import check_sla_alerts as task_check_sla_alerts
+from app.workers.tasks_imports import run_import as task_run_import
 from sqlalchemy import select
 from app.api.deps import require_role_admin
+from app.api.pagination import Keyset, respond
+from app.messaging import window as window_oracle
+from app.repositories.archive import read_archived
+from app.repositories.tenants import TenantInfo, get_tenant, invalidate_tenant
+from app.repositories import imports as import_jobs
+from app.domain.bot import BUILTIN_FLOWS, compile_flow
 
 # Definição do router e logger (precisa vir antes dos decoradores @router...)
 router = APIRouter(dependencies=[Depends(require_role_admin)])
 log = structlog.get_logger()
 
-# Endpoint mínimo para conversas (suporta validação de auth nos testes)
+# Ordenação das listagens paginadas (ver app.api.pagination)
+_LEADS_KEYSET = Keyset(Contact.id)
+_LOGS_KEYSET = Keyset(MessageLog.created_at, MessageLog.id)
+_USERS_KEYSET = Keyset(User.id, descending=False)
+
+_MESSAGE_FIELDS = ("id", "conversation_id", "direction", "type", "payload", "status", "created_at")
+
+
+def _message_out(m: Message) -> dict:
+    return {
+        "id": m.id,
+        "conversation_id": m.conversation_id,
+        "direction": m.direction.value,
+        "type": m.type,
+        "payload": m.payload,
+        "status": m.status,
+        "created_at": m.created_at.isoformat(),
+        "archived": False,
+    }
+
+
 @router.get("/conversations")
-def list_conversations(wa_id: str, limit: int = 50):
-    # Implementação simplificada para os testes: retorna lista vazia
-    return []
+def list_conversations(wa_id: str, limit: int = 50, before: datetime | None = None):
+    """Histórico de mensagens do contato, mais recentes primeiro (anteriores a `before`, se informado).
+
+    Quando o banco não tem `limit` mensagens, completa com o arquivo frio (ARCHIVE_URL).
+    """
+    limit = max(1, min(limit, 200))
+    tenant = _default_tenant()
+    with SessionLocal() as db:  # type: Session
+        conv_ids = list(
+            db.scalars(
+                select(Conversation.id)
+                .join(Contact, Contact.id == Conversation.contact_id)
+                .where(Contact.tenant_id == tenant.id, Contact.wa_id == wa_id)
+            )
+        )
+        if not conv_ids:
+            return []
+        q = select(Message).where(Message.conversation_id.in_(conv_ids))
+        if before is not None:
+            q = q.where(Message.created_at < before)
+        out = [_message_out(m) for m in db.scalars(q.order_by(Message.created_at.desc(), Message.id.desc()).limit(limit))]
+        if len(out) < limit and settings.ARCHIVE_URL:
+            try:
+                archived = read_archived(db, "messages", conv_ids, before=before)
+            except Exception as e:  # noqa: BLE001
+                log.error("archive_read_error", wa_id=wa_id, error=str(e))
+                archived = []
+            out.extend(
+                {**{k: row.get(k) for k in _MESSAGE_FIELDS}, "archived": True} for row in archived[: limit - len(out)]
+            )
+    return out
 
 
 # ------------------- Leads (veículos) -------------------
 @router.get("/leads")
-def list_leads(limit: int = 20, offset: int = 0):
+def list_leads(response: Response, limit: int = 20, offset: int = 0, cursor: str | None = None):
     """Lista leads a partir dos contatos cadastrados (POC veículos).
 
     Retorna estrutura compatível com a UI: id, nome, telefone, email, origem, preferencias.
+    Com `cursor`, pagina por keyset (ver app.api.pagination).
     """
     try:
         with SessionLocal() as db:  # type: Session
-            tenant = _get_or_create_default_tenant(db)
-            q = db.query(Contact).filter(Contact.tenant_id == tenant.id).order_by(Contact.id.desc())
-            q = q.limit(max(1, min(limit, 200))).offset(max(0, offset))
-            rows = q.all()
-            return [
+            tenant = _default_tenant()
+            limit = max(1, min(limit, 200))
+            q = db.query(Contact).filter(Contact.tenant_id == tenant.id)
+            q = _LEADS_KEYSET.apply(q, cursor, limit, max(0, offset))
+            rows, next_cursor = _LEADS_KEYSET.page(q.all(), limit, lambda r: (r.id,))
+            items = [
                 {
                     "id": r.id,
                     "nome": r.name,
                     "telefone": r.wa_id,
-                    "email": None,
+                    "email": r.email,
                     "origem": "whatsapp",
                     "preferencias": None,
                 }
                 for r in rows
             ]
+            return respond(items, next_cursor, cursor, response)
     except HTTPException:
         raise
     except Exception as e:
@@ -66,148 +126,80 @@ def list_leads(limit: int = 20, offset: int = 0):
         raise HTTPException(status_code=400, detail="list_leads_error")
 
 
-@router.post("/leads/import-csv")
-def import_leads_csv(file: UploadFile = File(...)):
-    """Importa leads básicos via CSV. Colunas aceitas: nome, telefone, email, origem.
-
-    - telefone será usado como wa_id (normalizado removendo não-dígitos);
-    - contatos existentes (tenant, wa_id) são atualizados com nome/email.
-    """
+def _start_import(kind: str, file: UploadFile, mode: str = "upsert") -> dict:
+    """Grava o upload, cria o ImportJob e enfileira o processamento no worker."""
+    if mode not in import_jobs.IMPORTERS[kind].modes:
+        raise HTTPException(status_code=400, detail="import_mode_invalid")
     try:
-        import csv
-        import io
-        content = file.file.read()
-        try:
-            text = content.decode("utf-8")
-        except Exception:
-            text = content.decode("latin-1")
-        if text.startswith("\ufeff"):
-            text = text.lstrip("\ufeff")
-        reader = csv.DictReader(io.StringIO(text))
-        cols = {c.strip().lower() for c in (reader.fieldnames or [])}
-        if not cols:
-            raise HTTPException(status_code=400, detail="csv_no_headers")
-
-        created = 0
-        updated = 0
         with SessionLocal() as db:  # type: Session
-            tenant = _get_or_create_default_tenant(db)
-            for row in reader:
-                nome = (row.get("nome") or row.get("name") or "").strip() or None
-                telefone = (row.get("telefone") or row.get("phone") or row.get("wa_id") or "").strip()
-                email = (row.get("email") or "").strip() or None
-                origem = (row.get("origem") or row.get("source") or "csv").strip() or "csv"
-                wa = "".join(ch for ch in telefone if ch.isdigit())
-                if not wa:
-                    # ignora linhas sem telefone/wa_id
-                    continue
-                existing = (
-                    db.query(Contact)
-                    .filter(Contact.tenant_id == tenant.id, Contact.wa_id == wa)
-                    .first()
-                )
-                if existing:
-                    # atualiza campos básicos
-                    if nome:
-                        existing.name = nome
-                    db.add(existing)
-                    updated += 1
-                else:
-                    c = Contact(tenant_id=tenant.id, wa_id=wa, name=nome, tags=[origem])
-                    db.add(c)
-                    created += 1
-            db.commit()
-
-        return {"processed": created + updated, "inserted": created, "updated": updated}
-    except HTTPException:
-        raise
+            tenant = _default_tenant()
+            job = import_jobs.create_job(db, kind, tenant.id, file.file, file.filename, mode)
+            out = import_jobs.job_status(job)
+    except import_jobs.CsvNoHeaders:
+        raise HTTPException(status_code=400, detail="csv_no_headers")
     except Exception as e:
-        log.error("import_leads_csv_error", error=str(e))
+        log.error("import_csv_error", kind=kind, error=str(e))
         raise HTTPException(status_code=400, detail={"code": "csv_parse_error", "message": str(e)})
+    try:
+        task_run_import.delay(out["id"])
+    except Exception as e:  # noqa: BLE001
+        # Job fica queued; POST /admin/imports/{id}/resume enfileira de novo
+        log.error("import_enqueue_error", job_id=out["id"], error=str(e))
+    return out
+
+
+@router.post("/leads/import-csv", status_code=202)
+def import_leads_csv(file: UploadFile = File(...)):
+    """Importa leads básicos via CSV em background. Colunas aceitas: nome, telefone, email, origem.
+
+    - telefone será usado como wa_id (normalizado removendo não-dígitos);
+    - contatos existentes (tenant, wa_id) são atualizados com o nome.
+    Devolve o job; acompanhar em GET /admin/imports/{id}.
+    """
+    return _start_import("leads", file)
 
 
-@router.post("/veiculos/import-csv")
-def import_veiculos_csv(file: UploadFile = File(...)):
-    """Importa inventário de veículos via CSV.
+@router.post("/veiculos/import-csv", status_code=202)
+def import_veiculos_csv(file: UploadFile = File(...), mode: str = "upsert"):
+    """Importa inventário de veículos via CSV em background (upsert em lotes).
 
-    Colunas aceitas: title, brand, model, year, category, price, image_url, active
+    Colunas aceitas: title, brand, model, year, category, price, image_url, active.
+    `mode=sync`: o arquivo é o inventário completo; veículos ausentes são desativados.
+    Linhas iguais às já gravadas (content_hash) não são reescritas.
+    Devolve o job; acompanhar em GET /admin/imports/{id}.
     """
+    return _start_import("vehicles", file, mode)
+
+
+def _get_import_job(db: Session, job_id: int) -> ImportJob:
+    job = db.get(ImportJob, job_id)
+    if job is None or job.tenant_id != _default_tenant().id:
+        raise HTTPException(status_code=404, detail="import_not_found")
+    return job
+
+
+@router.get("/imports/{job_id}")
+def get_import_job(job_id: int):
+    """Progresso do import: contadores, bytes processados e linhas/s."""
+    with SessionLocal() as db:  # type: Session
+        return import_jobs.job_status(_get_import_job(db, job_id))
+
+
+@router.post("/imports/{job_id}/resume", status_code=202)
+def resume_import_job(job_id: int):
+    """Reenfileira um import falho (ou parado) para continuar do último checkpoint."""
+    with SessionLocal() as db:  # type: Session
+        job = _get_import_job(db, job_id)
+        if not import_jobs.is_resumable(job):
+            raise HTTPException(status_code=409, detail="import_not_resumable")
+        out = import_jobs.job_status(job)
     try:
-        import csv
-        import io
-        content = file.file.read()
-        try:
-            text = content.decode("utf-8")
-        except Exception:
-            text = content.decode("latin-1")
-        if text.startswith("\ufeff"):
-            text = text.lstrip("\ufeff")
-        reader = csv.DictReader(io.StringIO(text))
-        created = 0
-        updated = 0
-        with SessionLocal() as db:  # type: Session
-            tenant = _get_or_create_default_tenant(db)
-            for row in reader:
-                title = (row.get("title") or row.get("titulo") or "").strip()
-                if not title:
-                    # ignora sem título
-                    continue
-                brand = (row.get("brand") or "").strip() or None
-                model = (row.get("model") or "").strip() or None
-                year = None
-                try:
-                    year = int((row.get("year") or "").strip())
-                except Exception:
-                    year = None
-                category = (row.get("category") or row.get("categoria") or "").strip().upper() or None
-                price = None
-                try:
-                    price = float((row.get("price") or "").replace('.', '').replace(',', '.'))
-                except Exception:
-                    price = None
-                image_url = (row.get("image_url") or row.get("imagem") or "").strip() or None
-                active = True
-                act_raw = (row.get("active") or row.get("ativo") or "").strip().lower()
-                if act_raw in {"0", "false", "nao", "não", "no"}:
-                    active = False
-
-                # Upsert por (tenant_id, title, year)
-                existing = (
-                    db.query(Vehicle)
-                    .filter(Vehicle.tenant_id == tenant.id, Vehicle.title == title, Vehicle.year == year)
-                    .first()
-                )
-                if existing:
-                    existing.brand = brand or existing.brand
-                    existing.model = model or existing.model
-                    existing.category = category or existing.category
-                    existing.price = price if price is not None else existing.price
-                    existing.image_url = image_url or existing.image_url
-                    existing.active = active
-                    db.add(existing)
-                    updated += 1
-                else:
-                    v = Vehicle(
-                        tenant_id=tenant.id,
-                        title=title,
-                        brand=brand,
-                        model=model,
-                        year=year,
-                        category=category,
-                        price=price,
-                        image_url=image_url,
-                        active=active,
-                    )
-                    db.add(v)
-                    created += 1
-            db.commit()
+        task_run_import.delay(job_id)
+    except Exception as e:  # noqa: BLE001
+        log.error("import_enqueue_error", job_id=job_id, error=str(e))
+        raise HTTPException(status_code=503, detail="import_enqueue_error")
+    return out
 
-        return {"processed": created + updated, "inserted": created, "updated": updated}
-    except HTTPException:
-        raise
-    except Exception as e:
-        log.error("import_vehicles_csv_error", error=str(e))
-        raise HTTPException(status_code=400, detail={"code": "csv_parse_error", "message": str(e)})
 
 # ------------------- Gestão de Usuários (admin-only) -------------------
 class UserCreate(BaseModel):
@@ -229,6 +221,11 @@ class UserOut(BaseModel):
         from_attributes = True
 
 
+class UserPage(BaseModel):
+    items: list[UserOut]
+    next_cursor: str | None
+
+
 class UserUpdate(BaseModel):
     full_name: str | None = None
     password: str | None = None
@@ -266,29 +263,25 @@ class SuppressIn(BaseModel):
     reason: str | None = None
 
 
-def _get_or_create_default_tenant(db: Session) -> Tenant:
-    tenant_name = settings.DEFAULT_TENANT_ID
-    tenant = db.query(Tenant).filter(Tenant.name == tenant_name).first()
-    if not tenant:
-        tenant = Tenant(name=tenant_name)
-        db.add(tenant)
-        db.flush()
-    return tenant
+def _default_tenant() -> TenantInfo:
+    # Cache em memória: não consulta o banco a cada requisição
+    return get_tenant(settings.DEFAULT_TENANT_ID)
 
 
 @router.get("/messaging/logs")
 def list_message_logs(
+    response: Response,
     to: str | None = None,
     status: str | None = None,
     dt_ini: str | None = None,
     dt_fim: str | None = None,
     limit: int = 50,
     offset: int = 0,
+    cursor: str | None = None,
 ):
     try:
-        from datetime import datetime
         with SessionLocal() as db:  # type: Session
-            tenant = _get_or_create_default_tenant(db)
+            tenant = _default_tenant()
             q = db.query(MessageLog).filter(MessageLog.tenant_id == tenant.id)
             if to:
                 q = q.filter(MessageLog.to == to)
@@ -306,9 +299,10 @@ def list_message_logs(
                     q = q.filter(MessageLog.created_at <= dtf)
                 except Exception:
                     pass
-            q = q.order_by(MessageLog.id.desc()).limit(max(1, min(limit, 200))).offset(max(0, offset))
-            rows = q.all()
-            return [
+            limit = max(1, min(limit, 200))
+            q = _LOGS_KEYSET.apply(q, cursor, limit, max(0, offset))
+            rows, next_cursor = _LOGS_KEYSET.page(q.all(), limit, lambda r: (r.created_at, r.id))
+            items = [
                 {
                     "id": r.id,
                     "to": r.to,
@@ -321,6 +315,7 @@ def list_message_logs(
                 }
                 for r in rows
             ]
+            return respond(items, next_cursor, cursor, response)
     except HTTPException:
         raise
     except Exception as e:
@@ -332,7 +327,7 @@ def list_message_logs(
 def add_suppressed_contact(payload: SuppressIn):
     try:
         with SessionLocal() as db:  # type: Session
-            tenant = _get_or_create_default_tenant(db)
+            tenant = _default_tenant()
             wa_id = (payload.wa_id or "").strip()
             if not wa_id:
                 raise HTTPException(status_code=400, detail="wa_id_required")
@@ -362,7 +357,7 @@ def add_suppressed_contact(payload: SuppressIn):
 def remove_suppressed_contact(wa_id: str):
     try:
         with SessionLocal() as db:  # type: Session
-            tenant = _get_or_create_default_tenant(db)
+            tenant = _default_tenant()
             wa_id_ = (wa_id or "").strip()
             if not wa_id_:
                 raise HTTPException(status_code=400, detail="wa_id_required")
@@ -384,31 +379,9 @@ def remove_suppressed_contact(wa_id: str):
 def window_status(wa_id: str):
     """Retorna se o contato está dentro da janela de 24h e quando foi a última inbound."""
     try:
-        from datetime import datetime, timedelta, timezone
         with SessionLocal() as db:  # type: Session
-            tenant = _get_or_create_default_tenant(db)
-            contact = db.query(Contact).filter(Contact.tenant_id == tenant.id, Contact.wa_id == wa_id).first()
-            if not contact:
-                return {"inside_window": False, "last_inbound_at": None, "hours_since": None}
-            last_inbound = (
-                db.query(Message)
-                .filter(
-                    Message.tenant_id == tenant.id,
-                    Message.direction == MessageDirection.inbound,
-                    Message.conversation_id.in_(db.query(Conversation.id).filter(Conversation.contact_id == contact.id)),
-                )
-                .order_by(Message.created_at.desc())
-                .first()
-            )
-            if not last_inbound:
-                return {"inside_window": False, "last_inbound_at": None, "hours_since": None}
-            now = datetime.now(timezone.utc)
-            li = last_inbound.created_at
-            if li.tzinfo is None:
-                li = li.replace(tzinfo=timezone.utc)
-            delta_h = (now - li).total_seconds() / 3600.0
-            inside = delta_h <= settings.WINDOW_24H_HOURS
-            return {"inside_window": inside, "last_inbound_at": li, "hours_since": round(delta_h, 2)}
+            tenant = _default_tenant()
+            return window_oracle.window_status(window_oracle.last_inbound_at(db, tenant.id, wa_id))
     except HTTPException:
         raise
     except Exception as e:
@@ -416,16 +389,50 @@ def window_status(wa_id: str):
         raise HTTPException(status_code=400, detail="window_status_error")
 
 
-@router.get("/users", response_model=list[UserOut])
-def list_users(role: UserRole | None = None, is_active: bool | None = None, limit: int = 50, offset: int = 0):
+class WindowStatusBulkIn(BaseModel):
+    wa_ids: list[str]
+
+
+@router.post("/messaging/window-status/bulk")
+def window_status_bulk(payload: WindowStatusBulkIn):
+    """Status da janela de 24h para muitos contatos numa chamada (planejamento de campanhas)."""
+    if len(payload.wa_ids) > 50000:
+        raise HTTPException(status_code=400, detail="too_many_wa_ids")
+    try:
+        from datetime import datetime
+        with SessionLocal() as db:  # type: Session
+            tenant = _default_tenant()
+            lasts = window_oracle.bulk_last_inbound(db, tenant.id, payload.wa_ids)
+        now = datetime.utcnow()
+        results = {w: window_oracle.window_status(at, now) for w, at in lasts.items()}
+        inside = sum(1 for r in results.values() if r["inside_window"])
+        return {"total": len(results), "inside_window": inside, "results": results}
+    except HTTPException:
+        raise
+    except Exception as e:
+        log.error("window_status_bulk_error", error=str(e))
+        raise HTTPException(status_code=400, detail="window_status_error")
+
+
+@router.get("/users", response_model=list[UserOut] | UserPage)
+def list_users(
+    response: Response,
+    role: UserRole | None = None,
+    is_active: bool | None = None,
+    limit: int = 50,
+    offset: int = 0,
+    cursor: str | None = None,
+):
     with SessionLocal() as db:  # type: Session
         q = db.query(User)
         if role is not None:
             q = q.filter(User.role == role)
         if is_active is not None:
             q = q.filter(User.is_active == is_active)
-        q = q.order_by(User.id.asc()).limit(max(1, min(limit, 200))).offset(max(0, offset))
-        return q.all()
+        limit = max(1, min(limit, 200))
+        q = _USERS_KEYSET.apply(q, cursor, limit, max(0, offset))
+        rows, next_cursor = _USERS_KEYSET.page(q.all(), limit, lambda u: (u.id,))
+        return respond([UserOut.model_validate(u) for u in rows], next_cursor, cursor, response)
 
 
 @router.patch("/users/{user_id}", response_model=UserOut)
@@ -449,3 +456,54 @@ def update_user(user_id: int, payload: UserUpdate):
         db.commit()
         db.refresh(user)
         return user
+
+
+# ------------------- Tenant: configurações -------------------
+class TenantSettingsIn(BaseModel):
+    settings: dict
+
+
+@router.get("/tenant/settings")
+def get_tenant_settings():
+    tenant = _default_tenant()
+    return {"tenant": tenant.name, "timezone": tenant.timezone, "settings": dict(tenant.settings)}
+
+
+@router.patch("/tenant/settings")
+def update_tenant_settings(payload: TenantSettingsIn):
+    """Mescla as chaves em settings_json (valor null remove a chave) e invalida o cache de tenants em todos os processos."""
+    flow = payload.settings.get("bot_flow")
+    if isinstance(flow, str) and flow not in BUILTIN_FLOWS:
+        raise HTTPException(status_code=400, detail="bot_flow_unknown")
+    if isinstance(flow, dict):
+        try:
+            compile_flow(flow)
+        except (ValueError, TypeError, AttributeError) as e:
+            raise HTTPException(status_code=400, detail=f"bot_flow_invalid: {e}")
+    retention = payload.settings.get("retention_months")
+    if retention is not None and (isinstance(retention, bool) or not isinstance(retention, int) or retention < 0):
+        raise HTTPException(status_code=400, detail="retention_months_invalid")
+    area_code = payload.settings.get("default_area_code")
+    if area_code is not None and not (isinstance(area_code, str) and re.fullmatch(r"[1-9]{2}", area_code)):
+        raise HTTPException(status_code=400, detail="default_area_code_invalid")
+    try:
+        with SessionLocal() as db:  # type: Session
+            tenant = db.get(Tenant, _default_tenant().id)
+            if tenant is None:
+                raise HTTPException(status_code=404, detail="tenant_not_found")
+            merged = dict(tenant.settings_json or {})
+            for key, value in payload.settings.items():
+                if value is None:
+                    merged.pop(key, None)
+                else:
+                    merged[key] = value
+            tenant.settings_json = merged
+            db.commit()
+            name = tenant.name
+        invalidate_tenant(name)
+        return {"tenant": name, "settings": merged}
+    except HTTPException:
+        raise
+    except Exception as e:
+        log.error("tenant_settings_update_error", error=str(e))
+        raise HTTPException(status_code=400, detail="tenant_settings_update_error")
@@ -1,6 +1,7 @@
 from fastapi import APIRouter, HTTPException
 import httpx
 from app.core.config import settings
+from app.core.metrics import timed_external
 
 router = APIRouter()
 
@@ -28,7 +29,8 @@ async def llm_ping():
     async with httpx.AsyncClient(timeout=5) as client:
         for base in _candidate_urls():
             try:
-                r = await client.get(f"{base}/api/tags")
+                with timed_external("ollama", "ping"):
+                    r = await client.get(f"{base}/api/tags")
                 attempts.append({"url": base, "status": r.status_code})
                 if r.status_code == 200:
                     return {"ok": True, "used_url": base, "attempts": attempts}
@@ -58,7 +60,8 @@ async def llm_generate(payload: dict):
     async with httpx.AsyncClient(timeout=60) as client:
         for base in _candidate_urls():
             try:
-                r = await client.post(f"{base}/api/generate", json=body)
+                with timed_external("ollama", "generate"):
+                    r = await client.post(f"{base}/api/generate", json=body)
                 if r.status_code == 200:
                     data = r.json()
                     return {"model": model, "response": data.get("response", ""), "raw": data, "used_url": base}
@@ -85,7 +88,8 @@ async def llm_chat(payload: dict):
     async with httpx.AsyncClient(timeout=60) as client:
         for base in _candidate_urls():
             try:
-                r = await client.post(f"{base}/api/chat", json=body)
+                with timed_external("ollama", "chat"):
+                    r = await client.post(f"{base}/api/chat", json=body)
                 if r.status_code == 200:
                     data = r.json()
                     data["used_url"] = base
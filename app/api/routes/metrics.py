@@ -1,7 +1,14 @@
 from __future__ import annotations
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, Query, Response
 from datetime import datetime, date
 
+from app.api.middleware import latency_snapshot
+from app.core.config import settings
+from app.core.metrics import render_latest
+from app.repositories import rollups
+from app.repositories.db import SessionLocal
+from app.repositories.tenants import get_tenant
+
 router = APIRouter()
 
 MES_LABELS_PT = [
@@ -10,47 +17,51 @@ MES_LABELS_PT = [
 ]
 
 
-@router.get("/overview", summary="Métricas gerais (dados sintéticos para dashboard)")
-async def metrics_overview(
+@router.get("", summary="Exposição Prometheus", include_in_schema=False)
+async def metrics_prometheus() -> Response:
+    body, content_type = render_latest()
+    return Response(content=body, media_type=content_type)
+
+
+@router.get("/overview", summary="Métricas gerais do dashboard (rollups pré-agregados)")
+def metrics_overview(
     period_months: int = Query(6, ge=1, le=12, description="Período em meses (1 a 12)"),
     channel: str | None = Query(None, description="Canal a filtrar (ex.: 'whatsapp')"),
     start_date: date | None = Query(None, description="Data inicial (YYYY-MM-DD)"),
     end_date: date | None = Query(None, description="Data final (YYYY-MM-DD)"),
 ):
-    # Determina labels mensais conforme filtros
-    labels: list[str]
+    # Meses do período: intervalo informado ou os últimos `period_months` até o mês corrente
     if start_date and end_date and start_date <= end_date:
-        # Gera labels de mês/ano no intervalo
-        labels = []
-        cur = date(start_date.year, start_date.month, 1)
-        endm = date(end_date.year, end_date.month, 1)
-        while cur <= endm and len(labels) < 24:  # limite sanidade
-            labels.append(MES_LABELS_PT[cur.month - 1])
-            # avança um mês
-            ny, nm = (cur.year + (cur.month // 12), 1 if cur.month == 12 else cur.month + 1)
-            cur = date(ny, nm, 1)
-        n = len(labels) if labels else 6
+        first, last = date(start_date.year, start_date.month, 1), end_date
+        lo = start_date
     else:
-        n = 12 if period_months > 6 else 6
-        labels = MES_LABELS_PT[:n]
+        today = datetime.utcnow().date()
+        m = today.year * 12 + today.month - 1 - (period_months - 1)
+        first, last = date(m // 12, m % 12 + 1, 1), today
+        lo = first
+    months: list[tuple[int, int]] = []
+    cur = first
+    while cur <= last and len(months) < 24:  # limite sanidade
+        months.append((cur.year, cur.month))
+        cur = date(cur.year + cur.month // 12, cur.month % 12 + 1, 1)
 
-    # Dados sintéticos; substitua por consulta real
-    base_leads = [12, 18, 25, 22, 30, 28, 26, 29, 31, 27, 24, 33]
-    base_conv = [80, 110, 95, 120, 130, 140, 135, 150, 145, 155, 160, 170]
-    base_rate = [8, 9, 11, 10, 12, 13, 12, 13, 12, 14, 13, 15]
-    leads = (base_leads * ((n // 12) + 1))[:n]
-    conversas = (base_conv * ((n // 12) + 1))[:n]
-    conversao = (base_rate * ((n // 12) + 1))[:n]
-
-    if channel and channel.lower() != "whatsapp":
-        conversas = [int(x * 0.9) for x in conversas]
+    tenant = get_tenant(settings.DEFAULT_TENANT_ID)
+    with SessionLocal() as db:
+        totals = rollups.monthly_totals(db, tenant.id, lo, last, channel.lower() if channel else None)
+    empty = dict.fromkeys(rollups.METRICS, 0)
+    series = [totals.get(ym, empty) for ym in months]
 
     return {
         "generated_at": datetime.utcnow().isoformat() + "Z",
-        "labels": labels,
-        "leads_por_mes": leads,
-        "conversas_whatsapp": conversas,
-        "taxa_conversao": conversao,
+        "labels": [MES_LABELS_PT[mo - 1] for _, mo in months],
+        "leads_por_mes": [s[rollups.LEADS] for s in series],
+        "conversas_whatsapp": [s[rollups.CONVERSATIONS] for s in series],
+        # % de leads que chegaram à pré-análise PAN
+        "taxa_conversao": [
+            round(100.0 * s[rollups.PAN_PREANALISE] / s[rollups.LEADS], 1) if s[rollups.LEADS] else 0 for s in series
+        ],
+        "mensagens_inbound": [s[rollups.INBOUND] for s in series],
+        "mensagens_outbound": [s[rollups.OUTBOUND] for s in series],
         "filters": {
             "period_months": period_months,
             "channel": channel,
@@ -58,3 +69,8 @@ async def metrics_overview(
             "end_date": end_date.isoformat() if end_date else None,
         },
     }
+
+
+@router.get("/http", summary="Latência HTTP por rota (histogramas deste processo)")
+async def metrics_http():
+    return {"generated_at": datetime.utcnow().isoformat() + "Z", "routes": latency_snapshot()}
@@ -1,15 +1,20 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Response
 from typing import Optional
 from sqlalchemy.orm import Session
-from sqlalchemy import select
+from app.api.pagination import Keyset, decode_cursor, respond
+from app.core.config import settings
 from app.repositories.db import SessionLocal
-from app.repositories import models as m
+from app.repositories import catalog_index, models as m
+from app.repositories.tenants import get_tenant
 
 router = APIRouter()
 
+_VEHICLES_KEYSET = Keyset(m.Vehicle.id)
+
 
 @router.get("/veiculos")
 def list_vehicles(
+    response: Response,
     categoria: Optional[str] = None,
     marca: Optional[str] = None,
     modelo: Optional[str] = None,
@@ -19,39 +24,31 @@ def list_vehicles(
     preco_max: Optional[float] = None,
     limit: int = 12,
     offset: int = 0,
+    cursor: Optional[str] = None,
 ):
+    """Catálogo do tenant, filtrado no índice em memória (repositories.catalog_index)."""
     try:
-        with SessionLocal() as db:  # type: Session
-            stmt = select(m.Vehicle).where(m.Vehicle.active == True)  # noqa: E712
-            if categoria:
-                stmt = stmt.where(m.Vehicle.category == categoria.upper())
-            if marca:
-                stmt = stmt.where(m.Vehicle.brand.ilike(f"%{marca}%"))
-            if modelo:
-                stmt = stmt.where(m.Vehicle.model.ilike(f"%{modelo}%"))
-            if ano_min is not None:
-                stmt = stmt.where(m.Vehicle.year >= int(ano_min))
-            if ano_max is not None:
-                stmt = stmt.where(m.Vehicle.year <= int(ano_max))
-            if preco_min is not None:
-                stmt = stmt.where(m.Vehicle.price >= float(preco_min))
-            if preco_max is not None:
-                stmt = stmt.where(m.Vehicle.price <= float(preco_max))
-            stmt = stmt.order_by(m.Vehicle.id.desc()).limit(max(1, min(limit, 48))).offset(max(0, offset))
-            rows = db.execute(stmt).scalars().all()
-            return [
-                {
-                    "id": r.id,
-                    "titulo": r.title,
-                    "marca": r.brand,
-                    "modelo": r.model,
-                    "ano": r.year,
-                    "categoria": r.category,
-                    "preco": r.price,
-                    "imagem": r.image_url,
-                }
-                for r in rows
-            ]
+        limit = max(1, min(limit, 48))
+        after_id = None
+        if cursor:
+            after_id = decode_cursor(cursor, 1)[0]
+            if not isinstance(after_id, int) or isinstance(after_id, bool):
+                raise HTTPException(status_code=400, detail="invalid_cursor")
+        snapshot = catalog_index.get_snapshot(get_tenant(settings.DEFAULT_TENANT_ID).id)
+        items = snapshot.search(
+            categoria=categoria,
+            marca=marca,
+            modelo=modelo,
+            ano_min=ano_min,
+            ano_max=ano_max,
+            preco_min=preco_min,
+            preco_max=preco_max,
+            after_id=after_id,
+            offset=0 if cursor else max(0, offset),
+            limit=limit + 1,
+        )
+        rows, next_cursor = _VEHICLES_KEYSET.page(items, limit, lambda v: (v["id"],))
+        return respond(rows, next_cursor, cursor, response)
     except HTTPException:
         raise
     except Exception as e:
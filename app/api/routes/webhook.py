@@ -6,11 +6,18 @@ import structlog
 import os
 import hmac
 import hashlib
+import time
+import json
 from app.repositories.db import SessionLocal
+from app.core.metrics import WEBHOOK_BATCH_SECONDS
+from app.core.redis_client import get_redis
+from app.messaging.dedup import get_deduplicator
+from app.messaging.inbound import InboundText, decode_payload, iter_text_messages
+from app.messaging.partitioning import split_payload, stream_key
+from app.messaging.statuses import get_status_coalescer
 import redis
 from sqlalchemy.orm import Session
-from sqlalchemy import select
-from app.repositories import models as core_models
+from app.domain.bot import reply_to
 try:
     # Importa modelos de imóveis apenas quando o domínio estiver habilitado
     if settings.REAL_ESTATE_ENABLED:
@@ -26,17 +33,12 @@ from typing import Literal
 
 router = APIRouter()
 log = structlog.get_logger()
-_r: redis.Redis | None = None
 # Compatibilidade com testes antigos: tarefa opcional de buffer
 buffer_incoming_message = None  # type: ignore
 
 
 def _redis() -> redis.Redis:
-    global _r
-    if _r is None:
-        # Usa REDIS_URL das settings
-        _r = redis.from_url(settings.REDIS_URL, decode_responses=True)
-    return _r
+    return get_redis()
 
 
 @router.get("")
@@ -59,7 +61,6 @@ async def verify(
 @router.post("")
 async def receive(request: Request):
     # Read raw body to handle different encodings safely
-    import json  # local import to avoid global overhead
     body_bytes: bytes = await request.body()
     # Optional: validate HMAC from Meta if secret configured
     try:
@@ -94,17 +95,20 @@ async def receive(request: Request):
                 host=host,
                 is_test_client=is_test_client,
             )
-    payload = None
     if not body_bytes:
         log.error("webhook_json_error", error="empty body")
         return {"received": True, "error": "invalid_json"}
-    for enc in ("utf-8", "utf-8-sig", "latin-1"):
+
+    # Modo stream: só anexa o evento bruto ao Redis Stream e responde; o consumidor faz o resto
+    if settings.WEBHOOK_INGEST_MODE == "stream":
         try:
-            payload = json.loads(body_bytes.decode(enc))
-            break
-        except Exception:  # noqa: BLE001
-            payload = None
-            continue
+            _append_to_stream(body_bytes)
+            return {"received": True, "queued": True}
+        except Exception as e:  # noqa: BLE001
+            # Sem Redis: processa inline para não perder o evento
+            log.error("webhook_stream_append_error", error=str(e))
+
+    payload = decode_payload(body_bytes)
     if payload is None:
         try:
             # As a last resort, try FastAPI's parser
@@ -115,328 +119,113 @@ async def receive(request: Request):
 
     log.info("webhook_received", payload=payload)
 
-    # Extrair texto e wa_id do payload do WhatsApp
     try:
-        entries = payload.get("entry", []) or []
-        for entry in entries:
-            changes = entry.get("changes", []) or []
-            for change in changes:
-                value = change.get("value", {}) or {}
-                messages = value.get("messages", []) or []
-                contacts = value.get("contacts", []) or []
-                wa_id = None
-                if contacts:
-                    wa_id = contacts[0].get("wa_id") or contacts[0].get("wa_id")
-                for msg in messages:
-                    if not wa_id:
-                        wa_id = msg.get("from")
-                    if msg.get("type") != "text":
-                        continue
-                    # Idempotência: se já processamos esta mensagem, ignore
-                    msg_id = msg.get("id") or ""
-                    if msg_id:
-                        r = _redis()
-                        dedup_key = f"wh:dedup:{msg_id}"
-                        if r.get(dedup_key):
-                            log.info("webhook_duplicated_msg", msg_id=msg_id)
-                            continue
-                        # marca como visto por 2 minutos
-                        r.setex(dedup_key, 120, "1")
-                    text_in = (msg.get("text", {}) or {}).get("body", "").strip()
-                    if not text_in:
-                        continue
-
-                    # Compat: se existir tarefa de buffer, enfileira e segue
-                    try:
-                        if buffer_incoming_message is not None:
-                            log.info(
-                                "buffer_enqueue_call",
-                                tenant=settings.DEFAULT_TENANT_ID,
-                                wa_id=wa_id or "unknown",
-                                text=text_in,
-                            )
-                            buffer_incoming_message.delay(
-                                settings.DEFAULT_TENANT_ID,
-                                wa_id or "unknown",
-                                text_in,
-                            )
-                    except Exception as e:  # noqa: BLE001
-                        log.error("buffer_enqueue_error", error=str(e))
-
-                    # Fluxo de resposta: se domínio imobiliário estiver habilitado, usa funil; caso contrário, orienta fluxo de veículos
-                    if settings.REAL_ESTATE_ENABLED and re_models is not None:
-                        with SessionLocal() as db:
-                            resp_text = _process_realestate_funnel(db, tenant_name=settings.DEFAULT_TENANT_ID, wa_id=wa_id or "unknown", user_text=text_in)
-                            # Enviar resposta via provider configurado (Meta Cloud por padrão)
-                            try:
-                                provider = get_provider()
-                                to = wa_id or ""
-                                if to:
-                                    provider.send_text(to=to, text=resp_text)
-                                log.info("bot_reply", wa_id=wa_id, reply=resp_text)
-                            except Exception as e:  # noqa: BLE001
-                                log.error("bot_reply_error", error=str(e))
-                    else:
-                        # Modo veículos (POC): mensagem padrão de orientação
-                        try:
-                            provider = get_provider()
-                            to = wa_id or ""
-                            if to:
-                                provider.send_text(
-                                    to=to,
-                                    text=(
-                                        "Olá! Para iniciar a análise, envie:\n"
-                                        "• cpf 00000000000\n"
-                                        "• opcional: categoria USADO | NOVO | MOTOS\n"
-                                        "Para encerrar, digite SAIR."
-                                    ),
-                                )
-                            log.info("bot_reply_vehicle_hint", wa_id=wa_id)
-                        except Exception as e:  # noqa: BLE001
-                            log.error("bot_reply_error", error=str(e))
+        process_payload(payload)
         return {"received": True}
     except Exception as e:  # noqa: BLE001
         log.error("webhook_process_error", error=str(e))
         return {"received": True, "error": "processing"}
 
 
-class PaymentEvent(BaseModel):
-    order_id: int
-    payment_id: str | None = None
-    status: Literal["paid"]
-
-
- 
-def _normalize_text(s: str) -> str:
-    return s.strip().lower()
-
-
-def _ensure_tenant(db: Session, tenant_name: str) -> core_models.Tenant:
-    stmt = select(core_models.Tenant).where(core_models.Tenant.name == tenant_name)
-    tenant = db.execute(stmt).scalar_one_or_none()
-    if not tenant:
-        tenant = core_models.Tenant(name=tenant_name)
-        db.add(tenant)
-        db.commit()
-        db.refresh(tenant)
-    return tenant
-
-
-def _ensure_contact(db: Session, tenant_id: int, wa_id: str) -> core_models.Contact:
-    stmt = select(core_models.Contact).where(
-        core_models.Contact.tenant_id == tenant_id,
-        core_models.Contact.wa_id == wa_id,
-    )
-    c = db.execute(stmt).scalar_one_or_none()
-    if not c:
-        c = core_models.Contact(tenant_id=tenant_id, wa_id=wa_id)
-        db.add(c)
-        db.commit()
-        db.refresh(c)
-    return c
-
-
-def _ensure_conversation(db: Session, tenant_id: int, contact_id: int) -> core_models.Conversation:
-    stmt = (
-        select(core_models.Conversation)
-        .where(
-            core_models.Conversation.tenant_id == tenant_id,
-            core_models.Conversation.contact_id == contact_id,
-            core_models.Conversation.status == core_models.ConversationStatus.active_bot,
+def _append_to_stream(body_bytes: bytes) -> None:
+    """XADD do evento; com partições, cada contato vai para o shard do seu wa_id (ordem por contato)."""
+    ts = f"{time.time():.3f}"
+    if settings.WEBHOOK_STREAM_PARTITIONS <= 1:
+        _redis().xadd(
+            settings.WEBHOOK_STREAM_KEY,
+            {"body": body_bytes, "ts": ts},
+            maxlen=settings.WEBHOOK_STREAM_MAXLEN,
+            approximate=True,
         )
-        .order_by(core_models.Conversation.id.desc())
-    )
-    conv = db.execute(stmt).scalar_one_or_none()
-    if not conv:
-        conv = core_models.Conversation(
-            tenant_id=tenant_id,
-            contact_id=contact_id,
-            status=core_models.ConversationStatus.active_bot,
-            last_state=None,
+        return
+    payload = decode_payload(body_bytes)
+    parts = split_payload(payload) if payload is not None else {0: None}
+    pipe = _redis().pipeline(transaction=False)
+    for partition, part in parts.items():
+        body = body_bytes if part is None or part is payload else json.dumps(part, ensure_ascii=False)
+        pipe.xadd(
+            stream_key(partition),
+            {"body": body, "ts": ts},
+            maxlen=settings.WEBHOOK_STREAM_MAXLEN,
+            approximate=True,
         )
-        db.add(conv)
-        db.commit()
-        db.refresh(conv)
-    return conv
-
-
-def _record_event(db: Session, conversation_id: int, type_: str, payload: dict) -> None:
-    db.add(core_models.ConversationEvent(conversation_id=conversation_id, type=type_, payload=payload))
-    db.commit()
-
+    pipe.execute()
 
-def _parse_price(text: str) -> tuple[float | None, float | None]:
-    # aceita formatos simples: "2000-3500" ou "ate 3000" ou "3000"
-    t = _normalize_text(text).replace("r$", "").replace(" ", "")
-    if "-" in t:
-        parts = t.split("-", 1)
-        try:
-            return float(parts[0]), float(parts[1])
-        except Exception:
-            return None, None
-    if t.startswith("ate"):
-        try:
-            return None, float(t.replace("ate", ""))
-        except Exception:
-            return None, None
-    try:
-        v = float(t)
-        return v, v
-    except Exception:
-        return None, None
 
+def _is_duplicate(msg_id: str) -> bool:
+    """Idempotência: marca a mensagem como vista (WEBHOOK_DEDUP_TTL_S); True se já processada."""
+    return get_deduplicator().is_duplicate(msg_id)
 
-def _process_realestate_funnel(db: Session, tenant_name: str, wa_id: str, user_text: str) -> str:
-    """State machine mínima para coletar filtros de busca e retornar imóveis.
 
-    Estados: purpose -> location_city -> location_state -> type -> bedrooms -> price -> done
-    """
-    tenant = _ensure_tenant(db, tenant_name)
-    contact = _ensure_contact(db, tenant.id, wa_id)
-    conv = _ensure_conversation(db, tenant.id, contact.id)
+def drop_duplicates(items: list[InboundText]) -> list[InboundText]:
+    """Remove mensagens já vistas (e repetidas no próprio lote); as ids vão ao Redis num único pipeline."""
+    dup = get_deduplicator().duplicates(item.msg_id for item in items if item.msg_id)
+    out: list[InboundText] = []
+    for item in items:
+        if item.msg_id:
+            if item.msg_id in dup:
+                log.info("webhook_duplicated_msg", msg_id=item.msg_id)
+                continue
+            dup.add(item.msg_id)  # próximas ocorrências no lote são repetição
+        out.append(item)
+    return out
 
-    text = _normalize_text(user_text)
 
-    # Recuperar progresso anterior
-    last = conv.last_state or "purpose"
-    criteria: dict = {}
-    # Buscar último event de tipo re_funnel se existir
-    stmt = (
-        select(core_models.ConversationEvent)
-        .where(
-            core_models.ConversationEvent.conversation_id == conv.id,
-            core_models.ConversationEvent.type == "re_funnel",
-        )
-        .order_by(core_models.ConversationEvent.id.desc())
-    )
-    ev = db.execute(stmt).scalar_one_or_none()
-    if ev and isinstance(ev.payload, dict):
-        criteria = dict(ev.payload)
+def process_payload(payload: dict) -> None:
+    """Processa um payload do webhook: status de entrega (em lote) e mensagens de texto (dedup + bot)."""
+    with WEBHOOK_BATCH_SECONDS.labels("inline").time():
+        get_status_coalescer().add_payload(payload)
+        for item in drop_duplicates(list(iter_text_messages(payload))):
+            handle_text_message(item.wa_id, item.text)
 
-    def save_criteria(next_state: str) -> None:
-        conv.last_state = next_state
-        db.add(conv)
-        _record_event(db, conv.id, "re_funnel", criteria)
 
-    # State: purpose (compra/locação)
-    if last == "purpose":
-        if text in {"compra", "comprar", "venda", "buy", "sale"}:
-            criteria["purpose"] = "sale"
-            save_criteria("location_city")
-            return "Legal! Você quer comprar. Me diga a cidade (ex: São Paulo)."
-        if text in {"locacao", "locação", "aluguel", "alugar", "rent"}:
-            criteria["purpose"] = "rent"
-            save_criteria("location_city")
-            return "Perfeito! Você quer alugar. Qual a cidade?"
-        return "Olá! Você procura compra ou locação?"
-
-    # State: cidade
-    if last == "location_city":
-        if len(text) < 2:
-            return "Informe a cidade (ex: Campinas)."
-        criteria["city"] = user_text.strip()
-        save_criteria("location_state")
-        return "Anotado. Qual o estado (UF)? (ex: SP)"
-
-    # State: estado
-    if last == "location_state":
-        uf = text.upper().replace(" ", "")
-        if len(uf) != 2:
-            return "Informe a UF com 2 letras (ex: SP)."
-        criteria["state"] = uf
-        save_criteria("type")
-        return "Certo. Prefere apartamento ou casa?"
-
-    # State: tipo
-    if last == "type":
-        if text in {"ap", "apto", "apartamento", "apartment"}:
-            criteria["type"] = "apartment"
-        elif text in {"casa", "house"}:
-            criteria["type"] = "house"
-        else:
-            return "Digite 'apartamento' ou 'casa'."
-        save_criteria("bedrooms")
-        return "Quantos dormitórios? (ex: 2)"
-
-    # State: dormitórios
-    if last == "bedrooms":
-        try:
-            n = int("".join(ch for ch in text if ch.isdigit()))
-            criteria["bedrooms"] = n
-            save_criteria("price")
-            return "Qual a faixa de preço? (ex: 2000-3500 ou 'ate 3000')"
-        except Exception:
-            return "Informe um número de dormitórios (ex: 2)."
-
-    # State: preço e busca
-    if last == "price":
-        min_p, max_p = _parse_price(user_text)
-        if min_p is not None:
-            criteria["min_price"] = min_p
-        if max_p is not None:
-            criteria["max_price"] = max_p
-
-        # Criar lead e inquiry
-        lead = re_models.Lead(
-            tenant_id=tenant.id,
-            name=None,
-            phone=None,
-            email=None,
-            source="whatsapp",
-            preferences=criteria,
-            consent_lgpd=False,
-        )
-        db.add(lead)
-        db.commit()
-        db.refresh(lead)
-
-        inquiry = re_models.Inquiry(
-            tenant_id=tenant.id,
-            lead_id=lead.id,
-            property_id=None,
-            type=re_models.InquiryType.buy if criteria.get("purpose") == "sale" else re_models.InquiryType.rent,
-            status=re_models.InquiryStatus.new,
-            payload=criteria,
-        )
-        db.add(inquiry)
-        db.commit()
-
-        # Buscar imóveis
-        stmt = select(re_models.Property).where(re_models.Property.is_active == True)  # noqa: E712
-        if criteria.get("purpose"):
-            stmt = stmt.where(re_models.Property.purpose == re_models.PropertyPurpose(criteria["purpose"]))
-        if criteria.get("type"):
-            stmt = stmt.where(re_models.Property.type == re_models.PropertyType(criteria["type"]))
-        if criteria.get("city"):
-            stmt = stmt.where(re_models.Property.address_city.ilike(criteria["city"]))
-        if criteria.get("state"):
-            stmt = stmt.where(re_models.Property.address_state == criteria["state"])
-        if criteria.get("bedrooms") is not None:
-            stmt = stmt.where(re_models.Property.bedrooms >= int(criteria["bedrooms"]))
-        if criteria.get("min_price") is not None:
-            stmt = stmt.where(re_models.Property.price >= float(criteria["min_price"]))
-        if criteria.get("max_price") is not None:
-            stmt = stmt.where(re_models.Property.price <= float(criteria["max_price"]))
+def handle_text_message(wa_id: str, text_in: str) -> None:
+    """Executa a lógica do bot para uma mensagem de texto já deduplicada."""
+    # Compat: se existir tarefa de buffer, enfileira e segue
+    try:
+        if buffer_incoming_message is not None:
+            log.info(
+                "buffer_enqueue_call",
+                tenant=settings.DEFAULT_TENANT_ID,
+                wa_id=wa_id or "unknown",
+                text=text_in,
+            )
+            buffer_incoming_message.delay(
+                settings.DEFAULT_TENANT_ID,
+                wa_id or "unknown",
+                text_in,
+            )
+    except Exception as e:  # noqa: BLE001
+        log.error("buffer_enqueue_error", error=str(e))
 
-        stmt = stmt.limit(5)
-        rows = db.execute(stmt).scalars().all()
+    # Fluxo de resposta: motor de fluxos do bot (funil de imóveis se o domínio estiver habilitado; veículos caso contrário)
+    default_flow = "realestate" if settings.REAL_ESTATE_ENABLED and re_models is not None else "vehicles"
+    try:
+        with SessionLocal() as db:
+            resp_text = reply_to(db, settings.DEFAULT_TENANT_ID, wa_id or "unknown", text_in, default_flow)
+    except Exception as e:  # noqa: BLE001
+        log.error("bot_flow_error", error=str(e), flow=default_flow)
+        return
+    # Enviar resposta via provider configurado (Meta Cloud por padrão)
+    try:
+        provider = get_provider()
+        to = wa_id or ""
+        if to and resp_text:
+            provider.send_text(to=to, text=resp_text)
+        log.info("bot_reply", wa_id=wa_id, flow=default_flow, reply=resp_text)
+    except Exception as e:  # noqa: BLE001
+        log.error("bot_reply_error", error=str(e))
 
-        conv.last_state = "done"
-        db.add(conv)
-        db.commit()
 
-        if not rows:
-            return "Obrigado! Registrei sua preferência. No momento não encontrei imóveis com esse perfil. Quer ajustar a faixa de preço ou dormitórios?"
+class PaymentEvent(BaseModel):
+    order_id: int
+    payment_id: str | None = None
+    status: Literal["paid"]
 
-        lines = ["Encontrei estas opções:"]
-        for p in rows:
-            lines.append(f"#{p.id} - {p.title} | R$ {p.price:,.0f} | {p.address_city}-{p.address_state}")
-        lines.append("Deseja ver mais detalhes? Envie o número do imóvel (ex: 3).")
-        return "\n".join(lines)
 
-    # State final ou desconhecido: reinicia
-    conv.last_state = "purpose"
-    db.add(conv)
-    db.commit()
-    return "Vamos começar! Você procura compra ou locação?"
+def _process_realestate_funnel(db: Session, tenant_name: str, wa_id: str, user_text: str) -> str:
+    """Funil de imóveis (purpose -> location_city -> location_state -> type -> bedrooms -> price -> done).
 
+    Definido declarativamente em `domain.bot.flows.REALESTATE_FLOW`; mantido por compatibilidade.
+    """
+    return reply_to(db, tenant_name, wa_id, user_text, "realestate")
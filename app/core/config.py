@@ -10,6 +10,19 @@ class Settings(BaseSettings):
     API_HOST: str = "0.0.0.0"
     API_PORT: int = 8000
     DEFAULT_TENANT_ID: str = "default"
+    # Access log HTTP: fração das requisições logadas (5xx e lentas sempre) e limite de "lenta"
+    ACCESS_LOG_SAMPLE_RATE: float = 0.1
+    ACCESS_LOG_SLOW_MS: float = 1000.0
+    # Logging: sync (stdout direto) | async (orjson + thread de escrita com fila)
+    LOG_MODE: str = "sync"
+    LOG_QUEUE_MAX: int = 10000
+    # Fração mantida por evento (info/debug; warning+ sempre). JSON no .env: {"webhook_received": 0.01}
+    # Sem valor: nenhuma amostragem em sync; webhook_received a 1% em async
+    LOG_SAMPLE_RATES: dict[str, float] | None = None
+    LOG_MAX_FIELD_CHARS: int = 4096
+    # Prometheus: filas do Celery (listas no Redis) medidas na coleta; porta de exposição dos workers (0 = desligado)
+    METRICS_CELERY_QUEUES: str = "celery"
+    METRICS_WORKER_PORT: int = 0
 
     # WhatsApp Cloud API
     WA_VERIFY_TOKEN: str = "changeme"
@@ -18,6 +31,12 @@ class Settings(BaseSettings):
     WA_API_BASE: str = "https://graph.facebook.com/v20.0"
     # Provider de mensageria: meta|twilio (usar 'meta' por padrão)
     WA_PROVIDER: str = "meta"
+    # Envio outbound: celery (uma task por mensagem) | async (fila Redis + engine asyncio)
+    WA_OUTBOUND_MODE: str = "celery"
+    WA_OUTBOUND_QUEUE_KEY: str = "wa:outbound"
+    WA_OUTBOUND_CONCURRENCY: int = 200  # envios simultâneos por processo do engine
+    WA_OUTBOUND_MAX_ATTEMPTS: int = 5
+    WA_HTTP2: bool = True
     # Optional: HMAC secret to validate webhook signatures (X-Hub-Signature-256)
     WA_WEBHOOK_SECRET: str = ""
 
@@ -34,6 +53,39 @@ class Settings(BaseSettings):
     REDIS_HOST: str = "redis"
     REDIS_PORT: int = 6379
     REDIS_DB: int = 0
+    REDIS_MAX_CONNECTIONS: int = 50
+    REDIS_SOCKET_TIMEOUT: float = 5.0
+
+    # Cache de tenants em memória (invalidação entre processos via pub/sub)
+    TENANT_CACHE_TTL_S: float = 60.0
+    TENANT_CACHE_MAX: int = 1000
+    TENANT_CACHE_CHANNEL: str = "tenants:invalidate"
+
+    # Ingestão do webhook: inline (processa na requisição) | stream (ack rápido + Redis Stream)
+    WEBHOOK_INGEST_MODE: str = "inline"
+    WEBHOOK_STREAM_KEY: str = "wh:events"
+    WEBHOOK_STREAM_MAXLEN: int = 100000  # corte aproximado (MAXLEN ~)
+    WEBHOOK_STREAM_GROUP: str = "wh-workers"
+    # Shards por wa_id (hash consistente): ordem por contato, contatos em paralelo. 1 = stream único
+    WEBHOOK_STREAM_PARTITIONS: int = 1
+    WEBHOOK_PARTITION_LEASE_MS: int = 30000
+    WEBHOOK_CONSUMER_BATCH: int = 100
+    WEBHOOK_CONSUMER_BLOCK_MS: int = 1000
+    # Entradas pendentes há mais que isso (worker caiu) são reassumidas por outro consumidor
+    WEBHOOK_CONSUMER_RECLAIM_IDLE_MS: int = 60000
+    # Após N entregas sem ack, o evento vai para a DLQ (<stream>:dlq)
+    WEBHOOK_CONSUMER_MAX_DELIVERIES: int = 5
+    # Idempotência por id de mensagem: SET NX EX em lote no Redis + LRU local na frente
+    WEBHOOK_DEDUP_TTL_S: int = 120
+    WEBHOOK_DEDUP_LOCAL_MAX: int = 10000
+
+    # Agregação de mensagens inbound (uma gravação por rajada de fragmentos)
+    INBOUND_AGG_WINDOW_S: float = 2.0  # padrão; por tenant em settings_json["inbound_agg_window_s"]
+    INBOUND_AGG_DUE_KEY: str = "agg:due"  # sorted set: buffer -> prazo de flush (epoch ms)
+    INBOUND_AGG_FLUSH_BATCH: int = 200
+    INBOUND_AGG_PROCESSING_KEY: str = "agg-processing"  # sorted set: buffer retirado -> instante (epoch ms)
+    INBOUND_AGG_STALE_S: float = 120.0  # retirado há mais que isso sem ack: o poller redespacha
+    INBOUND_AGG_POLL_S: float = 1.0
 
     # Chatbot – boas práticas
     # Janela de sessão: mensagens livres somente dentro de 24h desde a última mensagem do cliente
@@ -42,6 +94,49 @@ class Settings(BaseSettings):
     # Rate limit
     WA_RATE_LIMIT_PER_CONTACT_SECONDS: int = 2  # 1 msg a cada 2s por contato
     WA_RATE_LIMIT_GLOBAL_PER_MINUTE: int = 60   # teto global por tenant/minuto
+    # Write-behind do message_logs: grava em lote a cada N ms ou M registros
+    MSGLOG_FLUSH_INTERVAL_MS: int = 200
+    MSGLOG_FLUSH_MAX_ITEMS: int = 500
+    # Status de entrega (sent/delivered/read/failed) do webhook: coalescidos e aplicados em lote
+    STATUS_FLUSH_INTERVAL_MS: int = 500
+    STATUS_FLUSH_MAX_ITEMS: int = 2000
+    # Flushes em que um status sem linha (ou de um flush com erro) ainda é reaplicado antes de ser descartado
+    STATUS_MAX_RETRIES: int = 20
+    # Estado do funil por conversa: hash no Redis (TTL) + persistência em lote em conversations
+    FUNNEL_STATE_TTL_S: int = 86400
+    FUNNEL_STATE_FLUSH_INTERVAL_MS: int = 500
+    FUNNEL_STATE_FLUSH_MAX_ITEMS: int = 1000
+    # Rollups de métricas de negócio (hora/dia): incrementos em lote; cache de leitura do /metrics/overview
+    ROLLUP_FLUSH_INTERVAL_MS: int = 1000
+    ROLLUP_FLUSH_MAX_ITEMS: int = 5000
+    METRICS_OVERVIEW_CACHE_TTL_S: float = 30.0
+    # Particionamento mensal (Postgres) de messages/message_logs/conversation_events e retenção.
+    # Retenção por tenant: settings_json["retention_months"]; 0 = sem expiração.
+    PARTITION_PREMAKE_MONTHS: int = 3
+    PARTITION_MAINTENANCE_INTERVAL_S: float = 21600.0
+    PARTITION_EXPIRED_ACTION: str = "detach"  # detach (mantém a tabela para arquivamento) | drop
+    RETENTION_MONTHS_DEFAULT: int = 0
+    # Arquivo frio (NDJSON comprimido): diretório local (file:///...) ou s3://bucket/prefixo; vazio = desligado
+    ARCHIVE_URL: str = ""
+    ARCHIVE_S3_ENDPOINT_URL: str = ""
+    ARCHIVE_CODEC: str = "zstd"  # zstd (pacote zstandard) | gzip
+    ARCHIVE_AFTER_MONTHS: int = 0  # arquiva linhas vivas mais antigas que N meses; 0 = só partições desanexadas
+    ARCHIVE_SEGMENT_MAX_ROWS: int = 100000
+    ARCHIVE_INTERVAL_S: float = 86400.0
+    # Imports CSV (leads/veículos) em background: linhas por lote (upsert + checkpoint + commit por lote).
+    # IMPORT_DIR precisa ser compartilhado entre a API (grava o upload) e o worker (processa).
+    IMPORT_CHUNK_ROWS: int = 2000
+    IMPORT_DIR: str = "/tmp/atendeja-imports"
+    IMPORT_MAX_RETRIES: int = 3
+    IMPORT_RETRY_DELAY_S: int = 30
+    IMPORT_STALE_S: int = 600  # job "running" sem checkpoint há mais que isso pode ser retomado
+    # Import de leads: telefones sem código do país/DDD recebem estes (DDD por tenant: settings "default_area_code")
+    IMPORT_PHONE_COUNTRY_CODE: str = "55"
+    IMPORT_PHONE_AREA_CODE: str = ""  # vazio = rejeita números sem DDD
+    # Versão do catálogo de veículos (Redis): cache local da leitura
+    CATALOG_VERSION_CACHE_TTL_S: float = 2.0
+    # Índice em memória do GET /veiculos: reconstruído quando a versão muda ou após esta idade
+    CATALOG_INDEX_MAX_AGE_S: float = 300.0
 
     # MCP (Model Context Protocol) – autenticação simples para /mcp/execute
     MCP_API_TOKEN: str = ""  # quando definido, exigir Bearer <token> no endpoint MCP
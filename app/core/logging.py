@@ -1,65 +1,236 @@
+"""Configuração do structlog (API e workers).
+
+LOG_MODE=sync (padrão): JSON da stdlib escrito direto no stdout.
+LOG_MODE=async: JSON via orjson (se instalado) e escrita numa thread de fundo; o event
+loop só enfileira a linha pronta. Fila cheia descarta a linha (contadas e reportadas
+depois) em vez de bloquear a requisição.
+
+Nos dois modos:
+- amostragem por evento (LOG_SAMPLE_RATES; sem valor, só o modo async amostra
+  `webhook_received` a 1%); warning e acima nunca são amostrados;
+- campos acima de LOG_MAX_FIELD_CHARS são truncados (payloads da Meta, respostas de API);
+- redação de segredos com uma regex pré-compilada sobre a linha já serializada, em vez de
+  percorrer recursivamente cada dict do evento.
+"""
+from __future__ import annotations
+import atexit
+import json
 import logging
+import queue
+import random
+import re
 import sys
+import threading
+from typing import Any, Callable, Mapping
+
 import structlog
-from typing import Any, Mapping
+
+from app.core.config import settings
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson é opcional
+    orjson = None  # type: ignore[assignment]
+
+SENSITIVE_KEYS = (
+    "authorization",
+    "x-hub-signature-256",
+    "token",
+    "access_token",
+    "secret",
+    "signature",
+    "wa_token",
+    "wa_webhook_secret",
+)
+# "chave": "valor" em qualquer nível do JSON (inclusive no topo do evento), para as chaves sensíveis (sem diferenciar caixa)
+_SENSITIVE_RE = re.compile(
+    r'"(' + "|".join(re.escape(k) for k in SENSITIVE_KEYS) + r')"(\s*:\s*)"((?:[^"\\]|\\.)*)"',
+    re.IGNORECASE,
+)
+_SENSITIVE_RE_B = re.compile(_SENSITIVE_RE.pattern.encode(), re.IGNORECASE)
+# Valores sensíveis que não são string (números, objetos) viram "***"
+_SENSITIVE_OTHER_RE = re.compile(
+    r'"(' + "|".join(re.escape(k) for k in SENSITIVE_KEYS) + r')"(\s*:\s*)(\{[^{}]*\}|\[[^\[\]]*\]|[^"\s,}\]][^,}\]]*)',
+    re.IGNORECASE,
+)
+_SENSITIVE_OTHER_RE_B = re.compile(_SENSITIVE_OTHER_RE.pattern.encode(), re.IGNORECASE)
+
+
+def _mask(value: str) -> str:
+    if len(value) <= 8:
+        return "***"
+    return value[:2] + "***" + value[-2:]
+
+
+def redact(line: str) -> str:
+    line = _SENSITIVE_RE.sub(lambda m: f'"{m.group(1)}"{m.group(2)}"{_mask(m.group(3))}"', line)
+    return _SENSITIVE_OTHER_RE.sub(lambda m: f'"{m.group(1)}"{m.group(2)}"***"', line)
+
+
+def redact_bytes(line: bytes) -> bytes:
+    line = _SENSITIVE_RE_B.sub(
+        lambda m: b'"' + m.group(1) + b'"' + m.group(2) + b'"' + _mask(m.group(3).decode("utf-8", "replace")).encode() + b'"',
+        line,
+    )
+    return _SENSITIVE_OTHER_RE_B.sub(lambda m: b'"' + m.group(1) + b'"' + m.group(2) + b'"***"', line)
+
+
+def _dumps(value: Any) -> str:
+    if orjson is not None:
+        return orjson.dumps(value, default=str).decode()
+    return json.dumps(value, default=str, ensure_ascii=False)
+
+
+def _sampler(rates: Mapping[str, float]) -> Callable:
+    def sample(logger, method_name, event_dict):  # type: ignore[no-untyped-def]
+        rate = rates.get(event_dict.get("event"))  # type: ignore[arg-type]
+        if rate is not None and method_name in ("debug", "info") and random.random() >= rate:
+            raise structlog.DropEvent
+        return event_dict
+
+    return sample
+
+
+# Tracebacks não são truncados
+_KEEP_WHOLE = frozenset({"exception", "traceback"})
+
+
+def _truncator(limit: int) -> Callable:
+    def truncate(logger, method_name, event_dict):  # type: ignore[no-untyped-def]
+        for key, value in event_dict.items():
+            if key in _KEEP_WHOLE:
+                continue
+            if isinstance(value, str):
+                if len(value) > limit:
+                    event_dict[key] = f"{value[:limit]}...(+{len(value) - limit})"
+            elif isinstance(value, (Mapping, list, tuple)):
+                text = _dumps(value)
+                if len(text) > limit:
+                    # Vira string: a redação da linha renderizada não enxerga mais as chaves
+                    # (aspas escapadas), então redige aqui, antes de cortar
+                    text = redact(text)
+                    event_dict[key] = f"{text[:limit]}...(+{len(text) - limit})"
+        return event_dict
+
+    return truncate
+
+
+def _render_json(logger, method_name, event_dict) -> str:  # type: ignore[no-untyped-def]
+    return redact(json.dumps(event_dict, default=str))
+
+
+def _render_orjson(logger, method_name, event_dict) -> bytes:  # type: ignore[no-untyped-def]
+    if orjson is None:
+        return redact(json.dumps(event_dict, default=str)).encode()
+    return redact_bytes(orjson.dumps(event_dict, default=str))
+
+
+class _QueueLogger:
+    """Logger do structlog que só enfileira a linha; quem escreve é a _LogWriter."""
+
+    def __init__(self, writer: "_LogWriter") -> None:
+        self._writer = writer
+
+    def msg(self, message: bytes) -> None:
+        self._writer.put(message)
+
+    log = debug = info = warn = warning = err = error = critical = exception = fatal = msg
+
+
+class _LogWriter:
+    _STOP = object()
+
+    def __init__(self, stream, maxsize: int) -> None:  # type: ignore[no-untyped-def]
+        self._stream = stream
+        self._q: queue.Queue = queue.Queue(maxsize=maxsize)
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def put(self, line: bytes) -> None:
+        try:
+            self._q.put_nowait(line)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self) -> None:
+        while True:
+            item = self._q.get()
+            batch = []
+            stop = False
+            while True:
+                if item is self._STOP:
+                    stop = True
+                    break
+                batch.append(item)
+                if len(batch) >= 1000:
+                    break
+                try:
+                    item = self._q.get_nowait()
+                except queue.Empty:
+                    break
+            if self.dropped:
+                dropped, self.dropped = self.dropped, 0
+                batch.append(_dumps({"event": "log_lines_dropped", "count": dropped, "level": "warning"}).encode())
+            if batch:
+                try:
+                    self._stream.write(b"\n".join(batch) + b"\n")
+                    self._stream.flush()
+                except Exception:  # noqa: BLE001
+                    pass
+            if stop:
+                return
+
+    def close(self, timeout: float = 2.0) -> None:
+        try:
+            self._q.put(self._STOP, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+
+
+_writer: _LogWriter | None = None
+# Amostragem quando LOG_SAMPLE_RATES não é definido (o modo sync não descarta nada por padrão)
+_DEFAULT_SAMPLE_RATES = {"sync": {}, "async": {"webhook_received": 0.01}}
+
+
+def _stop_writer() -> None:
+    global _writer
+    if _writer is not None:
+        _writer.close()
+        _writer = None
+
+
+def sample_rates() -> dict[str, float]:
+    if settings.LOG_SAMPLE_RATES is not None:
+        return dict(settings.LOG_SAMPLE_RATES)
+    return dict(_DEFAULT_SAMPLE_RATES.get(settings.LOG_MODE, {}))
 
 
 def configure_logging() -> None:
-    timestamper = structlog.processors.TimeStamper(fmt="iso")
-
-    SENSITIVE_KEYS = {
-        "authorization",
-        "x-hub-signature-256",
-        "token",
-        "access_token",
-        "secret",
-        "signature",
-        "wa_token",
-        "wa_webhook_secret",
-    }
-
-    def _mask(value: str) -> str:
-        if not isinstance(value, str):
-            return "***"
-        if len(value) <= 8:
-            return "***"
-        return value[:2] + "***" + value[-2:]
-
-    def _redact_mapping(d: Mapping[str, Any]) -> dict:
-        out = {}
-        for k, v in d.items():
-            lk = str(k).lower()
-            if lk in SENSITIVE_KEYS:
-                out[k] = _mask(str(v))
-            elif isinstance(v, Mapping):
-                out[k] = _redact_mapping(v)
-            else:
-                out[k] = v
-        return out
-
-    def redact_processor(logger, method_name, event_dict):  # type: ignore[no-untyped-def]
-        # Redact common containers like headers/payload and flat keys
-        redacted = {}
-        for k, v in event_dict.items():
-            lk = str(k).lower()
-            if lk in SENSITIVE_KEYS:
-                redacted[k] = _mask(str(v))
-            elif isinstance(v, Mapping):
-                redacted[k] = _redact_mapping(v)
-            else:
-                redacted[k] = v
-        return redacted
+    global _writer
+    processors: list[Callable] = [
+        _sampler(sample_rates()),
+        structlog.processors.add_log_level,
+        structlog.processors.TimeStamper(fmt="iso"),
+        structlog.processors.dict_tracebacks,
+        _truncator(settings.LOG_MAX_FIELD_CHARS),
+    ]
+    if settings.LOG_MODE == "async":
+        if _writer is None:
+            _writer = _LogWriter(sys.stdout.buffer, settings.LOG_QUEUE_MAX)
+            atexit.register(_stop_writer)
+        writer = _writer
+        processors.append(_render_orjson)
+        logger_factory: Callable = lambda *args: _QueueLogger(writer)  # noqa: E731
+    else:
+        processors.append(_render_json)
+        logger_factory = structlog.PrintLoggerFactory(file=sys.stdout)
 
     structlog.configure(
-        processors=[
-            structlog.processors.add_log_level,
-            timestamper,
-            redact_processor,
-            structlog.processors.dict_tracebacks,
-            structlog.processors.JSONRenderer(),
-        ],
+        processors=processors,
         wrapper_class=structlog.make_filtering_bound_logger(logging.INFO),
-        logger_factory=structlog.PrintLoggerFactory(file=sys.stdout),
+        logger_factory=logger_factory,
         cache_logger_on_first_use=True,
     )
 
@@ -0,0 +1,142 @@
+"""Métricas Prometheus (API, workers Celery, consumidor do webhook, engine outbound).
+
+Com PROMETHEUS_MULTIPROC_DIR definido (diretório vazio, limpo a cada deploy), cada
+processo grava seus valores em arquivos mmap e a exposição agrega todos: vale para os
+workers do uvicorn e para os filhos do prefork do Celery. Sem a variável, cada processo
+expõe só os próprios valores.
+
+Profundidade das filas e buffers pendentes no Redis são lidos na hora da coleta
+(`RedisBacklogCollector`), não mantidos como gauges.
+"""
+from __future__ import annotations
+import os
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+import structlog
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+from prometheus_client import multiprocess
+
+from app.core.config import settings
+
+log = structlog.get_logger()
+
+# Mesmos limites do histograma do access log (app.api.middleware), em segundos
+LATENCY_BUCKETS_S = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "atendeja_http_request_seconds",
+    "Latência das requisições HTTP por rota",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS_S,
+)
+WEBHOOK_BATCH_SECONDS = Histogram(
+    "atendeja_webhook_batch_seconds",
+    "Tempo de processamento de um payload (inline) ou lote do stream (consumidor)",
+    ["mode"],
+    buckets=LATENCY_BUCKETS_S,
+)
+WA_SEND_SECONDS = Histogram(
+    "atendeja_wa_send_seconds",
+    "Latência de cada chamada HTTP de envio ao provedor de mensagens",
+    ["provider"],
+    buckets=LATENCY_BUCKETS_S,
+)
+WA_SEND_ERRORS = Counter(
+    "atendeja_wa_send_errors_total",
+    "Erros de envio ao provedor por código (status HTTP ou tipo de exceção)",
+    ["provider", "code"],
+)
+RATE_LIMIT_REJECTIONS = Counter(
+    "atendeja_rate_limit_rejections_total",
+    "Envios bloqueados pelo rate limiter",
+    ["backend"],
+)
+DB_POOL_CHECKOUT_SECONDS = Histogram(
+    "atendeja_db_pool_checkout_seconds",
+    "Espera para obter conexão do pool do banco",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0),
+)
+EXTERNAL_CALL_SECONDS = Histogram(
+    "atendeja_external_call_seconds",
+    "Latência de integrações externas (Pan, Ollama)",
+    ["service", "operation", "outcome"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0),
+)
+
+
+@contextmanager
+def timed_external(service: str, operation: str) -> Iterator[None]:
+    """Mede uma chamada externa; outcome=error se a exceção escapar do bloco."""
+    start = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield
+    except Exception:
+        outcome = "error"
+        raise
+    finally:
+        EXTERNAL_CALL_SECONDS.labels(service, operation, outcome).observe(time.perf_counter() - start)
+
+
+class RedisBacklogCollector:
+    """Gauges lidos no Redis na coleta: filas do Celery/outbound e buffers de agregação pendentes."""
+
+    def collect(self):  # type: ignore[no-untyped-def]
+        from app.core.redis_client import get_redis
+
+        depth = GaugeMetricFamily("atendeja_queue_depth", "Itens aguardando em cada fila", labels=["queue"])
+        pending = GaugeMetricFamily(
+            "atendeja_inbound_agg_pending_buffers", "Buffers de agregação inbound aguardando flush"
+        )
+        try:
+            r = get_redis()
+            pipe = r.pipeline(transaction=False)
+            queues = [q.strip() for q in settings.METRICS_CELERY_QUEUES.split(",") if q.strip()]
+            queues.append(settings.WA_OUTBOUND_QUEUE_KEY)
+            for q in queues:
+                pipe.llen(q)
+            pipe.zcard(settings.INBOUND_AGG_DUE_KEY)
+            *lengths, agg = pipe.execute()
+        except Exception as e:  # noqa: BLE001
+            log.warning("metrics_redis_collect_error", error=str(e))
+            return []
+        for q, n in zip(queues, lengths):
+            depth.add_metric([q], n)
+        pending.add_metric([], agg)
+        return [depth, pending]
+
+
+def render_latest() -> tuple[bytes, str]:
+    """Texto de exposição Prometheus (agregado entre processos no modo multiprocess)."""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        body = generate_latest(registry)
+    else:
+        from prometheus_client import REGISTRY
+
+        body = generate_latest(REGISTRY)
+    backlog = CollectorRegistry()
+    backlog.register(RedisBacklogCollector())
+    return body + generate_latest(backlog), CONTENT_TYPE_LATEST
+
+
+def start_metrics_server(port: int) -> None:
+    """Servidor HTTP de exposição para processos sem API (workers Celery, consumidores)."""
+    from prometheus_client import start_http_server
+
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        start_http_server(port, registry=registry)
+    else:
+        start_http_server(port)
+    log.info("metrics_server_started", port=port)
+
+
+def mark_process_dead(pid: int) -> None:
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(pid)
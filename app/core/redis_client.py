@@ -0,0 +1,31 @@
+from __future__ import annotations
+import threading
+
+import redis
+
+from app.core.config import settings
+
+# Pool único por processo (API/worker). Evita abrir um cliente novo a cada chamada.
+_pool: redis.ConnectionPool | None = None
+_lock = threading.Lock()
+
+
+def get_pool() -> redis.ConnectionPool:
+    global _pool
+    if _pool is None:
+        with _lock:
+            if _pool is None:
+                _pool = redis.ConnectionPool.from_url(
+                    settings.REDIS_URL,
+                    decode_responses=True,
+                    max_connections=settings.REDIS_MAX_CONNECTIONS,
+                    socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT,
+                    socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+                    health_check_interval=30,
+                )
+    return _pool
+
+
+def get_redis() -> redis.Redis:
+    """Cliente Redis compartilhado (thread-safe; conexões vêm do pool do processo)."""
+    return redis.Redis(connection_pool=get_pool())
@@ -0,0 +1,15 @@
+from app.domain.bot.engine import ActionContext, CompiledFlow, StepResult, compile_flow, register_action
+from app.domain.bot.flows import BUILTIN_FLOWS, builtin_flow, get_flow
+from app.domain.bot.service import reply_to
+
+__all__ = [
+    "ActionContext",
+    "BUILTIN_FLOWS",
+    "CompiledFlow",
+    "StepResult",
+    "builtin_flow",
+    "compile_flow",
+    "get_flow",
+    "register_action",
+    "reply_to",
+]
@@ -0,0 +1,118 @@
+"""Ações disponíveis para os fluxos do bot (referenciadas pelo nome na definição)."""
+from __future__ import annotations
+
+import structlog
+from sqlalchemy import select
+
+from app.domain.bot.engine import ActionContext, register_action
+from app.integrations.pan import PanService
+from app.repositories import models, rollups
+
+log = structlog.get_logger()
+
+_PAN_UNAVAILABLE = "Não foi possível completar a pré‑análise agora. Tente novamente em instantes."
+
+
+@register_action("pan_pre_analise")
+def pan_pre_analise(ctx: ActionContext) -> str:
+    # O CPF não fica no estado da conversa (Redis/banco): só vai para o PAN
+    cpf = str(ctx.data.pop("cpf", "") or "")
+    try:
+        res = PanService().pre_analise(cpf=cpf, categoria=ctx.data.get("categoria"))
+    except Exception as e:  # noqa: BLE001
+        log.error("bot_pan_pre_analise_error", error=str(e))
+        return _PAN_UNAVAILABLE
+    if not res.get("ok"):
+        return res.get("message") or _PAN_UNAVAILABLE
+    data = res.get("data") or {}
+    resultado = str(data.get("resultado") or data.get("status") or "EM_ANALISE")
+    ctx.data["pre_analise"] = resultado
+    rollups.record(ctx.tenant_id, rollups.PAN_PREANALISE)
+    lines = [f"Pré-análise concluída: {resultado.replace('_', ' ').lower()}."]
+    limite = data.get("limite_pre_aprovado")
+    if limite:
+        lines.append(f"Limite pré-aprovado: R$ {float(limite):,.0f}.")
+    lines.append("Para ver carros disponíveis, envie por exemplo: carros usados ate 60000.")
+    return "\n".join(lines)
+
+
+@register_action("vehicle_search")
+def vehicle_search(ctx: ActionContext) -> str:
+    if ctx.db is None:
+        return "Catálogo indisponível no momento."
+    V = models.Vehicle
+    stmt = select(V).where(V.active == True, V.tenant_id == ctx.tenant_id)  # noqa: E712
+    if ctx.data.get("categoria"):
+        stmt = stmt.where(V.category == ctx.data["categoria"])
+    # Valor único ("carros 60000") vale como teto, não como preço exato
+    if ctx.data.get("min_price") is not None and ctx.data.get("min_price") != ctx.data.get("max_price"):
+        stmt = stmt.where(V.price >= float(ctx.data["min_price"]))
+    if ctx.data.get("max_price") is not None:
+        stmt = stmt.where(V.price <= float(ctx.data["max_price"]))
+    rows = ctx.db.execute(stmt.order_by(V.id.desc()).limit(5)).scalars().all()
+    if not rows:
+        return "Não encontrei veículos com esse perfil. Quer tentar outra categoria ou faixa de preço?"
+    lines = ["Encontrei estas opções:"]
+    for v in rows:
+        price = f"R$ {v.price:,.0f}" if v.price is not None else "preço sob consulta"
+        lines.append(f"#{v.id} - {v.title} | {v.year or '-'} | {price}")
+    lines.append("Para simular crédito, envie: cpf 00000000000")
+    return "\n".join(lines)
+
+
+@register_action("realestate_search")
+def realestate_search(ctx: ActionContext) -> str:
+    """Registra lead + inquiry com os critérios coletados e busca imóveis compatíveis."""
+    from app.domain.realestate import models as re_models  # type: ignore
+
+    db = ctx.db
+    assert db is not None
+    criteria = dict(ctx.data)
+    lead = re_models.Lead(
+        tenant_id=ctx.tenant_id,
+        name=None,
+        phone=None,
+        email=None,
+        source="whatsapp",
+        preferences=criteria,
+        consent_lgpd=False,
+    )
+    db.add(lead)
+    db.flush()
+    db.add(
+        re_models.Inquiry(
+            tenant_id=ctx.tenant_id,
+            lead_id=lead.id,
+            property_id=None,
+            type=re_models.InquiryType.buy if criteria.get("purpose") == "sale" else re_models.InquiryType.rent,
+            status=re_models.InquiryStatus.new,
+            payload=criteria,
+        )
+    )
+    db.commit()
+
+    P = re_models.Property
+    stmt = select(P).where(P.is_active == True)  # noqa: E712
+    if criteria.get("purpose"):
+        stmt = stmt.where(P.purpose == re_models.PropertyPurpose(criteria["purpose"]))
+    if criteria.get("type"):
+        stmt = stmt.where(P.type == re_models.PropertyType(criteria["type"]))
+    if criteria.get("city"):
+        stmt = stmt.where(P.address_city.ilike(criteria["city"]))
+    if criteria.get("state"):
+        stmt = stmt.where(P.address_state == criteria["state"])
+    if criteria.get("bedrooms") is not None:
+        stmt = stmt.where(P.bedrooms >= int(criteria["bedrooms"]))
+    if criteria.get("min_price") is not None:
+        stmt = stmt.where(P.price >= float(criteria["min_price"]))
+    if criteria.get("max_price") is not None:
+        stmt = stmt.where(P.price <= float(criteria["max_price"]))
+    rows = db.execute(stmt.limit(5)).scalars().all()
+
+    if not rows:
+        return "Obrigado! Registrei sua preferência. No momento não encontrei imóveis com esse perfil. Quer ajustar a faixa de preço ou dormitórios?"
+    lines = ["Encontrei estas opções:"]
+    for p in rows:
+        lines.append(f"#{p.id} - {p.title} | R$ {p.price:,.0f} | {p.address_city}-{p.address_state}")
+    lines.append("Deseja ver mais detalhes? Envie o número do imóvel (ex: 3).")
+    return "\n".join(lines)
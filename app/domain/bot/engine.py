@@ -0,0 +1,249 @@
+"""Motor de fluxos do bot: definição declarativa (dict/JSON) compilada em tabelas de despacho.
+
+Formato da definição:
+
+    {
+      "name": "vehicles",
+      "start": "start",
+      "reset": {"keywords": ["sair"], "reply": "...", "next": "start"},   # opcional, vale em todo estado
+      "states": {
+        "start": {
+          "fallback": "texto quando nada casar",
+          "transitions": [
+            {"keywords": ["compra", "comprar"], "set": {"purpose": "sale"}, "next": "city", "reply": "..."},
+            {"regex": "\\\\bcpf\\\\b", "extract": {"cpf": "cpf", "categoria": "categoria?"},
+             "retry": "...", "action": "pan_pre_analise", "next": "start"},
+            {"extract": {"city": "text"}, "next": "uf", "reply": "Cidade {city} anotada."}   # sem matcher = padrão
+          ]
+        }
+      }
+    }
+
+Avaliação de uma mensagem: lookup da mensagem normalizada no dict de palavras-chave do
+estado (inclui as de reset); se não achar, uma única busca na regex combinada do estado
+(alternância com um grupo nomeado por transição: vence a que casa mais cedo no texto,
+empate pela ordem de declaração); se não achar, a transição padrão; senão o fallback.
+Extratores com "?" são opcionais; um obrigatório sem valor responde `retry` e não avança.
+`clear: true` zera os dados antes de aplicar a transição.
+"""
+from __future__ import annotations
+from dataclasses import dataclass
+import re
+import string
+from typing import Any, Callable, Mapping
+
+from sqlalchemy.orm import Session
+
+from app.domain.bot.extractors import EXTRACTORS, Extractor
+
+
+@dataclass
+class ActionContext:
+    db: Session | None
+    tenant_id: int
+    wa_id: str
+    data: dict[str, Any]
+
+
+# Ação: recebe o contexto (pode alterar ctx.data) e devolve a resposta, ou None para usar a `reply` da transição
+Action = Callable[[ActionContext], "str | None"]
+
+ACTIONS: dict[str, Action] = {}
+
+
+def register_action(name: str) -> Callable[[Action], Action]:
+    def deco(fn: Action) -> Action:
+        ACTIONS[name] = fn
+        return fn
+
+    return deco
+
+
+@dataclass(frozen=True)
+class StepResult:
+    reply: str
+    state: str
+    data: dict[str, Any]
+    changed: bool = True
+
+
+class _Template:
+    """Resposta com campos {chave} resolvidos pelos dados; sem campos, é devolvida como está."""
+
+    __slots__ = ("text", "fields")
+
+    def __init__(self, text: str) -> None:
+        self.text = text
+        try:
+            self.fields = any(f for _, f, _, _ in string.Formatter().parse(text))
+        except ValueError:
+            self.fields = False  # chaves desbalanceadas: texto literal
+
+    def render(self, data: Mapping[str, Any]) -> str:
+        if not self.fields:
+            return self.text
+        return self.text.format_map(_Missing(data))
+
+
+class _Missing(dict):
+    def __init__(self, data: Mapping[str, Any]) -> None:
+        super().__init__(data)
+
+    def __missing__(self, key: str) -> str:
+        return ""
+
+
+@dataclass(frozen=True)
+class _Transition:
+    next: str
+    reply: _Template | None
+    set: tuple[tuple[str, Any], ...]
+    extract: tuple[tuple[str, Extractor, bool], ...]
+    retry: _Template | None
+    action: Action | None
+    clear: bool
+
+
+@dataclass(frozen=True)
+class _State:
+    keywords: dict[str, _Transition]
+    pattern: re.Pattern[str] | None
+    by_group: dict[str, _Transition]
+    default: _Transition | None
+    fallback: _Template
+
+
+def normalize(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+class CompiledFlow:
+    def __init__(self, name: str, start: str, states: dict[str, _State]) -> None:
+        self.name = name
+        self.start = start
+        self.states = states
+
+    def step(
+        self,
+        state: str | None,
+        data: Mapping[str, Any],
+        text: str,
+        *,
+        db: Session | None = None,
+        tenant_id: int = 0,
+        wa_id: str = "",
+    ) -> StepResult:
+        current = state if state in self.states else self.start
+        st = self.states[current]
+        norm = normalize(text)
+
+        t = st.keywords.get(norm)
+        if t is None and st.pattern is not None:
+            m = st.pattern.search(norm)
+            if m is not None:
+                t = st.by_group[m.lastgroup]  # type: ignore[index]
+        if t is None:
+            t = st.default
+        if t is None:
+            return StepResult(st.fallback.render(data), current, dict(data), changed=False)
+
+        out: dict[str, Any] = {} if t.clear else dict(data)
+        for key, value in t.set:
+            out[key] = value
+        for key, fn, optional in t.extract:
+            value = fn(text, norm)
+            if value is None:
+                if optional:
+                    continue
+                retry = t.retry or st.fallback
+                return StepResult(retry.render(data), current, dict(data), changed=False)
+            if isinstance(value, dict):
+                out.update(value)
+            else:
+                out[key] = value
+
+        reply: str | None = None
+        if t.action is not None:
+            ctx = ActionContext(db=db, tenant_id=tenant_id, wa_id=wa_id, data=out)
+            reply = t.action(ctx)
+            out = ctx.data
+        if reply is None:
+            reply = t.reply.render(out) if t.reply is not None else ""
+        return StepResult(reply, t.next, out)
+
+
+def _compile_transition(spec: Mapping[str, Any], state_names: set[str], where: str) -> _Transition:
+    nxt = spec.get("next")
+    if nxt not in state_names:
+        raise ValueError(f"{where}: estado '{nxt}' não existe")
+    extract = []
+    for key, name in (spec.get("extract") or {}).items():
+        optional = str(name).endswith("?")
+        name = str(name).rstrip("?")
+        if name not in EXTRACTORS:
+            raise ValueError(f"{where}: extrator '{name}' desconhecido")
+        extract.append((str(key), EXTRACTORS[name], optional))
+    action = None
+    if spec.get("action"):
+        if spec["action"] not in ACTIONS:
+            raise ValueError(f"{where}: ação '{spec['action']}' desconhecida")
+        action = ACTIONS[spec["action"]]
+    return _Transition(
+        next=nxt,
+        reply=_Template(spec["reply"]) if spec.get("reply") else None,
+        set=tuple((spec.get("set") or {}).items()),
+        extract=tuple(extract),
+        retry=_Template(spec["retry"]) if spec.get("retry") else None,
+        action=action,
+        clear=bool(spec.get("clear")),
+    )
+
+
+def compile_flow(defn: Mapping[str, Any]) -> CompiledFlow:
+    """Valida e compila a definição; ValueError com o ponto do problema se inválida."""
+    states_spec = defn.get("states")
+    if not isinstance(states_spec, Mapping) or not states_spec:
+        raise ValueError("fluxo sem 'states'")
+    names = set(states_spec)
+    start = defn.get("start") or next(iter(states_spec))
+    if start not in names:
+        raise ValueError(f"estado inicial '{start}' não existe")
+
+    reset_keywords: dict[str, _Transition] = {}
+    if defn.get("reset"):
+        reset = dict(defn["reset"])
+        reset.setdefault("next", start)
+        reset.setdefault("clear", True)
+        t = _compile_transition(reset, names, "reset")
+        reset_keywords = {normalize(k): t for k in reset.get("keywords") or []}
+
+    states: dict[str, _State] = {}
+    for name, spec in states_spec.items():
+        keywords = dict(reset_keywords)
+        alternatives: list[str] = []
+        by_group: dict[str, _Transition] = {}
+        default: _Transition | None = None
+        for i, tspec in enumerate(spec.get("transitions") or []):
+            where = f"{name}[{i}]"
+            t = _compile_transition(tspec, names, where)
+            if tspec.get("keywords"):
+                for k in tspec["keywords"]:
+                    keywords[normalize(k)] = t
+            elif tspec.get("regex"):
+                try:
+                    re.compile(tspec["regex"])
+                except re.error as e:
+                    raise ValueError(f"{where}: regex inválida ({e})") from e
+                group = f"t{i}"
+                alternatives.append(f"(?P<{group}>{tspec['regex']})")
+                by_group[group] = t
+            elif default is None:
+                default = t
+        states[name] = _State(
+            keywords=keywords,
+            pattern=re.compile("|".join(alternatives), re.IGNORECASE) if alternatives else None,
+            by_group=by_group,
+            default=default,
+            fallback=_Template(spec.get("fallback") or ""),
+        )
+    return CompiledFlow(str(defn.get("name") or "custom"), start, states)
@@ -0,0 +1,111 @@
+"""Extratores do motor de fluxos: tiram um valor do texto do usuário.
+
+Assinatura: `fn(texto_original, texto_normalizado) -> valor | None` (None = não reconhecido).
+Um extrator que devolve dict tem as chaves mescladas direto nos dados da conversa
+(ex.: price_range -> min_price/max_price).
+"""
+from __future__ import annotations
+import re
+from typing import Any, Callable
+
+Extractor = Callable[[str, str], Any]
+
+_CPF_RE = re.compile(r"(?<!\d)(\d{3})\.?(\d{3})\.?(\d{3})-?(\d{2})(?!\d)")
+_CATEGORIA_RE = re.compile(r"\b(nov[oa]s?|usad[oa]s?|motos?|motocicletas?)\b")
+_INT_RE = re.compile(r"\d+")
+# Faixa "2000-3500", "ate 3000" / "até 3.000" ou valor solto, dentro de uma frase
+_PRICE_RE = re.compile(r"(?:at[eé]\s*)?(?:r\$\s*)?\d[\d.]*(?:,\d+)?(?:\s*-\s*(?:r\$\s*)?\d[\d.]*(?:,\d+)?)?")
+_THOUSANDS_RE = re.compile(r"(?<!\d)(\d{1,3}(?:\.\d{3})+)(?![\d.])")
+
+
+def parse_price(text: str) -> tuple[float | None, float | None]:
+    # aceita formatos simples: "2000-3500" ou "ate 3000" ou "3000"
+    t = text.strip().lower().replace("r$", "").replace(" ", "")
+    if "-" in t:
+        parts = t.split("-", 1)
+        try:
+            return float(parts[0]), float(parts[1])
+        except Exception:
+            return None, None
+    if t.startswith("ate"):
+        try:
+            return None, float(t.replace("ate", ""))
+        except Exception:
+            return None, None
+    try:
+        v = float(t)
+        return v, v
+    except Exception:
+        return None, None
+
+
+def extract_price_range(raw: str, norm: str) -> dict[str, float] | None:
+    """Faixa de preço da mensagem inteira (parse_price) ou do primeiro trecho com valor."""
+    min_p, max_p = parse_price(norm)
+    if min_p is None and max_p is None:
+        m = _PRICE_RE.search(norm)
+        if m is None:
+            return None
+        chunk = _THOUSANDS_RE.sub(lambda g: g.group(1).replace(".", ""), m.group(0))
+        min_p, max_p = parse_price(chunk.replace("até", "ate").replace(",", "."))
+    out = {}
+    if min_p is not None:
+        out["min_price"] = min_p
+    if max_p is not None:
+        out["max_price"] = max_p
+    return out or None
+
+
+def is_valid_cpf(digits: str) -> bool:
+    """Dígitos verificadores (módulo 11) de um CPF com 11 dígitos; recusa sequências repetidas."""
+    if len(digits) != 11 or not digits.isdigit() or digits == digits[0] * 11:
+        return False
+    nums = [int(c) for c in digits]
+    for n in (9, 10):
+        check = sum(v * w for v, w in zip(nums[:n], range(n + 1, 1, -1))) * 10 % 11 % 10
+        if check != nums[n]:
+            return False
+    return True
+
+
+def extract_cpf(raw: str, norm: str) -> str | None:
+    """Primeiro CPF válido da mensagem; sequências de 11 dígitos sem DV válido (telefones) não contam."""
+    for m in _CPF_RE.finditer(norm):
+        digits = "".join(m.groups())
+        if is_valid_cpf(digits):
+            return digits
+    return None
+
+
+def extract_categoria(raw: str, norm: str) -> str | None:
+    m = _CATEGORIA_RE.search(norm)
+    if m is None:
+        return None
+    word = m.group(1)
+    if word.startswith("moto"):
+        return "MOTOS"
+    return "NOVO" if word.startswith("nov") else "USADO"
+
+
+def extract_int(raw: str, norm: str) -> int | None:
+    m = _INT_RE.search(norm)
+    return int(m.group(0)) if m else None
+
+
+def extract_uf(raw: str, norm: str) -> str | None:
+    uf = norm.upper().replace(" ", "")
+    return uf if len(uf) == 2 else None
+
+
+def extract_text(raw: str, norm: str) -> str | None:
+    return raw.strip() if len(norm) >= 2 else None
+
+
+EXTRACTORS: dict[str, Extractor] = {
+    "cpf": extract_cpf,
+    "categoria": extract_categoria,
+    "price_range": extract_price_range,
+    "int": extract_int,
+    "uf": extract_uf,
+    "text": extract_text,
+}
@@ -0,0 +1,173 @@
+"""Fluxos embutidos e cache de fluxos compilados por tenant.
+
+O tenant escolhe o fluxo em settings_json["bot_flow"]: o nome de um fluxo embutido
+("vehicles", "realestate") ou uma definição completa (ver `engine`). A compilação
+acontece uma vez por versão das configurações do tenant (o cache de tenants troca o
+objeto de settings ao invalidar, o que recompila aqui).
+"""
+from __future__ import annotations
+import threading
+from typing import Any, Mapping
+
+import structlog
+
+from app.domain.bot import actions  # noqa: F401  (registra as ações)
+from app.domain.bot.engine import CompiledFlow, compile_flow
+from app.repositories.tenants import TenantInfo
+
+log = structlog.get_logger()
+
+VEHICLE_HINT = (
+    "Olá! Para iniciar a análise, envie:\n"
+    "• cpf 00000000000\n"
+    "• opcional: categoria USADO | NOVO | MOTOS\n"
+    "Para encerrar, digite SAIR."
+)
+
+VEHICLE_FLOW: dict[str, Any] = {
+    "name": "vehicles",
+    "start": "start",
+    "reset": {
+        "keywords": ["sair", "encerrar", "menu"],
+        "reply": "Atendimento encerrado. Quando quiser recomeçar, é só mandar uma mensagem.",
+    },
+    "states": {
+        "start": {
+            "fallback": VEHICLE_HINT,
+            "transitions": [
+                {
+                    "regex": r"\bcpf\b|(?<!\d)\d{3}\.?\d{3}\.?\d{3}-?\d{2}(?!\d)",
+                    "extract": {"cpf": "cpf", "categoria": "categoria?"},
+                    "retry": "CPF inválido. Envie no formato: cpf 00000000000",
+                    "action": "pan_pre_analise",
+                    "next": "start",
+                },
+                {
+                    "regex": r"\b(carros?|ve[ií]culos?|estoque|cat[aá]logo|motos?|categoria)\b",
+                    "clear": True,
+                    "extract": {"categoria": "categoria?", "preco": "price_range?"},
+                    "action": "vehicle_search",
+                    "next": "start",
+                },
+            ],
+        },
+    },
+}
+
+REALESTATE_FLOW: dict[str, Any] = {
+    "name": "realestate",
+    "start": "purpose",
+    "states": {
+        "purpose": {
+            "fallback": "Olá! Você procura compra ou locação?",
+            "transitions": [
+                {
+                    "keywords": ["compra", "comprar", "venda", "buy", "sale"],
+                    "set": {"purpose": "sale"},
+                    "next": "location_city",
+                    "reply": "Legal! Você quer comprar. Me diga a cidade (ex: São Paulo).",
+                },
+                {
+                    "keywords": ["locacao", "locação", "aluguel", "alugar", "rent"],
+                    "set": {"purpose": "rent"},
+                    "next": "location_city",
+                    "reply": "Perfeito! Você quer alugar. Qual a cidade?",
+                },
+            ],
+        },
+        "location_city": {
+            "transitions": [
+                {
+                    "extract": {"city": "text"},
+                    "retry": "Informe a cidade (ex: Campinas).",
+                    "next": "location_state",
+                    "reply": "Anotado. Qual o estado (UF)? (ex: SP)",
+                }
+            ],
+        },
+        "location_state": {
+            "transitions": [
+                {
+                    "extract": {"state": "uf"},
+                    "retry": "Informe a UF com 2 letras (ex: SP).",
+                    "next": "type",
+                    "reply": "Certo. Prefere apartamento ou casa?",
+                }
+            ],
+        },
+        "type": {
+            "fallback": "Digite 'apartamento' ou 'casa'.",
+            "transitions": [
+                {
+                    "keywords": ["ap", "apto", "apartamento", "apartment"],
+                    "set": {"type": "apartment"},
+                    "next": "bedrooms",
+                    "reply": "Quantos dormitórios? (ex: 2)",
+                },
+                {
+                    "keywords": ["casa", "house"],
+                    "set": {"type": "house"},
+                    "next": "bedrooms",
+                    "reply": "Quantos dormitórios? (ex: 2)",
+                },
+            ],
+        },
+        "bedrooms": {
+            "transitions": [
+                {
+                    "extract": {"bedrooms": "int"},
+                    "retry": "Informe um número de dormitórios (ex: 2).",
+                    "next": "price",
+                    "reply": "Qual a faixa de preço? (ex: 2000-3500 ou 'ate 3000')",
+                }
+            ],
+        },
+        "price": {
+            "transitions": [
+                {"extract": {"price": "price_range?"}, "action": "realestate_search", "next": "done"}
+            ],
+        },
+        # Busca feita: qualquer mensagem recomeça com critérios limpos
+        "done": {
+            "transitions": [
+                {"clear": True, "next": "purpose", "reply": "Vamos começar! Você procura compra ou locação?"}
+            ],
+        },
+    },
+}
+
+BUILTIN_FLOWS: dict[str, Mapping[str, Any]] = {"vehicles": VEHICLE_FLOW, "realestate": REALESTATE_FLOW}
+
+_builtin: dict[str, CompiledFlow] = {}
+# tenant_id -> (objeto settings usado na compilação, fluxo compilado)
+_by_tenant: dict[int, tuple[Mapping[str, Any], CompiledFlow]] = {}
+_lock = threading.Lock()
+
+
+def builtin_flow(name: str) -> CompiledFlow:
+    flow = _builtin.get(name)
+    if flow is None:
+        with _lock:
+            flow = _builtin.get(name)
+            if flow is None:
+                flow = _builtin[name] = compile_flow(BUILTIN_FLOWS[name])
+    return flow
+
+
+def get_flow(tenant: TenantInfo, default: str) -> CompiledFlow:
+    """Fluxo compilado do tenant (settings_json["bot_flow"]) ou o embutido `default`."""
+    spec = tenant.setting("bot_flow")
+    if not spec:
+        return builtin_flow(default)
+    if isinstance(spec, str):
+        return builtin_flow(spec if spec in BUILTIN_FLOWS else default)
+    cached = _by_tenant.get(tenant.id)
+    if cached is not None and cached[0] is tenant.settings:
+        return cached[1]
+    try:
+        flow = compile_flow(spec)
+    except (ValueError, TypeError, AttributeError) as e:
+        log.error("bot_flow_invalid", tenant=tenant.name, error=str(e))
+        flow = builtin_flow(default)
+    _by_tenant[tenant.id] = (tenant.settings, flow)
+    return flow
@@ -0,0 +1,19 @@
+"""Ponto de entrada do bot: estado da conversa (Redis) + fluxo compilado do tenant."""
+from __future__ import annotations
+
+from sqlalchemy.orm import Session
+
+from app.domain.bot.flows import get_flow
+from app.messaging.conversation_state import load_state, save_state
+from app.repositories.tenants import get_tenant
+
+
+def reply_to(db: Session, tenant_name: str, wa_id: str, text: str, default_flow: str) -> str:
+    """Avança o fluxo com a mensagem e devolve a resposta; só grava o estado se ele mudou."""
+    flow = get_flow(get_tenant(tenant_name), default_flow)
+    st = load_state(db, tenant_name, wa_id)
+    res = flow.step(st.state, st.data, text, db=db, tenant_id=st.tenant_id, wa_id=wa_id)
+    if res.changed:
+        st.state, st.data = res.state, res.data
+        save_state(st)
+    return res.reply
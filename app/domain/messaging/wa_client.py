@@ -1,10 +1,18 @@
 from __future__ import annotations
+import time
+
 import httpx
 import structlog
 from app.core.config import settings
+from app.core.metrics import WA_SEND_ERRORS, WA_SEND_SECONDS
 
 log = structlog.get_logger()
 
+# Cliente HTTP compartilhado (keep-alive entre mensagens em vez de uma conexão por envio)
+_http = httpx.Client(timeout=20, limits=httpx.Limits(max_connections=20, max_keepalive_connections=20))
+# Label `provider` das métricas de envio (caminho padrão das tasks Celery)
+_PROVIDER = "cloud_celery"
+
 
 class WhatsAppClient:
     def __init__(self, token: str | None = None, base_url: str | None = None, phone_number_id: str | None = None):
@@ -18,6 +26,18 @@ class WhatsAppClient:
             "Content-Type": "application/json",
         }
 
+    def _post(self, url: str, payload: dict) -> httpx.Response:
+        start = time.perf_counter()
+        try:
+            resp = _http.post(url, headers=self._headers(), json=payload)
+        except httpx.HTTPError as exc:
+            WA_SEND_ERRORS.labels(_PROVIDER, type(exc).__name__).inc()
+            raise
+        WA_SEND_SECONDS.labels(_PROVIDER).observe(time.perf_counter() - start)
+        if resp.status_code >= 400:
+            WA_SEND_ERRORS.labels(_PROVIDER, str(resp.status_code)).inc()
+        return resp
+
     def send_text(self, to_wa_id: str, text: str) -> dict:
         """Send a simple text message via WhatsApp Cloud API.
         Returns JSON response or raises httpx.HTTPStatusError
@@ -30,16 +50,15 @@ class WhatsAppClient:
             "text": {"body": text},
         }
         log.info("wa_send_text_request", to=to_wa_id)
-        with httpx.Client(timeout=20) as client:
-            resp = client.post(url, headers=self._headers(), json=payload)
-            try:
-                resp.raise_for_status()
-            except httpx.HTTPStatusError as e:
-                log.error("wa_send_text_error", status_code=resp.status_code, body=resp.text)
-                raise e
-            data = resp.json()
-            log.info("wa_send_text_response", to=to_wa_id, response=data)
-            return data
+        resp = self._post(url, payload)
+        try:
+            resp.raise_for_status()
+        except httpx.HTTPStatusError as e:
+            log.error("wa_send_text_error", status_code=resp.status_code, body=resp.text)
+            raise e
+        data = resp.json()
+        log.info("wa_send_text_response", to=to_wa_id, response=data)
+        return data
 
     def send_template(self, to_wa_id: str, template_name: str, language_code: str = "pt_BR", components: list[dict] | None = None) -> dict:
         """Send a template message to initiate a conversation outside 24h window.
@@ -58,16 +77,15 @@ class WhatsAppClient:
         if components:
             payload["template"]["components"] = components
         log.info("wa_send_template_request", to=to_wa_id, template=template_name)
-        with httpx.Client(timeout=20) as client:
-            resp = client.post(url, headers=self._headers(), json=payload)
-            try:
-                resp.raise_for_status()
-            except httpx.HTTPStatusError as e:
-                log.error("wa_send_template_error", status_code=resp.status_code, body=resp.text)
-                raise e
-            data = resp.json()
-            log.info("wa_send_template_response", to=to_wa_id, response=data)
-            return data
+        resp = self._post(url, payload)
+        try:
+            resp.raise_for_status()
+        except httpx.HTTPStatusError as e:
+            log.error("wa_send_template_error", status_code=resp.status_code, body=resp.text)
+            raise e
+        data = resp.json()
+        log.info("wa_send_template_response", to=to_wa_id, response=data)
+        return data
 
 
 def get_wa_client() -> WhatsAppClient:
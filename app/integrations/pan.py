@@ -6,6 +6,7 @@ import httpx
 import structlog
 
 from app.core.config import settings
+from app.core.metrics import timed_external
 
 log = structlog.get_logger()
 
@@ -93,7 +94,7 @@ class PanService:
             "password": self.password,
             "grant_type": "client_credentials+password",
         }
-        with self._client() as client:
+        with self._client() as client, timed_external("pan", "token"):
             resp = client.post(url, headers=headers, json=payload)
         if resp.status_code >= 400:
             log.error("pan_token_error", status=resp.status_code, body=resp.text[:500])
@@ -143,13 +144,13 @@ class PanService:
             "Authorization": f"Bearer {token}",
             "ApiKey": self.api_key,
         }
-        with self._client() as client:
+        with self._client() as client, timed_external("pan", "preanalise"):
             resp = client.get(url, headers=headers, params=params)
         if resp.status_code == 401 or resp.status_code == 403:
             # tenta renovar token uma vez
             token = self.obter_token(force_refresh=True)
             headers["Authorization"] = f"Bearer {token}"
-            with self._client() as client:
+            with self._client() as client, timed_external("pan", "preanalise"):
                 resp = client.get(url, headers=headers, params=params)
         if resp.status_code >= 400:
             log.warning(
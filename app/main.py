@@ -2,6 +2,7 @@ from fastapi import FastAPI
 from fastapi.exceptions import RequestValidationError
 from fastapi import HTTPException
 from app.api.errors import http_exception_handler, validation_exception_handler, generic_exception_handler
+from app.api.middleware import AccessLogMiddleware
 from app.core.config import settings
 from app.core.logging import configure_logging
 from app.api.routes.health import router as health_router
@@ -13,15 +14,13 @@ from app.api.routes.admin import router as admin_router
 from app.api.routes.mcp import router as mcp_router
 from app.api.routes.metrics import router as metrics_router
 from app.api.routes.auth import router as auth_router
+from app.messaging.batching import stop_all_flushers
 from app.repositories.db import engine
 from app.repositories.models import Base, User, UserRole
+from app.repositories.partitions import ensure_partitioned
 from contextlib import asynccontextmanager
 import structlog
-import traceback
-from fastapi.responses import JSONResponse
 import structlog
-import traceback
-from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
 from app.repositories.db import SessionLocal
 from app.core.security import get_password_hash
@@ -35,6 +34,8 @@ async def lifespan(app: FastAPI):
     # Startup
     if settings.APP_ENV != "test":  # skip for tests to speed up
         Base.metadata.create_all(bind=engine)
+        # Banco novo: tabelas append-only recém-criadas viram particionadas (Postgres)
+        ensure_partitioned(engine)
         # Seed do usuário admin, se configurado
         try:
             seed_email = (settings.AUTH_SEED_ADMIN_EMAIL or "").strip().lower()
@@ -56,7 +57,8 @@ async def lifespan(app: FastAPI):
         except Exception as e:
             log.error("admin_seed_error", error=str(e))
     yield
-    # Shutdown: nothing for now
+    # Shutdown: grava o que ainda está nos buffers write-behind (logs de envio etc.)
+    stop_all_flushers()
 
 
 tags_metadata = [
@@ -79,37 +81,8 @@ app = FastAPI(
     lifespan=lifespan,
 )
 
-@app.middleware("http")
-async def _http_logger(request, call_next):
-    try:
-        try:
-            body_bytes = await request.body()
-        except Exception:
-            body_bytes = b""
-        log.info(
-            "http_request_start",
-            method=request.method,
-            path=request.url.path,
-            content_type=request.headers.get("content-type"),
-            content_length=len(body_bytes) if body_bytes is not None else 0,
-        )
-        response = await call_next(request)
-        log.info(
-            "http_request_end",
-            method=request.method,
-            path=request.url.path,
-            status=getattr(response, "status_code", None),
-        )
-        return response
-    except Exception as e:
-        log.error(
-            "http_request_exception",
-            method=request.method,
-            path=request.url.path,
-            error=str(e),
-            traceback=traceback.format_exc(),
-        )
-        return JSONResponse(status_code=500, content={"error": {"code": "internal_error", "message": "unexpected error"}})
+# Access log + latência por rota (ASGI puro: não bufferiza o corpo da requisição)
+app.add_middleware(AccessLogMiddleware)
 
 app.include_router(health_router, prefix="/health", tags=["health"]) 
 app.include_router(ops_router, prefix="/ops", tags=["ops"]) 
@@ -0,0 +1,134 @@
+from __future__ import annotations
+import asyncio
+import json
+import random
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+import structlog
+
+from app.core.config import settings
+from app.core.metrics import WA_SEND_ERRORS, WA_SEND_SECONDS
+from app.core.redis_client import get_redis
+
+log = structlog.get_logger()
+
+try:  # HTTP/2 exige o pacote 'h2' (httpx[http2]); sem ele seguimos em HTTP/1.1 com keep-alive
+    import h2  # type: ignore  # noqa: F401
+
+    _HTTP2_AVAILABLE = True
+except Exception:  # noqa: BLE001
+    _HTTP2_AVAILABLE = False
+
+
+class PermanentSendError(Exception):
+    """Erro 4xx da Cloud API (exceto 429): não adianta tentar de novo."""
+
+    def __init__(self, status_code: int, body: str) -> None:
+        super().__init__(f"http_{status_code}")
+        self.status_code = status_code
+        self.body = body
+
+
+def text_payload(to: str, text: str) -> Dict[str, Any]:
+    return {
+        "messaging_product": "whatsapp",
+        "to": to,
+        "type": "text",
+        "text": {"preview_url": False, "body": text[:4096]},
+    }
+
+
+def template_payload(
+    to: str, template_name: str, language_code: str = "pt_BR", components: Optional[List[dict]] = None
+) -> Dict[str, Any]:
+    payload: Dict[str, Any] = {
+        "messaging_product": "whatsapp",
+        "to": to,
+        "type": "template",
+        "template": {"name": template_name, "language": {"code": language_code}},
+    }
+    if components:
+        payload["template"]["components"] = components
+    return payload
+
+
+def enqueue_outbound(job: Dict[str, Any]) -> None:
+    """Enfileira um envio para o engine assíncrono (`app.workers.outbound_engine`).
+
+    job: {"message_id": int|None, "tenant_id": int, "payload": <corpo da Cloud API>}
+    """
+    get_redis().rpush(settings.WA_OUTBOUND_QUEUE_KEY, json.dumps(job))
+
+
+class AsyncWhatsAppSender:
+    """Cliente assíncrono da Cloud API com um único `httpx.AsyncClient` (HTTP/2 + keep-alive).
+
+    Centenas de envios podem compartilhar as mesmas conexões; retries usam `asyncio.sleep`
+    e portanto não bloqueiam os demais envios do processo.
+    """
+
+    def __init__(
+        self,
+        token: str | None = None,
+        base_url: str | None = None,
+        phone_number_id: str | None = None,
+        max_connections: int | None = None,
+        max_attempts: int | None = None,
+        transport: httpx.AsyncBaseTransport | None = None,
+    ) -> None:
+        self.token = token or settings.WA_TOKEN
+        self.base_url = (base_url or settings.WA_API_BASE).rstrip("/")
+        self.phone_number_id = phone_number_id or settings.WA_PHONE_NUMBER_ID
+        self.max_attempts = max_attempts or settings.WA_OUTBOUND_MAX_ATTEMPTS
+        conns = max_connections or settings.WA_OUTBOUND_CONCURRENCY
+        self._client = httpx.AsyncClient(
+            http2=settings.WA_HTTP2 and _HTTP2_AVAILABLE and transport is None,
+            timeout=httpx.Timeout(15.0, connect=5.0),
+            limits=httpx.Limits(max_connections=conns, max_keepalive_connections=conns),
+            headers={"Authorization": f"Bearer {self.token}", "Content-Type": "application/json"},
+            transport=transport,
+        )
+
+    @property
+    def messages_url(self) -> str:
+        return f"{self.base_url}/{self.phone_number_id}/messages"
+
+    @staticmethod
+    def _backoff(attempt: int, retry_after: str | None = None) -> float:
+        if retry_after:
+            try:
+                return min(30.0, float(retry_after))
+            except ValueError:
+                pass
+        base = 0.3 * (2 ** (attempt - 1))
+        return min(30.0, base + random.uniform(0, 0.2 * base))
+
+    async def send(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        last_exc: Exception | None = None
+        for attempt in range(1, self.max_attempts + 1):
+            retry_after: str | None = None
+            start = time.perf_counter()
+            try:
+                r = await self._client.post(self.messages_url, json=payload)
+                WA_SEND_SECONDS.labels("meta_async").observe(time.perf_counter() - start)
+                if r.status_code < 400:
+                    return r.json()
+                WA_SEND_ERRORS.labels("meta_async", str(r.status_code)).inc()
+                if r.status_code != 429 and r.status_code < 500:
+                    raise PermanentSendError(r.status_code, r.text[:500])
+                retry_after = r.headers.get("retry-after")
+                last_exc = httpx.HTTPStatusError(f"http_{r.status_code}", request=r.request, response=r)
+            except PermanentSendError:
+                raise
+            except httpx.TransportError as exc:
+                WA_SEND_ERRORS.labels("meta_async", type(exc).__name__).inc()
+                last_exc = exc
+            if attempt < self.max_attempts:
+                await asyncio.sleep(self._backoff(attempt, retry_after))
+        assert last_exc is not None
+        raise last_exc
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
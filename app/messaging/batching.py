@@ -0,0 +1,96 @@
+from __future__ import annotations
+from abc import ABC, abstractmethod
+import atexit
+import threading
+from typing import Any
+
+import structlog
+
+log = structlog.get_logger()
+
+_registry: list["BatchFlusher"] = []
+_registry_lock = threading.Lock()
+
+
+class BatchFlusher(ABC):
+    """Buffer em memória com uma thread que grava em lote a cada `interval_s` ou ao atingir `max_items`.
+
+    Subclasses implementam `_drain` (troca o buffer sob `self._lock` e devolve o lote),
+    `_write` (grava o lote) e `_size`. `flush()` pode ser chamado a qualquer momento;
+    `stop()` faz o flush final (lifespan da API / shutdown do worker).
+    """
+
+    def __init__(self, name: str, interval_s: float, max_items: int) -> None:
+        self.name = name
+        self.interval_s = interval_s
+        self.max_items = max_items
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._stopped = False
+        with _registry_lock:
+            _registry.append(self)
+
+    # --- a implementar ---
+    @abstractmethod
+    def _drain(self) -> Any: ...
+
+    @abstractmethod
+    def _write(self, batch: Any) -> None: ...
+
+    @abstractmethod
+    def _size(self) -> int: ...
+
+    # --- ciclo de vida ---
+    def _notify(self) -> None:
+        """Chamar após enfileirar (fora de `self._lock`)."""
+        if self._thread is None and not self._stopped:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name=f"flusher-{self.name}", daemon=True)
+                    self._thread.start()
+        if self._size() >= self.max_items:
+            self._wake.set()
+
+    def _run(self) -> None:
+        while not self._stopped:
+            self._wake.wait(self.interval_s)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:  # noqa: BLE001
+                log.error("batch_flush_error", flusher=self.name, error=str(e))
+
+    def flush(self) -> None:
+        with self._flush_lock:
+            with self._lock:
+                batch = self._drain()
+            if batch:
+                self._write(batch)
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Para a thread e faz o flush final. Um novo registro volta a iniciar a thread."""
+        self._stopped = True
+        self._wake.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        try:
+            self.flush()
+        except Exception as e:  # noqa: BLE001
+            log.error("batch_flush_error", flusher=self.name, error=str(e))
+        if thread is None or not thread.is_alive():
+            self._thread = None
+            self._stopped = False
+
+
+def stop_all_flushers() -> None:
+    """Faz o flush final de todos os buffers write-behind do processo."""
+    with _registry_lock:
+        flushers = list(_registry)
+    for f in flushers:
+        f.stop()
+
+
+atexit.register(stop_all_flushers)
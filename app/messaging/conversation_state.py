@@ -0,0 +1,198 @@
+"""Estado do funil por conversa: snapshot quente no Redis, persistência write-behind.
+
+Cada conversa tem um hash `conv:{tenant_id}:{wa_id}` com o id da conversa, o estado
+(`last_state`) e os critérios coletados (`data`, JSON). Um passo do bot lê o hash
+(HGETALL) e grava o novo snapshot (HSET + EXPIRE no mesmo pipeline); no banco, só uma
+leitura por PK confere que a conversa do hash segue aberta. O banco
+(`Conversation.last_state`/`state_data`) é atualizado em lote pelo flusher, mantendo só o
+último snapshot de cada conversa por janela.
+
+Sem o hash (expirou, primeira mensagem, Redis fora, conversa fechada ou descartada com
+`invalidate_state`), o estado é lido do banco e o hash é repopulado; com o Redis fora, a
+gravação vai direto ao banco.
+"""
+from __future__ import annotations
+from dataclasses import dataclass, field
+from datetime import datetime
+import json
+import threading
+from typing import Any
+
+import structlog
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.redis_client import get_redis
+from app.messaging.batching import BatchFlusher
+from app.repositories.conversations import resolve_conversation
+from app.repositories.db import SessionLocal
+from app.repositories.models import Conversation, ConversationStatus
+from app.repositories.tenants import get_tenant
+
+log = structlog.get_logger()
+
+
+@dataclass
+class FunnelState:
+    tenant_id: int
+    wa_id: str
+    conversation_id: int
+    state: str | None = None
+    data: dict[str, Any] = field(default_factory=dict)
+
+
+def _key(tenant_id: int, wa_id: str) -> str:
+    return f"conv:{tenant_id}:{wa_id}"
+
+
+class ConversationStateWriter(BatchFlusher):
+    """Grava os snapshots do funil no banco em lote (um UPDATE por PK, executemany)."""
+
+    def __init__(self, interval_s: float | None = None, max_items: int | None = None) -> None:
+        super().__init__(
+            "conversation_state",
+            interval_s if interval_s is not None else settings.FUNNEL_STATE_FLUSH_INTERVAL_MS / 1000.0,
+            max_items or settings.FUNNEL_STATE_FLUSH_MAX_ITEMS,
+        )
+        self._pending: dict[int, dict[str, Any]] = {}
+
+    @staticmethod
+    def _row(st: FunnelState) -> dict[str, Any]:
+        return {
+            "id": st.conversation_id,
+            "last_state": st.state,
+            "state_data": dict(st.data),
+            "updated_at": datetime.utcnow(),
+        }
+
+    def add(self, st: FunnelState) -> None:
+        with self._lock:
+            self._pending[st.conversation_id] = self._row(st)
+        self._notify()
+
+    def write_now(self, st: FunnelState) -> None:
+        """Grava o snapshot já, fora do lote (sem Redis o banco é a única cópia).
+
+        Um snapshot anterior da mesma conversa ainda no buffer é descartado para não
+        sobrescrever este no próximo flush; em caso de erro, este volta ao buffer.
+        """
+        with self._lock:
+            self._pending.pop(st.conversation_id, None)
+        self._write([self._row(st)])
+
+    def _size(self) -> int:
+        return len(self._pending)
+
+    def _drain(self) -> list[dict[str, Any]] | None:
+        if not self._pending:
+            return None
+        batch, self._pending = list(self._pending.values()), {}
+        return batch
+
+    def _write(self, batch: list[dict[str, Any]]) -> None:
+        try:
+            with SessionLocal() as db:
+                db.execute(update(Conversation), batch)
+                db.commit()
+        except Exception as e:  # noqa: BLE001
+            log.error("conversation_state_flush_error", error=str(e), rows=len(batch))
+            with self._lock:
+                for row in batch:
+                    # Não sobrescreve snapshot mais novo que chegou nesse meio tempo
+                    self._pending.setdefault(row["id"], row)
+
+
+_writer: ConversationStateWriter | None = None
+_writer_lock = threading.Lock()
+
+
+def get_state_writer() -> ConversationStateWriter:
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = ConversationStateWriter()
+    return _writer
+
+
+def _from_db(db: Session, tenant_name: str, wa_id: str) -> FunnelState:
+    ref = resolve_conversation(db, tenant_name, wa_id)
+    db.commit()  # contato/conversa recém-criados persistem mesmo se o estado não avançar
+    conv = db.get(Conversation, ref.conversation_id)
+    return FunnelState(
+        tenant_id=ref.tenant_id,
+        wa_id=wa_id,
+        conversation_id=ref.conversation_id,
+        state=conv.last_state if conv else None,
+        data=dict((conv.state_data if conv else None) or {}),
+    )
+
+
+def _is_open(db: Session, conversation_id: int) -> bool:
+    status = db.scalar(select(Conversation.status).where(Conversation.id == conversation_id))
+    return status is not None and status != ConversationStatus.closed
+
+
+def invalidate_state(tenant_id: int, wa_id: str) -> None:
+    """Descarta o snapshot em cache; a próxima leitura vem do banco.
+
+    Chamar ao fechar, reabrir ou trocar a conversa de um contato fora do bot.
+    """
+    try:
+        get_redis().delete(_key(tenant_id, wa_id))
+    except Exception as e:  # noqa: BLE001
+        log.warning("conversation_state_invalidate_error", error=str(e))
+
+
+def load_state(db: Session, tenant_name: str, wa_id: str) -> FunnelState:
+    """Snapshot do funil: uma leitura no Redis; banco só quando o hash não existe."""
+    tenant_id = get_tenant(tenant_name).id
+    try:
+        raw = get_redis().hgetall(_key(tenant_id, wa_id))
+    except Exception as e:  # noqa: BLE001
+        log.warning("conversation_state_read_error", error=str(e))
+        return _from_db(db, tenant_name, wa_id)
+    if raw and raw.get("cid"):
+        if _is_open(db, int(raw["cid"])):
+            return FunnelState(
+                tenant_id=tenant_id,
+                wa_id=wa_id,
+                conversation_id=int(raw["cid"]),
+                state=raw.get("state") or None,
+                data=json.loads(raw.get("data") or "{}"),
+            )
+        # Conversa fechada/removida fora do bot: o hash aponta para a conversa antiga
+        log.info("conversation_state_stale", tenant_id=tenant_id, wa_id=wa_id, cid=raw["cid"])
+    st = _from_db(db, tenant_name, wa_id)
+    _cache(st)
+    return st
+
+
+def _cache(st: FunnelState) -> bool:
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        key = _key(st.tenant_id, st.wa_id)
+        pipe.hset(
+            key,
+            mapping={
+                "cid": st.conversation_id,
+                "state": st.state or "",
+                "data": json.dumps(st.data, ensure_ascii=False, separators=(",", ":")),
+            },
+        )
+        pipe.expire(key, settings.FUNNEL_STATE_TTL_S)
+        pipe.execute()
+        return True
+    except Exception as e:  # noqa: BLE001
+        log.warning("conversation_state_write_error", error=str(e))
+        return False
+
+
+def save_state(st: FunnelState) -> None:
+    """Grava o snapshot no Redis (um round trip) e agenda a persistência em lote."""
+    if _cache(st):
+        get_state_writer().add(st)
+        return
+    # Sem Redis o banco é a única cópia: grava já
+    get_state_writer().write_now(st)
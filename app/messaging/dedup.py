@@ -0,0 +1,98 @@
+"""Deduplicação de mensagens do webhook (a Meta reentrega o mesmo payload em retries).
+
+Todas as ids de um payload/lote são marcadas num único pipeline de `SET wh:dedup:<id> 1
+NX EX ttl`: a primeira réplica que marcar processa, as demais veem a chave e descartam
+(atômico, ao contrário do antigo GET + SETEX). Na frente fica um LRU local com o mesmo
+TTL: retries que voltam ao mesmo processo nem chegam ao Redis.
+
+Sem Redis, vale só o LRU (fail-open: melhor responder duas vezes que perder a mensagem).
+"""
+from __future__ import annotations
+from collections import OrderedDict
+import threading
+import time
+from typing import Iterable
+
+import structlog
+
+from app.core.config import settings
+from app.core.redis_client import get_redis
+
+log = structlog.get_logger()
+
+_PREFIX = "wh:dedup:"
+
+
+class WebhookDeduplicator:
+    def __init__(self, ttl_s: int | None = None, local_max: int | None = None, redis_client=None) -> None:  # type: ignore[no-untyped-def]
+        self.ttl_s = ttl_s or settings.WEBHOOK_DEDUP_TTL_S
+        self.local_max = local_max or settings.WEBHOOK_DEDUP_LOCAL_MAX
+        self._r = redis_client
+        self._seen: OrderedDict[str, float] = OrderedDict()
+        self._lock = threading.Lock()
+        self.local_hits = 0
+
+    def _local_hit(self, msg_id: str, now: float) -> bool:
+        expires = self._seen.get(msg_id)
+        if expires is None:
+            return False
+        if expires < now:
+            del self._seen[msg_id]
+            return False
+        self._seen.move_to_end(msg_id)
+        return True
+
+    def _remember(self, ids: Iterable[str], now: float) -> None:
+        expires = now + self.ttl_s
+        for msg_id in ids:
+            self._seen[msg_id] = expires
+            self._seen.move_to_end(msg_id)
+        while len(self._seen) > self.local_max:
+            self._seen.popitem(last=False)
+
+    def duplicates(self, msg_ids: Iterable[str]) -> set[str]:
+        """Marca as ids como vistas e devolve as que já tinham sido vistas antes deste lote."""
+        now = time.monotonic()
+        dup: set[str] = set()
+        fresh: dict[str, None] = {}  # ordenado, sem repetição
+        with self._lock:
+            for msg_id in msg_ids:
+                if not msg_id:
+                    continue
+                if msg_id in fresh or msg_id in dup:
+                    continue
+                if self._local_hit(msg_id, now):
+                    dup.add(msg_id)
+                    self.local_hits += 1
+                else:
+                    fresh[msg_id] = None
+            # Marca já no LRU: uma chamada concorrente no mesmo processo não reenvia ao Redis
+            self._remember(fresh, now)
+        if not fresh:
+            return dup
+        try:
+            pipe = (self._r or get_redis()).pipeline(transaction=False)
+            for msg_id in fresh:
+                pipe.set(_PREFIX + msg_id, "1", nx=True, ex=self.ttl_s)
+            for msg_id, created in zip(fresh, pipe.execute()):
+                if not created:
+                    dup.add(msg_id)
+        except Exception as e:  # noqa: BLE001
+            log.warning("webhook_dedup_redis_error", error=str(e), ids=len(fresh))
+        return dup
+
+    def is_duplicate(self, msg_id: str) -> bool:
+        return msg_id in self.duplicates([msg_id])
+
+
+_dedup: WebhookDeduplicator | None = None
+_dedup_lock = threading.Lock()
+
+
+def get_deduplicator() -> WebhookDeduplicator:
+    global _dedup
+    if _dedup is None:
+        with _dedup_lock:
+            if _dedup is None:
+                _dedup = WebhookDeduplicator()
+    return _dedup
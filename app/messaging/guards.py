@@ -0,0 +1,65 @@
+from __future__ import annotations
+from collections import defaultdict
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.messaging.window import bulk_inside_window, is_inside_window
+from app.repositories.models import SuppressedContact
+
+
+def is_suppressed(db: Session, tenant_id: int, wa_id: str) -> bool:
+    return (
+        db.query(SuppressedContact.id)
+        .filter(SuppressedContact.tenant_id == tenant_id, SuppressedContact.wa_id == wa_id)
+        .first()
+        is not None
+    )
+
+
+def blocked_reason(db: Session, tenant_id: int, wa_id: str, free_text: bool) -> str | None:
+    """Motivo pelo qual o envio não pode sair (None = liberado).
+
+    Mesmas regras para o provider síncrono e o engine assíncrono: texto livre só dentro da
+    janela de 24h; contatos na lista de supressão nunca recebem mensagem.
+    """
+    if free_text and settings.WINDOW_24H_ENABLED and not is_inside_window(db, tenant_id, wa_id):
+        return "outside_session_window"
+    if is_suppressed(db, tenant_id, wa_id):
+        return "suppressed_contact"
+    return None
+
+
+def blocked_reasons(db: Session, sends: list[tuple[int, str, bool]]) -> list[str | None]:
+    """`blocked_reason` de um lote de envios (tenant_id, wa_id, texto_livre), na mesma ordem.
+
+    Uma leitura de janela e um SELECT ... IN de supressão por tenant, não por envio.
+    """
+    wa_ids: dict[int, set[str]] = defaultdict(set)
+    free: dict[int, set[str]] = defaultdict(set)
+    for tenant_id, wa_id, free_text in sends:
+        wa_ids[tenant_id].add(wa_id)
+        if free_text:
+            free[tenant_id].add(wa_id)
+    inside: dict[tuple[int, str], bool] = {}
+    if settings.WINDOW_24H_ENABLED:
+        for tenant_id, ws in free.items():
+            inside.update(((tenant_id, w), v) for w, v in bulk_inside_window(db, tenant_id, ws).items())
+    suppressed: set[tuple[int, str]] = set()
+    for tenant_id, ws in wa_ids.items():
+        rows = db.scalars(
+            select(SuppressedContact.wa_id).where(
+                SuppressedContact.tenant_id == tenant_id, SuppressedContact.wa_id.in_(ws)
+            )
+        )
+        suppressed.update((tenant_id, w) for w in rows)
+    out: list[str | None] = []
+    for tenant_id, wa_id, free_text in sends:
+        if free_text and settings.WINDOW_24H_ENABLED and not inside.get((tenant_id, wa_id), False):
+            out.append("outside_session_window")
+        elif (tenant_id, wa_id) in suppressed:
+            out.append("suppressed_contact")
+        else:
+            out.append(None)
+    return out
@@ -0,0 +1,155 @@
+from __future__ import annotations
+from dataclasses import dataclass, field
+from datetime import datetime
+import json
+from typing import Iterator
+
+import structlog
+from sqlalchemy import select
+
+from app.messaging.window import cache_inbound
+from app.repositories.db import SessionLocal
+from app.repositories import models, rollups
+from app.repositories.tenants import get_tenant
+
+log = structlog.get_logger()
+
+
+@dataclass
+class InboundText:
+    """Mensagem de texto extraída de um payload do webhook do WhatsApp (wa_id vazio se ausente)."""
+
+    wa_id: str
+    msg_id: str
+    text: str
+    raw: dict = field(default_factory=dict)
+
+
+def decode_payload(body_bytes: bytes) -> dict | None:
+    """Decodifica o corpo bruto do webhook tentando encodings comuns. Retorna None se inválido."""
+    if not body_bytes:
+        return None
+    for enc in ("utf-8", "utf-8-sig", "latin-1"):
+        try:
+            payload = json.loads(body_bytes.decode(enc))
+        except Exception:  # noqa: BLE001
+            continue
+        if isinstance(payload, dict):
+            return payload
+    return None
+
+
+def iter_text_messages(payload: dict) -> Iterator[InboundText]:
+    """Percorre entry[].changes[].value.messages[] e devolve apenas mensagens de texto não vazias."""
+    for entry in payload.get("entry", []) or []:
+        for change in entry.get("changes", []) or []:
+            value = change.get("value", {}) or {}
+            messages = value.get("messages", []) or []
+            contacts = value.get("contacts", []) or []
+            contact_wa_id = contacts[0].get("wa_id") if contacts else None
+            for msg in messages:
+                # Cada mensagem tem o próprio remetente; contacts[0] é só fallback
+                wa_id = msg.get("from") or contact_wa_id
+                if msg.get("type") != "text":
+                    continue
+                text_in = ((msg.get("text", {}) or {}).get("body") or "").strip()
+                if not text_in:
+                    continue
+                yield InboundText(wa_id=wa_id or "", msg_id=msg.get("id") or "", text=text_in, raw=msg)
+
+
+def persist_inbound_batch(tenant_name: str, items: list[InboundText]) -> list[InboundText]:
+    """Persiste um lote de mensagens inbound numa única transação.
+
+    Resolve contatos/conversas do lote com consultas IN (não uma por mensagem) e ignora
+    wa_message_id já gravados (e repetidos no lote), de modo que reprocessar o lote é
+    idempotente. Retorna as mensagens efetivamente inseridas, na ordem recebida.
+    """
+    if not items:
+        return []
+    with SessionLocal() as db:
+        tenant = get_tenant(tenant_name)
+
+        msg_ids = [i.msg_id for i in items if i.msg_id]
+        seen: set[str] = set()
+        if msg_ids:
+            seen = set(
+                db.scalars(
+                    select(models.Message.wa_message_id).where(
+                        models.Message.tenant_id == tenant.id,
+                        models.Message.wa_message_id.in_(msg_ids),
+                    )
+                )
+            )
+
+        for item in items:
+            item.wa_id = item.wa_id or "unknown"
+        wa_ids = {i.wa_id for i in items}
+        contacts = {
+            c.wa_id: c
+            for c in db.query(models.Contact).filter(
+                models.Contact.tenant_id == tenant.id, models.Contact.wa_id.in_(wa_ids)
+            )
+        }
+        missing = [models.Contact(tenant_id=tenant.id, wa_id=w) for w in wa_ids if w not in contacts]
+        if missing:
+            db.add_all(missing)
+            db.flush()
+            contacts.update({c.wa_id: c for c in missing})
+
+        contact_ids = [c.id for c in contacts.values()]
+        convs: dict[int, models.Conversation] = {}
+        for conv in (
+            db.query(models.Conversation)
+            .filter(
+                models.Conversation.tenant_id == tenant.id,
+                models.Conversation.contact_id.in_(contact_ids),
+                models.Conversation.status != models.ConversationStatus.closed,
+            )
+            .order_by(models.Conversation.id.asc())
+        ):
+            convs[conv.contact_id] = conv  # fica a mais recente por contato
+        new_convs = [
+            models.Conversation(tenant_id=tenant.id, contact_id=cid)
+            for cid in contact_ids
+            if cid not in convs
+        ]
+        if new_convs:
+            db.add_all(new_convs)
+            db.flush()
+            convs.update({c.contact_id: c for c in new_convs})
+
+        now = datetime.utcnow()
+        for c in contacts.values():
+            c.last_inbound_at = now
+
+        rows: list[models.Message] = []
+        inserted: list[InboundText] = []
+        for item in items:
+            if item.msg_id:
+                if item.msg_id in seen:
+                    continue
+                seen.add(item.msg_id)
+            conv = convs[contacts[item.wa_id].id]
+            rows.append(
+                models.Message(
+                    tenant_id=tenant.id,
+                    conversation_id=conv.id,
+                    direction=models.MessageDirection.inbound,
+                    type="text",
+                    payload={"text": item.text, "raw": item.raw},
+                    status="received",
+                    wa_message_id=item.msg_id or None,
+                )
+            )
+            inserted.append(item)
+        db.add_all(rows)
+        db.commit()
+        tenant_id = tenant.id
+    rollups.record(tenant_id, rollups.LEADS, len(missing), now)
+    rollups.record(tenant_id, rollups.CONVERSATIONS, len(new_convs), now)
+    rollups.record(tenant_id, rollups.INBOUND, len(rows), now)
+    cache_inbound(tenant_id, wa_ids, now)
+    log.info("inbound_batch_persisted", tenant=tenant_name, received=len(items), inserted=len(rows))
+    return inserted
+
@@ -1,70 +1,241 @@
 from __future__ import annotations
+from collections import OrderedDict
+import threading
 import time
 from typing import Optional
 
 import redis  # type: ignore
+import structlog
 
 from app.core.config import settings
+from app.core.metrics import RATE_LIMIT_REJECTIONS
+from app.core.redis_client import get_redis
+
+log = structlog.get_logger()
+
+# Token bucket duplo (contato + tenant) avaliado atomicamente em um único round trip.
+# KEYS[1]=bucket do contato, KEYS[2]=bucket do tenant
+# ARGV[1]=ms por token do contato (capacidade 1), ARGV[2]=capacidade global, ARGV[3]=janela global (ms)
+# Retorna {1, 0} quando liberado ou {0, retry_after_ms}.
+_TOKEN_BUCKET_LUA = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local c_refill = tonumber(ARGV[1])
+local g_cap = tonumber(ARGV[2])
+local g_win = tonumber(ARGV[3])
+local g_refill = g_win / g_cap
+
+local function level(key, capacity, refill)
+  local v = redis.call('HMGET', key, 't', 'ts')
+  local tokens = tonumber(v[1])
+  local ts = tonumber(v[2])
+  if tokens == nil or ts == nil then
+    return capacity
+  end
+  return math.min(capacity, tokens + math.max(0, now - ts) / refill)
+end
+
+local ct = level(KEYS[1], 1, c_refill)
+local gt = level(KEYS[2], g_cap, g_refill)
+local wait = 0
+if ct < 1 then wait = math.max(wait, (1 - ct) * c_refill) end
+if gt < 1 then wait = math.max(wait, (1 - gt) * g_refill) end
+if wait > 0 then
+  return {0, math.ceil(wait)}
+end
+redis.call('HSET', KEYS[1], 't', tostring(ct - 1), 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(c_refill))
+redis.call('HSET', KEYS[2], 't', tostring(gt - 1), 'ts', now)
+redis.call('PEXPIRE', KEYS[2], math.ceil(g_win))
+return {1, 0}
+"""
+
+
+class RateLimitedError(RuntimeError):
+    """Envio bloqueado pelo rate limit; `retry_after` em segundos."""
+
+    def __init__(self, retry_after: float) -> None:
+        super().__init__("rate_limited_or_global_limit")
+        self.retry_after = retry_after
+
+
+class _MemoryBuckets:
+    """Fallback em memória com o mesmo algoritmo; buckets de contato limitados por LRU."""
+
+    def __init__(self, max_contacts: int) -> None:
+        self.max_contacts = max_contacts
+        self._contacts: OrderedDict[str, tuple[float, float]] = OrderedDict()
+        self._tenants: dict[str, tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _level(state: tuple[float, float] | None, capacity: float, refill: float, now: float) -> float:
+        if state is None:
+            return capacity
+        tokens, ts = state
+        return min(capacity, tokens + max(0.0, now - ts) / refill)
+
+    def acquire(self, contact_key: str, tenant_key: str, c_refill: float, g_cap: float, g_win: float) -> float:
+        now = time.monotonic()
+        g_refill = g_win / g_cap
+        with self._lock:
+            ct = self._level(self._contacts.get(contact_key), 1.0, c_refill, now)
+            gt = self._level(self._tenants.get(tenant_key), g_cap, g_refill, now)
+            wait = 0.0
+            if ct < 1:
+                wait = max(wait, (1 - ct) * c_refill)
+            if gt < 1:
+                wait = max(wait, (1 - gt) * g_refill)
+            if wait > 0:
+                return wait
+            self._contacts[contact_key] = (ct - 1, now)
+            self._contacts.move_to_end(contact_key)
+            while len(self._contacts) > self.max_contacts:
+                self._contacts.popitem(last=False)
+            self._tenants[tenant_key] = (gt - 1, now)
+            return 0.0
+
+    def __len__(self) -> int:
+        return len(self._contacts)
 
 
 class RateLimiter:
-    """Rate limit por contato e global usando Redis; fallback em memória.
+    """Rate limit por contato e global (tenant) com token bucket no Redis; fallback em memória.
+
+    - por_contato_interval_s: 1 mensagem por intervalo por contato
+    - global_per_minute: teto por minuto por tenant (com reposição contínua)
+
+    Uma instância por processo (ver `get_rate_limiter`): usa o pool Redis compartilhado e
+    avalia os dois buckets num único script Lua.
+    """
+
+    # Após falha do Redis, evita tentar a cada chamada (e pagar o timeout) por alguns segundos
+    REDIS_RETRY_AFTER_S = 5.0
 
-    - por_contato_interval_s: limite de 1 mensagem por intervalo por contato
-    - global_per_minute: limite global por minuto (tenant)
+    def __init__(
+        self,
+        por_contato_interval_s: float = 2,
+        global_per_minute: int = 60,
+        redis_client: Optional[redis.Redis] = None,
+        mem_max_contacts: int = 10000,
+    ) -> None:
+        self.por_contato_interval_s = por_contato_interval_s
+        self.global_per_minute = global_per_minute
+        self._r = redis_client
+        self._script = None
+        self._redis_down_until = 0.0
+        self._mem = _MemoryBuckets(mem_max_contacts)
+
+    def _key_contact(self, tenant_id: str, wa_id: str) -> str:
+        return f"rl:{tenant_id}:{wa_id}"
+
+    def _key_global(self, tenant_id: str) -> str:
+        return f"rlg:{tenant_id}"
+
+    def _redis_script(self):  # type: ignore[no-untyped-def]
+        if self._script is None:
+            r = self._r or get_redis()
+            self._script = r.register_script(_TOKEN_BUCKET_LUA)
+        return self._script
+
+    def acquire(self, tenant_id: int | str, wa_id: str) -> float:
+        """Consome um token; retorna 0.0 se liberado ou os segundos até a próxima tentativa."""
+        tenant = str(tenant_id)
+        kc = self._key_contact(tenant, wa_id)
+        kg = self._key_global(tenant)
+        if time.monotonic() >= self._redis_down_until:
+            try:
+                ok, wait_ms = self._redis_script()(
+                    keys=[kc, kg],
+                    args=[
+                        int(self.por_contato_interval_s * 1000),
+                        self.global_per_minute,
+                        60000,
+                    ],
+                )
+                if int(ok) == 1:
+                    return 0.0
+                RATE_LIMIT_REJECTIONS.labels("redis").inc()
+                return int(wait_ms) / 1000.0
+            except Exception as e:  # noqa: BLE001
+                self._redis_down_until = time.monotonic() + self.REDIS_RETRY_AFTER_S
+                log.warning("rate_limiter_redis_unavailable", error=str(e))
+        wait = self._mem.acquire(kc, kg, float(self.por_contato_interval_s), float(self.global_per_minute), 60.0)
+        if wait > 0:
+            RATE_LIMIT_REJECTIONS.labels("memory").inc()
+        return wait
+
+    def allow(self, tenant_id: int | str, wa_id: str) -> bool:
+        return self.acquire(tenant_id, wa_id) == 0.0
+
+    def check(self, tenant_id: int | str, wa_id: str) -> None:
+        """Como `acquire`, mas levanta RateLimitedError quando bloqueado."""
+        wait = self.acquire(tenant_id, wa_id)
+        if wait > 0:
+            raise RateLimitedError(wait)
+
+
+class AsyncRateLimiter:
+    """Mesmo token bucket do RateLimiter sobre um cliente `redis.asyncio` (engine outbound).
+
+    Divide as chaves com o RateLimiter síncrono, então o provider síncrono e o engine
+    consomem os mesmos buckets. Sem Redis, cai no fallback em memória do processo.
     """
 
-    def __init__(self, tenant_id: int | str, por_contato_interval_s: int = 2, global_per_minute: int = 60):
-        self.tenant_id = str(tenant_id)
+    REDIS_RETRY_AFTER_S = RateLimiter.REDIS_RETRY_AFTER_S
+
+    def __init__(
+        self,
+        r,  # redis.asyncio.Redis
+        por_contato_interval_s: float | None = None,
+        global_per_minute: int | None = None,
+        mem_max_contacts: int = 10000,
+    ) -> None:
+        if por_contato_interval_s is None:
+            por_contato_interval_s = settings.WA_RATE_LIMIT_PER_CONTACT_SECONDS
+        if global_per_minute is None:
+            global_per_minute = settings.WA_RATE_LIMIT_GLOBAL_PER_MINUTE
         self.por_contato_interval_s = por_contato_interval_s
         self.global_per_minute = global_per_minute
-        self._r = None
-        try:
-            self._r = redis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
-            # teste de conexão light
-            self._r.ping()
-        except Exception:
-            self._r = None
-        # fallback memória
-        self._mem_last: dict[str, float] = {}
-        self._mem_minute: dict[int, int] = {}
-
-    def _key_contact(self, wa_id: str) -> str:
-        return f"rl:{self.tenant_id}:{wa_id}"
-
-    def _key_global(self) -> str:
-        return f"rlg:{self.tenant_id}"
-
-    def allow(self, wa_id: str) -> bool:
-        now = time.time()
-        # por contato
-        if self._r:
-            k = self._key_contact(wa_id)
-            # set if not exists with TTL acting as interval guard
-            ok = self._r.set(k, "1", nx=True, ex=self.por_contato_interval_s)
-            if not ok:
-                return False
-        else:
-            last = self._mem_last.get(wa_id, 0.0)
-            if now - last < self.por_contato_interval_s:
-                return False
-            self._mem_last[wa_id] = now
-        # global per minute
-        minute_bucket = int(now // 60)
-        if self._r:
-            kg = f"{self._key_global()}:{minute_bucket}"
-            cnt = self._r.incr(kg)
-            if cnt == 1:
-                self._r.expire(kg, 60)
-            if cnt > self.global_per_minute:
-                return False
-        else:
-            cnt = self._mem_minute.get(minute_bucket, 0) + 1
-            self._mem_minute[minute_bucket] = cnt
-            # limpeza simples
-            for bucket in list(self._mem_minute.keys()):
-                if bucket < minute_bucket:
-                    del self._mem_minute[bucket]
-            if cnt > self.global_per_minute:
-                return False
-        return True
+        self._script = r.register_script(_TOKEN_BUCKET_LUA)
+        self._redis_down_until = 0.0
+        self._mem = _MemoryBuckets(mem_max_contacts)
+
+    async def acquire(self, tenant_id: int | str, wa_id: str) -> float:
+        """Consome um token; retorna 0.0 se liberado ou os segundos até a próxima tentativa."""
+        tenant = str(tenant_id)
+        kc = f"rl:{tenant}:{wa_id}"
+        kg = f"rlg:{tenant}"
+        if time.monotonic() >= self._redis_down_until:
+            try:
+                ok, wait_ms = await self._script(
+                    keys=[kc, kg],
+                    args=[int(self.por_contato_interval_s * 1000), self.global_per_minute, 60000],
+                )
+                if int(ok) == 1:
+                    return 0.0
+                RATE_LIMIT_REJECTIONS.labels("redis").inc()
+                return int(wait_ms) / 1000.0
+            except Exception as e:  # noqa: BLE001
+                self._redis_down_until = time.monotonic() + self.REDIS_RETRY_AFTER_S
+                log.warning("rate_limiter_redis_unavailable", error=str(e))
+        wait = self._mem.acquire(kc, kg, float(self.por_contato_interval_s), float(self.global_per_minute), 60.0)
+        if wait > 0:
+            RATE_LIMIT_REJECTIONS.labels("memory").inc()
+        return wait
+
+
+_limiter: Optional[RateLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                _limiter = RateLimiter(
+                    por_contato_interval_s=settings.WA_RATE_LIMIT_PER_CONTACT_SECONDS,
+                    global_per_minute=settings.WA_RATE_LIMIT_GLOBAL_PER_MINUTE,
+                )
+    return _limiter
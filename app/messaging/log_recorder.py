@@ -0,0 +1,146 @@
+from __future__ import annotations
+from datetime import datetime
+import threading
+from typing import Any, Optional
+import uuid
+
+import structlog
+from sqlalchemy import bindparam, insert, update
+
+from app.core.config import settings
+from app.messaging.batching import BatchFlusher
+from app.repositories.db import SessionLocal
+from app.repositories.models import MessageLog
+
+log = structlog.get_logger()
+
+
+class MessageLogRecorder(BatchFlusher):
+    """Write-behind do `MessageLog` chaveado por um UUID gerado no cliente (`log_uid`).
+
+    O envio chama `queued()` (sem ir ao banco) e depois `sent()`/`error()` com o uid.
+    Se a transição chega antes do flush, vira um único INSERT já com o status final;
+    senão vira um UPDATE por `log_uid` no próximo lote. Nada de "atualizar o último log
+    de (tenant, to, kind)", que errava de linha com envios concorrentes ao mesmo número.
+    """
+
+    # Limite de itens re-enfileirados após falha de escrita (evita crescer sem limite com o banco fora)
+    MAX_BACKLOG = 50000
+
+    def __init__(self, interval_s: float | None = None, max_items: int | None = None) -> None:
+        super().__init__(
+            "message_logs",
+            interval_s if interval_s is not None else settings.MSGLOG_FLUSH_INTERVAL_MS / 1000.0,
+            max_items or settings.MSGLOG_FLUSH_MAX_ITEMS,
+        )
+        self._new: dict[str, dict[str, Any]] = {}
+        self._updates: dict[str, dict[str, Any]] = {}
+
+    def queued(
+        self,
+        tenant_id: int,
+        to: str,
+        kind: str,
+        body: Optional[dict] = None,
+        template_name: Optional[str] = None,
+    ) -> str:
+        uid = uuid.uuid4().hex
+        row = {
+            "log_uid": uid,
+            "tenant_id": tenant_id,
+            "to": to,
+            "kind": kind,
+            "body": body,
+            "template_name": template_name,
+            "status": "queued",
+            "provider_message_id": None,
+            "error_code": None,
+            "created_at": datetime.utcnow(),
+        }
+        with self._lock:
+            self._new[uid] = row
+        self._notify()
+        return uid
+
+    def _transition(self, uid: str, status: str, provider_message_id: str | None, error_code: str | None) -> None:
+        values = {
+            "status": status,
+            "provider_message_id": provider_message_id,
+            "error_code": (error_code or None) and error_code[:64],
+        }
+        with self._lock:
+            pending = self._new.get(uid)
+            if pending is not None:
+                pending.update(values)
+            else:
+                self._updates[uid] = {"b_uid": uid, **values}
+        self._notify()
+
+    def sent(self, uid: str, provider_message_id: str | None) -> None:
+        self._transition(uid, "sent", provider_message_id, None)
+
+    def error(self, uid: str, error_code: str) -> None:
+        self._transition(uid, "error", None, error_code)
+
+    def _size(self) -> int:
+        return len(self._new) + len(self._updates)
+
+    def _drain(self) -> tuple[list[dict], list[dict]] | None:
+        if not self._new and not self._updates:
+            return None
+        batch = (list(self._new.values()), list(self._updates.values()))
+        self._new, self._updates = {}, {}
+        return batch
+
+    def _write(self, batch: tuple[list[dict], list[dict]]) -> None:
+        rows, updates = batch
+        try:
+            with SessionLocal() as db:
+                if rows:
+                    db.execute(insert(MessageLog), rows)
+                if updates:
+                    # UPDATE em nível Core (executemany) — o bulk do ORM exigiria a PK
+                    t = MessageLog.__table__
+                    db.execute(
+                        update(t)
+                        .where(t.c.log_uid == bindparam("b_uid"))
+                        .values(
+                            status=bindparam("status"),
+                            provider_message_id=bindparam("provider_message_id"),
+                            error_code=bindparam("error_code"),
+                        ),
+                        updates,
+                    )
+                db.commit()
+        except Exception as e:  # noqa: BLE001
+            log.error("message_log_flush_error", error=str(e), rows=len(rows), updates=len(updates))
+            self._requeue(rows, updates)
+            return
+        log.debug("message_log_flushed", rows=len(rows), updates=len(updates))
+
+    def _requeue(self, rows: list[dict], updates: list[dict]) -> None:
+        with self._lock:
+            if self._size() + len(rows) + len(updates) > self.MAX_BACKLOG:
+                log.error("message_log_backlog_dropped", rows=len(rows), updates=len(updates))
+                return
+            for row in rows:
+                # Transições que chegaram depois do drain ficaram em _updates; aplica no INSERT
+                upd = self._updates.pop(row["log_uid"], None)
+                if upd:
+                    row.update({k: v for k, v in upd.items() if k != "b_uid"})
+                self._new.setdefault(row["log_uid"], row)
+            for upd in updates:
+                self._updates.setdefault(upd["b_uid"], upd)
+
+
+_recorder: MessageLogRecorder | None = None
+_recorder_lock = threading.Lock()
+
+
+def get_log_recorder() -> MessageLogRecorder:
+    global _recorder
+    if _recorder is None:
+        with _recorder_lock:
+            if _recorder is None:
+                _recorder = MessageLogRecorder()
+    return _recorder
@@ -3,10 +3,11 @@ import httpx
 from typing import Optional, Dict, Any, List
 import time
 
-from app.messaging.limits import RateLimiter
+from app.messaging.guards import blocked_reason
+from app.messaging.limits import get_rate_limiter
+from app.messaging.log_recorder import get_log_recorder
 from app.repositories.db import SessionLocal
-from app.repositories.models import SuppressedContact, MessageLog, Contact, Conversation, Message, MessageDirection
-from app.core.config import settings
+from app.core.metrics import WA_SEND_ERRORS, WA_SEND_SECONDS
 
 
 class MetaCloudProvider:
@@ -28,11 +29,15 @@ class MetaCloudProvider:
     def _post_with_retry(self, url: str, json: Dict[str, Any], max_attempts: int = 3) -> httpx.Response:
         last_exc: Exception | None = None
         for attempt in range(1, max_attempts + 1):
+            start = time.perf_counter()
             try:
                 r = self._client.post(url, headers=self._headers(), json=json)
+                WA_SEND_SECONDS.labels("meta").observe(time.perf_counter() - start)
                 r.raise_for_status()
                 return r
             except Exception as exc:
+                code = str(exc.response.status_code) if isinstance(exc, httpx.HTTPStatusError) else type(exc).__name__
+                WA_SEND_ERRORS.labels("meta", code).inc()
                 last_exc = exc
                 # Backoff exponencial curto: 0.3s, 0.6s
                 if attempt < max_attempts:
@@ -44,56 +49,15 @@ class MetaCloudProvider:
     def send_text(self, to: str, text: str, tenant_id: Optional[str] = None) -> Dict[str, Any]:
         tenant = tenant_id or "0"
         # Rate limit & supressão
-        limiter = RateLimiter(
-            tenant,
-            por_contato_interval_s=settings.WA_RATE_LIMIT_PER_CONTACT_SECONDS,
-            global_per_minute=settings.WA_RATE_LIMIT_GLOBAL_PER_MINUTE,
-        )
-        if not limiter.allow(to):
-            raise RuntimeError("rate_limited_or_global_limit")
+        get_rate_limiter().check(tenant, to)
         with SessionLocal() as db:
-            # Guard da janela 24h (somente para texto livre)
-            if settings.WINDOW_24H_ENABLED:
-                contact = (
-                    db.query(Contact)
-                    .filter(Contact.tenant_id == int(tenant), Contact.wa_id == to)
-                    .first()
-                )
-                inside = False
-                if contact:
-                    # última inbound do cliente em qualquer conversa do contato
-                    last_inbound = (
-                        db.query(Message)
-                        .filter(
-                            Message.tenant_id == int(tenant),
-                            Message.direction == MessageDirection.inbound,
-                            Message.conversation_id.in_(
-                                db.query(Conversation.id).filter(Conversation.contact_id == contact.id)
-                            ),
-                        )
-                        .order_by(Message.created_at.desc())
-                        .first()
-                    )
-                    if last_inbound is not None:
-                        from datetime import datetime, timedelta, timezone
-
-                        now = datetime.now(timezone.utc)
-                        # normalizar created_at como naive->utc se necessário
-                        li = last_inbound.created_at
-                        if li.tzinfo is None:
-                            li = li.replace(tzinfo=timezone.utc)
-                        inside = (now - li) <= timedelta(hours=settings.WINDOW_24H_HOURS)
-                if not inside:
-                    raise RuntimeError("outside_session_window")
-            sup = db.query(SuppressedContact).filter(
-                SuppressedContact.tenant_id == int(tenant),
-                SuppressedContact.wa_id == to,
-            ).first()
-            if sup:
-                raise RuntimeError("suppressed_contact")
-            log = MessageLog(tenant_id=int(tenant), to=to, kind="text", body={"body": text[:4096]}, status="queued")
-            db.add(log)
-            db.commit()
+            # Janela 24h (somente texto livre) + supressão
+            reason = blocked_reason(db, int(tenant), to, free_text=True)
+        if reason:
+            raise RuntimeError(reason)
+        # Log de envio via write-behind: nenhum INSERT/UPDATE síncrono no caminho do envio
+        recorder = get_log_recorder()
+        log_uid = recorder.queued(int(tenant), to, "text", body={"body": text[:4096]})
 
         payload = {
             "messaging_product": "whatsapp",
@@ -109,24 +73,10 @@ class MetaCloudProvider:
                 provider_id = data.get("messages", [{}])[0].get("id")
             except Exception:
                 provider_id = None
-            with SessionLocal() as db:
-                db.query(MessageLog).filter(
-                    MessageLog.tenant_id == int(tenant), MessageLog.to == to, MessageLog.kind == "text"
-                ).order_by(MessageLog.id.desc()).limit(1).update({
-                    MessageLog.status: "sent",
-                    MessageLog.provider_message_id: provider_id,
-                })
-                db.commit()
+            recorder.sent(log_uid, provider_id)
             return data
         except Exception as exc:
-            with SessionLocal() as db:
-                db.query(MessageLog).filter(
-                    MessageLog.tenant_id == int(tenant), MessageLog.to == to, MessageLog.kind == "text"
-                ).order_by(MessageLog.id.desc()).limit(1).update({
-                    MessageLog.status: "error",
-                    MessageLog.error_code: str(exc),
-                })
-                db.commit()
+            recorder.error(log_uid, str(exc))
             raise
 
     def send_template(
@@ -138,30 +88,15 @@ class MetaCloudProvider:
         tenant_id: Optional[str] = None,
     ) -> Dict[str, Any]:
         tenant = tenant_id or "0"
-        limiter = RateLimiter(
-            tenant,
-            por_contato_interval_s=settings.WA_RATE_LIMIT_PER_CONTACT_SECONDS,
-            global_per_minute=settings.WA_RATE_LIMIT_GLOBAL_PER_MINUTE,
-        )
-        if not limiter.allow(to):
-            raise RuntimeError("rate_limited_or_global_limit")
+        get_rate_limiter().check(tenant, to)
         with SessionLocal() as db:
-            sup = db.query(SuppressedContact).filter(
-                SuppressedContact.tenant_id == int(tenant),
-                SuppressedContact.wa_id == to,
-            ).first()
-            if sup:
-                raise RuntimeError("suppressed_contact")
-            log = MessageLog(
-                tenant_id=int(tenant),
-                to=to,
-                kind="template",
-                body={"components": components or []},
-                template_name=template_name,
-                status="queued",
-            )
-            db.add(log)
-            db.commit()
+            reason = blocked_reason(db, int(tenant), to, free_text=False)
+        if reason:
+            raise RuntimeError(reason)
+        recorder = get_log_recorder()
+        log_uid = recorder.queued(
+            int(tenant), to, "template", body={"components": components or []}, template_name=template_name
+        )
 
         payload = {
             "messaging_product": "whatsapp",
@@ -182,24 +117,10 @@ class MetaCloudProvider:
                 provider_id = data.get("messages", [{}])[0].get("id")
             except Exception:
                 provider_id = None
-            with SessionLocal() as db:
-                db.query(MessageLog).filter(
-                    MessageLog.tenant_id == int(tenant), MessageLog.to == to, MessageLog.kind == "template"
-                ).order_by(MessageLog.id.desc()).limit(1).update({
-                    MessageLog.status: "sent",
-                    MessageLog.provider_message_id: provider_id,
-                })
-                db.commit()
+            recorder.sent(log_uid, provider_id)
             return data
         except Exception as exc:
-            with SessionLocal() as db:
-                db.query(MessageLog).filter(
-                    MessageLog.tenant_id == int(tenant), MessageLog.to == to, MessageLog.kind == "template"
-                ).order_by(MessageLog.id.desc()).limit(1).update({
-                    MessageLog.status: "error",
-                    MessageLog.error_code: str(exc),
-                })
-                db.commit()
+            recorder.error(log_uid, str(exc))
             raise
 
     def mark_read(self, message_id: str) -> Dict[str, Any]:
@@ -0,0 +1,90 @@
+"""Particionamento por contato (wa_id) para o processamento inbound.
+
+Mensagens de um mesmo contato precisam ser processadas em ordem (o funil faz
+read-modify-write em `Conversation.last_state`), mas contatos diferentes são
+independentes. Cada wa_id é mapeado por hash consistente para uma de N partições
+(shards do Redis Stream do webhook); cada partição é consumida em série por um único
+dono (lease no Redis) e as partições se distribuem entre os consumidores.
+
+Com WEBHOOK_STREAM_PARTITIONS=1 (padrão) nada muda: um único stream, WEBHOOK_STREAM_KEY.
+"""
+from __future__ import annotations
+import hashlib
+from typing import Any, Iterator
+
+from app.core.config import settings
+
+
+def _hash64(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def partition_for(wa_id: str, partitions: int | None = None) -> int:
+    """Jump consistent hash (Lamping & Veach): ao mudar N, só ~1/N dos contatos trocam de partição."""
+    n = partitions or settings.WEBHOOK_STREAM_PARTITIONS
+    if n <= 1:
+        return 0
+    key = _hash64(wa_id or "")
+    b, j = -1, 0
+    while j < n:
+        b = j
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        j = int((b + 1) * (float(1 << 31) / float((key >> 33) + 1)))
+    return b
+
+
+def stream_key(partition: int, partitions: int | None = None) -> str:
+    n = partitions or settings.WEBHOOK_STREAM_PARTITIONS
+    if n <= 1:
+        return settings.WEBHOOK_STREAM_KEY
+    return f"{settings.WEBHOOK_STREAM_KEY}:{partition}"
+
+
+def all_stream_keys(partitions: int | None = None) -> list[str]:
+    n = partitions or settings.WEBHOOK_STREAM_PARTITIONS
+    return [stream_key(p, n) for p in range(max(1, n))]
+
+
+def _items_by_partition(value: dict, n: int) -> Iterator[tuple[int, str, dict]]:
+    contacts = value.get("contacts", []) or []
+    fallback = contacts[0].get("wa_id") if contacts else None
+    for msg in value.get("messages", []) or []:
+        yield partition_for(msg.get("from") or fallback or "", n), "messages", msg
+    for st in value.get("statuses", []) or []:
+        yield partition_for(st.get("recipient_id") or "", n), "statuses", st
+
+
+def split_payload(payload: dict, partitions: int | None = None) -> dict[int, dict]:
+    """Divide um payload do webhook por partição, preservando entry/change/metadata.
+
+    Payloads de um só contato (o caso comum) viram uma única partição sem cópia.
+    """
+    n = partitions or settings.WEBHOOK_STREAM_PARTITIONS
+    if n <= 1:
+        return {0: payload}
+    out: dict[int, dict[str, Any]] = {}
+    seen: set[int] = set()
+    for entry in payload.get("entry", []) or []:
+        for change in entry.get("changes", []) or []:
+            value = change.get("value", {}) or {}
+            groups: dict[int, dict[str, list]] = {}
+            for p, kind, item in _items_by_partition(value, n):
+                groups.setdefault(p, {"messages": [], "statuses": []})[kind].append(item)
+                seen.add(p)
+            for p, items in groups.items():
+                wa_ids = {m.get("from") for m in items["messages"]} | {s.get("recipient_id") for s in items["statuses"]}
+                part_value = {k: v for k, v in value.items() if k not in ("messages", "statuses", "contacts")}
+                contacts = [c for c in value.get("contacts", []) or [] if c.get("wa_id") in wa_ids]
+                if contacts:
+                    part_value["contacts"] = contacts
+                for kind in ("messages", "statuses"):
+                    if items[kind]:
+                        part_value[kind] = items[kind]
+                part_entry = {k: v for k, v in entry.items() if k != "changes"}
+                part_entry["changes"] = [{**change, "value": part_value}]
+                out.setdefault(p, {**{k: v for k, v in payload.items() if k != "entry"}, "entry": []})
+                out[p]["entry"].append(part_entry)
+    if len(seen) <= 1:
+        # Um só contato (ou nenhum item reconhecido): mantém o payload original inteiro
+        return {next(iter(seen), 0): payload}
+    return out
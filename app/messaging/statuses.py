@@ -0,0 +1,180 @@
+from __future__ import annotations
+from dataclasses import dataclass
+import threading
+from typing import Iterable, Iterator
+
+import structlog
+from sqlalchemy import case, update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.messaging.batching import BatchFlusher
+from app.repositories.db import SessionLocal
+from app.repositories.models import Message, MessageLog
+
+log = structlog.get_logger()
+
+# Ordem de progressão dos status de entrega; um status nunca regride para um de rank menor.
+# "failed" é terminal (a Meta não manda delivered/read depois de failed).
+STATUS_RANK: dict[str, int] = {"queued": 0, "sent": 1, "delivered": 2, "read": 3, "failed": 4}
+
+# Chunk das listas IN por UPDATE (limite de parâmetros do driver)
+_IN_CHUNK = 1000
+
+
+@dataclass
+class StatusEvent:
+    """Evento de `value.statuses[]` do webhook."""
+
+    provider_message_id: str
+    status: str
+    error_code: str | None = None
+    # Flushes em que o evento já voltou ao buffer (linha ainda não gravada ou erro no flush)
+    attempts: int = 0
+
+
+def iter_statuses(payload: dict) -> Iterator[StatusEvent]:
+    """Percorre entry[].changes[].value.statuses[] e devolve os eventos com status conhecido."""
+    for entry in payload.get("entry", []) or []:
+        for change in entry.get("changes", []) or []:
+            value = change.get("value", {}) or {}
+            for st in value.get("statuses", []) or []:
+                pid = st.get("id")
+                status = (st.get("status") or "").lower()
+                if not pid or status not in STATUS_RANK:
+                    continue
+                error_code = None
+                errors = st.get("errors") or []
+                if status == "failed" and errors:
+                    err = errors[0] or {}
+                    error_code = str(err.get("code") or err.get("title") or "failed")[:64]
+                yield StatusEvent(provider_message_id=pid, status=status, error_code=error_code)
+
+
+def _not_after(status: str) -> list[str]:
+    """Status que o alvo não pode sobrescrever (iguais ou mais avançados)."""
+    rank = STATUS_RANK[status]
+    return [s for s, r in STATUS_RANK.items() if r >= rank]
+
+
+class StatusCoalescer(BatchFlusher):
+    """Agrega status de entrega por `provider_message_id` e aplica em lote.
+
+    Dentro de uma janela de flush fica só o status mais avançado de cada mensagem
+    (sent→delivered→read chegam quase juntos e viram uma única escrita). No flush,
+    os ids são agrupados por status alvo e cada grupo vira um UPDATE ... WHERE id IN (...)
+    RETURNING em `message_logs` e outro em `messages`, com guarda contra regressão de
+    status (eventos fora de ordem entre janelas).
+
+    Status de uma mensagem cuja linha ainda não existe (o `sent` da Meta chega antes do
+    flush do MessageLogRecorder) e lotes cujo flush falhou voltam ao buffer e são
+    reaplicados nos próximos flushes, até STATUS_MAX_RETRIES vezes.
+    """
+
+    def __init__(self, interval_s: float | None = None, max_items: int | None = None) -> None:
+        super().__init__(
+            "delivery_statuses",
+            interval_s if interval_s is not None else settings.STATUS_FLUSH_INTERVAL_MS / 1000.0,
+            max_items or settings.STATUS_FLUSH_MAX_ITEMS,
+        )
+        self._pending: dict[str, StatusEvent] = {}
+
+    def add(self, ev: StatusEvent) -> None:
+        with self._lock:
+            cur = self._pending.get(ev.provider_message_id)
+            if cur is None or STATUS_RANK[ev.status] > STATUS_RANK[cur.status]:
+                self._pending[ev.provider_message_id] = ev
+        self._notify()
+
+    def add_payload(self, payload: dict) -> int:
+        n = 0
+        for ev in iter_statuses(payload):
+            self.add(ev)
+            n += 1
+        return n
+
+    def _size(self) -> int:
+        return len(self._pending)
+
+    def _drain(self) -> dict[str, StatusEvent] | None:
+        if not self._pending:
+            return None
+        batch, self._pending = self._pending, {}
+        return batch
+
+    def _write(self, batch: dict[str, StatusEvent]) -> None:
+        groups: dict[tuple[str, str | None], list[str]] = {}
+        for ev in batch.values():
+            groups.setdefault((ev.status, ev.error_code), []).append(ev.provider_message_id)
+        unmatched: list[str] = []
+        try:
+            with SessionLocal() as db:
+                for (status, error_code), ids in groups.items():
+                    for i in range(0, len(ids), _IN_CHUNK):
+                        chunk = ids[i:i + _IN_CHUNK]
+                        found = _apply(db, chunk, status, error_code)
+                        unmatched.extend(pid for pid in chunk if pid not in found)
+                db.commit()
+        except Exception as e:  # noqa: BLE001
+            log.error("status_flush_error", error=str(e), events=len(batch))
+            self._retry(batch.values(), "flush_error")
+            return
+        if unmatched:
+            self._retry((batch[pid] for pid in unmatched), "row_not_found")
+        log.debug("status_flushed", events=len(batch), groups=len(groups), unmatched=len(unmatched))
+
+    def _retry(self, events: Iterable[StatusEvent], reason: str) -> None:
+        """Devolve ao buffer (sem sobrescrever status mais novos que chegaram nesse meio tempo)."""
+        dropped = 0
+        for ev in events:
+            if ev.attempts >= settings.STATUS_MAX_RETRIES:
+                dropped += 1
+                continue
+            ev.attempts += 1
+            self.add(ev)
+        if dropped:
+            log.warning("status_events_dropped", reason=reason, count=dropped)
+
+
+def _apply(db: Session, ids: list[str], status: str, error_code: str | None) -> set[str]:
+    """Aplica o status em message_logs e messages; devolve os ids que têm linha em alguma delas.
+
+    A guarda contra regressão fica no SET (CASE mantém o status igual/mais avançado), não no
+    WHERE: assim o RETURNING traz toda linha existente e os ids sem linha saem sem outro SELECT.
+    """
+    blocked = _not_after(status)
+    log_values: dict = {"status": case((MessageLog.status.in_(blocked), MessageLog.status), else_=status)}
+    if error_code:
+        log_values["error_code"] = case((MessageLog.status.in_(blocked), MessageLog.error_code), else_=error_code)
+    found = set(
+        db.scalars(
+            update(MessageLog)
+            .where(MessageLog.provider_message_id.in_(ids))
+            .values(**log_values)
+            .returning(MessageLog.provider_message_id)
+            .execution_options(synchronize_session=False)
+        )
+    )
+    found.update(
+        db.scalars(
+            update(Message)
+            .where(Message.wa_message_id.in_(ids))
+            .values(status=case((Message.status.in_(blocked), Message.status), else_=status))
+            .returning(Message.wa_message_id)
+            .execution_options(synchronize_session=False)
+        )
+    )
+    return found
+
+
+_coalescer: StatusCoalescer | None = None
+_coalescer_lock = threading.Lock()
+
+
+def get_status_coalescer() -> StatusCoalescer:
+    global _coalescer
+    if _coalescer is None:
+        with _coalescer_lock:
+            if _coalescer is None:
+                _coalescer = StatusCoalescer()
+    return _coalescer
@@ -0,0 +1,126 @@
+"""Oráculo da janela de sessão de 24h do WhatsApp.
+
+A última inbound por (tenant, wa_id) fica no Redis (`win:{tenant}:{wa_id}`, TTL igual a
+WINDOW_24H_HOURS) e em `Contact.last_inbound_at` como fallback durável. O caminho inbound
+grava a coluna na própria transação e chama `cache_inbound` após o commit; a checagem no
+envio é uma leitura de chave. Os datetimes são naive em UTC; no Redis, epoch em segundos.
+"""
+from __future__ import annotations
+import calendar
+from datetime import datetime, timedelta, timezone
+from typing import Iterable
+
+import structlog
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.redis_client import get_redis
+from app.repositories.models import Contact
+
+log = structlog.get_logger()
+
+_BULK_CHUNK = 1000
+
+
+def _key(tenant_id: int | str, wa_id: str) -> str:
+    return f"win:{tenant_id}:{wa_id}"
+
+
+def _window() -> timedelta:
+    return timedelta(hours=settings.WINDOW_24H_HOURS)
+
+
+def _inside(last: datetime | None, now: datetime) -> bool:
+    return last is not None and (now - last) <= _window()
+
+
+def _epoch(at: datetime) -> float:
+    """Datetime naive em UTC -> epoch (`at.timestamp()` trataria o naive como hora local)."""
+    return calendar.timegm(at.utctimetuple()) + at.microsecond / 1e6
+
+
+def _from_epoch(value: float) -> datetime:
+    return datetime.fromtimestamp(value, timezone.utc).replace(tzinfo=None)
+
+
+def _remember(items: dict[str, datetime], tenant_id: int | str, now: datetime) -> None:
+    """Grava no Redis (pipeline) os timestamps ainda dentro da janela, com o TTL restante."""
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        for wa_id, at in items.items():
+            ttl = int((_window() - (now - at)).total_seconds())
+            if ttl > 0:
+                pipe.set(_key(tenant_id, wa_id), f"{_epoch(at):.3f}", ex=ttl)
+        pipe.execute()
+    except Exception as e:  # noqa: BLE001
+        log.warning("window_cache_write_error", error=str(e))
+
+
+def cache_inbound(tenant_id: int | str, wa_ids: Iterable[str], at: datetime) -> None:
+    """Parte Redis do registro de inbound (chamar após o commit da coluna)."""
+    _remember({w: at for w in wa_ids if w}, tenant_id, at)
+
+
+def _from_cache(tenant_id: int | str, wa_ids: list[str]) -> dict[str, datetime | None]:
+    try:
+        values = get_redis().mget([_key(tenant_id, w) for w in wa_ids])
+    except Exception as e:  # noqa: BLE001
+        log.warning("window_cache_read_error", error=str(e))
+        return {w: None for w in wa_ids}
+    out: dict[str, datetime | None] = {}
+    for w, v in zip(wa_ids, values):
+        out[w] = _from_epoch(float(v)) if v else None
+    return out
+
+
+def bulk_last_inbound(db: Session, tenant_id: int, wa_ids: Iterable[str]) -> dict[str, datetime | None]:
+    """Última inbound para muitos contatos: MGET em blocos + um SELECT ... IN para os misses."""
+    wa_list = list(dict.fromkeys(w for w in wa_ids if w))
+    result: dict[str, datetime | None] = {}
+    now = datetime.utcnow()
+    for i in range(0, len(wa_list), _BULK_CHUNK):
+        chunk = wa_list[i : i + _BULK_CHUNK]
+        cached = _from_cache(tenant_id, chunk)
+        misses = [w for w, v in cached.items() if v is None]
+        result.update({w: v for w, v in cached.items() if v is not None})
+        if not misses:
+            continue
+        rows = db.execute(
+            select(Contact.wa_id, Contact.last_inbound_at).where(
+                Contact.tenant_id == tenant_id, Contact.wa_id.in_(misses)
+            )
+        ).all()
+        found = {w: at for w, at in rows}
+        for w in misses:
+            result[w] = found.get(w)
+        # Repopula o cache (ex.: Redis reiniciado) para quem ainda está na janela
+        _remember({w: at for w, at in found.items() if _inside(at, now)}, tenant_id, now)
+    return result
+
+
+def last_inbound_at(db: Session, tenant_id: int, wa_id: str) -> datetime | None:
+    return bulk_last_inbound(db, tenant_id, [wa_id]).get(wa_id)
+
+
+def is_inside_window(db: Session, tenant_id: int, wa_id: str) -> bool:
+    return _inside(last_inbound_at(db, tenant_id, wa_id), datetime.utcnow())
+
+
+def bulk_inside_window(db: Session, tenant_id: int, wa_ids: Iterable[str]) -> dict[str, bool]:
+    """`is_inside_window` para muitos contatos com a leitura em lote de `bulk_last_inbound`."""
+    now = datetime.utcnow()
+    return {w: _inside(at, now) for w, at in bulk_last_inbound(db, tenant_id, wa_ids).items()}
+
+
+def window_status(last: datetime | None, now: datetime | None = None) -> dict:
+    """Formato de resposta usado pelos endpoints admin."""
+    if last is None:
+        return {"inside_window": False, "last_inbound_at": None, "hours_since": None}
+    now = now or datetime.utcnow()
+    delta_h = (now - last).total_seconds() / 3600.0
+    return {
+        "inside_window": delta_h <= settings.WINDOW_24H_HOURS,
+        "last_inbound_at": last.replace(tzinfo=timezone.utc),
+        "hours_since": round(delta_h, 2),
+    }
@@ -0,0 +1,466 @@
+"""Arquivo frio do histórico (messages, conversation_events, message_logs) em NDJSON comprimido.
+
+Cada segmento é um arquivo `.ndjson.zst` (ou `.gz`) com as linhas ordenadas por conversa;
+as linhas de cada conversa formam um frame zstd / membro gzip independente, e o índice
+do segmento (`.idx.json`, pequeno) guarda o intervalo de bytes de cada conversa. Ler o
+histórico de uma conversa é: consulta em `archive_segments` pela faixa de conversation_id,
+leitura do índice (em cache) e leitura só dos bytes daquela conversa (range read no S3).
+
+Fontes do job `archive_expired`:
+- partições desanexadas pela retenção (Postgres, PARTITION_EXPIRED_ACTION=detach): a tabela
+  inteira vai para o arquivo e é removida. Segmentos de uma execução anterior interrompida
+  (antes do DROP) para a mesma partição são substituídos, não duplicados;
+- linhas mais antigas que ARCHIVE_AFTER_MONTHS nas tabelas vivas (qualquer banco): vão para o
+  arquivo e são apagadas por id na mesma transação que registra o segmento.
+
+Partições desanexadas são lidas com cursor do lado do servidor (stream_results); tabelas
+vivas, em páginas por chave (grupo, id) na sessão do writer, sem cursor aberto entre os
+commits dos segmentos. Em ambos a memória fica limitada a uma página/frame por vez. Destino: ARCHIVE_URL = diretório local (`file:///...`) ou
+`s3://bucket/prefixo` (boto3; ARCHIVE_S3_ENDPOINT_URL para storages compatíveis).
+"""
+from __future__ import annotations
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import date, datetime
+import gzip
+import json
+import os
+import tempfile
+import threading
+from typing import Any, Iterable, Iterator
+from urllib.parse import urlparse
+
+import structlog
+from sqlalchemy import MetaData, Select, and_, delete, or_, select, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.repositories.models import ArchiveSegment, Base
+from app.repositories.partitions import add_months, detached_partitions, is_postgres, month_start
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - zstandard é opcional (gzip como fallback)
+    zstandard = None  # type: ignore[assignment]
+
+log = structlog.get_logger()
+
+ARCHIVED_TABLES = ("messages", "conversation_events", "message_logs")
+# Coluna que agrupa as linhas em frames; sem coluna (logs), frames por bloco de linhas
+_GROUP_COLUMN = {"messages": "conversation_id", "conversation_events": "conversation_id", "message_logs": None}
+_NO_GROUP = "*"
+# Conversas muito longas viram vários frames (limita a memória do writer e do leitor)
+_FRAME_MAX_BYTES = 1 << 20
+
+
+# ------------------- Codecs -------------------
+class _GzipCodec:
+    name = "gzip"
+    ext = "gz"
+
+    def compress(self, data: bytes) -> bytes:
+        return gzip.compress(data, compresslevel=6)
+
+    def decompress(self, data: bytes) -> bytes:
+        return gzip.decompress(data)
+
+
+class _ZstdCodec:
+    name = "zstd"
+    ext = "zst"
+
+    def __init__(self) -> None:
+        self._c = zstandard.ZstdCompressor(level=3)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._c.compress(data)
+
+    def decompress(self, data: bytes) -> bytes:
+        return zstandard.ZstdDecompressor().decompress(data)
+
+
+def get_codec(name: str | None = None):  # type: ignore[no-untyped-def]
+    name = (name or settings.ARCHIVE_CODEC).lower()
+    if name == "zstd":
+        if zstandard is not None:
+            return _ZstdCodec()
+        log.warning("archive_zstd_unavailable", fallback="gzip")
+    return _GzipCodec()
+
+
+# ------------------- Storage -------------------
+class LocalStore:
+    def __init__(self, root: str) -> None:
+        self.root = root
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def put_file(self, key: str, src: str) -> None:
+        dst = self._path(key)
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        os.replace(src, dst)
+
+    def put_bytes(self, key: str, data: bytes) -> None:
+        dst = self._path(key)
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        with open(dst, "wb") as f:
+            f.write(data)
+
+    def read(self, key: str) -> bytes:
+        with open(self._path(key), "rb") as f:
+            return f.read()
+
+    def read_range(self, key: str, offset: int, length: int) -> bytes:
+        with open(self._path(key), "rb") as f:
+            f.seek(offset)
+            return f.read(length)
+
+    def delete(self, key: str) -> None:
+        try:
+            os.unlink(self._path(key))
+        except FileNotFoundError:
+            pass
+
+
+class S3Store:
+    def __init__(self, bucket: str, prefix: str) -> None:
+        import boto3  # dependência opcional (extra "s3")
+
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self._s3 = boto3.client("s3", endpoint_url=settings.ARCHIVE_S3_ENDPOINT_URL or None)
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def put_file(self, key: str, src: str) -> None:
+        self._s3.upload_file(src, self.bucket, self._key(key))
+        os.unlink(src)
+
+    def put_bytes(self, key: str, data: bytes) -> None:
+        self._s3.put_object(Bucket=self.bucket, Key=self._key(key), Body=data)
+
+    def read(self, key: str) -> bytes:
+        return self._s3.get_object(Bucket=self.bucket, Key=self._key(key))["Body"].read()
+
+    def read_range(self, key: str, offset: int, length: int) -> bytes:
+        rng = f"bytes={offset}-{offset + length - 1}"
+        return self._s3.get_object(Bucket=self.bucket, Key=self._key(key), Range=rng)["Body"].read()
+
+    def delete(self, key: str) -> None:
+        self._s3.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+
+def get_store(url: str | None = None):  # type: ignore[no-untyped-def]
+    url = url if url is not None else settings.ARCHIVE_URL
+    if not url:
+        raise RuntimeError("ARCHIVE_URL não configurado")
+    parsed = urlparse(url)
+    if parsed.scheme == "s3":
+        return S3Store(parsed.netloc, parsed.path)
+    return LocalStore(parsed.path if parsed.scheme == "file" else url)
+
+
+# ------------------- Escrita -------------------
+def _encode(row: dict[str, Any]) -> bytes:
+    return json.dumps(row, default=_json_default, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if hasattr(value, "value"):  # Enum
+        return value.value
+    return str(value)
+
+
+@dataclass
+class _Segment:
+    """Segmento em escrita: arquivo temporário + índice de frames por grupo."""
+
+    table: str
+    codec: Any
+    fh: Any
+    tmp_path: str
+    offset: int = 0
+    rows: int = 0
+    index: dict[str, list[list[int]]] = field(default_factory=dict)
+    ids: list[int] = field(default_factory=list)
+    group_min: int | None = None
+    group_max: int | None = None
+    created_min: datetime | None = None
+    created_max: datetime | None = None
+
+    def write_frame(self, group: Any, lines: list[bytes]) -> None:
+        frame = self.codec.compress(b"\n".join(lines) + b"\n")
+        self.fh.write(frame)
+        self.index.setdefault(_NO_GROUP if group is None else str(group), []).append([self.offset, len(frame), len(lines)])
+        self.offset += len(frame)
+        if isinstance(group, int):
+            self.group_min = group if self.group_min is None else min(self.group_min, group)
+            self.group_max = group if self.group_max is None else max(self.group_max, group)
+
+
+class SegmentWriter:
+    """Agrupa as linhas (já ordenadas pela coluna de grupo) em frames e gira segmentos por tamanho."""
+
+    def __init__(self, db: Session, store, table: str, source: str, month: date | None, codec=None) -> None:  # type: ignore[no-untyped-def]
+        self.db = db
+        self.store = store
+        self.table = table
+        self.source = source
+        self.month = month
+        self.codec = codec or get_codec()
+        self.group_col = _GROUP_COLUMN[table]
+        self.max_rows = settings.ARCHIVE_SEGMENT_MAX_ROWS
+        self.segments: list[ArchiveSegment] = []
+        self._seg: _Segment | None = None
+        self._group: Any = None
+        self._lines: list[bytes] = []
+        self._bytes = 0
+
+    def _open(self) -> _Segment:
+        fd, path = tempfile.mkstemp(prefix=f"archive-{self.table}-", suffix=f".ndjson.{self.codec.ext}")
+        return _Segment(self.table, self.codec, os.fdopen(fd, "wb"), path)
+
+    def _flush_frame(self) -> None:
+        if self._lines and self._seg is not None:
+            self._seg.write_frame(self._group, self._lines)
+        self._lines, self._bytes = [], 0
+
+    def add(self, row: dict[str, Any]) -> None:
+        group = row.get(self.group_col) if self.group_col else None
+        if self._seg is None:
+            self._seg = self._open()
+        elif group != self._group or self._bytes >= _FRAME_MAX_BYTES:
+            self._flush_frame()
+            if self._seg.rows >= self.max_rows and group != self._group:
+                self._close()
+                self._seg = self._open()
+        self._group = group
+        line = _encode(row)
+        self._lines.append(line)
+        self._bytes += len(line)
+        seg = self._seg
+        seg.rows += 1
+        seg.ids.append(row["id"])
+        created = row.get("created_at")
+        if isinstance(created, datetime):
+            seg.created_min = created if seg.created_min is None else min(seg.created_min, created)
+            seg.created_max = created if seg.created_max is None else max(seg.created_max, created)
+
+    def _close(self) -> None:
+        self._flush_frame()
+        seg, self._seg = self._seg, None
+        if seg is None or not seg.rows:
+            return
+        seg.fh.close()
+        stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S%f")
+        period = self.month.strftime("%Y-%m") if self.month else "live"
+        key = f"{self.table}/{period}/{stamp}.ndjson.{self.codec.ext}"
+        self.store.put_file(key, seg.tmp_path)
+        self.store.put_bytes(f"{key}.idx.json", json.dumps(seg.index, separators=(",", ":")).encode())
+        record = ArchiveSegment(
+            table_name=self.table,
+            source=self.source,
+            month=self.month,
+            path=key,
+            codec=self.codec.name,
+            rows=seg.rows,
+            group_min=seg.group_min,
+            group_max=seg.group_max,
+            created_min=seg.created_min,
+            created_max=seg.created_max,
+        )
+        self.db.add(record)
+        self.on_segment(seg.ids)
+        self.db.commit()
+        self.segments.append(record)
+        log.info("archive_segment_written", table=self.table, path=key, rows=seg.rows)
+
+    def on_segment(self, ids: list[int]) -> None:
+        """Chamado com o segmento já no storage, na transação que o registra (ex.: apagar as linhas de origem)."""
+
+    def close(self) -> list[ArchiveSegment]:
+        self._close()
+        return self.segments
+
+    def abort(self) -> None:
+        seg, self._seg = self._seg, None
+        if seg is not None:
+            seg.fh.close()
+            os.unlink(seg.tmp_path)
+
+
+class _DeletingWriter(SegmentWriter):
+    """Apaga da tabela viva as linhas de cada segmento na transação que o registra.
+
+    Segmento registrado e linhas apagadas são um commit só: uma queda no meio do job não
+    deixa linhas no banco e no arquivo ao mesmo tempo (leitura duplicada).
+    """
+
+    def on_segment(self, ids: list[int]) -> None:
+        table = Base.metadata.tables[self.table]
+        for i in range(0, len(ids), 1000):
+            self.db.execute(delete(table).where(table.c.id.in_(ids[i : i + 1000])))
+
+
+def _stream(conn: Connection, stmt: Select) -> Iterator[dict[str, Any]]:
+    # Cursor do lado do servidor: linhas chegam em blocos, sem materializar a tabela
+    result = conn.execution_options(stream_results=True, yield_per=2000).execute(stmt)
+    for row in result.mappings():
+        yield dict(row)
+
+
+def _paged(db: Session, table: str, stmt: Select, page: int = 2000) -> Iterator[dict[str, Any]]:
+    """Linhas de `stmt` (ordenado por grupo, id) em páginas por chave, na sessão do writer.
+
+    Cada página é uma consulta curta: o writer pode apagar e fazer commit entre as páginas
+    (SQLite não aceita commit com uma leitura aberta em outra conexão). As linhas apagadas
+    ficam antes da chave da próxima página, então nada é pulado nem lido duas vezes.
+    """
+    cols = stmt.selected_columns
+    group = _GROUP_COLUMN[table]
+    last: dict[str, Any] | None = None
+    while True:
+        q = stmt
+        if last is not None:
+            after = cols.id > last["id"]
+            if group:
+                after = or_(cols[group] > last[group], and_(cols[group] == last[group], after))
+            q = q.where(after)
+        rows = [dict(r) for r in db.execute(q.limit(page)).mappings()]
+        yield from rows
+        if len(rows) < page:
+            return
+        last = rows[-1]
+
+
+def _replace_segments(db: Session, store, table: str, source: str) -> None:  # type: ignore[no-untyped-def]
+    """Remove os segmentos de uma execução anterior interrompida para a mesma origem."""
+    old = db.scalars(select(ArchiveSegment).where(ArchiveSegment.table_name == table, ArchiveSegment.source == source)).all()
+    if not old:
+        return
+    paths = [seg.path for seg in old]
+    for seg in old:
+        db.delete(seg)
+    db.commit()
+    for path in paths:
+        try:
+            store.delete(path)
+            store.delete(f"{path}.idx.json")
+        except Exception as e:  # noqa: BLE001
+            log.warning("archive_segment_delete_error", path=path, error=str(e))
+    log.warning("archive_segments_replaced", table=table, source=source, segments=len(paths))
+
+
+def _select_ordered(table: str, source: str | None = None) -> Select:
+    """SELECT tipado (datas/enums/JSON convertidos) da tabela ou de uma partição desanexada dela."""
+    tbl = Base.metadata.tables[table]
+    if source is not None:
+        tbl = tbl.to_metadata(MetaData(), name=source)
+    col = _GROUP_COLUMN[table]
+    order = [tbl.c[col], tbl.c.id] if col else [tbl.c.id]
+    return select(tbl).order_by(*order)
+
+
+def _archive_rows(writer: SegmentWriter, rows: Iterable[dict[str, Any]]) -> int:
+    n = 0
+    try:
+        for row in rows:
+            writer.add(row)
+            n += 1
+        writer.close()
+    except Exception:
+        writer.abort()
+        raise
+    return n
+
+
+def archive_expired(engine: Engine, session_factory, today: date | None = None) -> dict[str, int]:  # type: ignore[no-untyped-def]
+    """Arquiva partições desanexadas e linhas vivas mais antigas que ARCHIVE_AFTER_MONTHS."""
+    store = get_store()
+    report: dict[str, int] = {}
+    if is_postgres(engine):
+        with engine.connect() as conn:
+            pending = detached_partitions(conn, ARCHIVED_TABLES)
+        for table, name, month in pending:
+            with engine.connect() as conn, session_factory() as db:
+                # O DROP só vem depois do último segmento: se a execução anterior caiu antes
+                # dele, a partição é arquivada de novo e os segmentos antigos saem do índice
+                _replace_segments(db, store, table, name)
+                writer = SegmentWriter(db, store, table, source=name, month=month)
+                n = _archive_rows(writer, _stream(conn, _select_ordered(table, name)))
+            with engine.begin() as conn:
+                conn.execute(text(f'DROP TABLE "{name}"'))
+            report[name] = n
+
+    if settings.ARCHIVE_AFTER_MONTHS > 0:
+        before = datetime.combine(
+            add_months(month_start(today or datetime.utcnow().date()), -settings.ARCHIVE_AFTER_MONTHS), datetime.min.time()
+        )
+        for table in ARCHIVED_TABLES:
+            with session_factory() as db:
+                writer = _DeletingWriter(db, store, table, source=table, month=None)
+                stmt = _select_ordered(table)
+                stmt = stmt.where(stmt.selected_columns.created_at < before)
+                report[table] = _archive_rows(writer, _paged(db, table, stmt))
+    log.info("archive_done", **report)
+    return report
+
+
+# ------------------- Leitura -------------------
+class _IndexCache:
+    """LRU dos índices de segmento (poucos KB cada) por caminho."""
+
+    def __init__(self, max_size: int = 256) -> None:
+        self.max_size = max_size
+        self._items: OrderedDict[str, dict[str, list[list[int]]]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, store, path: str) -> dict[str, list[list[int]]]:  # type: ignore[no-untyped-def]
+        with self._lock:
+            hit = self._items.get(path)
+            if hit is not None:
+                self._items.move_to_end(path)
+                return hit
+        index = json.loads(store.read(f"{path}.idx.json"))
+        with self._lock:
+            self._items[path] = index
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+        return index
+
+
+_index_cache = _IndexCache()
+
+
+def read_archived(
+    db: Session, table: str, group_ids: Iterable[int], before: datetime | None = None, store=None  # type: ignore[no-untyped-def]
+) -> list[dict[str, Any]]:
+    """Linhas arquivadas das conversas pedidas (mais recentes primeiro), lendo só os frames delas."""
+    ids = sorted(set(group_ids))
+    if not ids:
+        return []
+    S = ArchiveSegment
+    stmt = select(S).where(S.table_name == table, S.group_min <= ids[-1], S.group_max >= ids[0])
+    if before is not None:
+        stmt = stmt.where(S.created_min < before)
+    segments = db.scalars(stmt).all()
+    if not segments:
+        return []
+    store = store or get_store()
+    out: list[dict[str, Any]] = []
+    for seg in segments:
+        codec = get_codec(seg.codec)
+        index = _index_cache.get(store, seg.path)
+        for gid in ids:
+            for offset, length, _rows in index.get(str(gid), ()):
+                for line in codec.decompress(store.read_range(seg.path, offset, length)).splitlines():
+                    row = json.loads(line)
+                    if before is None or row["created_at"] < before.isoformat():
+                        out.append(row)
+    out.sort(key=lambda r: (r["created_at"], r["id"]), reverse=True)
+    return out
@@ -0,0 +1,62 @@
+"""Versão do catálogo de veículos por tenant.
+
+Carimbo monotônico (`catalog:version:{tenant_id}` no Redis) incrementado a cada commit que
+altera veículos (imports/sync). Caches derivados do catálogo usam a versão na chave: mudou
+a versão, o cache está velho. O valor nunca fica abaixo do relógio em ms, então um Redis
+zerado não reaproveita uma versão antiga.
+
+Leitura com cache local curto (CATALOG_VERSION_CACHE_TTL_S). Sem Redis, a versão é 0
+(consumidores devem cair no próprio TTL).
+"""
+from __future__ import annotations
+import threading
+import time
+
+import structlog
+
+from app.core.config import settings
+from app.core.redis_client import get_redis
+
+log = structlog.get_logger()
+
+# max(atual + 1, agora_ms): monotônico mesmo após perda do Redis
+_BUMP_LUA = """
+local v = tonumber(redis.call('GET', KEYS[1]) or '0')
+local n = math.max(v + 1, tonumber(ARGV[1]))
+redis.call('SET', KEYS[1], n)
+return n
+"""
+
+_local: dict[int, tuple[float, int]] = {}
+_lock = threading.Lock()
+
+
+def _key(tenant_id: int) -> str:
+    return f"catalog:version:{tenant_id}"
+
+
+def bump_version(tenant_id: int) -> int | None:
+    try:
+        version = int(get_redis().eval(_BUMP_LUA, 1, _key(tenant_id), int(time.time() * 1000)))
+    except Exception as e:  # noqa: BLE001
+        log.warning("catalog_version_bump_error", tenant_id=tenant_id, error=str(e))
+        return None
+    with _lock:
+        _local[tenant_id] = (time.monotonic() + settings.CATALOG_VERSION_CACHE_TTL_S, version)
+    return version
+
+
+def get_version(tenant_id: int) -> int:
+    now = time.monotonic()
+    with _lock:
+        hit = _local.get(tenant_id)
+    if hit is not None and hit[0] > now:
+        return hit[1]
+    try:
+        version = int(get_redis().get(_key(tenant_id)) or 0)
+    except Exception as e:  # noqa: BLE001
+        log.warning("catalog_version_read_error", tenant_id=tenant_id, error=str(e))
+        version = 0
+    with _lock:
+        _local[tenant_id] = (now + settings.CATALOG_VERSION_CACHE_TTL_S, version)
+    return version
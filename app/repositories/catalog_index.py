@@ -0,0 +1,217 @@
+"""Índice em memória do catálogo de veículos (GET /veiculos), por tenant.
+
+Cada processo da API guarda um snapshot colunar dos veículos ativos do tenant: arrays NumPy
+de id, ano, preço e códigos de categoria/marca/modelo, já na ordem da listagem (id desc).
+Cada filtro vira uma máscara booleana vetorizada. A busca por marca/modelo (substring, sem
+diferenciar caixa nem acentos) compara só os valores distintos e vira uma tabela
+código -> casa indexada pelos códigos. A página é o primeiro trecho da máscara após o cursor, sem ir ao banco.
+
+O snapshot vale enquanto a versão do catálogo (repositories.catalog, avançada pelos imports)
+não muda e por no máximo CATALOG_INDEX_MAX_AGE_S (sem Redis a versão fica 0 e vale só a idade).
+"""
+from __future__ import annotations
+from dataclasses import dataclass
+import threading
+import time
+from typing import Sequence
+import unicodedata
+
+import numpy as np
+import structlog
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.repositories import catalog
+from app.repositories.db import SessionLocal
+from app.repositories.models import Vehicle
+
+log = structlog.get_logger()
+
+
+def normalize(value: str) -> str:
+    """Minúsculas e sem acentos ("Citroën" -> "citroen")."""
+    decomposed = unicodedata.normalize("NFKD", value)
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+
+@dataclass(frozen=True)
+class _Strings:
+    """Coluna de texto como códigos (0 = vazio; n = values[n - 1]) + valores distintos normalizados."""
+
+    values: list[str]
+    codes: np.ndarray
+
+    @classmethod
+    def build(cls, raw: list[str | None]) -> "_Strings":
+        index: dict[str, int] = {}
+        codes = np.fromiter(
+            (0 if v is None else index.setdefault(normalize(v), len(index) + 1) for v in raw), np.int32, len(raw)
+        )
+        return cls(list(index), codes)
+
+    def contains(self, term: str) -> np.ndarray:
+        needle = normalize(term)
+        # Tabela código -> casa; indexar por ela é uma única passada vetorizada
+        table = np.zeros(len(self.values) + 1, dtype=bool)
+        table[1:] = [needle in value for value in self.values]
+        return table[self.codes]
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    tenant_id: int
+    version: int
+    built_at: float
+    ids: np.ndarray  # int64, desc
+    year: np.ndarray  # float64, NaN = sem ano
+    price: np.ndarray  # float64, NaN = sem preço
+    category: np.ndarray  # int32, -1 = sem categoria
+    categories: dict[str, int]
+    brand: _Strings
+    model: _Strings
+    items: list[dict]  # saída do endpoint, na mesma ordem dos arrays
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def search(
+        self,
+        categoria: str | None = None,
+        marca: str | None = None,
+        modelo: str | None = None,
+        ano_min: int | None = None,
+        ano_max: int | None = None,
+        preco_min: float | None = None,
+        preco_max: float | None = None,
+        after_id: int | None = None,
+        offset: int = 0,
+        limit: int = 12,
+    ) -> list[dict]:
+        """Itens que passam nos filtros, em id desc, após `after_id` (cursor) ou pulando `offset`.
+
+        Mesma semântica do SQL anterior: comparação com ano/preço ausente nunca casa.
+        """
+        mask = np.ones(len(self.ids), dtype=bool)
+        if categoria:
+            mask &= self.category == self.categories.get(categoria.upper(), -2)
+        if marca:
+            mask &= self.brand.contains(marca)
+        if modelo:
+            mask &= self.model.contains(modelo)
+        if ano_min is not None:
+            mask &= self.year >= ano_min
+        if ano_max is not None:
+            mask &= self.year <= ano_max
+        if preco_min is not None:
+            mask &= self.price >= preco_min
+        if preco_max is not None:
+            mask &= self.price <= preco_max
+        if after_id is not None:
+            mask &= self.ids < after_id
+        return [self.items[i] for i in np.flatnonzero(mask)[offset : offset + limit]]
+
+
+def _item(r) -> dict:  # type: ignore[no-untyped-def]
+    return {
+        "id": r.id,
+        "titulo": r.title,
+        "marca": r.brand,
+        "modelo": r.model,
+        "ano": r.year,
+        "categoria": r.category,
+        "preco": r.price,
+        "imagem": r.image_url,
+    }
+
+
+_COLUMNS = (
+    Vehicle.id,
+    Vehicle.title,
+    Vehicle.brand,
+    Vehicle.model,
+    Vehicle.year,
+    Vehicle.category,
+    Vehicle.price,
+    Vehicle.image_url,
+)
+
+
+def snapshot_from_rows(tenant_id: int, version: int, rows: Sequence) -> Snapshot:  # type: ignore[type-arg]
+    """Snapshot a partir das linhas (colunas de _COLUMNS) já em id desc."""
+    categories: dict[str, int] = {}
+    return Snapshot(
+        tenant_id=tenant_id,
+        version=version,
+        built_at=time.monotonic(),
+        ids=np.fromiter((r.id for r in rows), np.int64, len(rows)),
+        year=np.array([r.year for r in rows], dtype=np.float64),
+        price=np.array([r.price for r in rows], dtype=np.float64),
+        category=np.fromiter(
+            (-1 if r.category is None else categories.setdefault(r.category, len(categories)) for r in rows),
+            np.int32,
+            len(rows),
+        ),
+        categories=categories,
+        brand=_Strings.build([r.brand for r in rows]),
+        model=_Strings.build([r.model for r in rows]),
+        items=[_item(r) for r in rows],
+    )
+
+
+def load_rows(db: Session, tenant_id: int) -> Sequence:  # type: ignore[type-arg]
+    return db.execute(
+        select(*_COLUMNS)
+        .where(Vehicle.tenant_id == tenant_id, Vehicle.active == True)  # noqa: E712
+        .order_by(Vehicle.id.desc())
+    ).all()
+
+
+def build_snapshot(tenant_id: int, version: int) -> Snapshot:
+    with SessionLocal() as db:
+        rows = load_rows(db, tenant_id)
+    return snapshot_from_rows(tenant_id, version, rows)
+
+
+_snapshots: dict[int, Snapshot] = {}
+_locks: dict[int, threading.Lock] = {}
+
+
+def _fresh(snap: Snapshot | None, version: int) -> bool:
+    return (
+        snap is not None
+        and snap.version == version
+        and time.monotonic() - snap.built_at < settings.CATALOG_INDEX_MAX_AGE_S
+    )
+
+
+def get_snapshot(tenant_id: int) -> Snapshot:
+    """Snapshot atual do tenant; reconstrói (um por vez por tenant) quando a versão muda."""
+    # Versão lida antes da carga: um import que termine durante a carga deixa o snapshot com
+    # a versão antiga, e a próxima leitura reconstrói
+    version = catalog.get_version(tenant_id)
+    snap = _snapshots.get(tenant_id)
+    if _fresh(snap, version):
+        return snap  # type: ignore[return-value]
+    with _locks.setdefault(tenant_id, threading.Lock()):
+        snap = _snapshots.get(tenant_id)
+        if _fresh(snap, version):
+            return snap  # type: ignore[return-value]
+        started = time.perf_counter()
+        snap = build_snapshot(tenant_id, version)
+        _snapshots[tenant_id] = snap
+    log.info(
+        "catalog_index_built",
+        tenant_id=tenant_id,
+        version=version,
+        rows=len(snap),
+        duration_ms=round((time.perf_counter() - started) * 1000, 2),
+    )
+    return snap
+
+
+def invalidate(tenant_id: int | None = None) -> None:
+    if tenant_id is None:
+        _snapshots.clear()
+    else:
+        _snapshots.pop(tenant_id, None)
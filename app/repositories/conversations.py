@@ -0,0 +1,116 @@
+"""Resolução tenant → contato → conversa aberta em um round-trip.
+
+Substitui a sequência "busca Tenant por nome → busca Contact → busca Conversation aberta →
+insere o que faltar" que estava copiada no webhook e nas tasks de inbound/outbound.
+
+O tenant vem do cache em memória (`repositories.tenants`), sem ir ao banco.
+Caminho quente (contato e conversa já existem): um único SELECT com JOIN.
+Caminho de criação: Postgres faz os upserts num único statement (CTEs com
+INSERT ... ON CONFLICT DO NOTHING RETURNING); SQLite (dev/testes) usa INSERT OR IGNORE.
+O upsert não roda no caminho quente para não queimar valores de sequence a cada mensagem.
+
+Nada aqui faz commit: a resolução entra na transação do chamador. Os rollups de leads e
+conversas só contam se essa transação fizer commit (`rollups.record_on_commit`).
+"""
+from __future__ import annotations
+from dataclasses import dataclass
+from datetime import datetime
+
+from sqlalchemy import and_, select, text
+from sqlalchemy.orm import Session
+
+from app.repositories import models, rollups
+from app.repositories.tenants import get_tenant
+
+# Conversa "aberta" = qualquer status diferente de closed (garantida única pelo índice parcial uix_conversation_open)
+_OPEN = models.Conversation.status != models.ConversationStatus.closed
+
+_PG_UPSERT = text(
+    """
+    WITH c_new AS (
+        INSERT INTO contacts (tenant_id, wa_id, tags, do_not_disturb, created_at)
+        VALUES (:tenant_id, :wa_id, CAST('[]' AS json), false, :now)
+        ON CONFLICT (tenant_id, wa_id) DO NOTHING
+        RETURNING id
+    ), c AS (
+        SELECT id FROM c_new
+        UNION ALL
+        SELECT id FROM contacts WHERE tenant_id = :tenant_id AND wa_id = :wa_id
+        LIMIT 1
+    ), v_new AS (
+        INSERT INTO conversations (tenant_id, contact_id, status, updated_at)
+        SELECT :tenant_id, id, CAST('active_bot' AS conversationstatus), :now FROM c
+        ON CONFLICT (tenant_id, contact_id) WHERE status <> 'closed' DO NOTHING
+        RETURNING id
+    )
+    SELECT c.id,
+           COALESCE(
+               (SELECT id FROM v_new),
+               (SELECT v.id FROM conversations v
+                 WHERE v.tenant_id = :tenant_id AND v.contact_id = c.id AND v.status <> 'closed'
+                 ORDER BY v.id DESC LIMIT 1)
+           )
+    FROM c
+    """
+)
+
+_SQLITE_UPSERT = (
+    text(
+        "INSERT OR IGNORE INTO contacts (tenant_id, wa_id, tags, do_not_disturb, created_at) "
+        "VALUES (:tenant_id, :wa_id, '[]', 0, :now)"
+    ),
+    text(
+        "INSERT OR IGNORE INTO conversations (tenant_id, contact_id, status, updated_at) "
+        "SELECT tenant_id, id, 'active_bot', :now FROM contacts WHERE tenant_id = :tenant_id AND wa_id = :wa_id"
+    ),
+)
+
+
+@dataclass(frozen=True)
+class ConversationRef:
+    tenant_id: int
+    contact_id: int
+    conversation_id: int
+
+
+def _select_open(db: Session, tenant_id: int, wa_id: str) -> tuple[int, int | None] | None:
+    C, V = models.Contact, models.Conversation
+    stmt = (
+        select(C.id, V.id)
+        .select_from(C)
+        .outerjoin(V, and_(V.tenant_id == C.tenant_id, V.contact_id == C.id, _OPEN))
+        .where(C.tenant_id == tenant_id, C.wa_id == wa_id)
+        .order_by(V.id.desc())
+        .limit(1)
+    )
+    row = db.execute(stmt).first()
+    return (row[0], row[1]) if row else None
+
+
+def _upsert(db: Session, tenant_id: int, wa_id: str) -> tuple[int, int | None] | None:
+    params = {"tenant_id": tenant_id, "wa_id": wa_id, "now": datetime.utcnow()}
+    if db.get_bind().dialect.name == "postgresql":
+        row = db.execute(_PG_UPSERT, params).first()
+        if row is None or row[1] is None:
+            # Corrida: outra transação inseriu a mesma linha depois do snapshot deste statement.
+            # O próximo statement (READ COMMITTED) já enxerga a linha confirmada.
+            row = db.execute(_PG_UPSERT, params).first()
+        return (row[0], row[1]) if row else None
+    for stmt in _SQLITE_UPSERT:
+        db.execute(stmt, params)
+    return _select_open(db, tenant_id, wa_id)
+
+
+def resolve_conversation(db: Session, tenant_name: str, wa_id: str) -> ConversationRef:
+    """Devolve (tenant, contato, conversa aberta), criando o que faltar, sem commit."""
+    tenant_id = get_tenant(tenant_name).id
+    found = _select_open(db, tenant_id, wa_id)
+    if found is None or found[1] is None:
+        new_contact = found is None
+        found = _upsert(db, tenant_id, wa_id)
+        if found is not None and found[1] is not None:
+            rollups.record_on_commit(db, tenant_id, rollups.LEADS, int(new_contact))
+            rollups.record_on_commit(db, tenant_id, rollups.CONVERSATIONS)
+    if found is None or found[1] is None:
+        raise RuntimeError("conversation_resolve_failed")
+    return ConversationRef(tenant_id=tenant_id, contact_id=found[0], conversation_id=found[1])
@@ -1,16 +1,34 @@
+import time
+
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, DeclarativeBase
+from sqlalchemy.pool import QueuePool
 from app.core.config import settings
+from app.core.metrics import DB_POOL_CHECKOUT_SECONDS
 
 
 class Base(DeclarativeBase):
     pass
 
 
+class TimedQueuePool(QueuePool):
+    """QueuePool que mede a espera por conexão (pool esgotado aparece no histograma)."""
+
+    def _do_get(self):  # type: ignore[no-untyped-def]
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_CHECKOUT_SECONDS.observe(time.perf_counter() - start)
+
+
 # Ajuste para SQLite em desenvolvimento: evitar erro de threads do SQLite
 connect_args = {}
+engine_kwargs = {}
 if settings.DATABASE_URL.startswith("sqlite"):
     connect_args = {"check_same_thread": False}
+else:
+    engine_kwargs = {"poolclass": TimedQueuePool}
 
-engine = create_engine(settings.DATABASE_URL, pool_pre_ping=True, connect_args=connect_args)
+engine = create_engine(settings.DATABASE_URL, pool_pre_ping=True, connect_args=connect_args, **engine_kwargs)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -0,0 +1,312 @@
+"""Imports CSV em background (leads e veículos) com checkpoint e retomada.
+
+Fluxo: a API grava o upload em IMPORT_DIR, lê só o cabeçalho e cria um ImportJob (queued);
+a task `imports.run` processa o arquivo no worker em lotes de IMPORT_CHUNK_ROWS linhas.
+Cada lote faz o upsert do importador do tipo (lead_import / vehicle_import) e, na mesma
+transação, avança o checkpoint do job: `byte_offset` (fim da última linha do lote) e os
+contadores. Se o worker cair ou o lote falhar, a próxima execução reabre o arquivo nesse
+offset e segue dali — nada é relido nem contado duas vezes. No fim, o `finish` do
+importador (ex.: desativar veículos ausentes no modo sync) recebe as chaves de todas as
+linhas do arquivo (coletadas durante a leitura; numa retomada, o trecho já gravado é
+relido só para isso) e roda na mesma transação que marca o job como done.
+
+O arquivo é lido em binário, linha a linha, e decodificado por linha (UTF-8 com fallback
+para latin-1 nos bytes inválidos). O módulo csv só pede a próxima linha quando precisa
+(campo entre aspas com quebra de linha), então o offset após cada registro é sempre uma
+fronteira de registro.
+"""
+from __future__ import annotations
+import codecs
+import csv
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+import os
+import shutil
+import time
+from typing import BinaryIO, Callable, Hashable, Iterator
+import uuid
+
+import structlog
+from sqlalchemy import and_, or_, update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.repositories import lead_import, vehicle_import
+from app.repositories.db import SessionLocal
+from app.repositories.models import ImportJob
+
+log = structlog.get_logger()
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+_FALLBACK_ERRORS = "utf8_latin1_fallback"
+_SUMMARY_FIELDS = (
+    "id", "kind", "mode", "processed", "inserted", "updated", "unchanged", "deactivated", "rejected", "rows_per_s"
+)
+
+
+def _latin1_fallback(exc: UnicodeError) -> tuple[str, int]:
+    if not isinstance(exc, UnicodeDecodeError):
+        raise exc
+    return exc.object[exc.start : exc.end].decode("latin-1"), exc.end
+
+
+codecs.register_error(_FALLBACK_ERRORS, _latin1_fallback)
+
+
+@dataclass(frozen=True)
+class Importer:
+    parse: Callable[[dict[str, str | None]], dict | None]
+    # Grava o lote (sem commit) e devolve (novos, atualizados, rejeitados na validação do lote);
+    # o resto das linhas aceitas conta como sem alteração
+    upsert: Callable[[Session, int, list[dict]], tuple[int, int, int]]
+    # Chave natural da linha e passo final (sem commit) com as chaves de todo o arquivo;
+    # devolve quantos registros foram desativados
+    key: Callable[[dict], Hashable] | None = None
+    finish: Callable[[Session, ImportJob, set], int] | None = None
+    # Após cada commit que alterou dados (recebe o tenant)
+    on_commit: Callable[[int], None] | None = None
+    modes: tuple[str, ...] = ("upsert",)
+
+
+IMPORTERS: dict[str, Importer] = {
+    "leads": Importer(lead_import.parse_row, lead_import.upsert_chunk),
+    "vehicles": Importer(
+        vehicle_import.parse_row,
+        vehicle_import.upsert_chunk,
+        key=vehicle_import.row_key,
+        finish=vehicle_import.deactivate_missing,
+        on_commit=vehicle_import.on_commit,
+        modes=("upsert", "sync"),
+    ),
+}
+
+
+class CsvNoHeaders(ValueError):
+    pass
+
+
+# ------------------- Leitura -------------------
+def iter_records(fp: BinaryIO, offset: int = 0) -> Iterator[tuple[list[str], int]]:
+    """Registros do CSV a partir de `offset`, cada um com o byte em que termina."""
+    fp.seek(offset)
+    pos = offset
+
+    def _lines() -> Iterator[str]:
+        nonlocal pos
+        for raw in fp:
+            start = len(codecs.BOM_UTF8) if pos == 0 and raw.startswith(codecs.BOM_UTF8) else 0
+            pos += len(raw)
+            yield raw[start:].decode("utf-8", _FALLBACK_ERRORS)
+
+    for record in csv.reader(_lines()):
+        yield record, pos
+
+
+def read_header(path: str) -> tuple[list[str], int]:
+    """Cabeçalho e o offset da primeira linha de dados."""
+    with open(path, "rb") as fp:
+        for record, end in iter_records(fp):
+            if any(c.strip() for c in record):
+                return record, end
+    raise CsvNoHeaders("csv_no_headers")
+
+
+# ------------------- Ciclo de vida -------------------
+def create_job(
+    db: Session, kind: str, tenant_id: int, src: BinaryIO, filename: str | None = None, mode: str = "upsert"
+) -> ImportJob:
+    """Copia o upload para IMPORT_DIR e registra o job (queued). Não enfileira."""
+    if kind not in IMPORTERS:
+        raise ValueError(f"unknown import kind: {kind}")
+    if mode not in IMPORTERS[kind].modes:
+        raise ValueError(f"unsupported mode for {kind}: {mode}")
+    os.makedirs(settings.IMPORT_DIR, exist_ok=True)
+    path = os.path.join(settings.IMPORT_DIR, f"{kind}-{uuid.uuid4().hex}.csv")
+    with open(path, "wb") as out:
+        shutil.copyfileobj(src, out, 1 << 20)
+    try:
+        header, offset = read_header(path)
+    except CsvNoHeaders:
+        os.unlink(path)
+        raise
+    job = ImportJob(
+        tenant_id=tenant_id,
+        kind=kind,
+        mode=mode,
+        status=QUEUED,
+        filename=(filename or "")[:255] or None,
+        path=path,
+        size_bytes=os.path.getsize(path),
+        header=header,
+        byte_offset=offset,
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    log.info("import_job_created", job_id=job.id, kind=kind, tenant_id=tenant_id, size_bytes=job.size_bytes)
+    return job
+
+
+def _resumable(now: datetime):  # type: ignore[no-untyped-def]
+    # "running" parado há mais de IMPORT_STALE_S = worker morto no meio do lote
+    stale = now - timedelta(seconds=settings.IMPORT_STALE_S)
+    return or_(
+        ImportJob.status.in_((QUEUED, FAILED)),
+        and_(ImportJob.status == RUNNING, ImportJob.updated_at < stale),
+    )
+
+
+def is_resumable(job: ImportJob, now: datetime | None = None) -> bool:
+    now = now or datetime.utcnow()
+    if job.status in (QUEUED, FAILED):
+        return True
+    return job.status == RUNNING and job.updated_at < now - timedelta(seconds=settings.IMPORT_STALE_S)
+
+
+def _prefix_keys(job: ImportJob, importer: Importer, until: int) -> set:
+    """Chaves das linhas já gravadas antes de `until` (retomada de um job com `finish`)."""
+    header, offset = read_header(job.path)
+    keys: set = set()
+    if offset >= until:
+        return keys
+    with open(job.path, "rb") as fp:
+        for record, end in iter_records(fp, offset):
+            if record:
+                row = importer.parse(dict(zip(header, record)))
+                if row is not None:
+                    keys.add(importer.key(row))  # type: ignore[misc]
+            if end >= until:
+                break
+    return keys
+
+
+def _claim(db: Session, job_id: int) -> ImportJob | None:
+    """Marca o job como running se ninguém mais o está processando (update condicional)."""
+    now = datetime.utcnow()
+    res = db.execute(
+        update(ImportJob)
+        .where(ImportJob.id == job_id, _resumable(now))
+        .values(status=RUNNING, attempts=ImportJob.attempts + 1, error=None, updated_at=now)
+    )
+    db.commit()
+    if res.rowcount != 1:
+        return None
+    return db.get(ImportJob, job_id)
+
+
+def run_job(job_id: int, session_factory: Callable[[], Session] = SessionLocal, chunk_rows: int | None = None) -> dict:
+    """Processa (ou retoma) o job a partir do último checkpoint. Re-levanta a falha após registrá-la."""
+    chunk_rows = max(1, chunk_rows or settings.IMPORT_CHUNK_ROWS)
+    with session_factory() as db:
+        job = _claim(db, job_id)
+        if job is None:
+            log.info("import_job_skipped", job_id=job_id)
+            return {}
+        importer = IMPORTERS[job.kind]
+        header = job.header or []
+        log.info("import_job_started", job_id=job.id, kind=job.kind, byte_offset=job.byte_offset, attempt=job.attempts)
+
+        chunk: list[dict] = []
+        read = rejected = 0
+        last = time.perf_counter()
+        seen = _prefix_keys(job, importer, job.byte_offset) if importer.finish and importer.key else None
+
+        def _checkpoint(end: int) -> None:
+            nonlocal read, rejected, last
+            inserted, updated, late_rejected = importer.upsert(db, job.tenant_id, chunk) if chunk else (0, 0, 0)
+            accepted = len(chunk) - late_rejected
+            now = time.perf_counter()
+            job.byte_offset = end
+            job.rows_read += read
+            job.processed += accepted
+            job.inserted += inserted
+            job.updated += updated
+            job.unchanged += accepted - inserted - updated
+            job.rejected += rejected + late_rejected
+            job.elapsed_s += now - last
+            job.updated_at = datetime.utcnow()
+            db.commit()  # lote + checkpoint na mesma transação
+            if inserted or updated:
+                _notify()
+            chunk.clear()
+            read = rejected = 0
+            last = now
+
+        def _notify() -> None:
+            if importer.on_commit is not None:
+                try:
+                    importer.on_commit(job.tenant_id)
+                except Exception as e:  # noqa: BLE001
+                    log.warning("import_job_on_commit_error", job_id=job.id, error=str(e))
+
+        try:
+            with open(job.path, "rb") as fp:
+                end = job.byte_offset
+                for record, end in iter_records(fp, job.byte_offset):
+                    if not record:
+                        continue
+                    read += 1
+                    row = importer.parse(dict(zip(header, record)))
+                    if row is None:
+                        rejected += 1
+                    else:
+                        chunk.append(row)
+                        if seen is not None:
+                            seen.add(importer.key(row))  # type: ignore[misc]
+                    if read >= chunk_rows:
+                        _checkpoint(end)
+                _checkpoint(end)
+            if importer.finish is not None and seen is not None:
+                job.deactivated = importer.finish(db, job, seen)
+            job.status = DONE
+            job.finished_at = datetime.utcnow()
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            job = db.get(ImportJob, job_id)
+            job.status = FAILED
+            job.error = str(e)[:500]
+            job.updated_at = datetime.utcnow()
+            db.commit()
+            log.error("import_job_failed", job_id=job_id, error=str(e), byte_offset=job.byte_offset)
+            raise
+
+        if job.deactivated:
+            _notify()
+        try:
+            os.unlink(job.path)
+        except OSError:
+            pass
+        out = job_status(job)
+        log.info("import_job_done", **{k: out[k] for k in _SUMMARY_FIELDS})
+        return out
+
+
+def job_status(job: ImportJob) -> dict:
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "mode": job.mode,
+        "status": job.status,
+        "filename": job.filename,
+        "rows_read": job.rows_read,
+        "processed": job.processed,
+        "inserted": job.inserted,
+        "updated": job.updated,
+        "unchanged": job.unchanged,
+        "deactivated": job.deactivated,
+        "rejected": job.rejected,
+        "bytes_done": job.byte_offset,
+        "size_bytes": job.size_bytes,
+        "progress": round(job.byte_offset / job.size_bytes, 4) if job.size_bytes else 1.0,
+        "rows_per_s": round(job.rows_read / job.elapsed_s, 1) if job.elapsed_s > 0 else 0.0,
+        "attempts": job.attempts,
+        "error": job.error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "updated_at": job.updated_at.isoformat() if job.updated_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
@@ -0,0 +1,178 @@
+"""Import CSV de leads (contatos): parse da linha, normalização dos telefones e upsert do lote.
+
+Telefones viram E.164 só com dígitos (o formato do wa_id da Meta), em uma passada vetorizada
+(NumPy) sobre o lote inteiro, sem laço por telefone nem por caractere. Padrões brasileiros:
+números nacionais (com ou sem 0 de tronco/operadora) recebem o código do país
+(IMPORT_PHONE_COUNTRY_CODE) e, sem DDD, o DDD padrão do tenant (settings
+`default_area_code`, senão IMPORT_PHONE_AREA_CODE; vazio = rejeita). Com `+`/`00` o número é
+tratado como internacional.
+
+Chave: (tenant_id, wa_id) — índice único uix_contact_tenant_wa. Repetições no lote (já
+normalizadas) colapsam numa linha; a existência é resolvida com um único `wa_id IN (...)`
+por lote, antes do upsert em massa. Contato existente só tem nome/email atualizados quando
+o CSV traz; a origem entra como tag apenas na criação. Leitura em streaming, lotes e
+checkpoints ficam em repositories.imports.
+"""
+from __future__ import annotations
+import re
+from typing import Iterable
+
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.repositories import rollups
+from app.repositories.models import Contact
+from app.repositories.tenants import get_tenant_by_id
+
+# "00" + 15 dígitos (E.164): nada mais longo é normalizável
+_MAX_DIGITS = 17
+_EMAIL = re.compile(r"[^@\s]+@[^@\s]+\.[^@\s]+")
+
+
+def _shift(d: np.ndarray, by: np.ndarray) -> np.ndarray:
+    """Desloca cada linha `by[i]` posições para a esquerda (a cauda repete a última coluna)."""
+    idx = np.minimum(by[:, None] + np.arange(d.shape[1]), d.shape[1] - 1)
+    return np.take_along_axis(d, idx, axis=1)
+
+
+def _national(d: np.ndarray, off: int, length: np.ndarray) -> np.ndarray:
+    """Número nacional a partir de `off`: DDD sem zero + celular (9 + 8) ou fixo (2-9 + 7)."""
+    ddd = (d[:, off] >= 1) & (d[:, off + 1] >= 1)
+    third = d[:, off + 2]
+    return ddd & (((length == 11) & (third == 9)) | ((length == 10) & (third >= 2)))
+
+
+def normalize_phones(values: list[str], country_code: str = "55", area_code: str = "") -> list[str | None]:
+    """Telefones -> E.164 só com dígitos (None quando não dá para normalizar), na ordem recebida.
+
+    O lote vira uma matriz de code points (linha = telefone): os dígitos são compactados pela
+    contagem acumulada, e cada regra (00/+, 0 de tronco, DDD, celular/fixo, código do país)
+    é uma comparação vetorizada sobre colunas; o laço em Python fica só na montagem da lista.
+    """
+    if not values:
+        return []
+    width = _MAX_DIGITS
+    chars = np.array(values, dtype=str)
+    codes = chars.view(np.uint32).reshape(len(values), -1)
+    is_digit = (codes >= 48) & (codes <= 57)
+    n = is_digit.sum(axis=1)
+    # Compacta os dígitos à esquerda: a posição de cada dígito na linha é a contagem acumulada
+    pos = np.cumsum(is_digit, axis=1, dtype=np.int16) - 1
+    keep = is_digit & (pos < width)
+    rows = np.broadcast_to(np.arange(len(values))[:, None], codes.shape)
+    d = np.full((len(values), width), -1, dtype=np.int16)
+    d[rows[keep], pos[keep]] = codes[keep].astype(np.int16) - 48
+
+    # Primeiro caractere não branco é "+"; "00" na frente também indica internacional
+    first = np.argmax(codes > 32, axis=1)
+    intl = codes[np.arange(len(values)), first] == ord("+")
+    double_zero = (d[:, 0] == 0) & (d[:, 1] == 0)
+    intl |= double_zero
+    # 0 + operadora (2 dígitos) + DDD + número, ou só o 0 de tronco
+    trunk = ~intl & (d[:, 0] == 0)
+    by = np.where(double_zero, 2, np.where(trunk, np.where((n == 13) | (n == 14), 3, 1), 0))
+    d = _shift(d, by)
+    n = n - by
+    d[np.arange(width) >= n[:, None]] = -1
+
+    cc = np.array([int(c) for c in country_code], dtype=np.int16)
+    has_cc = (n >= len(cc)) & (d[:, : len(cc)] == cc).all(axis=1)
+    national = _national(d, 0, n)
+    national_cc = has_cc & _national(d, len(cc), n - len(cc))
+    local = ((n == 9) & (d[:, 0] == 9)) | ((n == 8) & (d[:, 0] >= 2))
+
+    add_cc = ~intl & national
+    add_area = ~intl & ~national & bool(area_code) & local
+    valid = np.where(
+        intl,
+        # Brasil com DDI: número nacional válido; demais: 8 a 15 dígitos (E.164)
+        np.where(has_cc & (country_code == "55"), national_cc, (n >= 8) & (n <= 15)),
+        add_cc | add_area | national_cc,
+    )
+    valid &= (n + by) <= width
+    prefix = np.where(add_cc, country_code, np.where(add_area, country_code + area_code, ""))
+    digits = np.where(d >= 0, d + 48, 0).astype(np.uint32).view(f"<U{width}").ravel()
+    phones = np.char.add(prefix, digits).tolist()
+    return [p if ok else None for p, ok in zip(phones, valid.tolist())]
+
+
+def _area_code(tenant_id: int) -> str:
+    tenant = get_tenant_by_id(tenant_id)
+    code = tenant.setting("default_area_code") if tenant is not None else None
+    return str(code or settings.IMPORT_PHONE_AREA_CODE or "")
+
+
+def parse_row(row: dict[str, str | None]) -> dict | None:
+    """Linha do CSV -> colunas de Contact (sem tenant). None quando não há telefone.
+
+    O telefone segue bruto; a normalização é feita no lote (upsert_chunk).
+    """
+    phone = (row.get("telefone") or row.get("phone") or row.get("wa_id") or "").strip()
+    if not phone:
+        return None
+    email = (row.get("email") or "").strip().lower()
+    origin = (row.get("origem") or row.get("source") or "csv").strip() or "csv"
+    return {
+        "wa_id": phone,
+        "name": (row.get("nome") or row.get("name") or "").strip() or None,
+        "email": email if _EMAIL.fullmatch(email) else None,
+        "tags": [origin],
+    }
+
+
+def _merge(rows: Iterable[dict]) -> list[dict]:
+    """Uma linha por wa_id no lote; repetições se combinam como se aplicadas em sequência."""
+    merged: dict[str, dict] = {}
+    for row in rows:
+        prev = merged.get(row["wa_id"])
+        if prev is not None:
+            row["tags"] = prev["tags"]
+            row["name"] = row["name"] or prev["name"]
+            row["email"] = row["email"] or prev["email"]
+        merged[row["wa_id"]] = row
+    return list(merged.values())
+
+
+def _upsert_stmt(db: Session):  # type: ignore[no-untyped-def]
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    stmt = insert(Contact)
+    table = Contact.__table__.c
+    return stmt.on_conflict_do_update(
+        index_elements=[Contact.tenant_id, Contact.wa_id],
+        set_={
+            "name": func.coalesce(stmt.excluded.name, table.name),
+            "email": func.coalesce(stmt.excluded.email, table.email),
+        },
+    )
+
+
+def upsert_chunk(db: Session, tenant_id: int, rows: list[dict]) -> tuple[int, int, int]:
+    """Normaliza e grava um lote (sem commit). Devolve (novos, atualizados, rejeitados).
+
+    Os contatos novos entram no rollup de leads quando o lote fizer commit.
+    """
+    phones = normalize_phones([r["wa_id"] for r in rows], settings.IMPORT_PHONE_COUNTRY_CODE, _area_code(tenant_id))
+    valid = []
+    for row, wa_id in zip(rows, phones):
+        if wa_id is not None:
+            row["wa_id"] = wa_id
+            valid.append(row)
+    unique = _merge(valid)
+    if not unique:
+        return 0, 0, len(rows)
+    wa_ids = [r["wa_id"] for r in unique]
+    existing = (
+        db.scalar(
+            select(func.count()).select_from(Contact).where(Contact.tenant_id == tenant_id, Contact.wa_id.in_(wa_ids))
+        )
+        or 0
+    )
+    db.execute(_upsert_stmt(db), [{**r, "tenant_id": tenant_id} for r in unique])
+    inserted = len(unique) - existing
+    rollups.record_on_commit(db, tenant_id, rollups.LEADS, inserted)
+    return inserted, len(valid) - inserted, len(rows) - len(valid)
@@ -1,7 +1,7 @@
 from __future__ import annotations
-from datetime import datetime
+from datetime import date, datetime
 from enum import Enum
-from sqlalchemy import String, Integer, DateTime, Enum as SAEnum, ForeignKey, Boolean, JSON, Index, Float
+from sqlalchemy import String, Integer, Date, DateTime, Enum as SAEnum, ForeignKey, Boolean, JSON, Index, Float, func, literal_column, text
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from .db import Base
 
@@ -48,14 +48,21 @@ class Contact(Base):
     tenant_id: Mapped[int] = mapped_column(ForeignKey("tenants.id"))
     wa_id: Mapped[str] = mapped_column(String(32), index=True)
     name: Mapped[str | None] = mapped_column(String(120), nullable=True)
+    email: Mapped[str | None] = mapped_column(String(180), nullable=True)
     tags: Mapped[list[str] | None] = mapped_column(JSON, default=list)
     do_not_disturb: Mapped[bool] = mapped_column(Boolean, default=False)
+    # Última mensagem recebida do contato (janela de 24h); espelhada no Redis com TTL
+    last_inbound_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    # Criação do contato (rollup de leads); NULL em contatos antigos sem mensagem
+    created_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True, default=datetime.utcnow)
 
     tenant: Mapped[Tenant] = relationship(back_populates="contacts")
     conversations: Mapped[list[Conversation]] = relationship(back_populates="contact")  # type: ignore
 
     __table_args__ = (
         Index("uix_contact_tenant_wa", "tenant_id", "wa_id", unique=True),
+        # Listagem de leads paginada por keyset (tenant_id, id desc)
+        Index("idx_contact_tenant_id", "tenant_id", "id"),
     )
 
 
@@ -67,10 +74,24 @@ class Conversation(Base):
     status: Mapped[ConversationStatus] = mapped_column(SAEnum(ConversationStatus), default=ConversationStatus.active_bot)
     assigned_to: Mapped[str | None] = mapped_column(String(120), nullable=True)
     last_state: Mapped[str | None] = mapped_column(String(120), nullable=True)
+    # Snapshot dos critérios do funil (espelho do hash no Redis, gravado em lote)
+    state_data: Mapped[dict | None] = mapped_column(JSON, nullable=True)
     updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     contact: Mapped[Contact] = relationship(back_populates="conversations")
 
+    __table_args__ = (
+        # No máximo uma conversa aberta por contato (alvo do ON CONFLICT em repositories.conversations)
+        Index(
+            "uix_conversation_open",
+            "tenant_id",
+            "contact_id",
+            unique=True,
+            postgresql_where=text("status <> 'closed'"),
+            sqlite_where=text("status <> 'closed'"),
+        ),
+    )
+
 
 class MessageDirection(str, Enum):
     inbound = "inbound"
@@ -78,6 +99,7 @@ class MessageDirection(str, Enum):
 
 
 class Message(Base):
+    # Postgres: particionada por mês em created_at (PK (id, created_at)); ver repositories.partitions
     __tablename__ = "messages"
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     tenant_id: Mapped[int] = mapped_column(ForeignKey("tenants.id"), index=True)
@@ -93,10 +115,13 @@ class Message(Base):
     __table_args__ = (
         Index("uix_wa_message_id", "tenant_id", "wa_message_id", unique=True),
         Index("uix_idempotency_key", "tenant_id", "idempotency_key", unique=True),
+        # Status do webhook chegam só com o id do provider (sem tenant)
+        Index("idx_messages_wa_message_id", "wa_message_id"),
     )
 
 
 class ConversationEvent(Base):
+    # Postgres: particionada por mês em created_at; ver repositories.partitions
     __tablename__ = "conversation_events"
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     conversation_id: Mapped[int] = mapped_column(ForeignKey("conversations.id"))
@@ -124,7 +149,10 @@ class SuppressedContact(Base):
 
 
 class MessageLog(Base):
-    """Log de envios via provider para rastreabilidade/auditoria."""
+    """Log de envios via provider para rastreabilidade/auditoria.
+
+    Postgres: particionada por mês em created_at; ver repositories.partitions.
+    """
 
     __tablename__ = "message_logs"
 
@@ -137,14 +165,102 @@ class MessageLog(Base):
     status: Mapped[str] = mapped_column(String(32), default="queued")
     provider_message_id: Mapped[str | None] = mapped_column(String(64), nullable=True)
     error_code: Mapped[str | None] = mapped_column(String(64), nullable=True)
+    # UUID gerado no envio; as transições de status (write-behind) são aplicadas por ele
+    log_uid: Mapped[str | None] = mapped_column(String(32), nullable=True)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
 
     __table_args__ = (
         Index("idx_msglog_tenant_to", "tenant_id", "to"),
         Index("idx_msglog_created", "created_at"),
+        Index("uq_msglog_log_uid", "log_uid", unique=True),
+        Index("idx_msglog_provider_message_id", "provider_message_id"),
+        # Logs paginados por keyset: (tenant_id) + (created_at, id) desc
+        Index("idx_msglog_tenant_created_id", "tenant_id", "created_at", "id"),
+    )
+
+
+class MetricRollup(Base):
+    """Contadores de negócio pré-agregados por tenant/canal/métrica, em buckets UTC de hora e dia.
+
+    Mantidos incrementalmente pelos workers (`repositories.rollups`); /metrics/overview só lê daqui.
+    """
+
+    __tablename__ = "metric_rollups"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    tenant_id: Mapped[int] = mapped_column(Integer)
+    channel: Mapped[str] = mapped_column(String(16))
+    granularity: Mapped[str] = mapped_column(String(8))  # hour|day
+    bucket: Mapped[datetime] = mapped_column(DateTime)
+    metric: Mapped[str] = mapped_column(String(32))
+    value: Mapped[int] = mapped_column(Integer, default=0)
+
+    __table_args__ = (
+        # Alvo do upsert incremental e do range scan do dashboard (tenant, granularidade, período)
+        Index("uix_metric_rollup", "tenant_id", "granularity", "bucket", "channel", "metric", unique=True),
+    )
+
+
+class ArchiveSegment(Base):
+    """Segmento do arquivo frio (NDJSON comprimido); ver repositories.archive.
+
+    `group_min`/`group_max` = faixa de conversation_id do segmento (linhas ordenadas por conversa).
+    """
+
+    __tablename__ = "archive_segments"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    table_name: Mapped[str] = mapped_column(String(40))
+    source: Mapped[str] = mapped_column(String(120))  # partição desanexada ou tabela viva
+    month: Mapped[date | None] = mapped_column(Date, nullable=True)
+    path: Mapped[str] = mapped_column(String(512))
+    codec: Mapped[str] = mapped_column(String(8))
+    rows: Mapped[int] = mapped_column(Integer)
+    group_min: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    group_max: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    created_min: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    created_max: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("idx_archive_segment_group", "table_name", "group_min", "group_max"),
     )
 
 
+class ImportJob(Base):
+    """Import CSV em background (leads/veículos); ver repositories.imports.
+
+    Checkpoint = `byte_offset` (fim da última linha gravada) + contadores, atualizados na mesma
+    transação de cada lote: uma retomada continua exatamente de onde o último commit parou.
+    """
+
+    __tablename__ = "import_jobs"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    tenant_id: Mapped[int] = mapped_column(Integer, index=True)
+    kind: Mapped[str] = mapped_column(String(16))  # leads|vehicles
+    mode: Mapped[str] = mapped_column(String(8), default="upsert")  # upsert|sync (feed completo: desativa ausentes)
+    status: Mapped[str] = mapped_column(String(16), default="queued")  # queued|running|done|failed
+    filename: Mapped[str | None] = mapped_column(String(255), nullable=True)
+    path: Mapped[str] = mapped_column(String(512))
+    size_bytes: Mapped[int] = mapped_column(Integer, default=0)
+    header: Mapped[list[str] | None] = mapped_column(JSON, nullable=True)
+    byte_offset: Mapped[int] = mapped_column(Integer, default=0)
+    rows_read: Mapped[int] = mapped_column(Integer, default=0)
+    processed: Mapped[int] = mapped_column(Integer, default=0)
+    inserted: Mapped[int] = mapped_column(Integer, default=0)
+    updated: Mapped[int] = mapped_column(Integer, default=0)
+    rejected: Mapped[int] = mapped_column(Integer, default=0)
+    unchanged: Mapped[int] = mapped_column(Integer, default=0)
+    deactivated: Mapped[int] = mapped_column(Integer, default=0)
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    elapsed_s: Mapped[float] = mapped_column(Float, default=0.0)  # tempo efetivo de processamento
+    error: Mapped[str | None] = mapped_column(String(500), nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    finished_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+
+
 # ------------------- Veículos (POC) -------------------
 class Vehicle(Base):
     __tablename__ = "vehicles"
@@ -159,8 +275,21 @@ class Vehicle(Base):
     price: Mapped[float | None] = mapped_column(Float, nullable=True)
     image_url: Mapped[str | None] = mapped_column(String(512), nullable=True)
     active: Mapped[bool] = mapped_column(Boolean, default=True)
+    # Hash da última linha de feed aplicada (import/sync pula linhas iguais); ver vehicle_import
+    content_hash: Mapped[str | None] = mapped_column(String(32), nullable=True)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        # Catálogo paginado por keyset: ativos por id desc
+        Index("idx_vehicle_active_id", "active", "id"),
+    )
+
+
+# Chave natural do inventário (upsert do import CSV). Ano ausente entra como 0: num índice
+# único NULLs são distintos e cada reimportação duplicaria os veículos sem ano.
+VEHICLE_KEY = (Vehicle.tenant_id, Vehicle.title, func.coalesce(Vehicle.year, literal_column("0")))
+Index("uix_vehicle_tenant_title_year", *VEHICLE_KEY, unique=True)
+
 
 class VehicleImage(Base):
     __tablename__ = "vehicle_images"
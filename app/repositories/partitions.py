@@ -0,0 +1,419 @@
+"""Particionamento mensal (Postgres) das tabelas append-only: messages, message_logs, conversation_events.
+
+Cada tabela vira um pai `PARTITION BY RANGE (created_at)` com uma partição por mês
+(`messages_p2025_01` = [2025-01-01, 2025-02-01)) e uma partição default para linhas fora
+das faixas criadas. As consultas quentes que filtram por período só tocam os meses
+envolvidos, e apagar um mês inteiro é DROP/DETACH da partição em vez de DELETE + VACUUM.
+
+Restrições do Postgres para tabelas particionadas:
+- a PK passa a ser (id, created_at); o ORM continua identificando as linhas por id;
+- índices únicos incluem created_at (únicos só dentro do mês). A unicidade global de
+  (tenant_id, wa_message_id), (tenant_id, idempotency_key) e log_uid fica na tabela não
+  particionada `partition_unique_keys`: um trigger BEFORE INSERT/UPDATE/DELETE no pai
+  registra a chave de cada linha ali (PK (idx, key)), e uma chave repetida falha com
+  unique_violation como falhava o índice original. Custa um INSERT extra por linha com
+  chave. Linhas apagadas (retenção por tenant, arquivamento) levam a chave junto; partições
+  removidas inteiras (DROP/DETACH não disparam trigger) têm as chaves expiradas pelo corte
+  global da retenção. Requer Postgres 13+.
+
+Manutenção (`run_maintenance`, task periódica do Celery):
+- cria as partições dos próximos PARTITION_PREMAKE_MONTHS meses;
+- retenção por tenant (`retention_months` nas configurações do tenant, padrão
+  RETENTION_MONTHS_DEFAULT, 0 = sem expiração): partições vencidas para todos os tenants
+  são removidas inteiras (PARTITION_EXPIRED_ACTION=drop) ou desanexadas para arquivamento
+  (detach); tenants com retenção menor têm as próprias linhas apagadas em lotes.
+
+SQLite (dev/testes) mantém as tabelas simples: tudo aqui é no-op fora do Postgres.
+"""
+from __future__ import annotations
+from datetime import date, datetime
+import re
+from typing import Iterable
+
+import structlog
+from sqlalchemy import Index, Table, select, text
+from sqlalchemy.engine import Connection, Engine
+
+from app.core.config import settings
+from app.repositories.models import Base, Tenant
+
+log = structlog.get_logger()
+
+PARTITIONED_TABLES = ("messages", "message_logs", "conversation_events")
+PARTITION_KEY = "created_at"
+
+_PART_RE = re.compile(r"^(?P<table>\w+)_p(?P<year>\d{4})_(?P<month>\d{2})$")
+_DELETE_BATCH = 5000
+
+
+# ------------------- Meses / nomes -------------------
+def month_start(value: date | datetime) -> date:
+    return date(value.year, value.month, 1)
+
+
+def add_months(d: date, n: int) -> date:
+    m = d.year * 12 + d.month - 1 + n
+    return date(m // 12, m % 12 + 1, 1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_p{month.year:04d}_{month.month:02d}"
+
+
+def partition_month(table: str, name: str) -> date | None:
+    m = _PART_RE.match(name)
+    if m is None or m.group("table") != table:
+        return None
+    return date(int(m.group("year")), int(m.group("month")), 1)
+
+
+def is_postgres(bind: Engine | Connection) -> bool:
+    return bind.dialect.name == "postgresql"
+
+
+# ------------------- DDL -------------------
+def create_partition_sql(table: str, month: date) -> str:
+    return (
+        f'CREATE TABLE IF NOT EXISTS "{partition_name(table, month)}" PARTITION OF "{table}" '
+        f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+    )
+
+
+def index_sql(table: Table) -> list[str]:
+    """Índices e FKs do modelo recriados no pai particionado (únicos passam a incluir created_at)."""
+    stmts = [f'ALTER TABLE "{table.name}" ADD PRIMARY KEY (id, {PARTITION_KEY})']
+    for ix in sorted(table.indexes, key=lambda i: i.name or ""):
+        cols = [c.name for c in ix.columns]
+        if ix.unique and PARTITION_KEY not in cols:
+            cols.append(PARTITION_KEY)
+        unique = "UNIQUE " if ix.unique else ""
+        stmts.append(f'CREATE {unique}INDEX IF NOT EXISTS "{ix.name}" ON "{table.name}" ({", ".join(cols)})')
+    for fk in sorted(table.foreign_keys, key=lambda f: f.parent.name):
+        stmts.append(
+            f'ALTER TABLE "{table.name}" ADD FOREIGN KEY ({fk.parent.name}) '
+            f'REFERENCES "{fk.column.table.name}" ({fk.column.name})'
+        )
+    # Consultas por período (listagens, retenção) sem depender só do pruning
+    if not any([c.name for c in ix.columns] == [PARTITION_KEY] for ix in table.indexes):
+        stmts.append(f'CREATE INDEX IF NOT EXISTS "idx_{table.name}_created" ON "{table.name}" ({PARTITION_KEY})')
+    return stmts
+
+
+KEYS_TABLE = "partition_unique_keys"
+_KEY_SEP = "chr(31)"
+
+
+def unique_guards(table: Table) -> list[Index]:
+    """Índices únicos do modelo que, particionados, deixariam de ser globais."""
+    return sorted(
+        (ix for ix in table.indexes if ix.unique and PARTITION_KEY not in [c.name for c in ix.columns]),
+        key=lambda i: i.name or "",
+    )
+
+
+def _key_expr(row: str, cols: list[str]) -> str:
+    return f"concat_ws({_KEY_SEP}, " + ", ".join(f"{row}.{c}::text" for c in cols) + ")"
+
+
+def guard_sql(table: Table) -> list[str]:
+    """Tabela de chaves + trigger que mantém a unicidade global dos índices de `unique_guards`."""
+    guards = unique_guards(table)
+    if not guards:
+        return []
+    fn = f"{table.name}_unique_guard"
+    body = ["DECLARE changed boolean;", "BEGIN", "  IF TG_OP = 'DELETE' THEN"]
+    for ix in guards:
+        cols = [c.name for c in ix.columns]
+        body += [
+            f"    IF {' AND '.join(f'OLD.{c} IS NOT NULL' for c in cols)} THEN",
+            f"      DELETE FROM {KEYS_TABLE} WHERE idx = '{ix.name}' AND key = {_key_expr('OLD', cols)};",
+            "    END IF;",
+        ]
+    body += ["    RETURN OLD;", "  END IF;"]
+    for ix in guards:
+        cols = [c.name for c in ix.columns]
+        new_cols = ", ".join(f"NEW.{c}" for c in cols)
+        old_cols = ", ".join(f"OLD.{c}" for c in cols)
+        body += [
+            "  IF TG_OP = 'INSERT' THEN changed := true;",
+            f"  ELSE changed := ROW({new_cols}) IS DISTINCT FROM ROW({old_cols});",
+            "  END IF;",
+            "  IF changed THEN",
+            # NULL em alguma coluna: o índice único não restringe (NULLs são distintos)
+            "    IF TG_OP = 'UPDATE' THEN",
+            f"      IF {' AND '.join(f'OLD.{c} IS NOT NULL' for c in cols)} THEN",
+            f"        DELETE FROM {KEYS_TABLE} WHERE idx = '{ix.name}' AND key = {_key_expr('OLD', cols)};",
+            "      END IF;",
+            "    END IF;",
+            f"    IF {' AND '.join(f'NEW.{c} IS NOT NULL' for c in cols)} THEN",
+            f"      INSERT INTO {KEYS_TABLE} (idx, key, created_at)",
+            f"      VALUES ('{ix.name}', {_key_expr('NEW', cols)}, coalesce(NEW.{PARTITION_KEY}, now()));",
+            "    END IF;",
+            "  END IF;",
+        ]
+    body += ["  RETURN NEW;", "END"]
+    return [
+        f"CREATE TABLE IF NOT EXISTS {KEYS_TABLE} ("
+        "idx varchar(64) NOT NULL, key text NOT NULL, created_at timestamp NOT NULL, PRIMARY KEY (idx, key))",
+        f"CREATE INDEX IF NOT EXISTS idx_{KEYS_TABLE}_created ON {KEYS_TABLE} (created_at)",
+        f'CREATE OR REPLACE FUNCTION "{fn}"() RETURNS trigger LANGUAGE plpgsql AS $$\n'
+        + "\n".join(body)
+        + "\n$$",
+        f'DROP TRIGGER IF EXISTS "{fn}" ON "{table.name}"',
+        f'CREATE TRIGGER "{fn}" BEFORE INSERT OR UPDATE OR DELETE ON "{table.name}" FOR EACH ROW EXECUTE FUNCTION "{fn}"()',
+    ]
+
+
+def backfill_keys_sql(table: Table) -> list[str]:
+    """Registra as chaves das linhas já existentes (conversão/migração)."""
+    stmts = []
+    quoted = f'"{table.name}"'
+    for ix in unique_guards(table):
+        cols = [c.name for c in ix.columns]
+        stmts.append(
+            f"INSERT INTO {KEYS_TABLE} (idx, key, created_at) "
+            f"SELECT '{ix.name}', {_key_expr(quoted, cols)}, {PARTITION_KEY} FROM {quoted} "
+            f"WHERE {' AND '.join(f'{c} IS NOT NULL' for c in cols)} ON CONFLICT DO NOTHING"
+        )
+    return stmts
+
+
+def _delete_batches(engine: Engine, stmt, params: dict) -> int:  # type: ignore[no-untyped-def]
+    """Repete o DELETE limitado a _DELETE_BATCH linhas, com commit e conexão próprios por lote.
+
+    Locks e WAL de cada lote são liberados antes do próximo; uma falha no meio preserva os
+    lotes já apagados e a próxima manutenção continua de onde parou.
+    """
+    total = 0
+    while True:
+        with engine.begin() as conn:
+            n = conn.execute(stmt, params).rowcount
+        total += n
+        if n < _DELETE_BATCH:
+            return total
+
+
+def orphan_keys_sql(table: Table) -> list[str]:
+    """Apaga chaves sem linha correspondente (linhas removidas antes do trigger cobrir DELETE)."""
+    stmts = []
+    quoted = f'"{table.name}"'
+    for ix in unique_guards(table):
+        cols = [c.name for c in ix.columns]
+        stmts.append(
+            f"DELETE FROM {KEYS_TABLE} k WHERE k.idx = '{ix.name}' AND NOT EXISTS ("
+            f"SELECT 1 FROM {quoted} WHERE {_key_expr(quoted, cols)} = k.key)"
+        )
+    return stmts
+
+
+def expire_keys(engine: Engine, cutoff: date) -> int:
+    """Remove as chaves de linhas anteriores ao corte global (partições já removidas)."""
+    stmt = text(
+        f"DELETE FROM {KEYS_TABLE} WHERE ctid IN ("
+        f"SELECT ctid FROM {KEYS_TABLE} WHERE created_at < :cutoff LIMIT {_DELETE_BATCH})"
+    )
+    return _delete_batches(engine, stmt, {"cutoff": cutoff})
+
+
+def ensure_guards(conn: Connection, table: str) -> None:
+    """Cria/atualiza a tabela de chaves e o trigger de `table` e registra as chaves existentes."""
+    model = Base.metadata.tables[table]
+    for stmt in guard_sql(model) + backfill_keys_sql(model):
+        conn.execute(text(stmt))
+
+
+def is_partitioned(conn: Connection, table: str) -> bool:
+    return bool(
+        conn.execute(
+            text(
+                "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+                "WHERE c.relname = :t AND c.relnamespace = current_schema()::regnamespace"
+            ),
+            {"t": table},
+        ).first()
+    )
+
+
+def list_partitions(conn: Connection, table: str) -> list[tuple[str, date]]:
+    rows = conn.execute(
+        text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = :t"
+        ),
+        {"t": table},
+    )
+    parts = [(name, partition_month(table, name)) for (name,) in rows]
+    return sorted((name, month) for name, month in parts if month is not None)
+
+
+def ensure_partitions(conn: Connection, table: str, first: date, last: date) -> int:
+    """Cria as partições mensais de `first` a `last` (inclusive) que ainda não existem."""
+    created = 0
+    existing = {month for _, month in list_partitions(conn, table)}
+    month = month_start(first)
+    while month <= last:
+        if month not in existing:
+            conn.execute(text(create_partition_sql(table, month)))
+            created += 1
+        month = add_months(month, 1)
+    return created
+
+
+def convert_to_partitioned(conn: Connection, table: str, *, only_empty: bool = False) -> bool:
+    """Converte uma tabela simples em particionada por mês (renomeia, copia, recria índices).
+
+    Roda dentro da transação do chamador (migração). Com `only_empty`, tabelas com dados
+    são deixadas como estão (a cópia de uma tabela grande é trabalho da migração, não do startup).
+    """
+    if is_partitioned(conn, table):
+        return False
+    bounds = conn.execute(text(f'SELECT min({PARTITION_KEY}), count(*) > 0 FROM "{table}"')).first()
+    if only_empty and bounds[1]:
+        log.warning("partition_conversion_skipped", table=table, reason="table_not_empty")
+        return False
+    plain = f"{table}__plain"
+    seq = conn.execute(text("SELECT pg_get_serial_sequence(:t, 'id')"), {"t": table}).scalar()
+    conn.execute(text(f'ALTER TABLE "{table}" RENAME TO "{plain}"'))
+    conn.execute(
+        text(f'CREATE TABLE "{table}" (LIKE "{plain}" INCLUDING DEFAULTS) PARTITION BY RANGE ({PARTITION_KEY})')
+    )
+    if seq:
+        conn.execute(text(f'ALTER SEQUENCE {seq} OWNED BY "{table}".id'))
+    now = month_start(datetime.utcnow())
+    first = month_start(bounds[0]) if bounds[0] else now
+    ensure_partitions(conn, table, first, add_months(now, settings.PARTITION_PREMAKE_MONTHS))
+    conn.execute(text(f'CREATE TABLE IF NOT EXISTS "{table}_default" PARTITION OF "{table}" DEFAULT'))
+    conn.execute(text(f'INSERT INTO "{table}" SELECT * FROM "{plain}"'))
+    conn.execute(text(f'DROP TABLE "{plain}"'))
+    for stmt in index_sql(Base.metadata.tables[table]):
+        conn.execute(text(stmt))
+    ensure_guards(conn, table)
+    log.info("partition_conversion_done", table=table)
+    return True
+
+
+def ensure_partitioned(engine: Engine) -> None:
+    """Startup da API: converte tabelas recém-criadas (vazias) pelo create_all. No-op fora do Postgres."""
+    if not is_postgres(engine):
+        return
+    with engine.begin() as conn:
+        for table in PARTITIONED_TABLES:
+            convert_to_partitioned(conn, table, only_empty=True)
+
+
+# ------------------- Retenção -------------------
+def tenant_retentions(conn: Connection) -> dict[int, int]:
+    """retention_months por tenant (0 = sem expiração)."""
+    out: dict[int, int] = {}
+    for tenant_id, cfg in conn.execute(select(Tenant.id, Tenant.settings_json)):
+        value = (cfg or {}).get("retention_months", settings.RETENTION_MONTHS_DEFAULT)
+        try:
+            out[tenant_id] = max(0, int(value))
+        except (TypeError, ValueError):
+            out[tenant_id] = settings.RETENTION_MONTHS_DEFAULT
+    return out
+
+
+def plan_retention(retentions: dict[int, int], today: date) -> tuple[date | None, dict[int, date]]:
+    """(corte global, cortes por tenant): meses anteriores ao corte estão vencidos.
+
+    O corte global (partição inteira) é o do tenant com retenção mais longa; sem tenants
+    ou com algum tenant sem expiração (0), nenhuma partição é removida. Tenants com
+    retenção menor que a global entram no dicionário para DELETE das próprias linhas.
+    """
+    current = month_start(today)
+    cutoffs = {t: add_months(current, -months) for t, months in retentions.items() if months > 0}
+    if not retentions or len(cutoffs) < len(retentions):
+        global_cutoff = None
+    else:
+        global_cutoff = min(cutoffs.values())
+    per_tenant = {t: c for t, c in cutoffs.items() if global_cutoff is None or c > global_cutoff}
+    return global_cutoff, per_tenant
+
+
+def _tenant_filter(table: str) -> str:
+    if table == "conversation_events":
+        return "conversation_id IN (SELECT id FROM conversations WHERE tenant_id = :tenant_id)"
+    return "tenant_id = :tenant_id"
+
+
+def expire_partitions(conn: Connection, table: str, cutoff: date, action: str) -> list[str]:
+    """Remove (drop) ou desanexa (detach) as partições inteiramente anteriores ao corte."""
+    done: list[str] = []
+    for name, month in list_partitions(conn, table):
+        if add_months(month, 1) > cutoff:
+            continue
+        conn.execute(text(f'ALTER TABLE "{table}" DETACH PARTITION "{name}"'))
+        if action == "drop":
+            conn.execute(text(f'DROP TABLE "{name}"'))
+        done.append(name)
+    return done
+
+
+def delete_tenant_rows(engine: Engine, table: str, tenant_id: int, cutoff: date) -> int:
+    """Apaga em lotes as linhas do tenant anteriores ao corte, partição por partição (commit por lote)."""
+    with engine.connect() as conn:
+        parts = list_partitions(conn, table)
+    total = 0
+    for name, month in parts:
+        if month >= cutoff:
+            continue
+        stmt = text(
+            f'DELETE FROM "{name}" WHERE ctid IN ('
+            f'SELECT ctid FROM "{name}" WHERE {_tenant_filter(table)} AND {PARTITION_KEY} < :cutoff LIMIT {_DELETE_BATCH})'
+        )
+        total += _delete_batches(engine, stmt, {"tenant_id": tenant_id, "cutoff": cutoff})
+    return total
+
+
+def run_maintenance(engine: Engine, today: date | None = None) -> dict[str, dict]:
+    """Pré-cria partições futuras e aplica a retenção.
+
+    Criação e expiração de partições numa transação por tabela (DDL curto); os DELETEs da
+    retenção por tenant e das chaves expiradas fazem commit a cada lote.
+    """
+    if not is_postgres(engine):
+        return {}
+    today = today or datetime.utcnow().date()
+    current = month_start(today)
+    report: dict[str, dict] = {}
+    with engine.connect() as conn:
+        global_cutoff, per_tenant = plan_retention(tenant_retentions(conn), today)
+    for table in PARTITIONED_TABLES:
+        with engine.begin() as conn:
+            if not is_partitioned(conn, table):
+                log.warning("partition_maintenance_skipped", table=table, reason="not_partitioned")
+                continue
+            created = ensure_partitions(conn, table, current, add_months(current, settings.PARTITION_PREMAKE_MONTHS))
+            expired = (
+                expire_partitions(conn, table, global_cutoff, settings.PARTITION_EXPIRED_ACTION)
+                if global_cutoff is not None
+                else []
+            )
+        deleted = {t: delete_tenant_rows(engine, table, t, cutoff) for t, cutoff in per_tenant.items()}
+        report[table] = {"created": created, "expired": expired, "deleted": {t: n for t, n in deleted.items() if n}}
+        log.info("partition_maintenance_done", table=table, **report[table])
+    if global_cutoff is not None:
+        with engine.connect() as conn:
+            has_keys = conn.execute(text("SELECT to_regclass(:t)"), {"t": KEYS_TABLE}).scalar() is not None
+        if has_keys:
+            report[KEYS_TABLE] = {"expired": expire_keys(engine, global_cutoff)}
+    return report
+
+
+def detached_partitions(conn: Connection, tables: Iterable[str] = PARTITIONED_TABLES) -> list[tuple[str, str, date]]:
+    """Partições desanexadas (PARTITION_EXPIRED_ACTION=detach) aguardando arquivamento: (tabela, nome, mês)."""
+    attached = {name for table in tables for name, _ in list_partitions(conn, table)}
+    rows = conn.execute(
+        text("SELECT tablename FROM pg_tables WHERE schemaname = current_schema()")
+    )
+    out: list[tuple[str, str, date]] = []
+    for (name,) in rows:
+        if name in attached:
+            continue
+        for table in tables:
+            month = partition_month(table, name)
+            if month is not None:
+                out.append((table, name, month))
+    return sorted(out)
@@ -0,0 +1,276 @@
+"""Rollups de métricas de negócio (leads, conversas, mensagens, pré-análises PAN).
+
+Escrita: os pontos que persistem eventos chamam `record` depois do commit (ou
+`record_on_commit`, que espera o commit da sessão e descarta no rollback), que só soma num
+buffer em memória por (tenant, canal, métrica, hora). A thread do `RollupWriter` grava o lote com
+um upsert incremental (INSERT ... ON CONFLICT DO UPDATE SET value = value + excluded.value)
+nos buckets de hora e de dia, fora da transação de quem gerou o evento: a linha quente do
+rollup não fica bloqueada durante a requisição. Contagens perdidas (processo morto antes
+do flush) são corrigidas com `backfill`.
+
+Leitura: `monthly_totals` soma as linhas diárias do período (no máximo ~31 por mês e
+métrica, independente do volume de mensagens), com cache TTL em memória.
+
+Buckets em UTC.
+"""
+from __future__ import annotations
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+import threading
+import time
+from typing import Iterable
+
+import structlog
+from sqlalchemy import delete, event, func, select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.messaging.batching import BatchFlusher
+from app.repositories.db import SessionLocal
+from app.repositories.models import Contact, Conversation, Message, MessageDirection, MetricRollup
+
+log = structlog.get_logger()
+
+CHANNEL_WHATSAPP = "whatsapp"
+
+LEADS = "leads"
+CONVERSATIONS = "conversations"
+INBOUND = "inbound"
+OUTBOUND = "outbound"
+PAN_PREANALISE = "pan_preanalise"
+METRICS = (LEADS, CONVERSATIONS, INBOUND, OUTBOUND, PAN_PREANALISE)
+# Reconstruíveis a partir de messages/conversations; pré-análises não deixam rastro no banco
+REBUILDABLE = (LEADS, CONVERSATIONS, INBOUND, OUTBOUND)
+
+_KEY_COLUMNS = ["tenant_id", "granularity", "bucket", "channel", "metric"]
+
+
+def _hour(at: datetime) -> datetime:
+    return at.replace(minute=0, second=0, microsecond=0)
+
+
+def _day(at: datetime) -> datetime:
+    return at.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _upsert_stmt(db: Session):  # type: ignore[no-untyped-def]
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    stmt = insert(MetricRollup)
+    return stmt.on_conflict_do_update(
+        index_elements=_KEY_COLUMNS,
+        set_={"value": MetricRollup.value + stmt.excluded.value},
+    )
+
+
+def _rows(counts: dict[tuple[int, str, str, datetime], int]) -> list[dict]:
+    """Expande contagens por hora em linhas de hora e de dia (ordenadas: ordem de lock estável)."""
+    merged: dict[tuple, int] = defaultdict(int)
+    for (tenant_id, channel, metric, hour), n in counts.items():
+        merged[(tenant_id, "hour", hour, channel, metric)] += n
+        merged[(tenant_id, "day", _day(hour), channel, metric)] += n
+    return [dict(zip(_KEY_COLUMNS, key), value=n) for key, n in sorted(merged.items()) if n]
+
+
+class RollupWriter(BatchFlusher):
+    """Acumula incrementos por (tenant, canal, métrica, hora) e grava em lote com upsert."""
+
+    def __init__(self, interval_s: float | None = None, max_items: int | None = None) -> None:
+        super().__init__(
+            "metric_rollups",
+            interval_s if interval_s is not None else settings.ROLLUP_FLUSH_INTERVAL_MS / 1000.0,
+            max_items or settings.ROLLUP_FLUSH_MAX_ITEMS,
+        )
+        self._pending: dict[tuple[int, str, str, datetime], int] = defaultdict(int)
+
+    def add(self, tenant_id: int, metric: str, n: int, at: datetime, channel: str) -> None:
+        with self._lock:
+            self._pending[(tenant_id, channel, metric, _hour(at))] += n
+        self._notify()
+
+    def _size(self) -> int:
+        return len(self._pending)
+
+    def _drain(self) -> dict | None:
+        if not self._pending:
+            return None
+        batch, self._pending = self._pending, defaultdict(int)
+        return batch
+
+    def _write(self, batch: dict[tuple[int, str, str, datetime], int]) -> None:
+        rows = _rows(batch)
+        try:
+            with SessionLocal() as db:
+                db.execute(_upsert_stmt(db), rows)
+                db.commit()
+        except Exception as e:  # noqa: BLE001
+            log.error("metric_rollup_flush_error", error=str(e), rows=len(rows))
+            with self._lock:
+                for key, n in batch.items():
+                    self._pending[key] += n
+
+
+_writer: RollupWriter | None = None
+_writer_lock = threading.Lock()
+
+
+def get_rollup_writer() -> RollupWriter:
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = RollupWriter()
+    return _writer
+
+
+def record(tenant_id: int, metric: str, n: int = 1, at: datetime | None = None, channel: str = CHANNEL_WHATSAPP) -> None:
+    """Soma `n` ao contador (gravação assíncrona, em lote)."""
+    if n:
+        get_rollup_writer().add(tenant_id, metric, n, at or datetime.utcnow(), channel)
+
+
+_PENDING_KEY = "rollups_pending"
+
+
+def record_on_commit(
+    db: Session, tenant_id: int, metric: str, n: int = 1, at: datetime | None = None, channel: str = CHANNEL_WHATSAPP
+) -> None:
+    """Como `record`, mas só conta quando a transação de `db` fizer commit (rollback descarta)."""
+    if n:
+        db.info.setdefault(_PENDING_KEY, []).append((tenant_id, metric, n, at or datetime.utcnow(), channel))
+
+
+@event.listens_for(Session, "after_commit")
+def _record_pending(session: Session) -> None:
+    for tenant_id, metric, n, at, channel in session.info.pop(_PENDING_KEY, ()):
+        record(tenant_id, metric, n, at, channel)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending(session: Session) -> None:
+    session.info.pop(_PENDING_KEY, None)
+
+
+# ------------------- Leitura -------------------
+@dataclass(frozen=True)
+class _Cached:
+    expires: float
+    value: dict[tuple[int, int], dict[str, int]]
+
+
+_cache: dict[tuple, _Cached] = {}
+_cache_lock = threading.Lock()
+_CACHE_MAX = 256
+
+
+def clear_cache() -> None:
+    with _cache_lock:
+        _cache.clear()
+
+
+def monthly_totals(
+    db: Session, tenant_id: int, start: date, end: date, channel: str | None = None
+) -> dict[tuple[int, int], dict[str, int]]:
+    """{(ano, mês): {métrica: total}} entre start e end (inclusive), a partir dos rollups diários."""
+    key = (tenant_id, start, end, channel)
+    now = time.monotonic()
+    with _cache_lock:
+        hit = _cache.get(key)
+        if hit is not None and hit.expires > now:
+            return hit.value
+
+    R = MetricRollup
+    stmt = select(R.bucket, R.metric, R.value).where(
+        R.tenant_id == tenant_id,
+        R.granularity == "day",
+        R.bucket >= datetime.combine(start, datetime.min.time()),
+        R.bucket < datetime.combine(end + timedelta(days=1), datetime.min.time()),
+    )
+    if channel:
+        stmt = stmt.where(R.channel == channel)
+    totals: dict[tuple[int, int], dict[str, int]] = defaultdict(lambda: dict.fromkeys(METRICS, 0))
+    for bucket, metric, value in db.execute(stmt):
+        month = totals[(bucket.year, bucket.month)]
+        month[metric] = month.get(metric, 0) + int(value)
+    value = dict(totals)
+
+    with _cache_lock:
+        if len(_cache) >= _CACHE_MAX:
+            _cache.clear()
+        _cache[key] = _Cached(now + settings.METRICS_OVERVIEW_CACHE_TTL_S, value)
+    return value
+
+
+# ------------------- Backfill -------------------
+def _firsts(  # type: ignore[no-untyped-def]
+    db: Session, group_col, tenant_id: int | None, since: datetime | None, until: datetime
+) -> Iterable[tuple[int, datetime]]:
+    """(tenant_id, primeira mensagem) por grupo (conversa ou contato), com a primeira no período."""
+    first = func.min(Message.created_at)
+    stmt = (
+        select(Conversation.tenant_id, first)
+        .select_from(Message)
+        .join(Conversation, Conversation.id == Message.conversation_id)
+        .group_by(group_col, Conversation.tenant_id)
+        .having(first < until)
+    )
+    if tenant_id is not None:
+        stmt = stmt.where(Conversation.tenant_id == tenant_id)
+    if since is not None:
+        stmt = stmt.having(first >= since)
+    return db.execute(stmt)
+
+
+def backfill(
+    db: Session,
+    *,
+    tenant_id: int | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+) -> int:
+    """Recalcula os rollups reconstruíveis de [since, until) a partir do histórico e faz commit.
+
+    Os limites são arredondados para o dia (UTC); `until` padrão = início de hoje, para não
+    disputar com os incrementos ao vivo do dia corrente. Conversas contam pela primeira
+    mensagem; leads pela criação do contato (`contacts.created_at`, como no incremento ao
+    vivo, que também conta contatos importados sem mensagem). Pré-análises PAN não são tocadas.
+    Devolve o número de linhas gravadas.
+    """
+    until = _day(until or datetime.utcnow())
+    since = _day(since) if since is not None else None
+
+    counts: dict[tuple[int, str, str, datetime], int] = defaultdict(int)
+    msgs = select(Message.tenant_id, Message.direction, Message.created_at).where(Message.created_at < until)
+    if since is not None:
+        msgs = msgs.where(Message.created_at >= since)
+    if tenant_id is not None:
+        msgs = msgs.where(Message.tenant_id == tenant_id)
+    for t_id, direction, created_at in db.execute(msgs.execution_options(yield_per=5000)):
+        metric = INBOUND if direction == MessageDirection.inbound else OUTBOUND
+        counts[(t_id, CHANNEL_WHATSAPP, metric, _hour(created_at))] += 1
+    for t_id, first_at in _firsts(db, Message.conversation_id, tenant_id, since, until):
+        counts[(t_id, CHANNEL_WHATSAPP, CONVERSATIONS, _hour(first_at))] += 1
+    leads = select(Contact.tenant_id, Contact.created_at).where(Contact.created_at < until)
+    if since is not None:
+        leads = leads.where(Contact.created_at >= since)
+    if tenant_id is not None:
+        leads = leads.where(Contact.tenant_id == tenant_id)
+    for t_id, created_at in db.execute(leads.execution_options(yield_per=5000)):
+        counts[(t_id, CHANNEL_WHATSAPP, LEADS, _hour(created_at))] += 1
+
+    wipe = delete(MetricRollup).where(MetricRollup.metric.in_(REBUILDABLE), MetricRollup.bucket < until)
+    if since is not None:
+        wipe = wipe.where(MetricRollup.bucket >= since)
+    if tenant_id is not None:
+        wipe = wipe.where(MetricRollup.tenant_id == tenant_id)
+    db.execute(wipe)
+    rows = _rows(counts)
+    for i in range(0, len(rows), 1000):
+        db.execute(_upsert_stmt(db), rows[i : i + 1000])
+    db.commit()
+    clear_cache()
+    log.info("metric_rollup_backfill_done", tenant_id=tenant_id, since=since, until=until, rows=len(rows))
+    return len(rows)
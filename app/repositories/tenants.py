@@ -0,0 +1,180 @@
+"""Cache de tenants em memória (API e workers), com invalidação entre processos via Redis pub/sub.
+
+Quase toda requisição/task resolve o tenant pelo nome; com o cache, o caminho quente não
+vai ao banco. Entradas expiram por TTL (TENANT_CACHE_TTL_S) e o tamanho é limitado
+(TENANT_CACHE_MAX, LRU). Ao alterar configurações de um tenant, `invalidate_tenant`
+descarta a entrada local e publica no canal TENANT_CACHE_CHANNEL; cada processo tem uma
+thread assinante que descarta a mesma entrada. Sem Redis, vale só o TTL.
+"""
+from __future__ import annotations
+from collections import OrderedDict
+from dataclasses import dataclass, field
+import threading
+import time
+from types import MappingProxyType
+from typing import Any, Mapping
+
+import structlog
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+from app.core.config import settings
+from app.core.redis_client import get_redis
+from app.repositories.db import SessionLocal
+from app.repositories.models import Tenant
+
+log = structlog.get_logger()
+
+
+@dataclass(frozen=True)
+class TenantInfo:
+    id: int
+    name: str
+    timezone: str
+    settings: Mapping[str, Any] = field(default_factory=lambda: MappingProxyType({}))
+
+    def setting(self, key: str, default: Any = None) -> Any:
+        return self.settings.get(key, default)
+
+    @classmethod
+    def from_model(cls, t: Tenant) -> "TenantInfo":
+        return cls(
+            id=t.id,
+            name=t.name,
+            timezone=t.timezone or "America/Sao_Paulo",
+            settings=MappingProxyType(dict(t.settings_json or {})),
+        )
+
+
+class TenantCache:
+    def __init__(self, ttl_s: float | None = None, max_size: int | None = None) -> None:
+        self.ttl_s = ttl_s if ttl_s is not None else settings.TENANT_CACHE_TTL_S
+        self.max_size = max_size or settings.TENANT_CACHE_MAX
+        self._by_name: OrderedDict[str, tuple[float, TenantInfo]] = OrderedDict()
+        self._name_by_id: dict[int, str] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _get_fresh(self, name: str) -> TenantInfo | None:
+        with self._lock:
+            item = self._by_name.get(name)
+            if item is None:
+                return None
+            expires, info = item
+            if expires < time.monotonic():
+                self._drop(name)
+                return None
+            self._by_name.move_to_end(name)
+            self.hits += 1
+            return info
+
+    def _put(self, info: TenantInfo) -> TenantInfo:
+        with self._lock:
+            self._by_name[info.name] = (time.monotonic() + self.ttl_s, info)
+            self._by_name.move_to_end(info.name)
+            self._name_by_id[info.id] = info.name
+            while len(self._by_name) > self.max_size:
+                old, (_, old_info) = self._by_name.popitem(last=False)
+                self._name_by_id.pop(old_info.id, None)
+        return info
+
+    def _drop(self, name: str) -> None:
+        item = self._by_name.pop(name, None)
+        if item is not None:
+            self._name_by_id.pop(item[1].id, None)
+
+    def get(self, name: str, create: bool = True) -> TenantInfo | None:
+        """Tenant pelo nome; cria se não existir (comportamento dos antigos _ensure_tenant)."""
+        info = self._get_fresh(name)
+        if info is not None:
+            return info
+        self.misses += 1
+        with SessionLocal() as db:
+            t = db.execute(select(Tenant).where(Tenant.name == name)).scalar_one_or_none()
+            if t is None:
+                if not create:
+                    return None
+                t = Tenant(name=name)
+                db.add(t)
+                try:
+                    db.commit()
+                except IntegrityError:
+                    # Criado em paralelo por outro processo
+                    db.rollback()
+                    t = db.execute(select(Tenant).where(Tenant.name == name)).scalar_one()
+            return self._put(TenantInfo.from_model(t))
+
+    def get_by_id(self, tenant_id: int) -> TenantInfo | None:
+        with self._lock:
+            name = self._name_by_id.get(tenant_id)
+        if name is not None:
+            info = self._get_fresh(name)
+            if info is not None:
+                return info
+        self.misses += 1
+        with SessionLocal() as db:
+            t = db.get(Tenant, tenant_id)
+            return self._put(TenantInfo.from_model(t)) if t is not None else None
+
+    def invalidate(self, name: str | None = None) -> None:
+        with self._lock:
+            if name is None:
+                self._by_name.clear()
+                self._name_by_id.clear()
+            else:
+                self._drop(name)
+
+
+_cache = TenantCache()
+_listener: threading.Thread | None = None
+_listener_lock = threading.Lock()
+
+
+def _listen() -> None:
+    backoff = 1.0
+    while True:
+        try:
+            pubsub = get_redis().pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(settings.TENANT_CACHE_CHANNEL)
+            # Pode ter perdido mensagens enquanto desconectado
+            _cache.invalidate()
+            backoff = 1.0
+            for msg in pubsub.listen():
+                if msg.get("type") == "message":
+                    _cache.invalidate(msg.get("data") or None)
+        except Exception as e:  # noqa: BLE001
+            log.warning("tenant_cache_listener_error", error=str(e), retry_in=backoff)
+            time.sleep(backoff)
+            backoff = min(30.0, backoff * 2)
+
+
+def _ensure_listener() -> None:
+    global _listener
+    if _listener is not None or settings.APP_ENV == "test":
+        return
+    with _listener_lock:
+        if _listener is None:
+            _listener = threading.Thread(target=_listen, name="tenant-cache-listener", daemon=True)
+            _listener.start()
+
+
+def get_tenant(name: str) -> TenantInfo:
+    _ensure_listener()
+    info = _cache.get(name)
+    assert info is not None
+    return info
+
+
+def get_tenant_by_id(tenant_id: int) -> TenantInfo | None:
+    _ensure_listener()
+    return _cache.get_by_id(tenant_id)
+
+
+def invalidate_tenant(name: str) -> None:
+    """Chamar após alterar um tenant: descarta a entrada aqui e nos demais processos."""
+    _cache.invalidate(name)
+    try:
+        get_redis().publish(settings.TENANT_CACHE_CHANNEL, name)
+    except Exception as e:  # noqa: BLE001
+        log.warning("tenant_cache_publish_error", error=str(e), tenant=name)
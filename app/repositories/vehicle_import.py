@@ -0,0 +1,157 @@
+"""Import CSV do inventário de veículos: parse da linha, upsert do lote e sync.
+
+Cada lote vira um único INSERT ... ON CONFLICT DO UPDATE pela chave natural (tenant_id,
+title, ano): sem SELECT por linha. Campos vazios no CSV não apagam o valor existente
+(coalesce); `active` sempre é sobrescrito.
+
+Delta: cada veículo guarda `content_hash`, o hash da última linha do feed aplicada. Como
+aplicar a mesma linha duas vezes não muda nada, linhas com o hash igual ao gravado são
+puladas, e um reenvio do inventário sem mudanças não escreve nada. No modo `sync` o feed é
+o inventário completo: ao final, os veículos ativos do tenant que não vieram no arquivo são
+desativados num único UPDATE (e perdem o hash, para que voltem se reaparecerem).
+
+Leitura em streaming, lotes e checkpoints ficam em repositories.imports.
+"""
+from __future__ import annotations
+import hashlib
+import json
+from typing import Iterable
+
+import structlog
+from sqlalchemy import String, any_, bindparam, func, literal_column, select, update
+from sqlalchemy.orm import Session
+
+from app.repositories import catalog
+from app.repositories.models import VEHICLE_KEY, ImportJob, Vehicle
+
+log = structlog.get_logger()
+
+
+# Atualizados só quando o CSV traz valor
+_COALESCE_FIELDS = ("brand", "model", "category", "price", "image_url")
+_FALSE_VALUES = {"0", "false", "nao", "não", "no"}
+_HASH_FIELDS = ("title", "brand", "model", "year", "category", "price", "image_url", "active")
+# Lote do UPDATE de desativação (limite de parâmetros do SQLite)
+_DEACTIVATE_BATCH = 10000
+
+
+def content_hash(row: dict) -> str:
+    return hashlib.blake2b(repr(tuple(row[f] for f in _HASH_FIELDS)).encode(), digest_size=16).hexdigest()
+
+
+def row_key(row: dict) -> tuple[str, int]:
+    return row["title"], row["year"] or 0
+
+
+def parse_row(row: dict[str, str | None]) -> dict | None:
+    """Linha do CSV -> colunas de Vehicle (sem tenant). None quando não há título."""
+    title = (row.get("title") or row.get("titulo") or "").strip()
+    if not title:
+        return None
+    try:
+        year = int((row.get("year") or "").strip())
+    except ValueError:
+        year = None
+    try:
+        price = float((row.get("price") or "").replace(".", "").replace(",", "."))
+    except ValueError:
+        price = None
+    return {
+        "title": title,
+        "brand": (row.get("brand") or "").strip() or None,
+        "model": (row.get("model") or "").strip() or None,
+        "year": year,
+        "category": (row.get("category") or row.get("categoria") or "").strip().upper() or None,
+        "price": price,
+        "image_url": (row.get("image_url") or row.get("imagem") or "").strip() or None,
+        "active": (row.get("active") or row.get("ativo") or "").strip().lower() not in _FALSE_VALUES,
+    }
+
+
+def _merge(rows: Iterable[dict]) -> list[dict]:
+    """Uma linha por chave no lote (o ON CONFLICT não pode tocar a mesma linha duas vezes).
+
+    Repetições se combinam como se fossem aplicadas em sequência.
+    """
+    merged: dict[tuple[str, int], dict] = {}
+    for row in rows:
+        key = row_key(row)
+        prev = merged.get(key)
+        if prev is not None:
+            for field in _COALESCE_FIELDS:
+                if row[field] is None:
+                    row[field] = prev[field]
+        merged[key] = row
+    return list(merged.values())
+
+
+def _upsert_stmt(db: Session):  # type: ignore[no-untyped-def]
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    stmt = insert(Vehicle)
+    set_ = {f: func.coalesce(stmt.excluded[f], Vehicle.__table__.c[f]) for f in _COALESCE_FIELDS}
+    set_["active"] = stmt.excluded.active
+    set_["content_hash"] = stmt.excluded.content_hash
+    return stmt.on_conflict_do_update(index_elements=list(VEHICLE_KEY), set_=set_)
+
+
+def _title_in(db: Session, titles: list[str]):  # type: ignore[no-untyped-def]
+    """`title IN (...)` com a lista num único parâmetro (um IN expandido com milhares de binds
+    custa mais para compilar do que a consulta para rodar)."""
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import ARRAY
+
+        return Vehicle.title == any_(bindparam("titles", titles, type_=ARRAY(String)))
+    return Vehicle.title.in_(select(literal_column("value")).select_from(func.json_each(json.dumps(titles))))
+
+
+def upsert_chunk(db: Session, tenant_id: int, rows: list[dict]) -> tuple[int, int, int]:
+    """Grava as linhas novas/alteradas do lote (sem commit). Devolve (novos, atualizados, rejeitados)."""
+    unique = _merge(rows)
+    for row in unique:
+        row["content_hash"] = content_hash(row)
+    # Prefixo (tenant_id, title) do índice único; o ano é conferido aqui
+    stored = {
+        (title, year): h
+        for title, year, h in db.execute(
+            select(Vehicle.title, func.coalesce(Vehicle.year, literal_column("0")), Vehicle.content_hash).where(
+                Vehicle.tenant_id == tenant_id, _title_in(db, list({r["title"] for r in unique}))
+            )
+        )
+    }
+    changed = [r for r in unique if row_key(r) not in stored or stored[row_key(r)] != r["content_hash"]]
+    if changed:
+        db.execute(_upsert_stmt(db), [{**r, "tenant_id": tenant_id} for r in changed])
+    inserted = sum(1 for r in changed if row_key(r) not in stored)
+    unchanged = len(unique) - len(changed)
+    return inserted, len(rows) - inserted - unchanged, 0
+
+
+def deactivate_missing(db: Session, job: ImportJob, seen: set[tuple[str, int]]) -> int:
+    """Modo sync: desativa (sem commit) os veículos ativos do tenant ausentes do feed completo."""
+    if job.mode != "sync":
+        return 0
+    if not seen:
+        # Feed vazio desativaria o catálogo inteiro: quase sempre arquivo errado
+        log.warning("vehicle_sync_empty_feed", job_id=job.id, tenant_id=job.tenant_id)
+        return 0
+    active = db.execute(
+        select(Vehicle.id, Vehicle.title, func.coalesce(Vehicle.year, literal_column("0"))).where(
+            Vehicle.tenant_id == job.tenant_id, Vehicle.active == True  # noqa: E712
+        )
+    )
+    missing = [vid for vid, title, year in active if (title, year) not in seen]
+    for i in range(0, len(missing), _DEACTIVATE_BATCH):
+        db.execute(
+            update(Vehicle)
+            .where(Vehicle.id.in_(missing[i : i + _DEACTIVATE_BATCH]))
+            .values(active=False, content_hash=None)
+        )
+    return len(missing)
+
+
+def on_commit(tenant_id: int) -> None:
+    """Veículos mudaram: nova versão do catálogo para os caches derivados."""
+    catalog.bump_version(tenant_id)
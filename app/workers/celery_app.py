@@ -1,5 +1,10 @@
+import os
+
 from celery import Celery
+from celery.signals import worker_init, worker_process_shutdown
 from app.core.config import settings
+from app.core.metrics import mark_process_dead, start_metrics_server
+from app.messaging.batching import stop_all_flushers
 
 celery = Celery(
     "atendeja",
@@ -8,6 +13,8 @@ celery = Celery(
     include=[
         "app.workers.tasks_inbound",
         "app.workers.tasks_outbound",
+        "app.workers.tasks_maintenance",
+        "app.workers.tasks_imports",
     ],
 )
 
@@ -18,9 +25,43 @@ celery.conf.update(
     timezone="America/Sao_Paulo",
     task_acks_late=True,
     worker_prefetch_multiplier=1,
+    beat_schedule={
+        # Poller único dos buffers de agregação inbound (sorted set de prazos)
+        "inbound-flush-due": {
+            "task": "inbound.flush_due",
+            "schedule": settings.INBOUND_AGG_POLL_S,
+            "options": {"expires": settings.INBOUND_AGG_POLL_S * 5},
+        },
+        # Partições futuras e retenção (no-op fora do Postgres)
+        "partition-maintenance": {
+            "task": "maintenance.partitions",
+            "schedule": settings.PARTITION_MAINTENANCE_INTERVAL_S,
+            "options": {"expires": settings.PARTITION_MAINTENANCE_INTERVAL_S},
+        },
+        # Arquivo frio das partições desanexadas / linhas antigas (no-op sem ARCHIVE_URL)
+        "archive-expired": {
+            "task": "maintenance.archive",
+            "schedule": settings.ARCHIVE_INTERVAL_S,
+            "options": {"expires": settings.ARCHIVE_INTERVAL_S},
+        },
+    },
 )
 
 
+@worker_process_shutdown.connect
+def _flush_write_behind(**_kwargs) -> None:
+    # Processos filhos do prefork não rodam atexit de forma confiável; flush explícito
+    stop_all_flushers()
+    mark_process_dead(os.getpid())
+
+
+@worker_init.connect
+def _start_metrics(**_kwargs) -> None:
+    # No processo principal do worker: com PROMETHEUS_MULTIPROC_DIR agrega os filhos do prefork
+    if settings.METRICS_WORKER_PORT:
+        start_metrics_server(settings.METRICS_WORKER_PORT)
+
+
 @celery.task(name="echo")
 def echo(message: str) -> str:
     return f"echo: {message}"
@@ -29,5 +70,7 @@ def echo(message: str) -> str:
 try:  # pragma: no cover
     import app.workers.tasks_inbound  # noqa: F401
     import app.workers.tasks_outbound  # noqa: F401
+    import app.workers.tasks_maintenance  # noqa: F401
+    import app.workers.tasks_imports  # noqa: F401
 except Exception:  # noqa: BLE001
     pass
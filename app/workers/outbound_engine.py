@@ -0,0 +1,369 @@
+"""Engine assíncrono de envio outbound (WA_OUTBOUND_MODE=async).
+
+Consome a fila Redis `WA_OUTBOUND_QUEUE_KEY` e mantém até WA_OUTBOUND_CONCURRENCY envios
+em voo num único processo, todos sobre o mesmo `httpx.AsyncClient` (HTTP/2). Cada job
+retirado da fila é movido atomicamente para `<fila>:processing:<nome>`; só sai de lá depois
+que o resultado é gravado no banco. Jobs em processamento de engines sem heartbeat (caídos)
+voltam à fila no start e periodicamente.
+Antes de cada envio valem as mesmas guardas do provider síncrono (janela de 24h para texto
+livre, lista de supressão e rate limit por contato/tenant). As guardas de banco rodam uma
+vez por lote retirado da fila (uma ida à thread); o rate limit usa o Redis assíncrono do
+engine. Job sem token não segura a vaga: volta para uma fila de espera em memória (continua
+na lista de processamento) e é redisparado quando o bucket libera. Os status (sent/error) são
+gravados em lote pelo flusher, não um UPDATE por envio; erros levam o código em payload.error.
+
+Uso: python -m app.workers.outbound_engine [--name engine-1]
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import heapq
+import itertools
+import json
+import os
+import signal
+import socket
+from typing import Any
+
+import httpx
+import redis.asyncio as aioredis
+import structlog
+from sqlalchemy import select, update
+
+from app.core.config import settings
+from app.core.logging import configure_logging
+from app.core.metrics import start_metrics_server
+from app.messaging.async_sender import AsyncWhatsAppSender, PermanentSendError
+from app.messaging.guards import blocked_reasons
+from app.messaging.limits import AsyncRateLimiter
+from app.repositories.db import SessionLocal
+from app.repositories import models
+
+log = structlog.get_logger()
+
+# Move até N jobs da fila para a lista de processamento do engine (atômico)
+_POP_BATCH_LUA = """
+local items = redis.call('LPOP', KEYS[1], ARGV[1])
+if not items then return {} end
+redis.call('RPUSH', KEYS[2], unpack(items))
+return items
+"""
+
+
+def _error_info(exc: Exception) -> dict[str, Any]:
+    """Código do erro de envio; para rejeições da Cloud API inclui o `error.code` da Meta."""
+    if isinstance(exc, PermanentSendError):
+        info: dict[str, Any] = {"code": f"http_{exc.status_code}"}
+        try:
+            provider_code = json.loads(exc.body).get("error", {}).get("code")
+        except Exception:  # noqa: BLE001
+            provider_code = None
+        if provider_code is not None:
+            info["provider_code"] = provider_code
+        return info
+    if isinstance(exc, httpx.HTTPStatusError):
+        return {"code": f"http_{exc.response.status_code}"}
+    return {"code": type(exc).__name__}
+
+
+def _pre_send(jobs: list[dict[str, Any]]) -> list[tuple[int | None, str | None]]:
+    """(tenant_id, motivo do bloqueio) de cada job do lote; None = liberado.
+
+    Uma sessão para o lote inteiro (rodar em thread): tenants faltantes num SELECT ... IN e
+    as guardas via `blocked_reasons`.
+    """
+    with SessionLocal() as db:
+        # Jobs enfileirados antes do tenant_id ir no job
+        missing = [j["message_id"] for j in jobs if j.get("tenant_id") is None and j.get("message_id")]
+        tenants: dict[int, int] = {}
+        if missing:
+            tenants = dict(
+                db.execute(
+                    select(models.Message.id, models.Message.tenant_id).where(models.Message.id.in_(missing))
+                ).all()
+            )
+        tenant_ids = [j.get("tenant_id") or tenants.get(j.get("message_id")) for j in jobs]
+        known = [i for i, t in enumerate(tenant_ids) if t is not None]
+        reasons = blocked_reasons(
+            db,
+            [
+                (int(tenant_ids[i]), jobs[i]["payload"]["to"], jobs[i]["payload"].get("type") == "text")  # type: ignore[arg-type]
+                for i in known
+            ],
+        )
+    out: list[tuple[int | None, str | None]] = [(None, "unknown_tenant")] * len(jobs)
+    for i, reason in zip(known, reasons):
+        out[i] = (int(tenant_ids[i]), reason)  # type: ignore[arg-type]
+    return out
+
+
+def _with_error_payloads(rows: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """Troca `error` por payload = payload atual + error (só as linhas com erro leem o banco)."""
+    errors = {r["id"]: r["error"] for r in rows if "error" in r}
+    if not errors:
+        return rows
+    with SessionLocal() as db:
+        current = dict(
+            db.execute(
+                select(models.Message.id, models.Message.payload).where(models.Message.id.in_(list(errors)))
+            ).all()
+        )
+    out = []
+    for row in rows:
+        row = {k: v for k, v in row.items() if k != "error"}
+        if row["id"] in errors:
+            row["payload"] = {**(current.get(row["id"]) or {}), "error": errors[row["id"]]}
+        out.append(row)
+    return out
+
+
+def _apply_results(results: list[dict[str, Any]]) -> None:
+    """Grava os status do lote com um UPDATE por chave primária (executemany)."""
+    rows = [r for r in results if r.get("id")]
+    if not rows:
+        return
+    try:
+        rows = _with_error_payloads(rows)
+    except Exception as e:  # noqa: BLE001
+        log.warning("outbound_engine_error_payload_failed", error=str(e))
+        rows = [{k: v for k, v in r.items() if k != "error"} for r in rows]
+    try:
+        with SessionLocal() as db:
+            db.execute(update(models.Message), rows)
+            db.commit()
+        return
+    except Exception as e:  # noqa: BLE001
+        log.warning("outbound_engine_batch_update_error", error=str(e), rows=len(rows))
+    # Uma linha ruim (ex.: wa_message_id repetido) não deve derrubar o lote inteiro
+    for row in rows:
+        try:
+            with SessionLocal() as db:
+                db.execute(update(models.Message), [row])
+                db.commit()
+        except Exception as e:  # noqa: BLE001
+            log.error("outbound_engine_update_error", message_id=row.get("id"), error=str(e))
+
+
+class OutboundEngine:
+    HEARTBEAT_TTL_S = 15
+    ORPHAN_SCAN_EVERY_S = 30.0
+
+    def __init__(
+        self,
+        r: aioredis.Redis,
+        sender: AsyncWhatsAppSender,
+        name: str,
+        queue: str | None = None,
+        concurrency: int | None = None,
+        flush_interval_s: float = 0.2,
+        limiter: AsyncRateLimiter | None = None,
+    ) -> None:
+        self.r = r
+        self.sender = sender
+        self.name = name
+        self.queue = queue or settings.WA_OUTBOUND_QUEUE_KEY
+        self.processing = f"{self.queue}:processing:{name}"
+        self.concurrency = concurrency or settings.WA_OUTBOUND_CONCURRENCY
+        self.flush_interval_s = flush_interval_s
+        self._pop = r.register_script(_POP_BATCH_LUA)
+        self.limiter = limiter or AsyncRateLimiter(r)
+        self._done: list[tuple[str, dict[str, Any]]] = []
+        # Jobs esperando token do rate limit: heap de (instante do loop, seq, (raw, job, tenant_id))
+        self._delayed: list[tuple[float, int, tuple[str, dict[str, Any], int]]] = []
+        self._seq = itertools.count()
+        self.sent = 0
+        self.failed = 0
+        self._started = False
+
+    def _heartbeat_key(self, name: str) -> str:
+        return f"{self.queue}:engine:{name}"
+
+    async def heartbeat(self) -> None:
+        await self.r.set(self._heartbeat_key(self.name), "1", ex=self.HEARTBEAT_TTL_S)
+
+    async def requeue_orphans(self) -> int:
+        """Devolve à fila jobs em processamento de engines sem heartbeat (caíram) ou do próprio nome."""
+        moved = 0
+        prefix = f"{self.queue}:processing:"
+        async for key in self.r.scan_iter(match=f"{prefix}*"):
+            owner = key[len(prefix):]
+            if owner != self.name and await self.r.exists(self._heartbeat_key(owner)):
+                continue
+            if owner == self.name and self._started:
+                continue
+            while await self.r.lmove(key, self.queue, "RIGHT", "LEFT"):
+                moved += 1
+        if moved:
+            log.warning("outbound_engine_requeued", count=moved)
+        return moved
+
+    async def _next_batch(self, n: int, block: bool = True) -> list[str]:
+        items = await self._pop(keys=[self.queue, self.processing], args=[n])
+        if items:
+            return list(items)
+        if not block:
+            return []
+        # Fila vazia: bloqueia até 1s por um item em vez de girar em falso
+        raw = await self.r.blmove(self.queue, self.processing, 1, "LEFT", "RIGHT")
+        return [raw] if raw else []
+
+    def _due(self, n: int) -> list[tuple[str, dict[str, Any], int]]:
+        """Até n jobs da fila de espera cujo token já deve ter sido reposto."""
+        now = asyncio.get_running_loop().time()
+        out = []
+        while self._delayed and len(out) < n and self._delayed[0][0] <= now:
+            out.append(heapq.heappop(self._delayed)[2])
+        return out
+
+    async def _prepare(self, raws: list[str]) -> list[tuple[str, dict[str, Any], int]]:
+        """Aplica as guardas ao lote numa única ida à thread; devolve os jobs liberados."""
+        jobs = [json.loads(raw) for raw in raws]
+        try:
+            checks = await asyncio.to_thread(_pre_send, jobs)
+        except Exception as e:  # noqa: BLE001
+            log.error("outbound_engine_pre_send_error", error=str(e), jobs=len(jobs))
+            checks = [(None, _error_info(e)["code"])] * len(jobs)
+        ready = []
+        for raw, job, (tenant_id, reason) in zip(raws, jobs, checks):
+            if reason:
+                self.failed += 1
+                log.info("outbound_engine_blocked", message_id=job.get("message_id"), tenant_id=tenant_id, reason=reason)
+                self._done.append((raw, {"id": job.get("message_id"), "status": "error", "error": {"code": reason}}))
+            else:
+                ready.append((raw, job, int(tenant_id)))  # type: ignore[arg-type]
+        return ready
+
+    async def _send(self, item: tuple[str, dict[str, Any], int]) -> None:
+        raw, job, tenant_id = item
+        result: dict[str, Any] = {"id": job.get("message_id")}
+        try:
+            wait = await self.limiter.acquire(tenant_id, job["payload"]["to"])
+            if wait > 0:
+                # Sem token: libera a vaga; o loop principal redispara o job quando vencer
+                due = asyncio.get_running_loop().time() + wait
+                heapq.heappush(self._delayed, (due, next(self._seq), item))
+                return
+            data = await self.sender.send(job["payload"])
+            provider_id = None
+            try:
+                provider_id = data.get("messages", [{}])[0].get("id")
+            except Exception:  # noqa: BLE001
+                provider_id = None
+            result.update(status="sent", wa_message_id=provider_id)
+            self.sent += 1
+        except PermanentSendError as e:
+            result.update(status="error", error=_error_info(e))
+            self.failed += 1
+            log.error(
+                "outbound_engine_rejected",
+                status_code=e.status_code,
+                provider_code=result["error"].get("provider_code"),
+                body=e.body,
+            )
+        except Exception as e:  # noqa: BLE001
+            result.update(status="error", error=_error_info(e))
+            self.failed += 1
+            log.error("outbound_engine_send_error", error=str(e), error_code=result["error"]["code"])
+        self._done.append((raw, result))
+
+    async def _requeue_delayed(self) -> None:
+        """No stop, devolve à fila os jobs que ainda esperavam token."""
+        if not self._delayed:
+            return
+        pipe = self.r.pipeline(transaction=True)
+        for _, _, (raw, _, _) in self._delayed:
+            pipe.lrem(self.processing, 1, raw)
+            pipe.lpush(self.queue, raw)
+        await pipe.execute()
+        log.info("outbound_engine_delayed_requeued", count=len(self._delayed))
+        self._delayed = []
+
+    async def flush(self) -> None:
+        if not self._done:
+            return
+        done, self._done = self._done, []
+        await asyncio.to_thread(_apply_results, [res for _, res in done])
+        pipe = self.r.pipeline(transaction=False)
+        for raw, _ in done:
+            pipe.lrem(self.processing, 1, raw)
+        await pipe.execute()
+
+    async def _flush_loop(self, stop: asyncio.Event) -> None:
+        loop = asyncio.get_running_loop()
+        next_scan = loop.time() + self.ORPHAN_SCAN_EVERY_S
+        while not stop.is_set():
+            await asyncio.sleep(self.flush_interval_s)
+            try:
+                await self.flush()
+                await self.heartbeat()
+                if loop.time() >= next_scan:
+                    next_scan = loop.time() + self.ORPHAN_SCAN_EVERY_S
+                    await self.requeue_orphans()
+            except Exception as e:  # noqa: BLE001
+                log.error("outbound_engine_flush_error", error=str(e))
+
+    async def run(self, stop: asyncio.Event) -> None:
+        await self.heartbeat()
+        await self.requeue_orphans()
+        self._started = True
+        flusher = asyncio.create_task(self._flush_loop(stop))
+        inflight: set[asyncio.Task] = set()
+        log.info("outbound_engine_started", name=self.name, concurrency=self.concurrency)
+        while not stop.is_set():
+            free = self.concurrency - len(inflight)
+            if free <= 0:
+                await asyncio.wait(inflight, return_when=asyncio.FIRST_COMPLETED)
+                continue
+            items = self._due(free)
+            if len(items) < free:
+                try:
+                    # Com jobs esperando token, não bloqueia no BLMOVE para não atrasá-los
+                    raws = await self._next_batch(free - len(items), block=not (items or self._delayed))
+                except Exception as e:  # noqa: BLE001
+                    log.error("outbound_engine_queue_error", error=str(e))
+                    raws = []
+                    if not items:
+                        await asyncio.sleep(1.0)
+                if raws:
+                    items += await self._prepare(raws)
+            for item in items:
+                task = asyncio.create_task(self._send(item))
+                inflight.add(task)
+                task.add_done_callback(inflight.discard)
+            if not items and self._delayed:
+                wait = self._delayed[0][0] - asyncio.get_running_loop().time()
+                await asyncio.sleep(min(max(wait, 0.0), 0.1))
+        if inflight:
+            await asyncio.gather(*inflight, return_exceptions=True)
+        flusher.cancel()
+        await self.flush()
+        await self._requeue_delayed()
+        log.info("outbound_engine_stopped", name=self.name, sent=self.sent, failed=self.failed)
+
+
+async def _main(name: str) -> None:
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    r = aioredis.from_url(settings.REDIS_URL, decode_responses=True)
+    sender = AsyncWhatsAppSender()
+    try:
+        await OutboundEngine(r, sender, name=name).run(stop)
+    finally:
+        await sender.aclose()
+        await r.aclose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Engine assíncrono de envio WhatsApp")
+    parser.add_argument("--name", default=f"{socket.gethostname()}-{os.getpid()}")
+    args = parser.parse_args()
+    configure_logging()
+    if settings.METRICS_WORKER_PORT:
+        start_metrics_server(settings.METRICS_WORKER_PORT)
+    asyncio.run(_main(args.name))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+"""Recalcula os rollups de métricas (metric_rollups) a partir do histórico.
+
+Uso:
+    python -m app.workers.rollup_backfill [--tenant default] [--since 2025-01-01] [--until 2026-01-01]
+
+Sem --until, vai até o início de hoje (UTC): o dia corrente continua só com os
+incrementos ao vivo dos workers. Pode ser reexecutado (substitui os buckets do período).
+"""
+from __future__ import annotations
+import argparse
+from datetime import datetime
+
+from app.core.logging import configure_logging
+from app.repositories.db import SessionLocal
+from app.repositories.rollups import backfill
+from app.repositories.tenants import get_tenant
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Backfill dos rollups de métricas")
+    parser.add_argument("--tenant", default=None, help="nome do tenant (padrão: todos)")
+    parser.add_argument("--since", type=datetime.fromisoformat, default=None)
+    parser.add_argument("--until", type=datetime.fromisoformat, default=None)
+    args = parser.parse_args()
+    configure_logging()
+    tenant_id = get_tenant(args.tenant).id if args.tenant else None
+    with SessionLocal() as db:
+        rows = backfill(db, tenant_id=tenant_id, since=args.since, until=args.until)
+    print(f"{rows} linhas gravadas")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,13 @@
+from __future__ import annotations
+from app.core.config import settings
+from app.repositories.imports import run_job
+from .celery_app import celery
+
+
+@celery.task(name="imports.run", bind=True, max_retries=settings.IMPORT_MAX_RETRIES)
+def run_import(self, job_id: int) -> dict:  # type: ignore[no-untyped-def]
+    """Processa um ImportJob (ver repositories.imports); em falha, retoma do último checkpoint."""
+    try:
+        return run_job(job_id)
+    except Exception as e:  # noqa: BLE001
+        raise self.retry(exc=e, countdown=settings.IMPORT_RETRY_DELAY_S)
@@ -1,115 +1,257 @@
 from __future__ import annotations
-from datetime import timedelta
+from collections import defaultdict
 import json
+from typing import Any
+
 import structlog
-import redis
 from app.core.config import settings
+from app.core.redis_client import get_redis
 from .celery_app import celery
-from app.repositories.db import SessionLocal
-from app.repositories import models
+from app.repositories.tenants import get_tenant
+from app.messaging.inbound import InboundText, persist_inbound_batch
 
 log = structlog.get_logger()
 
-# Aggregation settings (can be made per-tenant later)
-AGG_WINDOW_SECONDS = 2
+# Janela de agregação: settings.INBOUND_AGG_WINDOW_S ou, por tenant, settings_json["inbound_agg_window_s"]
 MAX_COMPOSE_LEN = 1200
+# Buffers órfãos (poller parado) expiram sozinhos após a janela + esta folga
+_ORPHAN_TTL_MS = 10 * 60 * 1000
+
+# Funções de texto comuns aos scripts: corte em bytes sem partir UTF-8 e junção de fragmentos.
+_TEXT_LUA = """
+local function cut(s, n)
+  if #s <= n then return s end
+  local i = n
+  while i > 0 do
+    local b = string.byte(s, i + 1)
+    if b == nil or b < 128 or b >= 192 then break end
+    i = i - 1
+  end
+  return string.sub(s, 1, i)
+end
+
+local function join(prev, s)
+  if prev == '' then return s end
+  local last = string.sub(prev, -1)
+  local sep = ' '
+  if last == ' ' or last == '\\n' then sep = '' end
+  return prev .. sep .. s
+end
+"""
+
+# Anexa o fragmento ao buffer do contato e empurra o prazo de flush no sorted set.
+# KEYS[1]=buffer (hash), KEYS[2]=sorted set de prazos
+# ARGV[1]=texto, ARGV[2]=raw (json), ARGV[3]=tenant, ARGV[4]=wa_id, ARGV[5]=janela (ms),
+# ARGV[6]=limite em bytes, ARGV[7]=folga do TTL (ms)
+# Retorna o tamanho (bytes) do texto composto.
+_APPEND_LUA = _TEXT_LUA + """
+local out = join(redis.call('HGET', KEYS[1], 'text') or '', ARGV[1])
+out = string.gsub(out, '^%s+', '')
+out = string.gsub(out, '%s+$', '')
+out = cut(out, tonumber(ARGV[6]))
+
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local window = tonumber(ARGV[5])
+redis.call('HSET', KEYS[1], 'text', out, 'raw', ARGV[2], 'tenant', ARGV[3], 'wa_id', ARGV[4])
+redis.call('PEXPIRE', KEYS[1], window + tonumber(ARGV[7]))
+redis.call('ZADD', KEYS[2], now + window, KEYS[1])
+return #out
+"""
+
+# Retira até ARGV[1] buffers, atomicamente (dois pollers nunca recebem o mesmo buffer):
+# primeiro entradas em processamento há mais de ARGV[2] ms (poller caiu antes do commit),
+# depois buffers vencidos (prazo <= agora). Cada buffer vencido é renomeado para uma chave
+# de processamento `<KEYS[2]>:<n>` (sem TTL) registrada em KEYS[2] com o instante da
+# retirada; só sai de lá pelo ack após o commit (ou pelo restore, se o flush falhar).
+# KEYS[1]=sorted set de prazos, KEYS[2]=sorted set em processamento
+# Retorna [chave de processamento, text, raw, tenant, wa_id, ...].
+# (Acessa chaves fora de KEYS; ok para Redis single-node, que é o deployment atual.)
+_CLAIM_DUE_LUA = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local limit = tonumber(ARGV[1])
+local out = {}
+
+local function take(pkey)
+  local v = redis.call('HMGET', pkey, 'text', 'raw', 'tenant', 'wa_id')
+  if v[1] and v[3] and v[4] then
+    redis.call('ZADD', KEYS[2], now, pkey)
+    table.insert(out, pkey)
+    table.insert(out, v[1])
+    table.insert(out, v[2] or '')
+    table.insert(out, v[3])
+    table.insert(out, v[4])
+  else
+    redis.call('DEL', pkey)
+    redis.call('ZREM', KEYS[2], pkey)
+  end
+end
 
+local stale = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', now - tonumber(ARGV[2]), 'LIMIT', 0, limit)
+for _, pkey in ipairs(stale) do take(pkey) end
+local left = limit - #stale
+if left > 0 then
+  local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', now, 'LIMIT', 0, left)
+  for _, key in ipairs(due) do
+    redis.call('ZREM', KEYS[1], key)
+    if redis.call('EXISTS', key) == 1 then
+      local pkey = KEYS[2] .. ':' .. redis.call('INCR', KEYS[2] .. ':seq')
+      redis.call('RENAME', key, pkey)
+      redis.call('PERSIST', pkey)
+      take(pkey)
+    end
+  end
+end
+return out
+"""
 
-def _redis() -> redis.Redis:
-    return redis.from_url(settings.REDIS_URL, decode_responses=True)
+# Devolve ao buffer do contato uma entrada em processamento cujo flush falhou. Se já chegou
+# fragmento novo, o texto retirado vem antes dele (mesma junção do append) e fica o raw novo.
+# KEYS[1]=chave em processamento, KEYS[2]=buffer do contato, KEYS[3]=prazos, KEYS[4]=em processamento
+# ARGV[1]=atraso da nova tentativa (ms), ARGV[2]=limite em bytes, ARGV[3]=TTL do buffer (ms)
+# Retorna 1 se devolveu, 0 se a entrada não existia mais.
+_RESTORE_LUA = _TEXT_LUA + """
+local v = redis.call('HMGET', KEYS[1], 'text', 'raw', 'tenant', 'wa_id')
+redis.call('ZREM', KEYS[4], KEYS[1])
+if not v[1] then return 0 end
+local text = v[1]
+local raw = v[2] or ''
+local cur = redis.call('HMGET', KEYS[2], 'text', 'raw')
+if cur[1] and cur[1] ~= '' then
+  text = join(text, cur[1])
+  raw = cur[2] or raw
+end
+text = cut(text, tonumber(ARGV[2]))
+redis.call('HSET', KEYS[2], 'text', text, 'raw', raw, 'tenant', v[3], 'wa_id', v[4])
+redis.call('PEXPIRE', KEYS[2], tonumber(ARGV[3]))
+local t = redis.call('TIME')
+local due = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000) + tonumber(ARGV[1])
+local prev = tonumber(redis.call('ZSCORE', KEYS[3], KEYS[2]))
+if prev and prev > due then due = prev end
+redis.call('ZADD', KEYS[3], due, KEYS[2])
+redis.call('DEL', KEYS[1])
+return 1
+"""
+
+
+# Scripts registrados uma vez por processo (o SHA1 sai daqui); cada chamada passa o cliente
+_scripts: dict[str, Any] = {}
+
+
+def _script(r, source: str):  # type: ignore[no-untyped-def]
+    script = _scripts.get(source)
+    if script is None:
+        script = _scripts[source] = r.register_script(source)
+    return script
 
 
 def _agg_key(tenant_id: str, wa_id: str) -> str:
     return f"agg:{tenant_id}:{wa_id}"
 
 
-def _compose(prev: str, new: str) -> str:
-    if not prev:
-        return new
-    # Add space if needed
-    sep = "" if prev.endswith((" ", "\n")) else " "
-    out = (prev + sep + new).strip()
-    if len(out) > MAX_COMPOSE_LEN:
-        return out[:MAX_COMPOSE_LEN]
-    return out
+def _window_ms(tenant_name: str) -> int:
+    """Janela de agregação do tenant (settings_json["inbound_agg_window_s"]), limitada a 0,2s–60s."""
+    default = settings.INBOUND_AGG_WINDOW_S
+    try:
+        value = float(get_tenant(tenant_name).setting("inbound_agg_window_s", default))
+    except Exception:  # noqa: BLE001
+        value = default
+    return int(min(60.0, max(0.2, value)) * 1000)
 
 
 @celery.task(name="inbound.buffer")
-def buffer_incoming_message(tenant_id: str, wa_id: str, text: str, raw_event: dict) -> None:
-    r = _redis()
+def buffer_incoming_message(tenant_id: str, wa_id: str, text: str, raw_event: dict | None = None) -> None:
+    """Anexa o fragmento ao buffer do contato; o flush acontece uma vez por rajada (poller)."""
+    r = get_redis()
     key = _agg_key(tenant_id, wa_id)
-    pipe = r.pipeline()
-    # Compose buffered text
-    existing = r.hget(key, "text") or ""
-    composed = _compose(existing, text)
-    pipe.hset(key, mapping={"text": composed, "raw": json.dumps(raw_event)})
-    # Set/refresh TTL as aggregation window
-    pipe.expire(key, AGG_WINDOW_SECONDS)
-    pipe.execute()
-    log.info("inbound_buffered", key=key, len=len(composed))
-    # Schedule flush after window using countdown; idempotent by key
-    flush_incoming_message.apply_async((tenant_id, wa_id), countdown=AGG_WINDOW_SECONDS)
+    size = _script(r, _APPEND_LUA)(
+        keys=[key, settings.INBOUND_AGG_DUE_KEY],
+        args=[text, json.dumps(raw_event or {}), tenant_id, wa_id, _window_ms(tenant_id), MAX_COMPOSE_LEN * 4, _ORPHAN_TTL_MS],
+        client=r,
+    )
+    log.info("inbound_buffered", key=key, len=size)
 
 
-@celery.task(name="inbound.flush")
-def flush_incoming_message(tenant_id: str, wa_id: str) -> None:
-    r = _redis()
-    key = _agg_key(tenant_id, wa_id)
-    # If key still exists, window expired and we can flush
-    if not r.exists(key):
-        return
-    data = r.hgetall(key)
-    text = data.get("text") or ""
-    raw = data.get("raw")
-    # Delete first to avoid duplicate flushes
-    r.delete(key)
-    log.info("inbound_flushed", key=key, text_len=len(text))
-    # Normalize: resolve/create Contact & Conversation and register Message
-    with SessionLocal() as db:
-        # Tenant (for now default logical tenant; in future map from token/page)
-        tenant = db.query(models.Tenant).filter(models.Tenant.name == tenant_id).first()
-        if tenant is None:
-            tenant = models.Tenant(name=tenant_id)
-            db.add(tenant)
-            db.flush()
-
-        contact = (
-            db.query(models.Contact)
-            .filter(models.Contact.tenant_id == tenant.id, models.Contact.wa_id == wa_id)
-            .first()
+def _persist_buffers(buffers: list[tuple[str, str, str, str]]) -> int:
+    """Grava uma mensagem inbound por buffer; uma transação por tenant (`persist_inbound_batch`)."""
+    by_tenant: dict[str, list[InboundText]] = defaultdict(list)
+    for text, raw, tenant_name, wa_id in buffers:
+        by_tenant[tenant_name].append(
+            InboundText(wa_id=wa_id, msg_id="", text=text[:MAX_COMPOSE_LEN], raw=json.loads(raw) if raw else {})
         )
-        if contact is None:
-            contact = models.Contact(tenant_id=tenant.id, wa_id=wa_id)
-            db.add(contact)
-            db.flush()
-
-        convo = (
-            db.query(models.Conversation)
-            .filter(
-                models.Conversation.tenant_id == tenant.id,
-                models.Conversation.contact_id == contact.id,
-                models.Conversation.status != models.ConversationStatus.closed,
-            )
-            .order_by(models.Conversation.id.desc())
-            .first()
-        )
-        if convo is None:
-            convo = models.Conversation(
-                tenant_id=tenant.id,
-                contact_id=contact.id,
+    return sum(len(persist_inbound_batch(tenant_name, items)) for tenant_name, items in by_tenant.items())
+
+
+def _ack(r, pkeys: list[str]) -> None:  # type: ignore[no-untyped-def]
+    """Apaga as entradas em processamento já gravadas no banco."""
+    try:
+        pipe = r.pipeline()
+        pipe.delete(*pkeys)
+        pipe.zrem(settings.INBOUND_AGG_PROCESSING_KEY, *pkeys)
+        pipe.execute()
+    except Exception as e:  # noqa: BLE001
+        # Ficam em processamento e são regravadas após INBOUND_AGG_STALE_S (duplicadas)
+        log.error("inbound_flush_ack_error", error=str(e), buffers=len(pkeys))
+
+
+def _restore(r, claimed: list[tuple[str, tuple[str, str, str, str]]]) -> None:  # type: ignore[no-untyped-def]
+    """Devolve ao scheduler buffers retirados cujo flush falhou (tenta de novo em ~5s)."""
+    restore = _script(r, _RESTORE_LUA)
+    for pkey, (_, _, tenant_name, wa_id) in claimed:
+        try:
+            restore(
+                keys=[pkey, _agg_key(tenant_name, wa_id), settings.INBOUND_AGG_DUE_KEY, settings.INBOUND_AGG_PROCESSING_KEY],
+                args=[5000, MAX_COMPOSE_LEN * 4, _ORPHAN_TTL_MS],
+                client=r,
             )
-            db.add(convo)
-            db.flush()
-
-        msg = models.Message(
-            tenant_id=tenant.id,
-            conversation_id=convo.id,
-            direction=models.MessageDirection.inbound,
-            type="text",
-            payload={"text": text, "raw": json.loads(raw) if raw else {}},
-            status="received",
+        except Exception as e:  # noqa: BLE001
+            # A entrada segue em processamento; o poller a redespacha quando ficar velha
+            log.error("inbound_flush_restore_error", key=pkey, error=str(e))
+
+
+@celery.task(name="inbound.flush_due")
+def flush_due_buffers(max_batches: int = 50) -> int:
+    """Poller (Celery beat): drena em lotes os buffers cuja janela já fechou.
+
+    Cada lote é gravado por tenant e confirmado (ack) logo após o commit daquele tenant;
+    se o processo cair antes do ack, a entrada é redespachada após INBOUND_AGG_STALE_S
+    (entrega ao menos uma vez).
+    """
+    r = get_redis()
+    claim = _script(r, _CLAIM_DUE_LUA)
+    batch_size = settings.INBOUND_AGG_FLUSH_BATCH
+    stale_ms = int(settings.INBOUND_AGG_STALE_S * 1000)
+    flushed = 0
+    for _ in range(max_batches):
+        flat = claim(
+            keys=[settings.INBOUND_AGG_DUE_KEY, settings.INBOUND_AGG_PROCESSING_KEY],
+            args=[batch_size, stale_ms],
+            client=r,
         )
-        db.add(msg)
-        db.commit()
-    # If conversation is human_handoff, we stop here; otherwise, state machine would be called next.
-    return
+        if not flat:
+            break
+        by_tenant: dict[str, list[tuple[str, tuple[str, str, str, str]]]] = defaultdict(list)
+        for i in range(0, len(flat), 5):
+            pkey, text, raw, tenant_name, wa_id = flat[i:i + 5]
+            by_tenant[tenant_name].append((pkey, (text, raw, tenant_name, wa_id)))
+        groups = list(by_tenant.values())
+        for n, group in enumerate(groups):
+            try:
+                flushed += _persist_buffers([buf for _, buf in group])
+            except Exception as e:  # noqa: BLE001
+                log.error("inbound_flush_error", error=str(e), buffers=len(group))
+                _restore(r, [item for g in groups[n:] for item in g])
+                raise
+            _ack(r, [pkey for pkey, _ in group])
+        if len(flat) // 5 < batch_size:
+            break
+    if flushed:
+        log.info("inbound_flushed", buffers=flushed)
+    return flushed
+
+
+@celery.task(name="inbound.flush")
+def flush_incoming_message(tenant_id: str, wa_id: str) -> None:
+    """Compat: tasks agendadas com countdown antes do scheduler; apenas drena o que venceu."""
+    flush_due_buffers()
@@ -0,0 +1,20 @@
+from __future__ import annotations
+from app.core.config import settings
+from app.repositories.archive import archive_expired
+from app.repositories.db import SessionLocal, engine
+from app.repositories.partitions import run_maintenance
+from .celery_app import celery
+
+
+@celery.task(name="maintenance.partitions")
+def partition_maintenance() -> dict:
+    """Pré-cria partições mensais e aplica a retenção (ver repositories.partitions)."""
+    return run_maintenance(engine)
+
+
+@celery.task(name="maintenance.archive")
+def archive_task() -> dict:
+    """Move partições desanexadas e linhas expiradas para o arquivo frio (ver repositories.archive)."""
+    if not settings.ARCHIVE_URL:
+        return {}
+    return archive_expired(engine, SessionLocal)
@@ -4,6 +4,8 @@ from app.workers.celery_app import celery
 import structlog
 from app.repositories.db import SessionLocal
 from app.repositories import models
+from app.repositories.tenants import get_tenant_by_id
+from sqlalchemy import select
 from app.workers.tasks_outbound import send_text as task_send_text
 from app.workers.tasks_outbound import send_template as task_send_template
 from datetime import datetime, timedelta
@@ -22,8 +24,8 @@ def set_status_task(self: Task, order_id: int, target_status: str):
             log.error("order_not_found", order_id=order_id)
             return {"ok": False, "error": "order_not_found"}
 
-        tenant = db.get(models.Tenant, order.tenant_id)
-        allow_direct_paid = bool((tenant.settings_json or {}).get("allow_direct_paid")) if tenant else False
+        tenant = get_tenant_by_id(order.tenant_id)
+        allow_direct_paid = bool(tenant.setting("allow_direct_paid")) if tenant else False
         current = order.status
         target = models.OrderStatus(target_status)
 
@@ -59,9 +61,8 @@ def set_status_task(self: Task, order_id: int, target_status: str):
         # Notificação via template (fallback para texto)
         try:
             customer = db.get(models.Customer, order.customer_id)
-            tenant = db.get(models.Tenant, order.tenant_id)
             if customer and customer.wa_id:
-                cfg = (tenant.settings_json if tenant else {}) or {}
+                cfg = tenant.settings if tenant else {}
                 lang = cfg.get("template_lang", "pt_BR")
                 map_tpl = {
                     models.OrderStatus.paid: cfg.get("template_paid"),
@@ -109,9 +110,11 @@ def check_sla_alerts(self: Task):
     now = datetime.utcnow()
     alerted = []
     with SessionLocal() as db:
-        tenants = db.query(models.Tenant).all()
-        for t in tenants:
-            cfg = (t.settings_json or {})
+        for tenant_id in db.scalars(select(models.Tenant.id)).all():
+            t = get_tenant_by_id(tenant_id)
+            if t is None:
+                continue
+            cfg = t.settings
             if not cfg.get("alerts_enabled"):
                 continue
             channel = (cfg.get("alerts_channel") or "log").lower()
@@ -3,11 +3,16 @@ import random
 import time
 import structlog
 from celery import Task
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
 from app.core.config import settings
 from app.domain.messaging.wa_client import get_wa_client
+from app.messaging.async_sender import enqueue_outbound, template_payload, text_payload
 from app.domain.policies import within_business_hours
 from app.repositories.db import SessionLocal
-from app.repositories import models
+from app.repositories import models, rollups
+from app.repositories.conversations import resolve_conversation
+from app.repositories.tenants import get_tenant
 from .celery_app import celery
 
 log = structlog.get_logger()
@@ -27,73 +32,94 @@ def _backoff(retry_count: int) -> float:
     return min(30.0, base + jitter)
 
 
+def _mark_sent(message_id: int, resp: dict) -> None:
+    """Marca a mensagem enviada pelo id e grava o wamid (necessário para casar os status do webhook)."""
+    provider_id = None
+    try:
+        provider_id = resp.get("messages", [{}])[0].get("id")
+    except Exception:  # noqa: BLE001
+        provider_id = None
+    with SessionLocal() as db:
+        msg = db.get(models.Message, message_id)
+        if msg is not None and msg.status == "queued":
+            msg.status = "sent"
+            msg.wa_message_id = provider_id
+            msg.payload = {**(msg.payload or {}), "wa_response": resp}
+            db.commit()
+
+
+def _find_by_idempotency_key(db: Session, tenant_id: int, key: str) -> models.Message | None:
+    return (
+        db.query(models.Message)
+        .filter(models.Message.tenant_id == tenant_id, models.Message.idempotency_key == key)
+        .first()
+    )
+
+
+def _insert_queued(db: Session, msg: models.Message) -> bool:
+    """Grava a mensagem (queued). False se a idempotency_key já foi gravada por outra entrega
+    concorrente da task (a consulta prévia não é atômica; quem decide é o índice único)."""
+    db.add(msg)
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        return False
+    return True
+
+
+def _retry_kwargs(task: Task, message_id: int) -> dict:
+    """kwargs do retry: a mensagem já gravada segue junto, sem nova linha nem nova contagem."""
+    return {**(task.request.kwargs or {}), "message_id": message_id}
+
+
 @celery.task(name="outbound.send_text", bind=True, max_retries=5)
-def send_text(self: Task, tenant_id: str, to_wa_id: str, text: str, idempotency_key: str | None = None) -> dict:
+def send_text(
+    self: Task,
+    tenant_id: str,
+    to_wa_id: str,
+    text: str,
+    idempotency_key: str | None = None,
+    message_id: int | None = None,
+) -> dict:
     # Respect business hours (simple policy for now)
     if not within_business_hours():
         log.info("outbound_skipped_off_hours", tenant_id=tenant_id, to=to_wa_id)
         return {"status": "scheduled"}
 
-    with SessionLocal() as db:
-        # Resolve tenant by name (DEFAULT_TENANT_ID currently mapped to name)
-        tenant = db.query(models.Tenant).filter(models.Tenant.name == tenant_id).first()
-        if tenant is None:
-            tenant = models.Tenant(name=tenant_id)
-            db.add(tenant)
-            db.flush()
-
-        # Idempotency guard
-        if idempotency_key:
-            existing = (
-                db.query(models.Message)
-                .filter(
-                    models.Message.tenant_id == tenant.id,
-                    models.Message.idempotency_key == idempotency_key,
-                )
-                .first()
-            )
-            if existing is not None:
+    # message_id só vem preenchido nos retries (mensagem já gravada e contada)
+    if message_id is None:
+        with SessionLocal() as db:
+            # Idempotency guard antes de criar contato/conversa: entrega repetida não deixa rastro
+            if idempotency_key and _find_by_idempotency_key(db, get_tenant(tenant_id).id, idempotency_key):
                 log.info("outbound_idempotent_skip", tenant_id=tenant_id, key=idempotency_key)
                 return {"status": "duplicate"}
 
-        # Create conversation on demand (outbound-only)
-        contact = (
-            db.query(models.Contact)
-            .filter(models.Contact.tenant_id == tenant.id, models.Contact.wa_id == to_wa_id)
-            .first()
-        )
-        if contact is None:
-            contact = models.Contact(tenant_id=tenant.id, wa_id=to_wa_id)
-            db.add(contact)
-            db.flush()
-
-        convo = (
-            db.query(models.Conversation)
-            .filter(
-                models.Conversation.tenant_id == tenant.id,
-                models.Conversation.contact_id == contact.id,
-                models.Conversation.status != models.ConversationStatus.closed,
+            # Resolve tenant by name (DEFAULT_TENANT_ID currently mapped to name) + contact/conversation on demand
+            ref = resolve_conversation(db, tenant_id, to_wa_id)
+
+            # Record message as queued
+            msg = models.Message(
+                tenant_id=ref.tenant_id,
+                conversation_id=ref.conversation_id,
+                direction=models.MessageDirection.outbound,
+                type="text",
+                payload={"text": text},
+                status="queued",
+                idempotency_key=idempotency_key,
             )
-            .order_by(models.Conversation.id.desc())
-            .first()
-        )
-        if convo is None:
-            convo = models.Conversation(tenant_id=tenant.id, contact_id=contact.id)
-            db.add(convo)
-            db.flush()
-
-        # Record message as queued
-        msg = models.Message(
-            tenant_id=tenant.id,
-            conversation_id=convo.id,
-            direction=models.MessageDirection.outbound,
-            type="text",
-            payload={"text": text},
-            status="queued",
-            idempotency_key=idempotency_key,
-        )
-        db.add(msg)
-        db.commit()
+            if not _insert_queued(db, msg):
+                log.info("outbound_idempotent_skip", tenant_id=tenant_id, key=idempotency_key, race=True)
+                return {"status": "duplicate"}
+            message_id = msg.id
+        rollups.record(ref.tenant_id, rollups.OUTBOUND)
+
+        if settings.WA_OUTBOUND_MODE == "async":
+            # Engine assíncrono faz o envio e grava o status; a task só enfileira
+            enqueue_outbound(
+                {"message_id": message_id, "tenant_id": ref.tenant_id, "payload": text_payload(to_wa_id, text)}
+            )
+            return {"status": "queued", "message_id": message_id}
 
     client = get_wa_client()
     try:
@@ -103,21 +129,10 @@ def send_text(self: Task, tenant_id: str, to_wa_id: str, text: str, idempotency_
         retry_no = self.request.retries
         delay = _backoff(retry_no)
         log.warning("outbound_retry", retries=retry_no + 1, delay=delay)
-        raise self.retry(exc=TransientSendError(str(e)), countdown=delay)
+        raise self.retry(exc=TransientSendError(str(e)), countdown=delay, kwargs=_retry_kwargs(self, message_id))
 
     # Mark as sent
-    with SessionLocal() as db:
-        last = (
-            db.query(models.Message)
-            .filter(models.Message.tenant_id == tenant.id)
-            .order_by(models.Message.id.desc())
-            .first()
-        )
-        if last is not None and last.status == "queued":
-            last.status = "sent"
-            last.payload = {**(last.payload or {}), "wa_response": resp}
-            db.add(last)
-            db.commit()
+    _mark_sent(message_id, resp)
 
     return {"status": "sent", "response": resp}
 
@@ -131,72 +146,49 @@ def send_template(
     language_code: str = "pt_BR",
     components: list[dict] | None = None,
     idempotency_key: str | None = None,
+    message_id: int | None = None,
 ) -> dict:
     # Template messages podem ser enviadas fora do horário, mas mantemos a mesma política por simplicidade
     if not within_business_hours():
         log.info("outbound_template_skipped_off_hours", tenant_id=tenant_id, to=to_wa_id)
         return {"status": "scheduled"}
 
-    with SessionLocal() as db:
-        tenant = db.query(models.Tenant).filter(models.Tenant.name == tenant_id).first()
-        if tenant is None:
-            tenant = models.Tenant(name=tenant_id)
-            db.add(tenant)
-            db.flush()
-
-        if idempotency_key:
-            existing = (
-                db.query(models.Message)
-                .filter(
-                    models.Message.tenant_id == tenant.id,
-                    models.Message.idempotency_key == idempotency_key,
-                )
-                .first()
-            )
-            if existing is not None:
+    if message_id is None:
+        with SessionLocal() as db:
+            if idempotency_key and _find_by_idempotency_key(db, get_tenant(tenant_id).id, idempotency_key):
                 log.info("outbound_template_idempotent_skip", tenant_id=tenant_id, key=idempotency_key)
                 return {"status": "duplicate"}
 
-        contact = (
-            db.query(models.Contact)
-            .filter(models.Contact.tenant_id == tenant.id, models.Contact.wa_id == to_wa_id)
-            .first()
-        )
-        if contact is None:
-            contact = models.Contact(tenant_id=tenant.id, wa_id=to_wa_id)
-            db.add(contact)
-            db.flush()
-
-        convo = (
-            db.query(models.Conversation)
-            .filter(
-                models.Conversation.tenant_id == tenant.id,
-                models.Conversation.contact_id == contact.id,
-                models.Conversation.status != models.ConversationStatus.closed,
+            ref = resolve_conversation(db, tenant_id, to_wa_id)
+
+            msg = models.Message(
+                tenant_id=ref.tenant_id,
+                conversation_id=ref.conversation_id,
+                direction=models.MessageDirection.outbound,
+                type="template",
+                payload={
+                    "template": template_name,
+                    "language_code": language_code,
+                    "components": components or [],
+                },
+                status="queued",
+                idempotency_key=idempotency_key,
             )
-            .order_by(models.Conversation.id.desc())
-            .first()
-        )
-        if convo is None:
-            convo = models.Conversation(tenant_id=tenant.id, contact_id=contact.id)
-            db.add(convo)
-            db.flush()
-
-        msg = models.Message(
-            tenant_id=tenant.id,
-            conversation_id=convo.id,
-            direction=models.MessageDirection.outbound,
-            type="template",
-            payload={
-                "template": template_name,
-                "language_code": language_code,
-                "components": components or [],
-            },
-            status="queued",
-            idempotency_key=idempotency_key,
-        )
-        db.add(msg)
-        db.commit()
+            if not _insert_queued(db, msg):
+                log.info("outbound_template_idempotent_skip", tenant_id=tenant_id, key=idempotency_key, race=True)
+                return {"status": "duplicate"}
+            message_id = msg.id
+        rollups.record(ref.tenant_id, rollups.OUTBOUND)
+
+        if settings.WA_OUTBOUND_MODE == "async":
+            enqueue_outbound(
+                {
+                    "message_id": message_id,
+                    "tenant_id": ref.tenant_id,
+                    "payload": template_payload(to_wa_id, template_name, language_code, components),
+                }
+            )
+            return {"status": "queued", "message_id": message_id}
 
     client = get_wa_client()
     try:
@@ -210,19 +202,8 @@ def send_template(
         retry_no = self.request.retries
         delay = _backoff(retry_no)
         log.warning("outbound_template_retry", retries=retry_no + 1, delay=delay)
-        raise self.retry(exc=TransientSendError(str(e)), countdown=delay)
+        raise self.retry(exc=TransientSendError(str(e)), countdown=delay, kwargs=_retry_kwargs(self, message_id))
 
-    with SessionLocal() as db:
-        last = (
-            db.query(models.Message)
-            .filter(models.Message.tenant_id == tenant.id)
-            .order_by(models.Message.id.desc())
-            .first()
-        )
-        if last is not None and last.status == "queued":
-            last.status = "sent"
-            last.payload = {**(last.payload or {}), "wa_response": resp}
-            db.add(last)
-            db.commit()
+    _mark_sent(message_id, resp)
 
     return {"status": "sent", "response": resp}
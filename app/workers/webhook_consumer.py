@@ -0,0 +1,358 @@
+"""Consumidor do Redis Stream de eventos do webhook (modo WEBHOOK_INGEST_MODE=stream).
+
+O `POST /webhook` apenas valida o HMAC e faz XADD do corpo bruto. Este processo lê os
+eventos em lotes via XREADGROUP, persiste as mensagens do lote numa única transação,
+executa a lógica do bot e só então confirma (XACK). Se um worker cair no meio do lote,
+as entradas ficam pendentes e são reassumidas (XCLAIM) por outro consumidor após
+WEBHOOK_CONSUMER_RECLAIM_IDLE_MS; eventos que excedem WEBHOOK_CONSUMER_MAX_DELIVERIES
+vão para `<stream>:dlq`.
+
+Com WEBHOOK_STREAM_PARTITIONS=N > 1 o webhook grava em N shards (`<stream>:<p>`, por hash
+consistente do wa_id). Cada shard tem um único dono por vez (lease `<shard>:owner`) e é
+consumido em série, o que mantém a ordem das mensagens de cada contato; contatos em shards
+diferentes rodam em paralelo em outros processos/nós. Um consumidor assume até
+`--max-partitions` shards livres; consumidores excedentes ficam de reserva e assumem
+shards cujo lease expirou (dono caiu), reprocessando antes os pendentes dele. Durante um
+lote, uma thread renova o lease a cada terço de WEBHOOK_PARTITION_LEASE_MS; se ele se
+perder, o lote para na próxima mensagem e fica pendente para o novo dono.
+
+Uso: python -m app.workers.webhook_consumer [--name worker-1] [--max-partitions K]
+"""
+from __future__ import annotations
+import argparse
+import os
+import signal
+import socket
+import threading
+import time
+from typing import Callable
+
+import redis
+import structlog
+
+from app.core.config import settings
+from app.core.logging import configure_logging
+from app.core.metrics import WEBHOOK_BATCH_SECONDS, start_metrics_server
+from app.core.redis_client import get_redis
+from app.messaging.inbound import InboundText, decode_payload, iter_text_messages, persist_inbound_batch
+from app.messaging.partitioning import all_stream_keys
+from app.messaging.statuses import get_status_coalescer
+
+log = structlog.get_logger()
+
+Entry = tuple[str, dict]
+
+
+class WebhookStreamConsumer:
+    def __init__(
+        self,
+        r: redis.Redis,
+        name: str,
+        stream: str | None = None,
+        group: str | None = None,
+        batch_size: int | None = None,
+        block_ms: int | None = None,
+        reclaim_idle_ms: int | None = None,
+        max_deliveries: int | None = None,
+    ) -> None:
+        self.r = r
+        self.name = name
+        self.stream = stream or settings.WEBHOOK_STREAM_KEY
+        self.group = group or settings.WEBHOOK_STREAM_GROUP
+        self.batch_size = batch_size or settings.WEBHOOK_CONSUMER_BATCH
+        self.block_ms = block_ms if block_ms is not None else settings.WEBHOOK_CONSUMER_BLOCK_MS
+        self.reclaim_idle_ms = reclaim_idle_ms or settings.WEBHOOK_CONSUMER_RECLAIM_IDLE_MS
+        self.max_deliveries = max_deliveries or settings.WEBHOOK_CONSUMER_MAX_DELIVERIES
+
+    @property
+    def dlq(self) -> str:
+        return f"{self.stream}:dlq"
+
+    def ensure_group(self) -> None:
+        try:
+            self.r.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+        except redis.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    def reclaim(self, idle_ms: int | None = None) -> list[Entry]:
+        """Reassume entradas pendentes de consumidores inativos; manda para a DLQ as reincidentes."""
+        idle = self.reclaim_idle_ms if idle_ms is None else idle_ms
+        pending = self.r.xpending_range(self.stream, self.group, min="-", max="+", count=self.batch_size, idle=idle)
+        if not pending:
+            return []
+        claim_ids: list[str] = []
+        dead_ids: list[str] = []
+        for p in pending:
+            if int(p.get("times_delivered", 0)) >= self.max_deliveries:
+                dead_ids.append(p["message_id"])
+            else:
+                claim_ids.append(p["message_id"])
+        if dead_ids:
+            for msg_id, fields in self.r.xclaim(self.stream, self.group, self.name, idle, dead_ids):
+                if fields:
+                    self.r.xadd(self.dlq, {**fields, "source_id": msg_id})
+            self.r.xack(self.stream, self.group, *dead_ids)
+            log.error("webhook_stream_dead_lettered", count=len(dead_ids))
+        if not claim_ids:
+            return []
+        claimed = self.r.xclaim(self.stream, self.group, self.name, idle, claim_ids)
+        log.warning("webhook_stream_reclaimed", count=len(claimed))
+        return [(msg_id, fields) for msg_id, fields in claimed if fields]
+
+    def read_batch(self) -> list[Entry]:
+        resp = self.r.xreadgroup(
+            self.group, self.name, {self.stream: ">"}, count=self.batch_size, block=self.block_ms
+        )
+        entries: list[Entry] = []
+        for _stream, items in resp or []:
+            entries.extend(items)
+        return entries
+
+    def process(
+        self,
+        entries: list[Entry],
+        before_ack: Callable[[], bool] | None = None,
+        still_owner: Callable[[], bool] | None = None,
+    ) -> int:
+        """Processa um lote e confirma as entradas. Em erro não confirma (serão reassumidas).
+
+        Modo particionado: `still_owner` (barato, sem Redis) é consultado antes de gravar e
+        entre as mensagens do bot; `before_ack` confirma no Redis que o shard ainda é deste
+        consumidor. Sem a posse, o lote para e fica pendente para o novo dono.
+        """
+        if not entries:
+            return 0
+        start = time.perf_counter()
+        # Import tardio: a lógica do bot vive no módulo do webhook
+        from app.api.routes.webhook import handle_text_message
+
+        items: list[InboundText] = []
+        statuses = get_status_coalescer()
+        for msg_id, fields in entries:
+            payload = decode_payload((fields.get("body") or "").encode("utf-8"))
+            if payload is None:
+                log.error("webhook_stream_invalid_json", stream_id=msg_id)
+                continue
+            statuses.add_payload(payload)
+            items.extend(iter_text_messages(payload))
+        # Sem marcar ids no deduplicador antes do commit: se o lote falhar, a reentrega
+        # (reclaim) precisa gravar as mensagens. A dedup é o próprio wa_message_id gravado;
+        # o bot roda só para as mensagens que este lote inseriu.
+        if still_owner is not None and not still_owner():
+            log.warning("webhook_partition_lost_mid_batch", stream=self.stream, events=len(entries), skipped=len(items))
+            return 0
+        new_items = persist_inbound_batch(settings.DEFAULT_TENANT_ID, items)
+        for n, item in enumerate(new_items):
+            if still_owner is not None and not still_owner():
+                # O novo dono não reexecuta o bot para as já gravadas (dedup por wa_message_id)
+                log.warning(
+                    "webhook_partition_lost_mid_batch",
+                    stream=self.stream,
+                    events=len(entries),
+                    skipped=len(new_items) - n,
+                )
+                return 0
+            handle_text_message(item.wa_id, item.text)
+        # Status ainda no buffer seriam perdidos se o processo cair após o XACK
+        statuses.flush()
+        if before_ack is not None and not before_ack():
+            log.warning("webhook_partition_lost_before_ack", stream=self.stream, events=len(entries))
+            return 0
+        self.r.xack(self.stream, self.group, *[msg_id for msg_id, _ in entries])
+        WEBHOOK_BATCH_SECONDS.labels("stream").observe(time.perf_counter() - start)
+        log.info("webhook_stream_batch_done", events=len(entries), messages=len(items), inserted=len(new_items))
+        return len(entries)
+
+    def run(self, stop: threading.Event) -> None:
+        self.ensure_group()
+        log.info("webhook_consumer_started", name=self.name, stream=self.stream, group=self.group)
+        while not stop.is_set():
+            try:
+                entries = self.reclaim() or self.read_batch()
+                self.process(entries)
+            except Exception as e:  # noqa: BLE001
+                log.error("webhook_consumer_error", error=str(e))
+                stop.wait(1.0)
+        log.info("webhook_consumer_stopped", name=self.name)
+
+
+# Renova o lease só se ainda for o dono
+_RENEW_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+_RELEASE_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class PartitionedConsumer:
+    """Consome os shards do stream com no máximo um dono por shard (ordem por contato)."""
+
+    def __init__(
+        self,
+        r: redis.Redis,
+        name: str,
+        streams: list[str] | None = None,
+        max_partitions: int | None = None,
+        lease_ms: int | None = None,
+        **consumer_kwargs,
+    ) -> None:
+        self.r = r
+        self.name = name
+        self.consumers = {
+            s: WebhookStreamConsumer(r, name, stream=s, **consumer_kwargs) for s in (streams or all_stream_keys())
+        }
+        self.max_partitions = max_partitions or len(self.consumers)
+        self.lease_ms = lease_ms or settings.WEBHOOK_PARTITION_LEASE_MS
+        self.owned: list[str] = []
+        self.fresh: set[str] = set()
+        self._renew = r.register_script(_RENEW_LUA)
+        self._release = r.register_script(_RELEASE_LUA)
+
+    @staticmethod
+    def lease_key(stream: str) -> str:
+        return f"{stream}:owner"
+
+    def renew(self, stream: str) -> bool:
+        """Estende o lease do shard; False se outro consumidor já é o dono."""
+        if self._renew(keys=[self.lease_key(stream)], args=[self.name, self.lease_ms]):
+            return True
+        self.fresh.discard(stream)
+        if stream in self.owned:
+            self.owned.remove(stream)
+            log.warning("webhook_partition_lost", stream=stream)
+        return False
+
+    def refresh_leases(self) -> list[str]:
+        """Renova os leases atuais e assume shards livres até `max_partitions`.
+
+        Shards recém-assumidos ficam em `self.fresh` até o primeiro reclaim.
+        """
+        for stream in list(self.owned):
+            self.renew(stream)
+        owned = list(self.owned)
+        for stream in self.consumers:
+            if len(owned) >= self.max_partitions:
+                break
+            if stream in owned:
+                continue
+            if self.r.set(self.lease_key(stream), self.name, nx=True, px=self.lease_ms):
+                owned.append(stream)
+                self.fresh.add(stream)
+                log.info("webhook_partition_acquired", stream=stream)
+        self.owned = owned
+        return owned
+
+    def release_all(self) -> None:
+        for stream in self.owned:
+            self._release(keys=[self.lease_key(stream)], args=[self.name])
+        self.owned = []
+        self.fresh.clear()
+
+    def _process(self, stream: str, entries: list[Entry]) -> int:
+        """Processa um lote do shard com o lease renovado em segundo plano.
+
+        Uma thread renova o lease a cada terço do prazo enquanto o lote roda; se a renovação
+        falhar (outro consumidor assumiu), o lote para na próxima mensagem. A posse é conferida
+        de novo antes do XACK.
+        """
+        if not entries or not self.renew(stream):
+            return 0
+        done = threading.Event()
+        lost = threading.Event()
+
+        def keep_lease() -> None:
+            while not done.wait(self.lease_ms / 3000.0):
+                try:
+                    if not self.renew(stream):
+                        lost.set()
+                        return
+                except Exception as e:  # noqa: BLE001
+                    # Redis instável: tenta de novo no próximo ciclo; o XACK confere a posse
+                    log.warning("webhook_partition_renew_error", stream=stream, error=str(e))
+
+        keeper = threading.Thread(target=keep_lease, name=f"lease-{stream}", daemon=True)
+        keeper.start()
+        try:
+            return self.consumers[stream].process(
+                entries,
+                before_ack=lambda: not lost.is_set() and self.renew(stream),
+                still_owner=lambda: not lost.is_set(),
+            )
+        finally:
+            done.set()
+            keeper.join()
+
+    def step(self) -> int:
+        """Uma rodada: pendentes primeiro (do dono anterior ou de falhas), depois entradas novas."""
+        owned = self.refresh_leases()
+        if not owned:
+            return 0
+        done = 0
+        for stream in list(owned):
+            consumer = self.consumers[stream]
+            if stream in self.fresh:
+                # Recém-assumido: o dono anterior perdeu o lease, então os pendentes dele podem
+                # ser reassumidos na hora. Depois disso só os nossos, após o idle normal.
+                self.fresh.discard(stream)
+                done += self._process(stream, consumer.reclaim(idle_ms=0))
+            else:
+                done += self._process(stream, consumer.reclaim())
+        if not self.owned:
+            return done
+        batch = max(c.batch_size for c in self.consumers.values())
+        block = min(c.block_ms for c in self.consumers.values())
+        group = next(iter(self.consumers.values())).group
+        resp = self.r.xreadgroup(group, self.name, {s: ">" for s in self.owned}, count=batch, block=block)
+        for stream, items in resp or []:
+            # Cada shard é processado em série e na ordem do stream
+            done += self._process(stream, items)
+        return done
+
+    def run(self, stop: threading.Event) -> None:
+        for consumer in self.consumers.values():
+            consumer.ensure_group()
+        log.info("webhook_partitioned_consumer_started", name=self.name, partitions=len(self.consumers))
+        try:
+            while not stop.is_set():
+                try:
+                    if not self.step() and not self.owned:
+                        # Reserva: nenhum shard livre; tenta de novo antes do lease de alguém expirar
+                        stop.wait(min(1.0, self.lease_ms / 3000.0))
+                except Exception as e:  # noqa: BLE001
+                    log.error("webhook_consumer_error", error=str(e))
+                    stop.wait(1.0)
+        finally:
+            self.release_all()
+            log.info("webhook_consumer_stopped", name=self.name)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Consumidor do stream de eventos do webhook")
+    parser.add_argument("--name", default=f"{socket.gethostname()}-{os.getpid()}")
+    parser.add_argument(
+        "--max-partitions", type=int, default=None, help="máximo de shards assumidos por este processo"
+    )
+    args = parser.parse_args()
+
+    configure_logging()
+    if settings.METRICS_WORKER_PORT:
+        start_metrics_server(settings.METRICS_WORKER_PORT)
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    if settings.WEBHOOK_STREAM_PARTITIONS > 1:
+        PartitionedConsumer(get_redis(), name=args.name, max_partitions=args.max_partitions).run(stop)
+    else:
+        WebhookStreamConsumer(get_redis(), name=args.name).run(stop)
+
+
+if __name__ == "__main__":
+    main()
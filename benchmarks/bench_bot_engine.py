@@ -0,0 +1,62 @@
+"""Mensagens por segundo (por core) avaliadas pelo motor de fluxos do bot.
+
+Mede só `CompiledFlow.step` (lookup no dict de palavras-chave + uma busca na regex
+combinada + extratores), sem Redis/banco/ações externas: é o custo de CPU do bot por
+mensagem. Também mede o tempo de compilação de um fluxo.
+
+Uso:
+    python -m benchmarks.bench_bot_engine
+    python -m benchmarks.bench_bot_engine --messages 500000
+"""
+from __future__ import annotations
+import argparse
+import time
+
+from app.domain.bot import BUILTIN_FLOWS, compile_flow
+
+# Conversas típicas, repetidas do início até completar o número de mensagens
+_SCRIPTS = {
+    "realestate": ["oi", "quero alugar", "alugar", "Campinas", "sp", "apto", "2 quartos"],
+    "vehicles": ["oi", "bom dia", "quero ver motos", "tem carros usados ate 60.000?", "SAIR"],
+}
+
+
+def _without_actions(defn: dict) -> dict:
+    """Cópia da definição sem ações (banco/APIs externas): mede só despacho e extratores."""
+    states = {
+        name: {**spec, "transitions": [{k: v for k, v in t.items() if k != "action"} for t in spec.get("transitions", [])]}
+        for name, spec in defn["states"].items()
+    }
+    return {**defn, "states": states}
+
+
+def _bench(name: str, n: int) -> float:
+    flow = compile_flow(_without_actions(dict(BUILTIN_FLOWS[name])))
+    script = _SCRIPTS[name]
+    state, data = None, {}
+    t0 = time.process_time()
+    for i in range(n):
+        if i % len(script) == 0:
+            state, data = None, {}
+        res = flow.step(state, data, script[i % len(script)])
+        state, data = res.state, res.data
+    elapsed = time.process_time() - t0
+    return n / elapsed if elapsed else float("inf")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--messages", type=int, default=200_000)
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    for _ in range(1000):
+        compile_flow(BUILTIN_FLOWS["realestate"])
+    compile_us = (time.perf_counter() - t0) / 1000 * 1e6
+    print(f"compilação (realestate): {compile_us:.0f} µs")
+    for name in ("realestate", "vehicles"):
+        print(f"{name:<11} {_bench(name, args.messages):>12,.0f} msgs/s/core")
+
+
+if __name__ == "__main__":
+    main()
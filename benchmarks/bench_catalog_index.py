@@ -0,0 +1,107 @@
+"""Latência de uma consulta ao catálogo: SQL com ILIKE (caminho antigo) vs índice em memória.
+
+Gera um catálogo sintético num SQLite em memória (ou no banco de --url) e roda as mesmas
+consultas do GET /veiculos pelos dois caminhos. Também mede a reconstrução do snapshot.
+
+Uso:
+    python -m benchmarks.bench_catalog_index
+    python -m benchmarks.bench_catalog_index --vehicles 20000 --url postgresql+psycopg2://...
+"""
+from __future__ import annotations
+import argparse
+import random
+import time
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.repositories import models
+from app.repositories.catalog_index import load_rows, snapshot_from_rows
+
+_BRANDS = {
+    "Fiat": ["Argo", "Mobi", "Cronos", "Toro", "Strada"],
+    "Volkswagen": ["Gol", "Polo", "T-Cross", "Nivus", "Saveiro"],
+    "Chevrolet": ["Onix", "Tracker", "S10", "Spin", "Montana"],
+    "Citroën": ["C3", "C4 Cactus", "Aircross"],
+    "Honda": ["CG 160", "Biz", "City", "HR-V", "Civic"],
+}
+_QUERIES = [
+    {},
+    {"marca": "fiat"},
+    {"categoria": "USADO", "preco_max": 80000},
+    {"marca": "chev", "modelo": "onix", "ano_min": 2018},
+    {"ano_min": 2020, "ano_max": 2022, "preco_min": 50000},
+]
+
+
+def _sql(db: Session, tenant_id: int, q: dict, limit: int) -> list:  # type: ignore[type-arg]
+    """Reprodução da consulta antiga de list_vehicles (mais o filtro de tenant)."""
+    v = models.Vehicle
+    stmt = select(v).where(v.tenant_id == tenant_id, v.active == True)  # noqa: E712
+    if q.get("categoria"):
+        stmt = stmt.where(v.category == q["categoria"].upper())
+    if q.get("marca"):
+        stmt = stmt.where(v.brand.ilike(f"%{q['marca']}%"))
+    if q.get("modelo"):
+        stmt = stmt.where(v.model.ilike(f"%{q['modelo']}%"))
+    if q.get("ano_min") is not None:
+        stmt = stmt.where(v.year >= q["ano_min"])
+    if q.get("ano_max") is not None:
+        stmt = stmt.where(v.year <= q["ano_max"])
+    if q.get("preco_min") is not None:
+        stmt = stmt.where(v.price >= q["preco_min"])
+    if q.get("preco_max") is not None:
+        stmt = stmt.where(v.price <= q["preco_max"])
+    return list(db.execute(stmt.order_by(v.id.desc()).limit(limit + 1)).scalars())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--vehicles", type=int, default=5000)
+    parser.add_argument("-n", type=int, default=200, help="repetições de cada consulta")
+    parser.add_argument("--url", default="sqlite://")
+    args = parser.parse_args()
+
+    engine = create_engine(args.url)
+    models.Base.metadata.drop_all(engine)
+    models.Base.metadata.create_all(engine)
+    make_session = sessionmaker(bind=engine, autoflush=False)
+    rnd = random.Random(42)
+    brands = list(_BRANDS)
+    with make_session() as db:
+        for i in range(args.vehicles):
+            brand = rnd.choice(brands)
+            model = rnd.choice(_BRANDS[brand])
+            db.add(
+                models.Vehicle(
+                    tenant_id=1,
+                    title=f"{brand} {model} {i}",
+                    brand=brand,
+                    model=model,
+                    year=rnd.randint(2010, 2025),
+                    category=rnd.choice(["NOVO", "USADO", "MOTOS"]),
+                    price=float(rnd.randint(15, 250) * 1000),
+                    active=rnd.random() > 0.05,
+                )
+            )
+        db.commit()
+
+        t0 = time.perf_counter()
+        snap = snapshot_from_rows(1, 0, load_rows(db, 1))
+        print(f"snapshot: {len(snap)} veículos em {(time.perf_counter() - t0) * 1000:,.1f} ms")
+
+        for q in _QUERIES:
+            assert [r.id for r in _sql(db, 1, q, 12)] == [r["id"] for r in snap.search(limit=13, **q)]
+            t0 = time.perf_counter()
+            for _ in range(args.n):
+                _sql(db, 1, q, 12)
+            sql_us = (time.perf_counter() - t0) * 1e6 / args.n
+            t0 = time.perf_counter()
+            for _ in range(args.n):
+                snap.search(limit=13, **q)
+            idx_us = (time.perf_counter() - t0) * 1e6 / args.n
+            print(f"{str(q):<58} sql {sql_us:>8,.0f} us   índice {idx_us:>6,.0f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Statements SQL por mensagem inbound: resolução antiga (consulta a consulta) vs repositório.
+
+Conta os statements enviados ao banco (evento before_cursor_execute) para gravar uma
+mensagem inbound, com contato novo e com contato já existente.
+
+Uso:
+    python -m benchmarks.bench_conversation_resolve                # SQLite em memória
+    python -m benchmarks.bench_conversation_resolve --url postgresql+psycopg2://...
+"""
+from __future__ import annotations
+import argparse
+import time
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.repositories import models
+from app.repositories.conversations import resolve_conversation
+
+
+def _legacy(db: Session, tenant_name: str, wa_id: str) -> None:
+    """Reprodução do caminho antigo de tasks_inbound.flush_incoming_message."""
+    tenant = db.query(models.Tenant).filter(models.Tenant.name == tenant_name).first()
+    if tenant is None:
+        tenant = models.Tenant(name=tenant_name)
+        db.add(tenant)
+        db.flush()
+    contact = (
+        db.query(models.Contact)
+        .filter(models.Contact.tenant_id == tenant.id, models.Contact.wa_id == wa_id)
+        .first()
+    )
+    if contact is None:
+        contact = models.Contact(tenant_id=tenant.id, wa_id=wa_id)
+        db.add(contact)
+        db.flush()
+    convo = (
+        db.query(models.Conversation)
+        .filter(
+            models.Conversation.tenant_id == tenant.id,
+            models.Conversation.contact_id == contact.id,
+            models.Conversation.status != models.ConversationStatus.closed,
+        )
+        .order_by(models.Conversation.id.desc())
+        .first()
+    )
+    if convo is None:
+        convo = models.Conversation(tenant_id=tenant.id, contact_id=contact.id)
+        db.add(convo)
+        db.flush()
+    db.add(
+        models.Message(
+            tenant_id=tenant.id,
+            conversation_id=convo.id,
+            direction=models.MessageDirection.inbound,
+            type="text",
+            payload={"text": "oi"},
+        )
+    )
+    db.commit()
+
+
+def _repository(db: Session, tenant_name: str, wa_id: str) -> None:
+    ref = resolve_conversation(db, tenant_name, wa_id)
+    db.add(
+        models.Message(
+            tenant_id=ref.tenant_id,
+            conversation_id=ref.conversation_id,
+            direction=models.MessageDirection.inbound,
+            type="text",
+            payload={"text": "oi"},
+        )
+    )
+    db.commit()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", type=int, default=500)
+    parser.add_argument("--url", default="sqlite://")
+    args = parser.parse_args()
+
+    engine = create_engine(args.url)
+    models.Base.metadata.drop_all(engine)
+    models.Base.metadata.create_all(engine)
+    make_session = sessionmaker(bind=engine, autoflush=False)
+    counter = {"n": 0}
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _count(*_args):  # type: ignore[no-untyped-def]
+        counter["n"] += 1
+
+    for label, fn in (("before (query a query)", _legacy), ("after (repositório)", _repository)):
+        tenant = f"bench-{label[:5]}"
+        for phase in ("contato novo", "contato existente"):
+            counter["n"] = 0
+            t0 = time.perf_counter()
+            for i in range(args.n):
+                with make_session() as db:
+                    fn(db, tenant, f"55119{i:08d}")
+            dt = time.perf_counter() - t0
+            print(
+                f"{label:<24} {phase:<18} {counter['n'] / args.n:>5.1f} statements/msg"
+                f"  ({dt * 1e6 / args.n:,.0f} us/msg)"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""Micro-benchmark do rate limiter: chamadas/s antes (instância por envio) e depois (singleton + Lua).
+
+Uso:
+    python -m benchmarks.bench_rate_limiter            # Redis de settings.REDIS_URL
+    python -m benchmarks.bench_rate_limiter --memory   # apenas o fallback em memória
+"""
+from __future__ import annotations
+import argparse
+import time
+
+import redis
+
+from app.core.config import settings
+from app.messaging.limits import RateLimiter
+
+
+def _legacy_allow(tenant: str, wa_id: str) -> bool:
+    """Reprodução do caminho antigo: cliente novo + ping + SET NX/INCR/EXPIRE a cada envio."""
+    r = redis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
+    r.ping()
+    if not r.set(f"rl:{tenant}:{wa_id}", "1", nx=True, ex=2):
+        return False
+    kg = f"rlg:{tenant}:{int(time.time() // 60)}"
+    cnt = r.incr(kg)
+    if cnt == 1:
+        r.expire(kg, 60)
+    return cnt <= 10**9
+
+
+def _run(label: str, fn, n: int) -> None:  # type: ignore[no-untyped-def]
+    t0 = time.perf_counter()
+    for i in range(n):
+        fn("bench", f"55119{i:08d}")
+    dt = time.perf_counter() - t0
+    print(f"{label:<28} {n / dt:>12,.0f} calls/s  ({dt * 1e6 / n:,.1f} us/call)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", type=int, default=5000)
+    parser.add_argument("--memory", action="store_true", help="mede só o fallback em memória")
+    args = parser.parse_args()
+
+    limiter = RateLimiter(por_contato_interval_s=2, global_per_minute=10**9)
+    if args.memory:
+        limiter._redis_down_until = float("inf")
+        _run("after (memory fallback)", limiter.acquire, args.n)
+        return
+    _run("before (per-call limiter)", _legacy_allow, args.n)
+    _run("after (shared pool + Lua)", limiter.acquire, args.n)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""contatos: last_inbound_at (janela de 24h)
+
+Revision ID: a3c91e7d5b10
+Revises: 7f2d3a1c9b2a
+Create Date: 2026-10-17 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "a3c91e7d5b10"
+down_revision: Union[str, Sequence[str], None] = "7f2d3a1c9b2a"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _has_column(table: str, column: str) -> bool:
+    insp = sa.inspect(op.get_bind())
+    if not insp.has_table(table):
+        # Tabelas core são criadas pelo create_all no startup; nada a migrar ainda
+        return True
+    return any(c["name"] == column for c in insp.get_columns(table))
+
+
+def upgrade() -> None:
+    if not _has_column("contacts", "last_inbound_at"):
+        op.add_column("contacts", sa.Column("last_inbound_at", sa.DateTime(), nullable=True))
+        # Backfill a partir das mensagens inbound já gravadas
+        op.execute(
+            """
+            UPDATE contacts SET last_inbound_at = (
+                SELECT MAX(m.created_at)
+                FROM messages m JOIN conversations cv ON cv.id = m.conversation_id
+                WHERE cv.contact_id = contacts.id AND m.direction = 'inbound'
+            )
+            """
+        )
+
+
+def downgrade() -> None:
+    insp = sa.inspect(op.get_bind())
+    if insp.has_table("contacts") and any(c["name"] == "last_inbound_at" for c in insp.get_columns("contacts")):
+        op.drop_column("contacts", "last_inbound_at")
@@ -0,0 +1,38 @@
+"""sync de catálogo: vehicles.content_hash e contadores/modo em import_jobs
+
+Revision ID: a5d8e0f2b915
+Revises: f4c7d9e1a804
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "a5d8e0f2b915"
+down_revision: Union[str, Sequence[str], None] = "f4c7d9e1a804"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+_COLUMNS = (
+    ("vehicles", sa.Column("content_hash", sa.String(length=32), nullable=True)),
+    ("import_jobs", sa.Column("mode", sa.String(length=8), nullable=False, server_default="upsert")),
+    ("import_jobs", sa.Column("unchanged", sa.Integer(), nullable=False, server_default="0")),
+    ("import_jobs", sa.Column("deactivated", sa.Integer(), nullable=False, server_default="0")),
+)
+
+
+def upgrade() -> None:
+    insp = sa.inspect(op.get_bind())
+    for table, column in _COLUMNS:
+        if insp.has_table(table) and column.name not in {c["name"] for c in insp.get_columns(table)}:
+            op.add_column(table, column)
+
+
+def downgrade() -> None:
+    insp = sa.inspect(op.get_bind())
+    for table, column in reversed(_COLUMNS):
+        if insp.has_table(table) and column.name in {c["name"] for c in insp.get_columns(table)}:
+            op.drop_column(table, column.name)
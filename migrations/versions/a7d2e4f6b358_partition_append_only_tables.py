@@ -0,0 +1,53 @@
+"""particionamento mensal de messages, message_logs e conversation_events (Postgres)
+
+Revision ID: a7d2e4f6b358
+Revises: f3c6d9e2a145
+Create Date: 2026-10-17 17:00:00.000000
+
+Copia os dados para a tabela particionada dentro da transação da migração: em bases
+grandes, rodar numa janela de manutenção. SQLite mantém as tabelas simples.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.repositories.models import Base
+from app.repositories.partitions import PARTITIONED_TABLES, convert_to_partitioned, is_partitioned
+
+# revision identifiers, used by Alembic.
+revision: str = "a7d2e4f6b358"
+down_revision: Union[str, Sequence[str], None] = "f3c6d9e2a145"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql":
+        return
+    insp = sa.inspect(bind)
+    for table in PARTITIONED_TABLES:
+        # Banco novo: tabelas core ainda não existem (create_all + ensure_partitioned no startup)
+        if insp.has_table(table):
+            convert_to_partitioned(bind, table)
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql":
+        return
+    for table in PARTITIONED_TABLES:
+        if not is_partitioned(bind, table):
+            continue
+        # Volta a uma tabela simples com os dados das partições anexadas
+        op.execute(f'CREATE TABLE "{table}__plain" (LIKE "{table}" INCLUDING DEFAULTS)')
+        op.execute(f'INSERT INTO "{table}__plain" SELECT * FROM "{table}"')
+        seq = bind.execute(sa.text("SELECT pg_get_serial_sequence(:t, 'id')"), {"t": table}).scalar()
+        if seq:
+            op.execute(f'ALTER SEQUENCE {seq} OWNED BY "{table}__plain".id')
+        op.execute(f'DROP TABLE "{table}" CASCADE')
+        op.execute(f'ALTER TABLE "{table}__plain" RENAME TO "{table}"')
+        op.execute(f'ALTER TABLE "{table}" ADD PRIMARY KEY (id)')
+        for ix in Base.metadata.tables[table].indexes:
+            op.execute(sa.schema.CreateIndex(ix))
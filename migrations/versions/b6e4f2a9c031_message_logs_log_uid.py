@@ -0,0 +1,38 @@
+"""message_logs: log_uid (write-behind das transições de status)
+
+Revision ID: b6e4f2a9c031
+Revises: a3c91e7d5b10
+Create Date: 2026-10-17 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "b6e4f2a9c031"
+down_revision: Union[str, Sequence[str], None] = "a3c91e7d5b10"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    insp = sa.inspect(op.get_bind())
+    if not insp.has_table("message_logs"):
+        # Tabelas core são criadas pelo create_all no startup; nada a migrar ainda
+        return
+    if not any(c["name"] == "log_uid" for c in insp.get_columns("message_logs")):
+        op.add_column("message_logs", sa.Column("log_uid", sa.String(length=32), nullable=True))
+    if not any(i["name"] == "uq_msglog_log_uid" for i in insp.get_indexes("message_logs")):
+        op.create_index("uq_msglog_log_uid", "message_logs", ["log_uid"], unique=True)
+
+
+def downgrade() -> None:
+    insp = sa.inspect(op.get_bind())
+    if not insp.has_table("message_logs"):
+        return
+    if any(i["name"] == "uq_msglog_log_uid" for i in insp.get_indexes("message_logs")):
+        op.drop_index("uq_msglog_log_uid", table_name="message_logs")
+    if any(c["name"] == "log_uid" for c in insp.get_columns("message_logs")):
+        op.drop_column("message_logs", "log_uid")
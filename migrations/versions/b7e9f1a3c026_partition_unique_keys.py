@@ -0,0 +1,42 @@
+"""unicidade global das chaves das tabelas particionadas (partition_unique_keys + triggers)
+
+Revision ID: b7e9f1a3c026
+Revises: a5d8e0f2b915
+Create Date: 2026-10-18 01:00:00.000000
+
+Bases já particionadas por a7d2e4f6b358 perderam a unicidade global de
+(tenant_id, wa_message_id), (tenant_id, idempotency_key) e log_uid. Esta migração cria a
+tabela de chaves, registra as chaves existentes e instala os triggers. Postgres 13+.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+from app.repositories.models import Base
+from app.repositories.partitions import KEYS_TABLE, PARTITIONED_TABLES, ensure_guards, is_partitioned, unique_guards
+
+# revision identifiers, used by Alembic.
+revision: str = "b7e9f1a3c026"
+down_revision: Union[str, Sequence[str], None] = "a5d8e0f2b915"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql":
+        return
+    for table in PARTITIONED_TABLES:
+        if is_partitioned(bind, table):
+            ensure_guards(bind, table)
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql":
+        return
+    for table in PARTITIONED_TABLES:
+        if unique_guards(Base.metadata.tables[table]):
+            op.execute(f'DROP TRIGGER IF EXISTS "{table}_unique_guard" ON "{table}"')
+            op.execute(f'DROP FUNCTION IF EXISTS "{table}_unique_guard"()')
+    op.execute(f"DROP TABLE IF EXISTS {KEYS_TABLE}")
@@ -0,0 +1,45 @@
+"""arquivo frio: tabela archive_segments
+
+Revision ID: b8e3f5a7c469
+Revises: a7d2e4f6b358
+Create Date: 2026-10-17 19:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "b8e3f5a7c469"
+down_revision: Union[str, Sequence[str], None] = "a7d2e4f6b358"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    if sa.inspect(op.get_bind()).has_table("archive_segments"):
+        return
+    op.create_table(
+        "archive_segments",
+        sa.Column("id", sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column("table_name", sa.String(length=40), nullable=False),
+        sa.Column("source", sa.String(length=120), nullable=False),
+        sa.Column("month", sa.Date(), nullable=True),
+        sa.Column("path", sa.String(length=512), nullable=False),
+        sa.Column("codec", sa.String(length=8), nullable=False),
+        sa.Column("rows", sa.Integer(), nullable=False),
+        sa.Column("group_min", sa.Integer(), nullable=True),
+        sa.Column("group_max", sa.Integer(), nullable=True),
+        sa.Column("created_min", sa.DateTime(), nullable=True),
+        sa.Column("created_max", sa.DateTime(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+    )
+    op.create_index("idx_archive_segment_group", "archive_segments", ["table_name", "group_min", "group_max"])
+
+
+def downgrade() -> None:
+    if not sa.inspect(op.get_bind()).has_table("archive_segments"):
+        return
+    op.drop_index("idx_archive_segment_group", table_name="archive_segments")
+    op.drop_table("archive_segments")
@@ -0,0 +1,41 @@
+"""índices para aplicar status de entrega por id do provider
+
+Revision ID: c1d8e5f7a402
+Revises: b6e4f2a9c031
+Create Date: 2026-10-17 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "c1d8e5f7a402"
+down_revision: Union[str, Sequence[str], None] = "b6e4f2a9c031"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+_INDEXES = [
+    ("idx_msglog_provider_message_id", "message_logs", ["provider_message_id"]),
+    ("idx_messages_wa_message_id", "messages", ["wa_message_id"]),
+]
+
+
+def _has_index(insp, table: str, name: str) -> bool:
+    return any(i["name"] == name for i in insp.get_indexes(table))
+
+
+def upgrade() -> None:
+    insp = sa.inspect(op.get_bind())
+    for name, table, cols in _INDEXES:
+        # Tabelas core são criadas pelo create_all no startup (já com os índices)
+        if insp.has_table(table) and not _has_index(insp, table, name):
+            op.create_index(name, table, cols)
+
+
+def downgrade() -> None:
+    insp = sa.inspect(op.get_bind())
+    for name, table, _cols in _INDEXES:
+        if insp.has_table(table) and _has_index(insp, table, name):
+            op.drop_index(name, table_name=table)
@@ -0,0 +1,45 @@
+"""contatos: created_at (rollup de leads pela criação do contato)
+
+Revision ID: c2f8a4b6d137
+Revises: b7e9f1a3c026
+Create Date: 2026-10-18 02:00:00.000000
+
+Contatos existentes recebem a data da primeira mensagem; sem mensagem ficam NULL
+(criação desconhecida, fora do backfill de leads).
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "c2f8a4b6d137"
+down_revision: Union[str, Sequence[str], None] = "b7e9f1a3c026"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _has_column(insp: sa.Inspector) -> bool:
+    return any(c["name"] == "created_at" for c in insp.get_columns("contacts"))
+
+
+def upgrade() -> None:
+    insp = sa.inspect(op.get_bind())
+    if not insp.has_table("contacts") or _has_column(insp):
+        return
+    op.add_column("contacts", sa.Column("created_at", sa.DateTime(), nullable=True))
+    op.execute(
+        """
+        UPDATE contacts SET created_at = (
+            SELECT MIN(m.created_at)
+            FROM conversations v JOIN messages m ON m.conversation_id = v.id
+            WHERE v.contact_id = contacts.id
+        )
+        """
+    )
+
+
+def downgrade() -> None:
+    insp = sa.inspect(op.get_bind())
+    if insp.has_table("contacts") and _has_column(insp):
+        op.drop_column("contacts", "created_at")
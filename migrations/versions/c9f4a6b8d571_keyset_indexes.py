@@ -0,0 +1,41 @@
+"""índices compostos para paginação por keyset
+
+Revision ID: c9f4a6b8d571
+Revises: b8e3f5a7c469
+Create Date: 2026-10-17 20:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "c9f4a6b8d571"
+down_revision: Union[str, Sequence[str], None] = "b8e3f5a7c469"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+_INDEXES = (
+    ("idx_contact_tenant_id", "contacts", ["tenant_id", "id"]),
+    ("idx_msglog_tenant_created_id", "message_logs", ["tenant_id", "created_at", "id"]),
+    ("idx_vehicle_active_id", "vehicles", ["active", "id"]),
+)
+
+
+def _existing(insp: sa.Inspector, table: str) -> set[str]:
+    return {ix["name"] for ix in insp.get_indexes(table)}
+
+
+def upgrade() -> None:
+    insp = sa.inspect(op.get_bind())
+    for name, table, cols in _INDEXES:
+        if insp.has_table(table) and name not in _existing(insp, table):
+            op.create_index(name, table, cols)
+
+
+def downgrade() -> None:
+    insp = sa.inspect(op.get_bind())
+    for name, table, _cols in _INDEXES:
+        if insp.has_table(table) and name in _existing(insp, table):
+            op.drop_index(name, table_name=table)
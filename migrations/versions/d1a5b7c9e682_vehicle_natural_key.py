@@ -0,0 +1,48 @@
+"""veículos: índice único (tenant_id, title, coalesce(year, 0)) para o upsert do import
+
+Revision ID: d1a5b7c9e682
+Revises: c9f4a6b8d571
+Create Date: 2026-10-17 21:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "d1a5b7c9e682"
+down_revision: Union[str, Sequence[str], None] = "c9f4a6b8d571"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+_INDEX = "uix_vehicle_tenant_title_year"
+_KEEP = "SELECT MIN(id) FROM vehicles GROUP BY tenant_id, title, COALESCE(year, 0)"
+
+
+def upgrade() -> None:
+    insp = sa.inspect(op.get_bind())
+    if not insp.has_table("vehicles") or _INDEX in {ix["name"] for ix in insp.get_indexes("vehicles")}:
+        return
+    # Duplicatas antigas (o import fazia SELECT + INSERT sem índice): mantém o menor id e
+    # reaponta as imagens para ele antes de apagar as demais
+    if insp.has_table("vehicle_images"):
+        op.execute(
+            f"""
+            UPDATE vehicle_images SET vehicle_id = (
+                SELECT MIN(k.id) FROM vehicles v
+                JOIN vehicles k ON k.tenant_id = v.tenant_id AND k.title = v.title
+                    AND COALESCE(k.year, 0) = COALESCE(v.year, 0)
+                WHERE v.id = vehicle_images.vehicle_id
+            )
+            WHERE vehicle_id NOT IN ({_KEEP})
+            """
+        )
+    op.execute(f"DELETE FROM vehicles WHERE id NOT IN ({_KEEP})")
+    op.create_index(_INDEX, "vehicles", ["tenant_id", "title", sa.text("COALESCE(year, 0)")], unique=True)
+
+
+def downgrade() -> None:
+    insp = sa.inspect(op.get_bind())
+    if insp.has_table("vehicles") and _INDEX in {ix["name"] for ix in insp.get_indexes("vehicles")}:
+        op.drop_index(_INDEX, table_name="vehicles")
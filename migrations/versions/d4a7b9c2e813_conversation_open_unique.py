@@ -0,0 +1,52 @@
+"""conversas: no máximo uma aberta por contato (índice único parcial)
+
+Revision ID: d4a7b9c2e813
+Revises: c1d8e5f7a402
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "d4a7b9c2e813"
+down_revision: Union[str, Sequence[str], None] = "c1d8e5f7a402"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    insp = sa.inspect(op.get_bind())
+    if not insp.has_table("conversations"):
+        # Tabelas core são criadas pelo create_all no startup (já com o índice)
+        return
+    if any(i["name"] == "uix_conversation_open" for i in insp.get_indexes("conversations")):
+        return
+    # Fecha conversas abertas duplicadas, mantendo a mais recente de cada contato
+    op.execute(
+        """
+        UPDATE conversations SET status = 'closed'
+        WHERE status <> 'closed'
+          AND id NOT IN (
+              SELECT MAX(id) FROM conversations WHERE status <> 'closed' GROUP BY tenant_id, contact_id
+          )
+        """
+    )
+    op.create_index(
+        "uix_conversation_open",
+        "conversations",
+        ["tenant_id", "contact_id"],
+        unique=True,
+        postgresql_where=sa.text("status <> 'closed'"),
+        sqlite_where=sa.text("status <> 'closed'"),
+    )
+
+
+def downgrade() -> None:
+    insp = sa.inspect(op.get_bind())
+    if insp.has_table("conversations") and any(
+        i["name"] == "uix_conversation_open" for i in insp.get_indexes("conversations")
+    ):
+        op.drop_index("uix_conversation_open", table_name="conversations")
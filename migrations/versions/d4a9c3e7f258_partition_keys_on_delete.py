@@ -0,0 +1,46 @@
+"""chaves de unicidade apagadas junto com as linhas (trigger também em DELETE)
+
+Revision ID: d4a9c3e7f258
+Revises: c2f8a4b6d137
+Create Date: 2026-10-18 03:00:00.000000
+
+O trigger de b7e9f1a3c026 só cobria INSERT/UPDATE: linhas apagadas pela retenção por
+tenant ou pelo arquivamento deixavam a chave em partition_unique_keys (e, sem corte
+global, para sempre). Reinstala os triggers com DELETE e remove as chaves órfãs.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+from sqlalchemy import text
+
+from app.repositories.models import Base
+from app.repositories.partitions import PARTITIONED_TABLES, guard_sql, is_partitioned, orphan_keys_sql, unique_guards
+
+# revision identifiers, used by Alembic.
+revision: str = "d4a9c3e7f258"
+down_revision: Union[str, Sequence[str], None] = "c2f8a4b6d137"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql":
+        return
+    for table in PARTITIONED_TABLES:
+        if is_partitioned(bind, table):
+            model = Base.metadata.tables[table]
+            for stmt in guard_sql(model) + orphan_keys_sql(model):
+                bind.execute(text(stmt))
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql":
+        return
+    for table in PARTITIONED_TABLES:
+        if is_partitioned(bind, table) and unique_guards(Base.metadata.tables[table]):
+            # A função segue tratando DELETE, mas o trigger volta a disparar só em INSERT/UPDATE
+            fn = f"{table}_unique_guard"
+            op.execute(f'DROP TRIGGER IF EXISTS "{fn}" ON "{table}"')
+            op.execute(f'CREATE TRIGGER "{fn}" BEFORE INSERT OR UPDATE ON "{table}" FOR EACH ROW EXECUTE FUNCTION "{fn}"()')
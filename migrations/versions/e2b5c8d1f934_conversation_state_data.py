@@ -0,0 +1,48 @@
+"""conversas: state_data (snapshot dos critérios do funil)
+
+Revision ID: e2b5c8d1f934
+Revises: d4a7b9c2e813
+Create Date: 2026-10-17 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "e2b5c8d1f934"
+down_revision: Union[str, Sequence[str], None] = "d4a7b9c2e813"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _has_column(table: str, column: str) -> bool:
+    insp = sa.inspect(op.get_bind())
+    if not insp.has_table(table):
+        # Tabelas core são criadas pelo create_all no startup; nada a migrar ainda
+        return True
+    return any(c["name"] == column for c in insp.get_columns(table))
+
+
+def upgrade() -> None:
+    if not _has_column("conversations", "state_data"):
+        op.add_column("conversations", sa.Column("state_data", sa.JSON(), nullable=True))
+        if not sa.inspect(op.get_bind()).has_table("conversation_events"):
+            return
+        # Backfill a partir do último evento re_funnel de cada conversa (o funil antigo)
+        op.execute(
+            """
+            UPDATE conversations SET state_data = (
+                SELECT e.payload FROM conversation_events e
+                WHERE e.conversation_id = conversations.id AND e.type = 're_funnel'
+                ORDER BY e.id DESC LIMIT 1
+            )
+            """
+        )
+
+
+def downgrade() -> None:
+    insp = sa.inspect(op.get_bind())
+    if insp.has_table("conversations") and any(c["name"] == "state_data" for c in insp.get_columns("conversations")):
+        op.drop_column("conversations", "state_data")
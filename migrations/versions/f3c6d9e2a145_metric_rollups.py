@@ -0,0 +1,46 @@
+"""métricas: tabela de rollups (hora/dia) para o dashboard
+
+Revision ID: f3c6d9e2a145
+Revises: e2b5c8d1f934
+Create Date: 2026-10-17 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "f3c6d9e2a145"
+down_revision: Union[str, Sequence[str], None] = "e2b5c8d1f934"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    if sa.inspect(op.get_bind()).has_table("metric_rollups"):
+        return
+    op.create_table(
+        "metric_rollups",
+        sa.Column("id", sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column("tenant_id", sa.Integer(), nullable=False),
+        sa.Column("channel", sa.String(length=16), nullable=False),
+        sa.Column("granularity", sa.String(length=8), nullable=False),
+        sa.Column("bucket", sa.DateTime(), nullable=False),
+        sa.Column("metric", sa.String(length=32), nullable=False),
+        sa.Column("value", sa.Integer(), nullable=False, server_default="0"),
+    )
+    op.create_index(
+        "uix_metric_rollup",
+        "metric_rollups",
+        ["tenant_id", "granularity", "bucket", "channel", "metric"],
+        unique=True,
+    )
+    # Histórico: python -m app.workers.rollup_backfill
+
+
+def downgrade() -> None:
+    if not sa.inspect(op.get_bind()).has_table("metric_rollups"):
+        return
+    op.drop_index("uix_metric_rollup", table_name="metric_rollups")
+    op.drop_table("metric_rollups")
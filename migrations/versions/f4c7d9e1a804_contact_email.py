@@ -0,0 +1,33 @@
+"""contatos: coluna email (import de leads)
+
+Revision ID: f4c7d9e1a804
+Revises: e3b6c8d0f793
+Create Date: 2026-10-17 23:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "f4c7d9e1a804"
+down_revision: Union[str, Sequence[str], None] = "e3b6c8d0f793"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _has_column(insp: sa.Inspector) -> bool:
+    return any(c["name"] == "email" for c in insp.get_columns("contacts"))
+
+
+def upgrade() -> None:
+    insp = sa.inspect(op.get_bind())
+    if insp.has_table("contacts") and not _has_column(insp):
+        op.add_column("contacts", sa.Column("email", sa.String(length=180), nullable=True))
+
+
+def downgrade() -> None:
+    insp = sa.inspect(op.get_bind())
+    if insp.has_table("contacts") and _has_column(insp):
+        op.drop_column("contacts", "email")
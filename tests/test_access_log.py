@@ -0,0 +1,62 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+
+from app.api import middleware
+from app.api.middleware import AccessLogMiddleware, LatencyHistogram
+from app.core.config import settings
+from app.main import app
+
+client = TestClient(app)
+
+
+def test_latency_is_recorded_per_route_template():
+    middleware.http_latency.clear()
+    client.get("/veiculos/999999")
+    client.get("/veiculos/888888")
+    routes = {(r["method"], r["route"]): r for r in client.get("/metrics/http").json()["routes"]}
+    assert routes[("GET", "/veiculos/{vehicle_id}")]["count"] == 2
+
+
+def test_histogram_quantiles_use_bucket_bounds():
+    h = LatencyHistogram()
+    for ms in [1, 2, 3, 40, 2000]:
+        h.observe(ms)
+    assert h.quantile(0.5) == 5
+    assert h.quantile(0.99) == 2500
+    assert h.snapshot()["count"] == 5
+
+
+def test_body_is_streamed_not_buffered(monkeypatch):
+    monkeypatch.setattr(settings, "ACCESS_LOG_SAMPLE_RATE", 1.0)
+    seen = []
+
+    async def inner(scope, receive, send):
+        while True:
+            msg = await receive()
+            seen.append(len(msg.get("body", b"")))
+            if not msg.get("more_body"):
+                break
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    chunks = [
+        {"type": "http.request", "body": b"a" * 10, "more_body": True},
+        {"type": "http.request", "body": b"b" * 5, "more_body": False},
+    ]
+    logged = []
+
+    async def receive():
+        return chunks.pop(0)
+
+    async def send(msg):
+        pass
+
+    monkeypatch.setattr(middleware.log, "info", lambda event, **kw: logged.append((event, kw)))
+    scope = {"type": "http", "method": "POST", "path": "/x", "headers": []}
+    asyncio.run(AccessLogMiddleware(inner)(scope, receive, send))
+    # O app interno recebeu os pedaços como chegaram
+    assert seen == [10, 5]
+    assert logged[-1][0] == "http_access"
+    assert logged[-1][1]["req_bytes"] == 15 and logged[-1][1]["resp_bytes"] == 2
+    assert logged[-1][1]["route"] == "<unmatched>"
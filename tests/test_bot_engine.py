@@ -0,0 +1,70 @@
+import pytest
+
+from app.core.config import settings
+from app.domain.bot import builtin_flow, compile_flow, get_flow
+from app.domain.bot.extractors import extract_cpf, extract_price_range
+from app.repositories.tenants import TenantInfo
+
+
+def _run(flow, messages):  # type: ignore[no-untyped-def]
+    state, data, replies = None, {}, []
+    for text in messages:
+        res = flow.step(state, data, text)
+        state, data = res.state, res.data
+        replies.append(res.reply)
+    return state, data, replies
+
+
+def test_realestate_flow_collects_criteria_until_price():
+    flow = builtin_flow("realestate")
+    state, data, replies = _run(flow, ["oi", "Alugar", "Campinas", "s", "sp", "casa", "2 quartos"])
+    assert replies[0] == "Olá! Você procura compra ou locação?"
+    assert replies[3] == "Informe a UF com 2 letras (ex: SP)."  # retry: não avança
+    assert state == "price"
+    assert data == {"purpose": "rent", "city": "Campinas", "state": "SP", "type": "house", "bedrooms": 2}
+
+
+def test_fallback_reports_unchanged_state():
+    res = builtin_flow("realestate").step("type", {"purpose": "sale"}, "sei la")
+    assert res.changed is False and res.state == "type"
+    assert res.reply == "Digite 'apartamento' ou 'casa'."
+
+
+def test_vehicle_flow_runs_pan_pre_analise_without_keeping_cpf(monkeypatch):
+    monkeypatch.setattr(settings, "PAN_MOCK", True)
+    flow = builtin_flow("vehicles")
+    res = flow.step(None, {}, "cpf 123.456.780-62 categoria motos")
+    assert "aprovado" in res.reply.lower()
+    assert res.data == {"categoria": "MOTOS", "pre_analise": "APROVADO"}
+    assert flow.step(None, {}, "cpf 123").reply.startswith("CPF inválido")
+    reset = flow.step("start", res.data, "SAIR")
+    assert reset.data == {} and reset.reply.startswith("Atendimento encerrado")
+
+
+def test_extractors():
+    assert extract_cpf("", "meu cpf é 123.456.789-09") == "12345678909"
+    assert extract_cpf("", "123.456.789-08") is None  # DV errado
+    assert extract_cpf("", "111.111.111-11") is None
+    assert extract_cpf("", "me liga no 61999998888") is None
+    assert extract_cpf("", "fone 11987654321, cpf 52998224725") == "52998224725"
+    assert extract_price_range("", "2000-3500") == {"min_price": 2000.0, "max_price": 3500.0}
+    assert extract_price_range("", "carros usados até 60.000") == {"max_price": 60000.0}
+    assert extract_price_range("", "carros") is None
+
+
+def test_custom_tenant_flow_is_compiled_once_and_validated():
+    defn = {
+        "start": "a",
+        "states": {
+            "a": {"fallback": "?", "transitions": [{"regex": r"\d+", "extract": {"n": "int"}, "next": "a", "reply": "n={n}"}]}
+        },
+    }
+    tenant = TenantInfo(id=999, name="flow-tenant", timezone="America/Sao_Paulo", settings={"bot_flow": defn})
+    flow = get_flow(tenant, "vehicles")
+    assert get_flow(tenant, "vehicles") is flow
+    assert flow.step("a", {}, "quero 3").reply == "n=3"
+
+    with pytest.raises(ValueError):
+        compile_flow({"states": {"a": {"transitions": [{"next": "b"}]}}})
+    with pytest.raises(ValueError):
+        compile_flow({"states": {"a": {"transitions": [{"extract": {"x": "nope"}, "next": "a"}]}}})
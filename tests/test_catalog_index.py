@@ -0,0 +1,78 @@
+from fastapi.testclient import TestClient
+
+from app.api.pagination import encode_cursor
+from app.core.config import settings
+from app.main import app
+from app.repositories import catalog, catalog_index
+from app.repositories.db import SessionLocal
+from app.repositories.models import Vehicle
+from app.repositories.tenants import get_tenant
+
+client = TestClient(app)
+
+TENANT = 9301
+
+
+def _add(tenant_id: int, **cols) -> int:
+    with SessionLocal() as db:
+        v = Vehicle(tenant_id=tenant_id, active=True, **cols)
+        db.add(v)
+        db.commit()
+        return v.id
+
+
+def test_filters_match_sql_semantics():
+    ids = {
+        "argo": _add(TENANT, title="Argo", brand="Fiat", model="Argo Drive", year=2021, category="USADO", price=65000),
+        "c3": _add(TENANT, title="C3", brand="Citroën", model="C3 Feel", year=2023, category="NOVO", price=90000),
+        "cg": _add(TENANT, title="CG 160", brand="Honda", model="CG 160", year=None, category="MOTOS", price=None),
+        "mobi": _add(TENANT, title="Mobi", brand="FIAT", model="Mobi Like", year=2019, category="USADO", price=48000),
+    }
+    _add(TENANT + 1, title="Outro tenant", brand="Fiat", year=2021, category="USADO", price=1)
+    with SessionLocal() as db:
+        db.add(Vehicle(tenant_id=TENANT, title="Inativo", brand="Fiat", active=False))
+        db.commit()
+    snap = catalog_index.build_snapshot(TENANT, 0)
+
+    def found(**filters):  # type: ignore[no-untyped-def]
+        return [v["id"] for v in snap.search(limit=48, **filters)]
+
+    assert found() == sorted(ids.values(), reverse=True)
+    assert found(marca="fiat") == [ids["mobi"], ids["argo"]]
+    assert found(marca="citroen") == [ids["c3"]]  # sem acento casa com acento
+    assert found(modelo="DRIVE") == [ids["argo"]]
+    assert found(marca="inexistente") == []
+    assert found(categoria="usado") == [ids["mobi"], ids["argo"]]
+    assert found(categoria="caminhao") == []
+    # Ano/preço ausentes não passam em filtros de faixa
+    assert found(ano_min=2000) == [ids["mobi"], ids["c3"], ids["argo"]]
+    assert found(ano_min=2020, ano_max=2022) == [ids["argo"]]
+    assert found(preco_max=70000) == [ids["mobi"], ids["argo"]]
+    assert found(preco_min=50000, marca="fiat") == [ids["argo"]]
+    assert found(after_id=ids["c3"]) == [ids["argo"]]
+    assert [v["id"] for v in snap.search(offset=1, limit=2)] == sorted(ids.values(), reverse=True)[1:3]
+
+
+def test_snapshot_rebuilds_when_catalog_version_changes(monkeypatch):
+    versions = {"v": 1}
+    monkeypatch.setattr(catalog, "get_version", lambda tenant_id: versions["v"])
+    catalog_index.invalidate()
+    tenant_id = get_tenant(settings.DEFAULT_TENANT_ID).id
+    first = _add(tenant_id, title="Indexado 1", brand="IndiceTeste")
+
+    r = client.get("/veiculos", params={"marca": "indiceteste"})
+    assert [v["id"] for v in r.json()] == [first]
+
+    second = _add(tenant_id, title="Indexado 2", brand="IndiceTeste")
+    r = client.get("/veiculos", params={"marca": "indiceteste"})
+    assert [v["id"] for v in r.json()] == [first]  # mesma versão: snapshot em memória
+
+    versions["v"] = 2
+    r = client.get("/veiculos", params={"marca": "indiceteste"})
+    assert [v["id"] for v in r.json()] == [second, first]
+
+
+def test_cursor_must_be_an_id():
+    r = client.get("/veiculos", params={"cursor": encode_cursor(["x"])})
+    assert r.status_code == 400
+    assert r.json()["error"]["code"] == "invalid_cursor"
@@ -0,0 +1,59 @@
+from sqlalchemy import event
+
+from app.repositories import models, rollups
+from app.repositories.conversations import resolve_conversation
+from app.repositories.db import SessionLocal, engine
+
+
+def test_resolve_creates_once_and_reuses_open_conversation():
+    with SessionLocal() as db:
+        first = resolve_conversation(db, "repo-tenant", "5511900000100")
+        db.commit()
+    with SessionLocal() as db:
+        again = resolve_conversation(db, "repo-tenant", "5511900000100")
+        other = resolve_conversation(db, "repo-tenant", "5511900000101")
+        db.commit()
+    assert again == first
+    assert other.tenant_id == first.tenant_id and other.contact_id != first.contact_id
+
+
+def test_closed_conversation_gets_replaced():
+    with SessionLocal() as db:
+        ref = resolve_conversation(db, "repo-tenant", "5511900000102")
+        db.get(models.Conversation, ref.conversation_id).status = models.ConversationStatus.closed
+        db.commit()
+        new = resolve_conversation(db, "repo-tenant", "5511900000102")
+        db.commit()
+    assert new.contact_id == ref.contact_id and new.conversation_id != ref.conversation_id
+
+
+def test_hot_path_is_a_single_statement():
+    with SessionLocal() as db:
+        resolve_conversation(db, "repo-tenant", "5511900000103")
+        db.commit()
+    statements: list[str] = []
+
+    def _count(conn, cursor, statement, *args):  # type: ignore[no-untyped-def]
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", _count)
+    try:
+        with SessionLocal() as db:
+            resolve_conversation(db, "repo-tenant", "5511900000103")
+    finally:
+        event.remove(engine, "before_cursor_execute", _count)
+    assert len(statements) == 1
+
+
+def test_rollups_count_only_committed_resolutions(monkeypatch):
+    recorded = []
+    monkeypatch.setattr(rollups, "record", lambda tenant_id, metric, n=1, at=None, channel="whatsapp": recorded.append((metric, n)))
+    with SessionLocal() as db:
+        resolve_conversation(db, "repo-tenant", "5511900000104")
+        assert recorded == []
+        db.rollback()
+    assert recorded == []
+    with SessionLocal() as db:
+        resolve_conversation(db, "repo-tenant", "5511900000104")
+        db.commit()
+    assert sorted(recorded) == [(rollups.CONVERSATIONS, 1), (rollups.LEADS, 1)]
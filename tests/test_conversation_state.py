@@ -0,0 +1,105 @@
+from app.messaging import conversation_state
+from app.messaging.conversation_state import (
+    ConversationStateWriter,
+    FunnelState,
+    invalidate_state,
+    load_state,
+    save_state,
+)
+from app.repositories.db import SessionLocal
+from app.repositories.models import Conversation, ConversationStatus
+
+
+class _NoRedis:
+    def __getattr__(self, name):
+        raise ConnectionError("redis down")
+
+
+def test_state_falls_back_to_db_without_redis(monkeypatch):
+    monkeypatch.setattr(conversation_state, "get_redis", lambda: _NoRedis())
+    with SessionLocal() as db:
+        st = load_state(db, "state-tenant", "5511900001001")
+    assert st.state is None and st.data == {}
+
+    st.data["purpose"] = "rent"
+    st.state = "location_city"
+    save_state(st)
+    st.data["city"] = "Campinas"
+    st.state = "location_state"
+    save_state(st)
+
+    # Vários passos não acumulam eventos para replay: vale o último snapshot
+    with SessionLocal() as db:
+        again = load_state(db, "state-tenant", "5511900001001")
+    assert again.conversation_id == st.conversation_id
+    assert again.state == "location_state"
+    assert again.data == {"purpose": "rent", "city": "Campinas"}
+
+
+def test_writer_keeps_only_latest_snapshot_per_conversation(monkeypatch):
+    monkeypatch.setattr(conversation_state, "get_redis", lambda: _NoRedis())
+    with SessionLocal() as db:
+        st = load_state(db, "state-tenant", "5511900001002")
+    writer = ConversationStateWriter(interval_s=60, max_items=1000)
+    for n, state in enumerate(["location_city", "location_state", "type"]):
+        writer.add(FunnelState(st.tenant_id, st.wa_id, st.conversation_id, state, {"step": n}))
+    assert writer._size() == 1
+    writer.stop()
+    with SessionLocal() as db:
+        conv = db.get(Conversation, st.conversation_id)
+        assert conv.last_state == "type" and conv.state_data == {"step": 2}
+
+
+class _HashRedis:
+    def __init__(self):
+        self.hashes: dict[str, dict] = {}
+
+    def hgetall(self, key):
+        return dict(self.hashes.get(key, {}))
+
+    def pipeline(self, transaction=True):
+        return self
+
+    def hset(self, key, mapping):
+        self.hashes.setdefault(key, {}).update({k: str(v) for k, v in mapping.items()})
+
+    def expire(self, key, ttl):
+        pass
+
+    def execute(self):
+        return []
+
+    def delete(self, key):
+        self.hashes.pop(key, None)
+
+
+def test_cached_snapshot_of_closed_conversation_is_not_served(monkeypatch):
+    fake = _HashRedis()
+    monkeypatch.setattr(conversation_state, "get_redis", lambda: fake)
+    with SessionLocal() as db:
+        st = load_state(db, "state-tenant", "5511900001003")
+    st.state, st.data = "type", {"purpose": "rent"}
+    save_state(st)
+
+    # Fechada fora do bot (admin/SQL): o hash ainda aponta para ela
+    with SessionLocal() as db:
+        db.get(Conversation, st.conversation_id).status = ConversationStatus.closed
+        db.commit()
+    with SessionLocal() as db:
+        fresh = load_state(db, "state-tenant", "5511900001003")
+    assert fresh.conversation_id != st.conversation_id
+    assert fresh.state is None and fresh.data == {}
+
+
+def test_invalidate_state_reloads_from_db(monkeypatch):
+    fake = _HashRedis()
+    monkeypatch.setattr(conversation_state, "get_redis", lambda: fake)
+    with SessionLocal() as db:
+        st = load_state(db, "state-tenant", "5511900001004")
+        db.get(Conversation, st.conversation_id).last_state = "price"
+        db.commit()
+    with SessionLocal() as db:
+        assert load_state(db, "state-tenant", "5511900001004").state is None  # hash ainda vale
+    invalidate_state(st.tenant_id, st.wa_id)
+    with SessionLocal() as db:
+        assert load_state(db, "state-tenant", "5511900001004").state == "price"
@@ -0,0 +1,126 @@
+from sqlalchemy import event
+
+from app.messaging.log_recorder import MessageLogRecorder
+from app.messaging.statuses import StatusCoalescer, iter_statuses
+from app.repositories import models
+from app.repositories.conversations import resolve_conversation
+from app.repositories.db import SessionLocal, engine
+from app.repositories.models import MessageLog
+
+
+def _status_payload(*events: tuple[str, str]) -> dict:
+    return {
+        "entry": [
+            {
+                "changes": [
+                    {
+                        "value": {
+                            "statuses": [
+                                {"id": pid, "status": st, "recipient_id": "5511900000010"} for pid, st in events
+                            ]
+                        }
+                    }
+                ]
+            }
+        ]
+    }
+
+
+def _log_status(uid: str) -> str:
+    with SessionLocal() as db:
+        return db.query(MessageLog).filter(MessageLog.log_uid == uid).one().status
+
+
+def test_iter_statuses_skips_unknown():
+    evs = list(iter_statuses(_status_payload(("wamid.1", "sent"), ("wamid.1", "deleted"), ("", "read"))))
+    assert [(e.provider_message_id, e.status) for e in evs] == [("wamid.1", "sent")]
+
+
+def test_coalesces_to_furthest_status_and_never_regresses():
+    rec = MessageLogRecorder(interval_s=60, max_items=1000)
+    a = rec.queued(1, "5511900000010", "text", body={"body": "a"})
+    b = rec.queued(1, "5511900000010", "text", body={"body": "b"})
+    rec.sent(a, "wamid.S1")
+    rec.sent(b, "wamid.S2")
+    rec.stop()
+
+    co = StatusCoalescer(interval_s=60, max_items=1000)
+    # Fora de ordem na mesma janela: fica o mais avançado
+    co.add_payload(_status_payload(("wamid.S1", "read"), ("wamid.S1", "delivered"), ("wamid.S2", "delivered")))
+    assert co._size() == 2
+    co.flush()
+    assert _log_status(a) == "read"
+    assert _log_status(b) == "delivered"
+
+    # Janela seguinte com status atrasado não regride
+    co.add_payload(_status_payload(("wamid.S1", "delivered"), ("wamid.S2", "read")))
+    co.stop()
+    assert _log_status(a) == "read"
+    assert _log_status(b) == "read"
+
+
+def test_status_before_log_row_is_applied_once_the_row_exists():
+    co = StatusCoalescer(interval_s=60, max_items=1000)
+    # O webhook de status chega antes do flush do MessageLogRecorder
+    co.add_payload(_status_payload(("wamid.EARLY", "delivered")))
+    co.flush()
+    assert co._size() == 1
+
+    rec = MessageLogRecorder(interval_s=60, max_items=1000)
+    uid = rec.queued(1, "5511900000010", "text", body={"body": "x"})
+    rec.sent(uid, "wamid.EARLY")
+    rec.stop()
+
+    co.stop()
+    assert co._size() == 0
+    assert _log_status(uid) == "delivered"
+
+
+def test_unmatched_and_failed_statuses_are_retried_a_bounded_number_of_times(monkeypatch):
+    from app.messaging import statuses
+
+    monkeypatch.setattr(statuses.settings, "STATUS_MAX_RETRIES", 2)
+    co = StatusCoalescer(interval_s=60, max_items=1000)
+    co.add_payload(_status_payload(("wamid.NEVER", "read")))
+    for expected in (1, 1, 0):
+        co.flush()
+        assert co._size() == expected
+
+    def _boom():  # type: ignore[no-untyped-def]
+        raise RuntimeError("db down")
+
+    monkeypatch.setattr(statuses, "SessionLocal", _boom)
+    co.add_payload(_status_payload(("wamid.FAIL", "sent")))
+    for expected in (1, 1, 0):
+        co.flush()
+        assert co._size() == expected
+
+
+def test_flush_resolves_rows_without_extra_lookups():
+    # Enviada pelas tasks/engine: só existe em messages, sem linha em message_logs
+    with SessionLocal() as db:
+        ref = resolve_conversation(db, "status-tenant", "5511900000011")
+        db.add(
+            models.Message(
+                tenant_id=ref.tenant_id, conversation_id=ref.conversation_id,
+                direction=models.MessageDirection.outbound, type="text", payload={},
+                status="read", wa_message_id="wamid.TASK",
+            )
+        )
+        db.commit()
+    co = StatusCoalescer(interval_s=60, max_items=1000)
+    co.add_payload(_status_payload(("wamid.TASK", "delivered")))
+    statements: list[str] = []
+
+    def _count(conn, cursor, statement, *args):  # type: ignore[no-untyped-def]
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", _count)
+    try:
+        co.flush()
+    finally:
+        event.remove(engine, "before_cursor_execute", _count)
+    assert co._size() == 0
+    assert [s.split()[0] for s in statements] == ["UPDATE", "UPDATE"]
+    with SessionLocal() as db:
+        assert db.query(models.Message).filter(models.Message.wa_message_id == "wamid.TASK").one().status == "read"
@@ -0,0 +1,121 @@
+import io
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app.core.security import get_password_hash
+from app.main import app
+from app.repositories import imports, lead_import
+from app.repositories.db import engine, SessionLocal
+from app.repositories.models import Base, Contact, ImportJob, User, UserRole
+from app.workers import tasks_imports
+
+client = TestClient(app)
+
+TENANT = 88
+
+
+@pytest.fixture(autouse=True)
+def _import_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "IMPORT_DIR", str(tmp_path))
+
+
+def setup_module(module):
+    Base.metadata.create_all(bind=engine)
+
+
+def _leads_csv(n: int) -> bytes:
+    lines = ["nome,telefone,origem"]
+    lines += [f"Lead {i},+55 11 9{i:08d},site" for i in range(n)]
+    lines.insert(3, 'sem telefone,"",site')
+    return ("\n".join(lines) + "\n").encode()
+
+
+def test_failed_job_resumes_from_checkpoint(monkeypatch):
+    with SessionLocal() as db:
+        job = imports.create_job(db, "leads", TENANT, io.BytesIO(_leads_csv(10)), "leads.csv")
+    calls = []
+    real_upsert = lead_import.upsert_chunk
+
+    def flaky_upsert(db, tenant_id, rows):
+        calls.append([r["wa_id"] for r in rows])
+        if len(calls) == 3:
+            raise RuntimeError("db down")
+        return real_upsert(db, tenant_id, rows)
+
+    monkeypatch.setitem(imports.IMPORTERS, "leads", imports.Importer(lead_import.parse_row, flaky_upsert))
+    with pytest.raises(RuntimeError):
+        imports.run_job(job.id, chunk_rows=4)
+    with SessionLocal() as db:
+        failed = db.get(ImportJob, job.id)
+        assert failed.status == imports.FAILED
+        assert failed.rows_read == 8  # dois lotes gravados
+        assert failed.processed == 7 and failed.rejected == 1
+        assert "db down" in failed.error
+        checkpoint = failed.byte_offset
+
+    out = imports.run_job(job.id, chunk_rows=4)
+    assert out["status"] == imports.DONE
+    assert (out["processed"], out["inserted"], out["rejected"], out["rows_read"]) == (10, 10, 1, 11)
+    assert out["attempts"] == 2
+    assert out["bytes_done"] == out["size_bytes"] > checkpoint
+    # A retomada começou no lote que falhou, sem repetir os anteriores
+    assert calls[3] == calls[2]
+    with SessionLocal() as db:
+        assert db.query(Contact).filter(Contact.tenant_id == TENANT).count() == 10
+
+    # Job concluído não é reprocessado
+    assert imports.run_job(job.id) == {}
+
+
+def test_quoted_newlines_keep_record_boundaries():
+    data = b'title,model,year\n"Argo","linha 1\nlinha 2",2022\nMobi,Like,2021\n'
+    with SessionLocal() as db:
+        job = imports.create_job(db, "vehicles", TENANT, io.BytesIO(data))
+    out = imports.run_job(job.id, chunk_rows=1)
+    assert (out["processed"], out["inserted"]) == (2, 2)
+
+
+def _admin_headers() -> dict:
+    with SessionLocal() as db:
+        if not db.query(User).filter(User.email == "imports@test.local").first():
+            db.add(
+                User(
+                    email="imports@test.local",
+                    hashed_password=get_password_hash("pass123"),
+                    role=UserRole.admin,
+                    is_active=True,
+                )
+            )
+            db.commit()
+    token = client.post(
+        "/auth/login",
+        data={"username": "imports@test.local", "password": "pass123"},
+        headers={"content-type": "application/x-www-form-urlencoded"},
+    ).json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_import_endpoints(monkeypatch):
+    queued: list[int] = []
+    monkeypatch.setattr(tasks_imports.run_import, "delay", queued.append)
+    headers = _admin_headers()
+
+    r = client.post("/admin/leads/import-csv", files={"file": ("l.csv", _leads_csv(3), "text/csv")}, headers=headers)
+    assert r.status_code == 202, r.text
+    job_id = r.json()["id"]
+    assert r.json()["status"] == "queued" and queued == [job_id]
+
+    imports.run_job(job_id)
+    body = client.get(f"/admin/imports/{job_id}", headers=headers).json()
+    assert body["status"] == "done"
+    assert (body["processed"], body["inserted"], body["updated"], body["rejected"]) == (3, 3, 0, 1)
+    assert body["rows_per_s"] > 0 and body["progress"] == 1.0
+
+    assert client.post(f"/admin/imports/{job_id}/resume", headers=headers).status_code == 409
+    assert client.get("/admin/imports/999999", headers=headers).status_code == 404
+
+    r = client.post("/admin/veiculos/import-csv", files={"file": ("v.csv", b"", "text/csv")}, headers=headers)
+    assert r.status_code == 400
+    assert r.json()["error"]["code"] == "csv_no_headers"
@@ -0,0 +1,118 @@
+from app.messaging import inbound
+from app.repositories.db import SessionLocal
+from app.repositories.models import Contact, Message, Tenant
+from app.repositories import tenants as tenant_repo
+from app.workers import tasks_inbound
+
+
+def test_persist_buffers_writes_one_message_per_burst(monkeypatch):
+    monkeypatch.setattr(inbound, "cache_inbound", lambda *args: None)
+    n = tasks_inbound._persist_buffers(
+        [
+            ("oi tudo bem? quero um carro", "{}", "agg-tenant", "5511900000200"),
+            ("x" * 5000, "", "agg-tenant", "5511900000201"),
+        ]
+    )
+    assert n == 2
+    with SessionLocal() as db:
+        contact = db.query(Contact).filter(Contact.wa_id == "5511900000200").one()
+        assert contact.last_inbound_at is not None
+        msgs = db.query(Message).filter(Message.tenant_id == contact.tenant_id).order_by(Message.id).all()
+    assert [m.payload["text"][:6] for m in msgs] == ["oi tud", "xxxxxx"]
+    assert len(msgs[1].payload["text"]) == tasks_inbound.MAX_COMPOSE_LEN
+
+
+def test_window_is_per_tenant_and_clamped():
+    assert tasks_inbound._window_ms("agg-window-default") == 2000
+    with SessionLocal() as db:
+        t = db.query(Tenant).filter(Tenant.name == "agg-window-default").one()
+        t.settings_json = {"inbound_agg_window_s": 500}
+        db.commit()
+    tenant_repo.invalidate_tenant("agg-window-default")
+    assert tasks_inbound._window_ms("agg-window-default") == 60000
+
+
+class _ScriptRedis:
+    def __init__(self):
+        self.registered = 0
+        self.calls = []
+
+    def register_script(self, source):
+        self.registered += 1
+
+        def run(keys, args, client=None):
+            self.calls.append((keys[0], client))
+            return len(args[0])
+
+        return run
+
+
+def test_append_script_is_registered_once(monkeypatch):
+    fake = _ScriptRedis()
+    monkeypatch.setattr(tasks_inbound, "get_redis", lambda: fake)
+    monkeypatch.setattr(tasks_inbound, "_scripts", {})
+    tasks_inbound.buffer_incoming_message.run("agg-script", "5511900000210", "oi")
+    tasks_inbound.buffer_incoming_message.run("agg-script", "5511900000211", "tudo bem?")
+    assert fake.registered == 1
+    assert [key for key, _ in fake.calls] == ["agg:agg-script:5511900000210", "agg:agg-script:5511900000211"]
+    assert all(client is fake for _, client in fake.calls)
+
+
+class _FlushRedis:
+    """Scripts falsos do poller: o claim devolve um lote fixo; restore/ack são registrados."""
+
+    def __init__(self, flat):
+        self.flat = list(flat)
+        self.restored = []
+        self.acked = []
+
+    def register_script(self, source):
+        def run(keys, args, client=None):
+            if source is tasks_inbound._CLAIM_DUE_LUA:
+                flat, self.flat = self.flat, []
+                return flat
+            self.restored.append((keys[0], keys[1]))
+            return 1
+
+        return run
+
+    def pipeline(self):
+        return self
+
+    def delete(self, *keys):
+        self.acked.extend(keys)
+
+    def zrem(self, key, *members):
+        pass
+
+    def execute(self):
+        pass
+
+
+def test_flush_acks_per_tenant_and_restores_the_rest(monkeypatch):
+    fake = _FlushRedis(
+        [
+            "agg-processing:1", "oi", "", "agg-ok", "5511900000220",
+            "agg-processing:2", "quero", "", "agg-bad", "5511900000221",
+        ]
+    )
+    monkeypatch.setattr(tasks_inbound, "get_redis", lambda: fake)
+    monkeypatch.setattr(tasks_inbound, "_scripts", {})
+    persisted = []
+
+    def persist(tenant_name, items):
+        if tenant_name == "agg-bad":
+            raise RuntimeError("db down")
+        persisted.extend((tenant_name, i.wa_id, i.text) for i in items)
+        return items
+
+    monkeypatch.setattr(tasks_inbound, "persist_inbound_batch", persist)
+    try:
+        tasks_inbound.flush_due_buffers.run()
+        assert False, "should raise"
+    except RuntimeError:
+        pass
+    assert persisted == [("agg-ok", "5511900000220", "oi")]
+    # Só o tenant gravado é confirmado; o outro volta para o buffer do contato
+    assert fake.acked == ["agg-processing:1"]
+    assert fake.restored == [("agg-processing:2", "agg:agg-bad:5511900000221")]
@@ -0,0 +1,65 @@
+import io
+
+from app.repositories import imports, rollups
+from app.repositories.db import engine, SessionLocal
+from app.repositories.lead_import import normalize_phones
+from app.repositories.models import Base, Contact
+
+TENANT = 99
+
+
+def setup_module(module):
+    Base.metadata.create_all(bind=engine)
+
+
+def test_normalize_phones_brazilian_defaults():
+    values = [
+        "(11) 98765-4321",  # DDD + celular
+        "+55 11 98765-4321",
+        "0 15 11 98765-4321",  # operadora
+        "011 3456-7890",  # tronco + fixo
+        "98765-4321",  # sem DDD -> DDD padrão
+        "5511987654321",
+        "+1 415 555 0100",  # internacional
+        "123",
+        "(11) 1234-5678",  # fixo não começa com 1
+    ]
+    assert normalize_phones(values, "55", "21") == [
+        "5511987654321",
+        "5511987654321",
+        "5511987654321",
+        "551134567890",
+        "5521987654321",
+        "5511987654321",
+        "14155550100",
+        None,
+        None,
+    ]
+    # Sem DDD padrão, número local é rejeitado
+    assert normalize_phones(["98765-4321"], "55", "") == [None]
+
+
+def test_lead_import_dedups_formats_and_keeps_email(monkeypatch):
+    recorded = []
+    monkeypatch.setattr(
+        rollups, "record", lambda tenant_id, metric, n=1, at=None, channel="whatsapp": recorded.append((tenant_id, metric, n))
+    )
+    data = (
+        "nome,telefone,email,origem\n"
+        "Ana,(11) 98765-4321,ANA@Example.com ,site\n"
+        ",+55 11 98765-4321,,site\n"  # mesmo número em outro formato
+        "Bia,11 3456-7890,invalido,feira\n"
+        "Caio,123,,site\n"  # telefone inválido
+    ).encode()
+    with SessionLocal() as db:
+        job = imports.create_job(db, "leads", TENANT, io.BytesIO(data))
+    out = imports.run_job(job.id)
+    assert (out["processed"], out["inserted"], out["updated"], out["rejected"]) == (3, 2, 1, 1)
+    assert recorded == [(TENANT, rollups.LEADS, 2)]
+    with SessionLocal() as db:
+        rows = {c.wa_id: c for c in db.query(Contact).filter(Contact.tenant_id == TENANT)}
+    assert set(rows) == {"5511987654321", "551134567890"}
+    assert rows["5511987654321"].name == "Ana"
+    assert rows["5511987654321"].email == "ana@example.com"
+    assert rows["551134567890"].email is None
+    assert all(c.created_at is not None for c in rows.values())
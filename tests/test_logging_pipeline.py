@@ -0,0 +1,64 @@
+import io
+import json
+
+import pytest
+import structlog
+
+from app.core import logging as app_logging
+
+
+def test_redaction_masks_nested_secrets_in_rendered_line():
+    line = app_logging._render_json(
+        None, "info", {"event": "x", "headers": {"Authorization": "Bearer abcdefghijkl"}, "resp": [{"token": 123}]}
+    )
+    data = json.loads(line)
+    assert data["headers"]["Authorization"] == "Be***kl"
+    assert data["resp"][0]["token"] == "***"
+    assert json.loads(app_logging._render_orjson(None, "info", {"event": "x", "secret": {"a": 1}}))["secret"] == "***"
+
+
+def test_sampling_never_drops_warnings():
+    sample = app_logging._sampler({"webhook_received": 0.0})
+    with pytest.raises(structlog.DropEvent):
+        sample(None, "info", {"event": "webhook_received"})
+    assert sample(None, "error", {"event": "webhook_received"})
+    assert sample(None, "info", {"event": "other"})
+
+
+def test_large_fields_are_truncated():
+    truncate = app_logging._truncator(50)
+    out = truncate(None, "info", {"event": "x", "payload": {"entry": ["a" * 200]}, "traceback": "t" * 200})
+    assert out["payload"].startswith('{"entry"') and out["payload"].endswith(")")
+    assert len(out["payload"]) < 70
+    assert len(out["traceback"]) == 200
+
+
+def test_truncated_containers_are_redacted_before_cut():
+    truncate = app_logging._truncator(200)
+    event = {"event": "x", "response": {"headers": {"Authorization": "Bearer SUPERSECRETTOKEN123"}, "pad": "x" * 5000}}
+    out = truncate(None, "info", event)
+    assert isinstance(out["response"], str)
+    for render in (app_logging._render_json, app_logging._render_orjson):
+        line = render(None, "info", dict(out))
+        line = line.decode() if isinstance(line, bytes) else line
+        assert "SUPERSECRETTOKEN123" not in line
+
+
+def test_sync_mode_does_not_sample_by_default(monkeypatch):
+    monkeypatch.setattr(app_logging.settings, "LOG_SAMPLE_RATES", None)
+    monkeypatch.setattr(app_logging.settings, "LOG_MODE", "sync")
+    assert app_logging.sample_rates() == {}
+    monkeypatch.setattr(app_logging.settings, "LOG_MODE", "async")
+    assert app_logging.sample_rates() == {"webhook_received": 0.01}
+    monkeypatch.setattr(app_logging.settings, "LOG_SAMPLE_RATES", {"webhook_received": 0.5})
+    assert app_logging.sample_rates() == {"webhook_received": 0.5}
+
+
+def test_queue_writer_writes_in_background_and_counts_drops():
+    stream = io.BytesIO()
+    writer = app_logging._LogWriter(stream, maxsize=10)
+    logger = app_logging._QueueLogger(writer)
+    logger.info(b'{"event":"a"}')
+    logger.error(b'{"event":"b"}')
+    writer.close()
+    assert stream.getvalue().splitlines() == [b'{"event":"a"}', b'{"event":"b"}']
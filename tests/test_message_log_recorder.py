@@ -0,0 +1,48 @@
+import pytest
+
+from app.messaging.batching import BatchFlusher
+from app.messaging.log_recorder import MessageLogRecorder
+from app.repositories.db import SessionLocal
+from app.repositories.models import MessageLog
+
+
+def _rows(to: str) -> list[MessageLog]:
+    with SessionLocal() as db:
+        return db.query(MessageLog).filter(MessageLog.to == to).order_by(MessageLog.id).all()
+
+
+def test_transition_before_flush_is_a_single_insert():
+    rec = MessageLogRecorder(interval_s=60, max_items=1000)
+    uid = rec.queued(1, "5511900000001", "text", body={"body": "oi"})
+    rec.sent(uid, "wamid.A")
+    rec.stop()
+    rows = _rows("5511900000001")
+    assert len(rows) == 1
+    assert rows[0].log_uid == uid
+    assert rows[0].status == "sent" and rows[0].provider_message_id == "wamid.A"
+
+
+def test_transition_after_flush_updates_by_uid():
+    rec = MessageLogRecorder(interval_s=60, max_items=1000)
+    # Dois envios concorrentes ao mesmo número: cada transição acerta a sua linha
+    a = rec.queued(1, "5511900000002", "text", body={"body": "a"})
+    b = rec.queued(1, "5511900000002", "text", body={"body": "b"})
+    rec.flush()
+    rec.sent(a, "wamid.B")
+    rec.error(b, "x" * 200)
+    rec.stop()
+    rows = {r.log_uid: r for r in _rows("5511900000002")}
+    assert rows[a].status == "sent" and rows[a].provider_message_id == "wamid.B"
+    assert rows[b].status == "error" and len(rows[b].error_code) == 64
+
+
+def test_incomplete_flusher_fails_on_creation():
+    class _NoWrite(BatchFlusher):
+        def _drain(self):
+            return None
+
+        def _size(self):
+            return 0
+
+    with pytest.raises(TypeError):
+        _NoWrite("incomplete", 1.0, 10)
@@ -0,0 +1,102 @@
+from datetime import datetime
+
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+
+from app.main import app
+from app.repositories import models, rollups
+from app.repositories.db import SessionLocal
+from app.repositories.models import MetricRollup
+from app.repositories.tenants import get_tenant
+
+client = TestClient(app)
+
+
+def _value(tenant_id, granularity, bucket, metric):
+    with SessionLocal() as db:
+        return db.scalar(
+            select(MetricRollup.value).where(
+                MetricRollup.tenant_id == tenant_id,
+                MetricRollup.granularity == granularity,
+                MetricRollup.bucket == bucket,
+                MetricRollup.metric == metric,
+            )
+        )
+
+
+def test_writer_coalesces_and_increments_hour_and_day_rows():
+    tenant_id = get_tenant("rollup-tenant").id
+    writer = rollups.RollupWriter(interval_s=60, max_items=1000)
+    writer.add(tenant_id, rollups.INBOUND, 2, datetime(2025, 3, 4, 10, 5), "whatsapp")
+    writer.add(tenant_id, rollups.INBOUND, 1, datetime(2025, 3, 4, 10, 59), "whatsapp")
+    writer.add(tenant_id, rollups.INBOUND, 4, datetime(2025, 3, 4, 18, 0), "whatsapp")
+    assert writer._size() == 2
+    writer.flush()
+    writer.add(tenant_id, rollups.INBOUND, 1, datetime(2025, 3, 4, 10, 30), "whatsapp")
+    writer.stop()
+    assert _value(tenant_id, "hour", datetime(2025, 3, 4, 10), rollups.INBOUND) == 4
+    assert _value(tenant_id, "day", datetime(2025, 3, 4), rollups.INBOUND) == 8
+
+
+def test_backfill_rebuilds_from_message_history():
+    tenant_id = get_tenant("rollup-backfill").id
+    with SessionLocal() as db:
+        contact = models.Contact(tenant_id=tenant_id, wa_id="5511900002001", created_at=datetime(2025, 1, 10, 9, 0))
+        # Importado sem mensagem: é lead (pela criação), mas não abre conversa
+        db.add(models.Contact(tenant_id=tenant_id, wa_id="5511900002002", created_at=datetime(2025, 1, 12, 8, 0)))
+        db.add(contact)
+        db.flush()
+        conv = models.Conversation(tenant_id=tenant_id, contact_id=contact.id)
+        db.add(conv)
+        db.flush()
+        for at, direction in [
+            (datetime(2025, 1, 10, 9, 15), models.MessageDirection.inbound),
+            (datetime(2025, 1, 10, 9, 16), models.MessageDirection.outbound),
+            (datetime(2025, 2, 1, 12, 0), models.MessageDirection.inbound),
+        ]:
+            db.add(
+                models.Message(
+                    tenant_id=tenant_id, conversation_id=conv.id, direction=direction,
+                    type="text", payload={}, created_at=at,
+                )
+            )
+        db.commit()
+        # Linha antiga (contagem errada) é substituída, não somada
+        db.add(MetricRollup(tenant_id=tenant_id, channel="whatsapp", granularity="day",
+                            bucket=datetime(2025, 1, 10), metric=rollups.INBOUND, value=99))
+        db.commit()
+        rows = rollups.backfill(db, tenant_id=tenant_id, since=datetime(2025, 1, 1), until=datetime(2025, 3, 1))
+    assert rows > 0
+    assert _value(tenant_id, "day", datetime(2025, 1, 10), rollups.INBOUND) == 1
+    assert _value(tenant_id, "hour", datetime(2025, 1, 10, 9), rollups.OUTBOUND) == 1
+    assert _value(tenant_id, "day", datetime(2025, 1, 10), rollups.LEADS) == 1
+    assert _value(tenant_id, "day", datetime(2025, 1, 12), rollups.LEADS) == 1
+    assert _value(tenant_id, "day", datetime(2025, 1, 12), rollups.CONVERSATIONS) is None
+    assert _value(tenant_id, "day", datetime(2025, 1, 10), rollups.CONVERSATIONS) == 1
+    assert _value(tenant_id, "day", datetime(2025, 2, 1), rollups.CONVERSATIONS) is None
+
+    with SessionLocal() as db:
+        totals = rollups.monthly_totals(db, tenant_id, datetime(2025, 1, 1).date(), datetime(2025, 2, 28).date())
+    assert totals[(2025, 1)][rollups.INBOUND] == 1
+    assert totals[(2025, 2)][rollups.INBOUND] == 1
+
+
+def test_overview_reads_rollups():
+    rollups.clear_cache()
+    tenant_id = get_tenant("default").id
+    with SessionLocal() as db:
+        db.add_all([
+            MetricRollup(tenant_id=tenant_id, channel="whatsapp", granularity="day",
+                         bucket=datetime(2024, 5, 2), metric=rollups.LEADS, value=10),
+            MetricRollup(tenant_id=tenant_id, channel="whatsapp", granularity="day",
+                         bucket=datetime(2024, 5, 20), metric=rollups.LEADS, value=10),
+            MetricRollup(tenant_id=tenant_id, channel="whatsapp", granularity="day",
+                         bucket=datetime(2024, 5, 20), metric=rollups.PAN_PREANALISE, value=5),
+        ])
+        db.commit()
+    r = client.get("/metrics/overview", params={"start_date": "2024-04-15", "end_date": "2024-05-31"})
+    assert r.status_code == 200
+    js = r.json()
+    assert js["labels"] == ["Abr", "Mai"]
+    assert js["leads_por_mes"] == [0, 20]
+    assert js["taxa_conversao"] == [0, 25.0]
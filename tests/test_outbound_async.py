@@ -0,0 +1,207 @@
+import asyncio
+import json
+import uuid
+
+import httpx
+
+from app.core.config import settings
+from app.messaging import guards
+from app.messaging.async_sender import AsyncWhatsAppSender, PermanentSendError, text_payload
+from app.repositories.db import SessionLocal
+from app.repositories.models import Message, SuppressedContact
+from app.workers import outbound_engine, tasks_outbound
+
+
+def _sender(handler, monkeypatch) -> AsyncWhatsAppSender:
+    monkeypatch.setattr(AsyncWhatsAppSender, "_backoff", staticmethod(lambda attempt, retry_after=None: 0))
+    return AsyncWhatsAppSender(
+        token="tkn",
+        base_url="https://graph.facebook.com/v20.0",
+        phone_number_id="123",
+        max_attempts=3,
+        transport=httpx.MockTransport(handler),
+    )
+
+
+def test_async_sender_retries_transient_errors(monkeypatch):
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request.url.path)
+        if len(calls) < 3:
+            return httpx.Response(503)
+        return httpx.Response(200, json={"messages": [{"id": "wamid.ok"}]})
+
+    async def run():
+        sender = _sender(handler, monkeypatch)
+        try:
+            return await sender.send(text_payload("5561999999999", "Ola"))
+        finally:
+            await sender.aclose()
+
+    data = asyncio.run(run())
+    assert data["messages"][0]["id"] == "wamid.ok"
+    assert calls == ["/v20.0/123/messages"] * 3
+
+
+def test_async_sender_does_not_retry_client_errors(monkeypatch):
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(1)
+        return httpx.Response(400, json={"error": {"message": "invalid"}})
+
+    async def run():
+        sender = _sender(handler, monkeypatch)
+        try:
+            await sender.send(text_payload("5561999999999", "Ola"))
+        finally:
+            await sender.aclose()
+
+    try:
+        asyncio.run(run())
+        assert False, "should raise"
+    except PermanentSendError as e:
+        assert e.status_code == 400
+    assert len(calls) == 1
+
+
+class _NoRedis:
+    def register_script(self, script):
+        return None
+
+
+class _FakeSender:
+    def __init__(self, error: Exception | None = None):
+        self.error = error
+        self.sent: list[dict] = []
+
+    async def send(self, payload):
+        if self.error is not None:
+            raise self.error
+        self.sent.append(payload)
+        return {"messages": [{"id": f"wamid.{uuid.uuid4().hex}"}]}
+
+
+class _Limiter:
+    def __init__(self, waits):
+        self.waits = list(waits)
+        self.calls = []
+
+    async def acquire(self, tenant_id, wa_id):
+        self.calls.append((tenant_id, wa_id))
+        return self.waits.pop(0) if self.waits else 0.0
+
+
+def _queued_job(monkeypatch, to: str) -> str:
+    """Grava a mensagem pela task (modo async) e devolve o job que iria para a fila."""
+    jobs = []
+    monkeypatch.setattr(tasks_outbound, "within_business_hours", lambda: True)
+    monkeypatch.setattr(settings, "WA_OUTBOUND_MODE", "async")
+    monkeypatch.setattr(tasks_outbound, "enqueue_outbound", jobs.append)
+    tasks_outbound.send_text.run(settings.DEFAULT_TENANT_ID, to, "oi", f"idem-{uuid.uuid4().hex}")
+    return json.dumps(jobs[0])
+
+
+async def _drive(engine, raws: list[str]) -> None:
+    """Prepara o lote e envia, redisparando os jobs que ficaram esperando token."""
+    items = await engine._prepare(raws)
+    while items or engine._delayed:
+        await asyncio.gather(*(engine._send(item) for item in items))
+        if engine._delayed:
+            await asyncio.sleep(max(0.0, engine._delayed[0][0] - asyncio.get_running_loop().time()))
+        items = engine._due(len(engine._delayed))
+
+
+def _run(monkeypatch, raw: str, sender, limiter=None) -> Message:
+    engine = outbound_engine.OutboundEngine(_NoRedis(), sender, name="test", limiter=limiter or _Limiter([]))
+    asyncio.run(_drive(engine, [raw]))
+    outbound_engine._apply_results([res for _, res in engine._done])
+    with SessionLocal() as db:
+        return db.get(Message, json.loads(raw)["message_id"])
+
+
+def test_engine_waits_for_rate_limit_before_sending(monkeypatch):
+    monkeypatch.setattr(guards, "bulk_inside_window", lambda db, tenant_id, wa_ids: {w: True for w in wa_ids})
+    raw = _queued_job(monkeypatch, "5561966660001")
+    sender = _FakeSender()
+    limiter = _Limiter([0.01, 0.0])
+
+    msg = _run(monkeypatch, raw, sender, limiter)
+
+    assert msg.status == "sent" and msg.wa_message_id
+    assert len(limiter.calls) == 2 and limiter.calls[0][1] == "5561966660001"
+    assert len(sender.sent) == 1
+
+
+def test_rate_limited_job_releases_its_slot(monkeypatch):
+    monkeypatch.setattr(guards, "bulk_inside_window", lambda db, tenant_id, wa_ids: {w: True for w in wa_ids})
+    raw = _queued_job(monkeypatch, "5561966660006")
+    sender = _FakeSender()
+    engine = outbound_engine.OutboundEngine(_NoRedis(), sender, name="test", limiter=_Limiter([30.0]))
+
+    async def run():
+        items = await engine._prepare([raw])
+        # Sem token o envio retorna na hora (a vaga fica livre) e o job vai para a espera
+        await asyncio.wait_for(engine._send(items[0]), timeout=1)
+        return engine._due(10)
+
+    assert asyncio.run(run()) == []
+    assert len(engine._delayed) == 1 and engine._delayed[0][2][0] == raw
+    assert sender.sent == [] and engine._done == []
+
+
+def test_pre_send_checks_the_whole_batch_in_one_session(monkeypatch):
+    monkeypatch.setattr(guards, "bulk_inside_window", lambda db, tenant_id, wa_ids: {w: True for w in wa_ids})
+    raws = [_queued_job(monkeypatch, f"556196666001{i}") for i in range(3)]
+    jobs = [json.loads(raw) for raw in raws]
+    with SessionLocal() as db:
+        db.add(SuppressedContact(tenant_id=jobs[1]["tenant_id"], wa_id="5561966660011"))
+        db.commit()
+    jobs[2].pop("tenant_id")  # job antigo, sem tenant_id
+    sessions = []
+
+    def counting_session():
+        sessions.append(1)
+        return SessionLocal()
+
+    monkeypatch.setattr(outbound_engine, "SessionLocal", counting_session)
+    checks = outbound_engine._pre_send(jobs)
+
+    tenant = jobs[0]["tenant_id"]
+    assert checks == [(tenant, None), (tenant, "suppressed_contact"), (tenant, None)]
+    assert len(sessions) == 1
+
+
+def test_engine_skips_suppressed_and_out_of_window_contacts(monkeypatch):
+    monkeypatch.setattr(guards, "bulk_inside_window", lambda db, tenant_id, wa_ids: {w: False for w in wa_ids})
+    raw = _queued_job(monkeypatch, "5561966660002")
+    sender = _FakeSender()
+    msg = _run(monkeypatch, raw, sender)
+    assert msg.status == "error"
+    assert msg.payload["error"] == {"code": "outside_session_window"}
+    assert msg.payload["text"] == "oi"
+
+    monkeypatch.setattr(guards, "bulk_inside_window", lambda db, tenant_id, wa_ids: {w: True for w in wa_ids})
+    raw = _queued_job(monkeypatch, "5561966660003")
+    with SessionLocal() as db:
+        db.add(SuppressedContact(tenant_id=json.loads(raw)["tenant_id"], wa_id="5561966660003"))
+        db.commit()
+    msg = _run(monkeypatch, raw, sender)
+    assert msg.status == "error"
+    assert msg.payload["error"] == {"code": "suppressed_contact"}
+    assert sender.sent == []
+
+
+def test_engine_records_provider_error_code(monkeypatch):
+    monkeypatch.setattr(guards, "bulk_inside_window", lambda db, tenant_id, wa_ids: {w: True for w in wa_ids})
+    raw = _queued_job(monkeypatch, "5561966660004")
+    body = json.dumps({"error": {"message": "Re-engagement message", "code": 131047}})
+    msg = _run(monkeypatch, raw, _FakeSender(PermanentSendError(400, body)))
+    assert msg.status == "error"
+    assert msg.payload["error"] == {"code": "http_400", "provider_code": 131047}
+
+    raw = _queued_job(monkeypatch, "5561966660005")
+    msg = _run(monkeypatch, raw, _FakeSender(httpx.ConnectError("boom")))
+    assert msg.status == "error"
+    assert msg.payload["error"] == {"code": "ConnectError"}
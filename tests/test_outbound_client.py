@@ -2,6 +2,7 @@ import respx
 import httpx
 from app.domain.messaging.wa_client import WhatsAppClient
 from app.core.config import settings
+from app.core.metrics import WA_SEND_ERRORS, WA_SEND_SECONDS
 
 
 @respx.mock
@@ -26,3 +27,32 @@ def test_wa_client_send_text_error_401():
         assert False, "should raise"
     except httpx.HTTPStatusError as e:
         assert e.response.status_code == 401
+
+
+def _sample(metric, suffix, **labels) -> float:
+    for m in metric.collect():
+        for s in m.samples:
+            if s.name.endswith(suffix) and all(s.labels.get(k) == v for k, v in labels.items()):
+                return s.value
+    return 0.0
+
+
+@respx.mock
+def test_wa_client_records_send_metrics():
+    client = WhatsAppClient(token="tkn", base_url="https://graph.facebook.com/v20.0", phone_number_id="123")
+    respx.post("https://graph.facebook.com/v20.0/123/messages").mock(
+        side_effect=[
+            httpx.Response(200, json={"messages": [{"id": "wamid.abc"}]}),
+            httpx.Response(429, json={"error": {"code": 4}}),
+        ]
+    )
+    sends = _sample(WA_SEND_SECONDS, "_count", provider="cloud_celery")
+    errors = _sample(WA_SEND_ERRORS, "_total", provider="cloud_celery", code="429")
+    client.send_text(to_wa_id="5561999999999", text="Ola")
+    try:
+        client.send_template(to_wa_id="5561999999999", template_name="boas_vindas")
+        assert False, "should raise"
+    except httpx.HTTPStatusError:
+        pass
+    assert _sample(WA_SEND_SECONDS, "_count", provider="cloud_celery") == sends + 2
+    assert _sample(WA_SEND_ERRORS, "_total", provider="cloud_celery", code="429") == errors + 1
@@ -0,0 +1,94 @@
+import uuid
+
+import pytest
+
+from app.core.config import settings
+from app.repositories.db import SessionLocal
+from app.repositories import rollups
+from app.repositories.models import Message
+from app.workers import tasks_outbound
+
+
+def _messages(key: str) -> int:
+    with SessionLocal() as db:
+        return db.query(Message).filter(Message.idempotency_key == key).count()
+
+
+def test_concurrent_duplicate_is_rejected_by_unique_key(monkeypatch):
+    monkeypatch.setattr(tasks_outbound, "within_business_hours", lambda: True)
+    monkeypatch.setattr(settings, "WA_OUTBOUND_MODE", "async")
+    monkeypatch.setattr(tasks_outbound, "enqueue_outbound", lambda job: None)
+    key = f"idem-{uuid.uuid4().hex}"
+
+    first = tasks_outbound.send_text.run(settings.DEFAULT_TENANT_ID, "5561977776666", "oi", key)
+    assert first["status"] == "queued"
+    # Outra entrega que passou pela consulta antes do commit da primeira
+    monkeypatch.setattr(tasks_outbound, "_find_by_idempotency_key", lambda db, tenant_id, k: None)
+    second = tasks_outbound.send_text.run(settings.DEFAULT_TENANT_ID, "5561977776666", "oi", key)
+    assert second == {"status": "duplicate"}
+    assert _messages(key) == 1
+
+
+class _FlakyClient:
+    def __init__(self, failures: int):
+        self.failures = failures
+        self.calls = 0
+
+    def send_text(self, to_wa_id, text):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise RuntimeError("http_503")
+        return {"messages": [{"id": f"wamid.{uuid.uuid4().hex}"}]}
+
+
+def test_retry_reuses_message_and_counts_outbound_once(monkeypatch):
+    monkeypatch.setattr(tasks_outbound, "within_business_hours", lambda: True)
+    monkeypatch.setattr(settings, "WA_OUTBOUND_MODE", "celery")
+    client = _FlakyClient(failures=1)
+    monkeypatch.setattr(tasks_outbound, "get_wa_client", lambda: client)
+    outbound = []
+    monkeypatch.setattr(
+        rollups, "record", lambda tenant_id, metric, n=1, at=None, channel="whatsapp": outbound.append(metric)
+    )
+    retried = {}
+
+    def _retry(exc=None, countdown=None, kwargs=None, **_):  # type: ignore[no-untyped-def]
+        retried.update(kwargs)
+        return exc
+
+    monkeypatch.setattr(tasks_outbound.send_text, "retry", _retry)
+    key = f"idem-{uuid.uuid4().hex}"
+
+    with pytest.raises(tasks_outbound.TransientSendError):
+        tasks_outbound.send_text.run(settings.DEFAULT_TENANT_ID, "5561977775555", "oi", key)
+    assert retried["message_id"]
+    done = tasks_outbound.send_text.run(settings.DEFAULT_TENANT_ID, "5561977775555", "oi", key, **retried)
+
+    assert done["status"] == "sent"
+    assert _messages(key) == 1
+    with SessionLocal() as db:
+        assert db.get(Message, retried["message_id"]).status == "sent"
+    assert outbound.count(rollups.OUTBOUND) == 1
+
+
+def test_duplicate_delivery_skips_before_resolving_conversation(monkeypatch):
+    monkeypatch.setattr(tasks_outbound, "within_business_hours", lambda: True)
+    monkeypatch.setattr(settings, "WA_OUTBOUND_MODE", "async")
+    monkeypatch.setattr(tasks_outbound, "enqueue_outbound", lambda job: None)
+    key = f"idem-{uuid.uuid4().hex}"
+    first = tasks_outbound.send_template.run(
+        settings.DEFAULT_TENANT_ID, "5561977774444", "boas_vindas", idempotency_key=key
+    )
+    assert first["status"] == "queued"
+
+    def _resolve(*args, **kwargs):  # type: ignore[no-untyped-def]
+        raise AssertionError("duplicate must not touch contacts/conversations")
+
+    monkeypatch.setattr(tasks_outbound, "resolve_conversation", _resolve)
+    outbound = []
+    monkeypatch.setattr(rollups, "record", lambda *args, **kwargs: outbound.append(args))
+    assert tasks_outbound.send_text.run(settings.DEFAULT_TENANT_ID, "5561977774444", "oi", key) == {"status": "duplicate"}
+    assert tasks_outbound.send_template.run(
+        settings.DEFAULT_TENANT_ID, "5561977774444", "boas_vindas", idempotency_key=key
+    ) == {"status": "duplicate"}
+    assert outbound == []
@@ -0,0 +1,64 @@
+from fastapi.testclient import TestClient
+
+from app.api.pagination import NEXT_CURSOR_HEADER, encode_cursor
+from app.core.config import settings
+from app.main import app
+from app.repositories import catalog_index
+from app.repositories.db import engine, SessionLocal
+from app.repositories.models import Base, Vehicle
+from app.repositories.tenants import get_tenant
+
+client = TestClient(app)
+
+BRAND = "PaginaTeste"
+
+
+def setup_module(module):
+    Base.metadata.create_all(bind=engine)
+    tenant_id = get_tenant(settings.DEFAULT_TENANT_ID).id
+    with SessionLocal() as db:
+        db.query(Vehicle).filter(Vehicle.brand == BRAND).delete()
+        db.add_all(Vehicle(tenant_id=tenant_id, title=f"Carro {i}", brand=BRAND, active=True) for i in range(7))
+        db.commit()
+    catalog_index.invalidate()
+
+
+def test_keyset_pages_are_stable_and_complete():
+    seen: list[int] = []
+    cursor = ""
+    pages = 0
+    while True:
+        r = client.get("/veiculos", params={"marca": BRAND, "limit": 3, "cursor": cursor})
+        assert r.status_code == 200, r.text
+        body = r.json()
+        seen.extend(v["id"] for v in body["items"])
+        assert r.headers.get(NEXT_CURSOR_HEADER) == body["next_cursor"]
+        pages += 1
+        if not body["next_cursor"]:
+            break
+        # Inserção nova no topo não desloca as páginas seguintes
+        if pages == 1:
+            tenant_id = get_tenant(settings.DEFAULT_TENANT_ID).id
+            with SessionLocal() as db:
+                db.add(Vehicle(tenant_id=tenant_id, title="Carro novo", brand=BRAND, active=True))
+                db.commit()
+            catalog_index.invalidate()  # próxima página já vem do snapshot novo
+        cursor = body["next_cursor"]
+
+    assert pages == 3
+    assert len(seen) == 7
+    assert seen == sorted(seen, reverse=True)
+
+
+def test_offset_mode_keeps_plain_list_and_sends_cursor_header():
+    r = client.get("/veiculos", params={"marca": BRAND, "limit": 2, "offset": 1})
+    assert r.status_code == 200
+    assert isinstance(r.json(), list) and len(r.json()) == 2
+    assert r.headers.get(NEXT_CURSOR_HEADER)
+
+
+def test_invalid_cursor():
+    for cursor in ("%%%", encode_cursor([1, 2])):
+        r = client.get("/veiculos", params={"cursor": cursor})
+        assert r.status_code == 400
+        assert r.json()["error"]["code"] == "invalid_cursor"
@@ -0,0 +1,216 @@
+import json
+import time
+import uuid
+
+from fastapi.testclient import TestClient
+
+from app.api.routes import webhook as webhook_module
+from app.main import app
+from app.core.config import settings
+from app.messaging.inbound import decode_payload, iter_text_messages
+from app.messaging.partitioning import partition_for, split_payload, stream_key
+from app.workers.webhook_consumer import PartitionedConsumer
+
+
+class _FakePipelineRedis:
+    def __init__(self):
+        self.added = []
+
+    def pipeline(self, transaction=True):
+        return self
+
+    def xadd(self, name, fields, maxlen=None, approximate=True):
+        self.added.append((name, fields))
+
+    def execute(self):
+        return []
+
+
+def _payload(wa_ids):
+    return {
+        "object": "whatsapp_business_account",
+        "entry": [
+            {
+                "id": "E1",
+                "changes": [
+                    {
+                        "field": "messages",
+                        "value": {
+                            "metadata": {"phone_number_id": "1"},
+                            "contacts": [{"wa_id": w} for w in wa_ids],
+                            "messages": [
+                                {"id": f"wamid.{w}", "from": w, "type": "text", "text": {"body": f"oi {w}"}}
+                                for w in wa_ids
+                            ],
+                        },
+                    }
+                ],
+            }
+        ],
+    }
+
+
+def test_partition_is_stable_and_moves_little_when_growing():
+    ids = [f"5511{i:09d}" for i in range(2000)]
+    assert all(partition_for(w, 8) == partition_for(w, 8) for w in ids)
+    assert {partition_for(w, 8) for w in ids} == set(range(8))
+    moved = sum(partition_for(w, 8) != partition_for(w, 9) for w in ids)
+    assert moved < len(ids) * 0.2  # ~1/9 esperado
+
+
+def test_split_payload_keeps_each_contact_whole():
+    wa_ids = [f"5511{i:09d}" for i in range(20)]
+    parts = split_payload(_payload(wa_ids), 4)
+    assert len(parts) > 1
+    seen = []
+    for p, part in parts.items():
+        for item in iter_text_messages(part):
+            assert partition_for(item.wa_id, 4) == p
+            assert item.text == f"oi {item.wa_id}"
+            seen.append(item.wa_id)
+        assert part["entry"][0]["changes"][0]["value"]["metadata"] == {"phone_number_id": "1"}
+    assert sorted(seen) == sorted(wa_ids)
+    # Um único contato: payload original, sem cópia
+    single = _payload(["5511000000001"])
+    assert split_payload(single, 4) == {partition_for("5511000000001", 4): single}
+
+
+def test_webhook_stream_mode_routes_to_partition(monkeypatch):
+    from app.api.routes import webhook as webhook_module
+
+    fake = _FakePipelineRedis()
+    monkeypatch.setattr(webhook_module, "_redis", lambda: fake)
+    monkeypatch.setattr(settings, "WEBHOOK_INGEST_MODE", "stream")
+    monkeypatch.setattr(settings, "WEBHOOK_STREAM_PARTITIONS", 4)
+
+    resp = TestClient(app).post("/webhook", json=_payload(["5561999999999"]))
+    assert resp.json() == {"received": True, "queued": True}
+    [(name, fields)] = fake.added
+    assert name == stream_key(partition_for("5561999999999", 4), 4)
+    assert decode_payload(fields["body"]) == _payload(["5561999999999"])
+
+
+class _FakeShardRedis:
+    """Leases (SET NX + scripts de renovação/liberação) e streams com grupo, em memória."""
+
+    def __init__(self):
+        self.kv: dict[str, str] = {}
+        self.entries: dict[str, list] = {}
+        self.delivered: dict[str, int] = {}
+        self.pending: dict[str, dict] = {}
+        self.idles: list[int] = []
+        self.renewals = 0
+
+    def set(self, key, value, nx=False, px=None):
+        if nx and key in self.kv:
+            return None
+        self.kv[key] = value
+        return True
+
+    def register_script(self, lua):
+        renew = "PEXPIRE" in lua
+
+        def run(keys, args):  # type: ignore[no-untyped-def]
+            if self.kv.get(keys[0]) != args[0]:
+                return 0
+            if renew:
+                self.renewals += 1
+            else:
+                del self.kv[keys[0]]
+            return 1
+
+        return run
+
+    def xadd(self, name, fields, maxlen=None, approximate=True):
+        items = self.entries.setdefault(name, [])
+        items.append((f"{len(items) + 1}-0", fields))
+
+    def xreadgroup(self, group, consumer, streams, count=None, block=None):
+        out = []
+        for name in streams:
+            start = self.delivered.get(name, 0)
+            new = self.entries.get(name, [])[start:]
+            self.delivered[name] = start + len(new)
+            for msg_id, fields in new:
+                self.pending.setdefault(name, {})[msg_id] = {"fields": fields, "times_delivered": 1}
+            if new:
+                out.append((name, new))
+        return out
+
+    def xpending_range(self, name, group, min, max, count, idle=None):
+        self.idles.append(idle)
+        return [{"message_id": k, "times_delivered": v["times_delivered"]} for k, v in self.pending.get(name, {}).items()]
+
+    def xclaim(self, name, group, consumer, min_idle_time, message_ids):
+        return [(m, self.pending[name][m]["fields"]) for m in message_ids]
+
+    def xack(self, name, group, *ids):
+        for m in ids:
+            self.pending.get(name, {}).pop(m, None)
+
+
+def test_partitioned_consumer_does_not_ack_after_losing_lease(monkeypatch):
+    stream = f"{settings.WEBHOOK_STREAM_KEY}:test-lease"
+    fake = _FakeShardRedis()
+    wa_id = "5561955554444"
+    payload = _payload([wa_id])
+    payload["entry"][0]["changes"][0]["value"]["messages"][0]["id"] = f"wamid.{uuid.uuid4().hex}"
+    fake.xadd(stream, {"body": json.dumps(payload)})
+    consumer = PartitionedConsumer(fake, "node-a", streams=[stream], lease_ms=1000)
+
+    def slow_bot(wa_id, text):  # type: ignore[no-untyped-def]
+        # O lote demorou mais que o lease: outro nó assumiu o shard
+        fake.kv[consumer.lease_key(stream)] = "node-b"
+
+    monkeypatch.setattr(webhook_module, "handle_text_message", slow_bot)
+    assert consumer.step() == 0
+    assert fake.pending[stream]  # fica pendente para o novo dono
+    assert consumer.owned == []
+
+
+def _queued(fake, stream, wa_ids):  # type: ignore[no-untyped-def]
+    for wa_id in wa_ids:
+        payload = _payload([wa_id])
+        payload["entry"][0]["changes"][0]["value"]["messages"][0]["id"] = f"wamid.{uuid.uuid4().hex}"
+        fake.xadd(stream, {"body": json.dumps(payload)})
+
+
+def test_partitioned_consumer_renews_lease_during_slow_batch(monkeypatch):
+    stream = f"{settings.WEBHOOK_STREAM_KEY}:test-heartbeat"
+    fake = _FakeShardRedis()
+    _queued(fake, stream, ["5561955554450"])
+    consumer = PartitionedConsumer(fake, "node-a", streams=[stream], lease_ms=60)
+    monkeypatch.setattr(webhook_module, "handle_text_message", lambda wa_id, text: time.sleep(0.2))
+
+    assert consumer.step() == 1
+    # Renovado em segundo plano enquanto o bot rodava (mais que o antes/depois do lote)
+    assert fake.renewals >= 5
+    assert not fake.pending[stream]
+
+
+def test_partitioned_consumer_stops_batch_when_lease_is_lost(monkeypatch):
+    stream = f"{settings.WEBHOOK_STREAM_KEY}:test-lost"
+    fake = _FakeShardRedis()
+    _queued(fake, stream, ["5561955554451", "5561955554452"])
+    consumer = PartitionedConsumer(fake, "node-a", streams=[stream], lease_ms=60)
+    handled = []
+
+    def slow_bot(wa_id, text):  # type: ignore[no-untyped-def]
+        handled.append(wa_id)
+        fake.kv[consumer.lease_key(stream)] = "node-b"
+        time.sleep(0.1)
+
+    monkeypatch.setattr(webhook_module, "handle_text_message", slow_bot)
+    assert consumer.step() == 0
+    assert handled == ["5561955554451"]
+    assert len(fake.pending[stream]) == 2
+    assert consumer.owned == []
+
+
+def test_partitioned_consumer_reclaims_immediately_only_after_acquiring():
+    stream = f"{settings.WEBHOOK_STREAM_KEY}:test-idle"
+    fake = _FakeShardRedis()
+    consumer = PartitionedConsumer(fake, "node-a", streams=[stream], lease_ms=1000, reclaim_idle_ms=60000)
+    consumer.step()
+    consumer.step()
+    assert fake.idles == [0, 60000]
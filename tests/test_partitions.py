@@ -0,0 +1,80 @@
+from datetime import date
+
+from app.repositories import partitions
+from app.repositories.models import Base
+
+
+def test_month_helpers_and_partition_names():
+    assert partitions.add_months(date(2025, 11, 1), 3) == date(2026, 2, 1)
+    assert partitions.add_months(date(2025, 1, 1), -1) == date(2024, 12, 1)
+    name = partitions.partition_name("message_logs", date(2025, 1, 1))
+    assert name == "message_logs_p2025_01"
+    assert partitions.partition_month("message_logs", name) == date(2025, 1, 1)
+    # Partição de outra tabela com prefixo parecido não é confundida
+    assert partitions.partition_month("messages", name) is None
+    assert "FROM ('2025-12-01') TO ('2026-01-01')" in partitions.create_partition_sql("messages", date(2025, 12, 1))
+
+
+def test_unique_indexes_include_partition_key():
+    stmts = partitions.index_sql(Base.metadata.tables["messages"])
+    assert stmts[0] == 'ALTER TABLE "messages" ADD PRIMARY KEY (id, created_at)'
+    assert 'CREATE UNIQUE INDEX IF NOT EXISTS "uix_wa_message_id" ON "messages" (tenant_id, wa_message_id, created_at)' in stmts
+    assert any("REFERENCES \"conversations\" (id)" in s for s in stmts)
+
+
+def test_global_uniqueness_is_kept_in_key_table():
+    messages = Base.metadata.tables["messages"]
+    assert [ix.name for ix in partitions.unique_guards(messages)] == ["uix_idempotency_key", "uix_wa_message_id"]
+    assert [ix.name for ix in partitions.unique_guards(Base.metadata.tables["message_logs"])] == ["uq_msglog_log_uid"]
+    assert partitions.guard_sql(Base.metadata.tables["conversation_events"]) == []
+
+    stmts = partitions.guard_sql(messages)
+    assert "PRIMARY KEY (idx, key)" in stmts[0]
+    fn = next(s for s in stmts if s.startswith("CREATE OR REPLACE FUNCTION"))
+    # Chave global sem created_at; o UPDATE que grava o wamid depois do envio também é coberto
+    assert "'uix_wa_message_id', concat_ws(chr(31), NEW.tenant_id::text, NEW.wa_message_id::text)" in fn
+    assert "NEW.tenant_id IS NOT NULL AND NEW.wa_message_id IS NOT NULL" in fn
+    assert stmts[-1].startswith('CREATE TRIGGER "messages_unique_guard" BEFORE INSERT OR UPDATE OR DELETE ON "messages"')
+    # Linha apagada (retenção por tenant, arquivamento) leva a chave junto
+    assert (
+        "IF TG_OP = 'DELETE' THEN\n    IF OLD.tenant_id IS NOT NULL AND OLD.idempotency_key IS NOT NULL THEN\n"
+        "      DELETE FROM partition_unique_keys WHERE idx = 'uix_idempotency_key'"
+    ) in fn
+    assert "RETURN OLD;" in fn
+    (orphans,) = partitions.orphan_keys_sql(Base.metadata.tables["message_logs"])
+    assert "NOT EXISTS" in orphans and "k.idx = 'uq_msglog_log_uid'" in orphans
+    (backfill,) = partitions.backfill_keys_sql(Base.metadata.tables["message_logs"])
+    assert "ON CONFLICT DO NOTHING" in backfill and "log_uid IS NOT NULL" in backfill
+
+
+def test_retention_plan_uses_longest_policy_for_partition_drops():
+    today = date(2026, 6, 15)
+    global_cutoff, per_tenant = partitions.plan_retention({1: 12, 2: 3}, today)
+    assert global_cutoff == date(2025, 6, 1)
+    assert per_tenant == {2: date(2026, 3, 1)}
+    # Um tenant sem expiração impede remover partições inteiras
+    global_cutoff, per_tenant = partitions.plan_retention({1: 0, 2: 3}, today)
+    assert global_cutoff is None
+    assert per_tenant == {2: date(2026, 3, 1)}
+
+
+def test_maintenance_is_noop_outside_postgres():
+    from app.repositories.db import engine
+
+    assert partitions.run_maintenance(engine) == {}
+
+
+def test_batched_deletes_commit_each_batch():
+    from sqlalchemy import create_engine, event, text
+
+    engine = create_engine("sqlite://")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE t (id INTEGER PRIMARY KEY)"))
+        conn.execute(text("INSERT INTO t (id) VALUES (:id)"), [{"id": i} for i in range(12000)])
+    commits = []
+    event.listen(engine, "commit", lambda conn: commits.append(1))
+    stmt = text(f"DELETE FROM t WHERE rowid IN (SELECT rowid FROM t LIMIT {partitions._DELETE_BATCH})")
+
+    assert partitions._delete_batches(engine, stmt, {}) == 12000
+    # 5000 + 5000 + 2000: um commit por lote, não uma transação para todos
+    assert len(commits) == 3
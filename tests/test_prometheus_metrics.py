@@ -0,0 +1,35 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core.metrics import EXTERNAL_CALL_SECONDS, timed_external
+from app.main import app
+
+client = TestClient(app)
+
+
+def _count(metric, **labels) -> float:
+    for m in metric.collect():
+        for s in m.samples:
+            if s.name.endswith("_count") and all(s.labels.get(k) == v for k, v in labels.items()):
+                return s.value
+    return 0.0
+
+
+def test_metrics_endpoint_exposes_http_histogram():
+    client.get("/veiculos/999999")
+    resp = client.get("/metrics")
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/plain")
+    assert 'atendeja_http_request_seconds_bucket{le="0.005",method="GET",route="/veiculos/{vehicle_id}"' in resp.text
+
+
+def test_timed_external_labels_outcome():
+    before_ok = _count(EXTERNAL_CALL_SECONDS, service="pan", operation="token", outcome="ok")
+    before_err = _count(EXTERNAL_CALL_SECONDS, service="pan", operation="token", outcome="error")
+    with timed_external("pan", "token"):
+        pass
+    with pytest.raises(RuntimeError):
+        with timed_external("pan", "token"):
+            raise RuntimeError("boom")
+    assert _count(EXTERNAL_CALL_SECONDS, service="pan", operation="token", outcome="ok") == before_ok + 1
+    assert _count(EXTERNAL_CALL_SECONDS, service="pan", operation="token", outcome="error") == before_err + 1
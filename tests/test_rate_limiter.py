@@ -0,0 +1,72 @@
+import asyncio
+
+from app.messaging.limits import AsyncRateLimiter, RateLimiter, RateLimitedError
+
+
+def _memory_limiter(**kwargs) -> RateLimiter:
+    limiter = RateLimiter(**kwargs)
+    # Força o fallback em memória (sem Redis nos testes)
+    limiter._redis_down_until = float("inf")
+    return limiter
+
+
+def test_per_contact_interval_and_retry_after():
+    limiter = _memory_limiter(por_contato_interval_s=2, global_per_minute=100)
+    assert limiter.acquire("1", "5511") == 0.0
+    wait = limiter.acquire("1", "5511")
+    assert 0 < wait <= 2
+    # Outro contato não é afetado
+    assert limiter.allow("1", "5522")
+
+
+def test_global_budget_per_tenant():
+    limiter = _memory_limiter(por_contato_interval_s=1, global_per_minute=3)
+    assert all(limiter.allow("1", f"55{i}") for i in range(3))
+    try:
+        limiter.check("1", "55999")
+        assert False, "should raise"
+    except RateLimitedError as e:
+        assert str(e) == "rate_limited_or_global_limit"
+        assert e.retry_after > 0
+    # Orçamento é por tenant
+    assert limiter.allow("2", "55999")
+
+
+def test_memory_fallback_is_bounded():
+    limiter = _memory_limiter(por_contato_interval_s=1, global_per_minute=10**6, mem_max_contacts=50)
+    for i in range(500):
+        limiter.acquire("1", f"55{i}")
+    assert len(limiter._mem) == 50
+
+
+class _AsyncScriptRedis:
+    """Cliente async mínimo: o script devolve as respostas dadas (exceção = Redis fora)."""
+
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.calls = []
+
+    def register_script(self, source):
+        async def script(keys, args):
+            self.calls.append((keys, args))
+            reply = self.replies.pop(0)
+            if isinstance(reply, Exception):
+                raise reply
+            return reply
+
+        return script
+
+
+def test_async_limiter_uses_shared_keys_and_falls_back_to_memory():
+    r = _AsyncScriptRedis([[1, 0], [0, 1500], ConnectionError("down")])
+    limiter = AsyncRateLimiter(r, por_contato_interval_s=2, global_per_minute=60)
+
+    async def run():
+        return [await limiter.acquire(7, "5511") for _ in range(4)]
+
+    first, second, third, fourth = asyncio.run(run())
+    assert (first, second) == (0.0, 1.5)
+    assert r.calls[0] == (["rl:7:5511", "rlg:7"], [2000, 60, 60000])
+    # Redis caiu: o fallback em memória assume e o Redis não é chamado de novo em seguida
+    assert third == 0.0 and 0 < fourth <= 2
+    assert len(r.calls) == 3
@@ -0,0 +1,63 @@
+import time
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from app.main import app
+from app.core.config import settings
+from app.repositories import tenants as tenant_repo
+from app.repositories.db import engine
+from app.repositories.tenants import TenantCache
+
+from tests.test_admin_users import _ensure_admin, _login
+
+client = TestClient(app)
+
+
+def _count_statements(fn):  # type: ignore[no-untyped-def]
+    statements: list[str] = []
+
+    def _count(conn, cursor, statement, *args):  # type: ignore[no-untyped-def]
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", _count)
+    try:
+        fn()
+    finally:
+        event.remove(engine, "before_cursor_execute", _count)
+    return len(statements)
+
+
+def test_cache_hit_skips_database_and_respects_bounds():
+    cache = TenantCache(ttl_s=60, max_size=2)
+    first = cache.get("cache-a")
+    assert first is not None and first.name == "cache-a"
+    assert _count_statements(lambda: cache.get("cache-a")) == 0
+    assert _count_statements(lambda: cache.get_by_id(first.id)) == 0
+
+    cache.get("cache-b")
+    cache.get("cache-c")  # excede max_size: "cache-a" (LRU) sai
+    assert _count_statements(lambda: cache.get("cache-a")) > 0
+
+
+def test_cache_ttl_expires():
+    cache = TenantCache(ttl_s=0.01, max_size=10)
+    cache.get("cache-ttl")
+    time.sleep(0.02)
+    assert _count_statements(lambda: cache.get("cache-ttl")) > 0
+
+
+def test_settings_update_invalidates_cache():
+    email, password = _ensure_admin()
+    headers = {"Authorization": f"Bearer {_login(email, password)}"}
+    before = tenant_repo.get_tenant(settings.DEFAULT_TENANT_ID)
+    assert before.setting("alerts_enabled") is None
+
+    r = client.patch("/admin/tenant/settings", json={"settings": {"alerts_enabled": True}}, headers=headers)
+    assert r.status_code == 200, r.text
+    assert tenant_repo.get_tenant(settings.DEFAULT_TENANT_ID).setting("alerts_enabled") is True
+
+    r = client.patch("/admin/tenant/settings", json={"settings": {"alerts_enabled": None}}, headers=headers)
+    assert r.status_code == 200, r.text
+    r = client.get("/admin/tenant/settings", headers=headers)
+    assert "alerts_enabled" not in r.json()["settings"]
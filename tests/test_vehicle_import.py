@@ -0,0 +1,118 @@
+import dataclasses
+import io
+
+import pytest
+
+from app.repositories import catalog, imports, vehicle_import
+from app.repositories.db import engine, SessionLocal
+from app.repositories.models import Base, Vehicle
+
+TENANT = 77
+
+
+def setup_module(module):
+    Base.metadata.create_all(bind=engine)
+    with SessionLocal() as db:
+        db.query(Vehicle).filter(Vehicle.tenant_id == TENANT).delete()
+        db.commit()
+
+
+def _import(
+    csv_text: str, encoding: str = "utf-8", chunk_rows: int = 2, mode: str = "upsert", tenant_id: int = TENANT
+) -> dict:
+    with SessionLocal() as db:
+        job = imports.create_job(db, "vehicles", tenant_id, io.BytesIO(csv_text.encode(encoding)), "v.csv", mode)
+    return imports.run_job(job.id, chunk_rows=chunk_rows)
+
+
+def _vehicles(tenant_id: int = TENANT) -> dict[tuple, Vehicle]:
+    with SessionLocal() as db:
+        return {(v.title, v.year): v for v in db.query(Vehicle).filter(Vehicle.tenant_id == tenant_id)}
+
+
+def test_chunked_upsert_counts_and_coalesce():
+    csv_text = (
+        "\ufefftitle,brand,year,price,active\n"
+        "Argo,Fiat,2022,\"75.000,00\",1\n"
+        "Onix,GM,,60000,1\n"
+        ",sem titulo,2020,1,1\n"
+        "Argo,,2022,,1\n"  # repetida no arquivo: não apaga a marca
+        "Kwid,Renault,2021,50000,0\n"
+    )
+    stats = _import(csv_text)
+    assert (stats["processed"], stats["inserted"], stats["updated"], stats["rejected"]) == (4, 3, 1, 1)
+    rows = _vehicles()
+    assert rows[("Argo", 2022)].brand == "Fiat"
+    assert rows[("Argo", 2022)].price == 75000.0
+    assert rows[("Kwid", 2021)].active is False
+
+    # Reimportação: mesma chave (inclusive sem ano) atualiza em vez de duplicar
+    stats = _import("title,brand,year,price\nOnix,Chevrolet,,61000\nKwid,,2021,\n", chunk_rows=1000)
+    assert (stats["inserted"], stats["updated"]) == (0, 2)
+    rows = _vehicles()
+    assert len(rows) == 3
+    assert rows[("Onix", None)].brand == "Chevrolet"
+    assert rows[("Kwid", 2021)].price == 50000.0
+    assert rows[("Kwid", 2021)].active is True
+
+
+def test_latin1_upload_is_decoded():
+    stats = _import("title,brand,year\nCaminhão Baú,Agrale,2019\n", encoding="latin-1")
+    assert stats["inserted"] == 1
+    assert ("Caminhão Baú", 2019) in _vehicles()
+
+
+def test_sync_skips_unchanged_rows_and_deactivates_missing(monkeypatch):
+    bumps: list[int] = []
+    monkeypatch.setattr(catalog, "bump_version", bumps.append)
+    tenant = TENANT + 1
+    feed = "title,brand,year,price\nArgo,Fiat,2022,70000\nMobi,Fiat,2021,50000\nPulse,Fiat,2023,90000\n"
+    out = _import(feed, mode="sync", tenant_id=tenant)
+    assert (out["inserted"], out["deactivated"]) == (3, 0)
+    assert bumps
+
+    # Reenvio idêntico: nada é escrito e a versão do catálogo não muda
+    bumps.clear()
+    out = _import(feed, mode="sync", tenant_id=tenant)
+    assert (out["inserted"], out["updated"], out["unchanged"], out["deactivated"]) == (0, 0, 3, 0)
+    assert bumps == []
+
+    # Preço alterado + Pulse fora do feed
+    out = _import("title,brand,year,price\nArgo,Fiat,2022,69000\nMobi,Fiat,2021,50000\n", mode="sync", tenant_id=tenant)
+    assert (out["updated"], out["unchanged"], out["deactivated"]) == (1, 1, 1)
+    rows = _vehicles(tenant)
+    assert rows[("Argo", 2022)].price == 69000.0
+    assert rows[("Pulse", 2023)].active is False
+    assert bumps == [tenant, tenant]
+
+    # Volta no feed: reativado mesmo com o conteúdo igual ao de antes
+    out = _import(feed, mode="sync", tenant_id=tenant)
+    assert out["unchanged"] == 1 and out["deactivated"] == 0
+    assert all(v.active for v in _vehicles(tenant).values())
+
+
+def test_resumed_sync_keeps_keys_from_committed_chunks(monkeypatch):
+    monkeypatch.setattr(catalog, "bump_version", lambda tenant_id: None)
+    tenant = TENANT + 2
+    _import("title,year\nA,2020\nB,2020\nC,2020\nD,2020\n", mode="sync", tenant_id=tenant)
+
+    real_upsert = vehicle_import.upsert_chunk
+    calls = []
+
+    def flaky(db, tenant_id, rows):
+        calls.append(len(rows))
+        if len(calls) == 2:
+            raise RuntimeError("boom")
+        return real_upsert(db, tenant_id, rows)
+
+    monkeypatch.setitem(
+        imports.IMPORTERS, "vehicles", dataclasses.replace(imports.IMPORTERS["vehicles"], upsert=flaky)
+    )
+    with SessionLocal() as db:
+        job = imports.create_job(db, "vehicles", tenant, io.BytesIO(b"title,year\nA,2020\nB,2020\nC,2020\n"), mode="sync")
+    with pytest.raises(RuntimeError):
+        imports.run_job(job.id, chunk_rows=2)
+    out = imports.run_job(job.id, chunk_rows=2)
+    # A e B vieram do lote gravado antes da falha: só D sai do catálogo
+    assert out["deactivated"] == 1
+    assert {k[0] for k, v in _vehicles(tenant).items() if v.active} == {"A", "B", "C"}
@@ -0,0 +1,73 @@
+from app.api.routes import webhook as webhook_module
+from app.messaging.dedup import WebhookDeduplicator
+from app.messaging.inbound import InboundText
+
+
+class _FakeRedis:
+    """SET NX EX compartilhado entre "réplicas"; conta round trips (execute)."""
+
+    def __init__(self):
+        self.keys = set()
+        self.round_trips = 0
+
+    def pipeline(self, transaction=False):
+        return _FakePipe(self)
+
+
+class _FakePipe:
+    def __init__(self, r):
+        self.r = r
+        self.ops = []
+
+    def set(self, key, value, nx=False, ex=None):
+        assert nx and ex
+        self.ops.append(key)
+
+    def execute(self):
+        self.r.round_trips += 1
+        out = []
+        for key in self.ops:
+            out.append(None if key in self.r.keys else True)
+            self.r.keys.add(key)
+        return out
+
+
+def test_batch_is_one_round_trip_and_local_lru_absorbs_retries():
+    r = _FakeRedis()
+    dedup = WebhookDeduplicator(ttl_s=60, local_max=100, redis_client=r)
+    assert dedup.duplicates(["a", "b", "c"]) == set()
+    assert r.round_trips == 1
+    # Retry da Meta no mesmo processo: não vai ao Redis
+    assert dedup.duplicates(["a", "b"]) == {"a", "b"}
+    assert r.round_trips == 1
+
+
+def test_two_replicas_only_one_processes():
+    r = _FakeRedis()
+    api1 = WebhookDeduplicator(ttl_s=60, local_max=100, redis_client=r)
+    api2 = WebhookDeduplicator(ttl_s=60, local_max=100, redis_client=r)
+    assert api1.duplicates(["wamid.X"]) == set()
+    assert api2.duplicates(["wamid.X", "wamid.Y"]) == {"wamid.X"}
+
+
+def test_drop_duplicates_keeps_first_occurrence(monkeypatch):
+    dedup = WebhookDeduplicator(ttl_s=60, local_max=100, redis_client=_FakeRedis())
+    monkeypatch.setattr(webhook_module, "get_deduplicator", lambda: dedup)
+    items = [
+        InboundText(wa_id="1", msg_id="m1", text="a", raw={}),
+        InboundText(wa_id="1", msg_id="m1", text="a", raw={}),
+        InboundText(wa_id="1", msg_id="", text="sem id", raw={}),
+        InboundText(wa_id="2", msg_id="m2", text="b", raw={}),
+    ]
+    assert [i.text for i in webhook_module.drop_duplicates(items)] == ["a", "sem id", "b"]
+    assert webhook_module.drop_duplicates(items[:1]) == []
+
+
+def test_redis_down_falls_back_to_local_lru():
+    class _Down:
+        def pipeline(self, transaction=False):
+            raise ConnectionError("redis down")
+
+    dedup = WebhookDeduplicator(ttl_s=60, local_max=100, redis_client=_Down())
+    assert dedup.duplicates(["z"]) == set()
+    assert dedup.is_duplicate("z")
@@ -0,0 +1,184 @@
+from fastapi.testclient import TestClient
+from app.main import app
+from app.core.config import settings
+from app.messaging.inbound import decode_payload, iter_text_messages
+
+
+class _FakeStreamRedis:
+    def __init__(self):
+        self.added = []
+
+    def xadd(self, name, fields, maxlen=None, approximate=True):
+        self.added.append((name, fields))
+        return "1-0"
+
+
+def _payload():
+    return {
+        "entry": [
+            {
+                "changes": [
+                    {
+                        "value": {
+                            "contacts": [{"wa_id": "5561999999999"}],
+                            "messages": [
+                                {"id": "wamid.1", "from": "5561999999999", "type": "text", "text": {"body": " Ola "}},
+                                {"id": "wamid.2", "from": "5561999999999", "type": "image"},
+                            ],
+                        }
+                    }
+                ]
+            }
+        ]
+    }
+
+
+def test_webhook_stream_mode_only_appends(monkeypatch):
+    from app.api.routes import webhook as webhook_module
+
+    fake = _FakeStreamRedis()
+    monkeypatch.setattr(webhook_module, "_redis", lambda: fake)
+    monkeypatch.setattr(settings, "WEBHOOK_INGEST_MODE", "stream")
+
+    def _fail(*args, **kwargs):
+        raise AssertionError("processamento não deve ocorrer na requisição")
+
+    monkeypatch.setattr(webhook_module, "process_payload", _fail)
+
+    client = TestClient(app)
+    resp = client.post("/webhook", json=_payload())
+
+    assert resp.status_code == 200
+    assert resp.json() == {"received": True, "queued": True}
+    assert len(fake.added) == 1
+    name, fields = fake.added[0]
+    assert name == settings.WEBHOOK_STREAM_KEY
+    assert decode_payload(fields["body"]) == _payload()
+
+
+def test_iter_text_messages_skips_non_text():
+    items = list(iter_text_messages(_payload()))
+    assert len(items) == 1
+    assert items[0].wa_id == "5561999999999"
+    assert items[0].msg_id == "wamid.1"
+    assert items[0].text == "Ola"
+
+
+class _FakeGroupStream:
+    """Stream + consumer group mínimos (XREADGROUP/XPENDING/XCLAIM/XACK) para um único stream."""
+
+    def __init__(self):
+        self.entries: list[tuple[str, dict]] = []
+        self.delivered = 0
+        self.pending: dict[str, dict] = {}
+        self.streams: dict[str, list] = {}
+
+    def xadd(self, name, fields, maxlen=None, approximate=True):
+        msg_id = f"{len(self.entries) + 1}-0"
+        self.entries.append((msg_id, fields))
+        self.streams.setdefault(name, []).append((msg_id, fields))
+        return msg_id
+
+    def xreadgroup(self, group, consumer, streams, count=None, block=None):
+        (name,) = streams
+        new = self.entries[self.delivered : self.delivered + (count or len(self.entries))]
+        self.delivered += len(new)
+        for msg_id, fields in new:
+            self.pending[msg_id] = {"fields": fields, "times_delivered": 1}
+        return [(name, new)] if new else []
+
+    def xpending_range(self, name, group, min, max, count, idle=None):
+        return [{"message_id": k, "times_delivered": v["times_delivered"]} for k, v in self.pending.items()][:count]
+
+    def xclaim(self, name, group, consumer, min_idle_time, message_ids):
+        out = []
+        for msg_id in message_ids:
+            p = self.pending[msg_id]
+            p["times_delivered"] += 1
+            out.append((msg_id, p["fields"]))
+        return out
+
+    def xack(self, name, group, *ids):
+        for msg_id in ids:
+            self.pending.pop(msg_id, None)
+        return len(ids)
+
+
+def _text_payload(msg_id: str, wa_id: str = "5561988887777", body: str = "oi"):
+    return {
+        "entry": [
+            {
+                "changes": [
+                    {"value": {"messages": [{"id": msg_id, "from": wa_id, "type": "text", "text": {"body": body}}]}}
+                ]
+            }
+        ]
+    }
+
+
+def _stored(msg_id: str) -> int:
+    from app.repositories.db import SessionLocal
+    from app.repositories.models import Message
+
+    with SessionLocal() as db:
+        return db.query(Message).filter(Message.wa_message_id == msg_id).count()
+
+
+def test_failed_batch_is_persisted_on_reclaim(monkeypatch):
+    import json
+    import uuid
+
+    from app.api.routes import webhook as webhook_module
+    from app.workers import webhook_consumer
+
+    msg_id = f"wamid.{uuid.uuid4().hex}"
+    fake = _FakeGroupStream()
+    fake.xadd(settings.WEBHOOK_STREAM_KEY, {"body": json.dumps(_text_payload(msg_id))})
+    replies: list[str] = []
+    monkeypatch.setattr(webhook_module, "handle_text_message", lambda wa_id, text: replies.append(text))
+
+    real_persist = webhook_consumer.persist_inbound_batch
+    calls = {"n": 0}
+
+    def flaky(tenant, items):  # type: ignore[no-untyped-def]
+        calls["n"] += 1
+        if calls["n"] == 1:
+            raise RuntimeError("db down")
+        return real_persist(tenant, items)
+
+    monkeypatch.setattr(webhook_consumer, "persist_inbound_batch", flaky)
+    consumer = webhook_consumer.WebhookStreamConsumer(fake, "w1")
+
+    batch = consumer.read_batch()
+    try:
+        consumer.process(batch)
+    except RuntimeError:
+        pass
+    assert fake.pending and _stored(msg_id) == 0
+
+    # Reentrega dentro do TTL de dedup: a mensagem ainda precisa ser gravada e respondida
+    assert consumer.process(consumer.reclaim(idle_ms=0)) == 1
+    assert _stored(msg_id) == 1 and replies == ["oi"]
+    assert not fake.pending
+
+    # Reentrega de algo já gravado: não duplica nem chama o bot de novo
+    fake.pending[batch[0][0]] = {"fields": batch[0][1], "times_delivered": 1}
+    consumer.process(consumer.reclaim(idle_ms=0))
+    assert _stored(msg_id) == 1 and replies == ["oi"]
+
+
+def test_reclaim_sends_exhausted_entries_to_dlq():
+    import json
+
+    from app.workers import webhook_consumer
+
+    fake = _FakeGroupStream()
+    fake.xadd(settings.WEBHOOK_STREAM_KEY, {"body": json.dumps(_text_payload("wamid.dlq"))})
+    consumer = webhook_consumer.WebhookStreamConsumer(fake, "w1", max_deliveries=2)
+    consumer.read_batch()
+    fake.pending["1-0"]["times_delivered"] = 2
+
+    assert consumer.reclaim(idle_ms=0) == []
+    assert not fake.pending
+    (dead,) = fake.streams[consumer.dlq]
+    assert dead[1]["source_id"] == "1-0"
@@ -0,0 +1,72 @@
+from datetime import datetime, timedelta
+
+from app.messaging import window
+from app.repositories.db import SessionLocal
+from app.repositories.models import Contact, Tenant
+
+
+class _NoRedis:
+    def __getattr__(self, name):
+        raise ConnectionError("redis indisponível")
+
+
+def test_window_falls_back_to_contact_column(monkeypatch):
+    monkeypatch.setattr(window, "get_redis", lambda: _NoRedis())
+    now = datetime.utcnow()
+    with SessionLocal() as db:
+        tenant = Tenant(name="window-test")
+        db.add(tenant)
+        db.flush()
+        db.add_all(
+            [
+                Contact(tenant_id=tenant.id, wa_id="551100000001", last_inbound_at=now - timedelta(hours=1)),
+                Contact(tenant_id=tenant.id, wa_id="551100000002", last_inbound_at=now - timedelta(hours=30)),
+                Contact(tenant_id=tenant.id, wa_id="551100000003"),
+            ]
+        )
+        db.commit()
+
+        assert window.is_inside_window(db, tenant.id, "551100000001")
+        assert not window.is_inside_window(db, tenant.id, "551100000002")
+
+        lasts = window.bulk_last_inbound(
+            db, tenant.id, ["551100000001", "551100000002", "551100000003", "551100000004"]
+        )
+    assert set(lasts) == {"551100000001", "551100000002", "551100000003", "551100000004"}
+    assert lasts["551100000003"] is None and lasts["551100000004"] is None
+    status = window.window_status(lasts["551100000002"])
+    assert status["inside_window"] is False
+    assert status["hours_since"] >= 30
+
+
+class _DictRedis:
+    def __init__(self):
+        self.data: dict[str, str] = {}
+
+    def pipeline(self, transaction=True):
+        return self
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value
+
+    def execute(self):
+        return []
+
+    def mget(self, keys):
+        return [self.data.get(k) for k in keys]
+
+
+def test_cached_timestamp_is_utc_regardless_of_local_timezone(monkeypatch):
+    import time
+
+    fake = _DictRedis()
+    monkeypatch.setattr(window, "get_redis", lambda: fake)
+    monkeypatch.setenv("TZ", "America/Sao_Paulo")
+    time.tzset()
+    try:
+        at = datetime.utcnow().replace(microsecond=0) - timedelta(hours=23)
+        window.cache_inbound(1, ["551100000009"], at)
+        assert window._from_cache(1, ["551100000009"]) == {"551100000009": at}
+    finally:
+        monkeypatch.undo()
+        time.tzset()